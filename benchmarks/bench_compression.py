@@ -0,0 +1,113 @@
+"""
+bench_compression.py
+
+Report of the recall@k, the index memory and the search latency of the compressed text index of the
+numpy backend (quantization.py) for truncated, int8 and product quantized embeddings, with and
+without rescoring the candidates with the full embeddings.
+
+The embeddings are synthetic by default: clustered vectors whose variance decreases with the
+dimension, like Matryoshka embeddings. With --vectors the stored text embeddings of a numpy backend
+directory are used instead, e.g. .vectors/real_estate_description.npy. The queries are stored
+vectors with noise, the recall is measured against the exact search of the full float32 embeddings.
+
+Usage:
+    python benchmarks/bench_compression.py --listings 50000 --dimension 3072 -k 10
+    python benchmarks/bench_compression.py --vectors .vectors/real_estate_description.npy
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from quantization import CompressedIndex
+from vector_store import NumpyClient, normalize, top_k
+
+
+def synthetic_embeddings(listings, dimension, seed=0):
+    """
+    Clustered normalized vectors with a variance decreasing with the dimension.
+    """
+    rng = np.random.default_rng(seed)
+    decay = 1 / np.sqrt(1 + np.arange(dimension) / 32)
+    centers = rng.standard_normal((max(1, listings // 50), dimension)) * decay
+    vectors = np.empty((listings, dimension), dtype=np.float32)
+    for start in range(0, listings, 10000):
+        end = min(start + 10000, listings)
+        assignment = rng.integers(0, len(centers), end - start)
+        vectors[start:end] = centers[assignment] + 0.5 * rng.standard_normal((end - start, dimension)) * decay
+    return normalize(vectors)
+
+
+def configurations(dimension):
+    """
+    Compressions of the report: (name, index settings), the full embeddings first.
+    """
+    configs = [("float32", None)]
+    for dimensions in (dimension // 2, dimension // 4, dimension // 12):
+        if dimensions >= 64:
+            configs.append((f"float32 d={dimensions}", dict(dimensions=dimensions, quantization="none")))
+    configs.append(("int8", dict(dimensions=0, quantization="int8")))
+    if dimension // 3 >= 64:
+        configs.append((f"int8 d={dimension // 3}", dict(dimensions=dimension // 3, quantization="int8")))
+    for subvectors in (dimension // 32, dimension // 64):
+        if subvectors >= 8 and dimension % subvectors == 0:
+            configs.append((f"pq m={subvectors}", dict(dimensions=0, quantization="pq", subvectors=subvectors)))
+    return configs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Recall@k, memory and latency of the compressed text index")
+    arg_parser.add_argument("--listings", type=int, default=50000, help="Synthetic listings (default: 50000)")
+    arg_parser.add_argument("--dimension", type=int, default=3072,
+                            help="Dimension of the synthetic embeddings (default: 3072, text-embedding-3-large)")
+    arg_parser.add_argument("--vectors", help="Stored embeddings of a numpy backend (.npy) instead of synthetic ones")
+    arg_parser.add_argument("-k", type=int, default=10, help="Results per query (default: 10)")
+    arg_parser.add_argument("--queries", type=int, default=100, help="Number of queries (default: 100)")
+    arg_parser.add_argument("--rescore", type=int, nargs="+", default=[0, 4],
+                            help="Candidates per result rescored with the full embeddings (default: 0 4)")
+    args = arg_parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors, mmap_mode="r")
+        # the matrix has unused rows at the end
+        vectors = normalize(vectors[:int(np.flatnonzero(np.abs(vectors).sum(axis=1))[-1]) + 1])
+    else:
+        vectors = synthetic_embeddings(args.listings, args.dimension)
+    listings, dimension = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = normalize(vectors[rng.choice(listings, args.queries)] + 0.3 * rng.standard_normal((args.queries, dimension))
+                        / np.sqrt(dimension))
+    expected = top_k(queries @ vectors.T, min(args.k, listings))[0]
+
+    print(f"{listings} listings, dimension {dimension}, recall@{args.k} against the exact search:")
+    print(f"  {'index':16} {'rescore':>7} {'bytes':>6} {'MiB':>8} {'p50 ms':>8} {'recall':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        collection = NumpyClient(directory).get_or_create_collection("bench")
+        for start in range(0, listings, 10000):
+            collection.upsert(ids=[f"listing-{row}" for row in range(start, min(start + 10000, listings))],
+                              embeddings=vectors[start:start + 10000])
+        row_of = {f"listing-{row}": row for row in range(listings)}
+
+        for name, settings in configurations(dimension):
+            for rescore in (args.rescore if settings else [0]):
+                collection.index_settings = CompressedIndex(**settings, rescore=rescore) if settings else None
+                stats = collection.reindex()
+                seconds, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    result = collection.query(query_embeddings=query[None, :], n_results=args.k, include=[])
+                    seconds.append(time.perf_counter() - start)
+                    found.append([row_of[id] for id in result["ids"][0]])
+                recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected.tolist())])
+                print(f"  {name:16} {rescore:7} {stats['code_bytes']:6} {stats['code_bytes'] * listings / 2**20:8.1f} "
+                      f"{np.percentile(seconds, 50) * 1e3:8.2f} {recall:7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_filtering.py
+
+Benchmark of the similarity search with a metadata filter compared with an unfiltered search whose
+results are filtered afterwards, on random vectors in an in-memory ChromaDB collection.
+
+For every query the exact top-k among the eligible listings is the reference. The report shows the
+latency of both variants and the recall of the eligible listings: the post-filtered search only
+keeps the eligible listings among its k results.
+
+Usage:
+    python benchmarks/bench_filtering.py --listings 20000 --k 15 --min-bedrooms 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import chromadb
+
+
+def make_collection(listings, dimension, rng):
+    """Collection with random unit vectors and random bedroom counts and prices."""
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name="bench_filtering", metadata={"hnsw:space": "cosine"})
+    vectors = rng.standard_normal((listings, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    bedrooms = rng.integers(1, 6, size=listings)
+    prices = rng.integers(200, 1500, size=listings) * 1000
+    ids = [f"listing-{index}" for index in range(listings)]
+    batch = 5000
+    for start in range(0, listings, batch):
+        collection.add(
+            ids=ids[start:start + batch],
+            embeddings=vectors[start:start + batch],
+            metadatas=[{"bedrooms": int(b), "price": int(p)}
+                       for b, p in zip(bedrooms[start:start + batch], prices[start:start + batch])],
+        )
+    return collection, vectors, bedrooms, prices
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Filtered similarity search benchmark")
+    arg_parser.add_argument("--listings", type=int, default=10000, help="Number of listings (default: 10000)")
+    arg_parser.add_argument("--dimension", type=int, default=512, help="Vector dimension (default: 512)")
+    arg_parser.add_argument("--queries", type=int, default=50, help="Number of queries (default: 50)")
+    arg_parser.add_argument("--k", type=int, default=15, help="Number of results (default: 15)")
+    arg_parser.add_argument("--min-bedrooms", type=int, default=4, help="Bedroom constraint (default: 4)")
+    arg_parser.add_argument("--max-price", type=int, default=800000, help="Price constraint (default: 800000)")
+    args = arg_parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    collection, vectors, bedrooms, prices = make_collection(args.listings, args.dimension, rng)
+    where = {"$and": [{"bedrooms": {"$gte": args.min_bedrooms}}, {"price": {"$lte": args.max_price}}]}
+    eligible = (bedrooms >= args.min_bedrooms) & (prices <= args.max_price)
+    print(f"{args.listings} listings, {eligible.sum()} eligible ({eligible.mean():.1%})")
+
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    timings = {"unfiltered": 0.0, "filtered": 0.0}
+    recall = {"unfiltered": 0.0, "filtered": 0.0}
+    for query in queries:
+        similarities = np.where(eligible, vectors @ query, -np.inf)
+        expected = {f"listing-{index}" for index in np.argsort(-similarities)[:args.k]}
+
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=args.k, include=["metadatas"])
+        kept = [id for id, metadata in zip(result["ids"][0], result["metadatas"][0])
+                if metadata["bedrooms"] >= args.min_bedrooms and metadata["price"] <= args.max_price]
+        timings["unfiltered"] += time.perf_counter() - start
+        recall["unfiltered"] += len(expected & set(kept)) / len(expected)
+
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=args.k, where=where, include=[])
+        timings["filtered"] += time.perf_counter() - start
+        recall["filtered"] += len(expected & set(result["ids"][0])) / len(expected)
+
+    print(f"{'search':>12} {'ms/query':>10} {'recall@k':>10}")
+    for name in timings:
+        print(f"{name:>12} {1000 * timings[name] / args.queries:>10.2f} {recall[name] / args.queries:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+bench_fusion.py
+
+Microbenchmark of the fusion of text and image search results at large k, comparing the former
+nested list lookup with fusion.fuse().
+
+Usage:
+    python benchmarks/bench_fusion.py --k 1000 10000 50000
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fusion import fuse
+
+
+def legacy_selection(results, results_image, max_samples):
+    """Selection loop formerly used in get_results, with list lookups."""
+    samples = ""
+    num_samples = 0
+    images = []
+    for idx, id in enumerate(results_image['ids'][0]):
+        if num_samples >= max_samples:
+            break
+        if id in results['ids'][0]:
+            images.append(results_image['uris'][0][idx])
+            idx_results = results['ids'][0].index(id)
+            samples += f"{results['documents'][0][idx_results]}\n-------------------------------\n"
+            num_samples += 1
+    return images
+
+
+def make_results(k, overlap, rng):
+    """Text and image results of size k where only a fraction of the ids is in both lists."""
+    shared = [f"id{index}" for index in range(int(k * overlap))]
+    text_ids = shared + [f"text{index}" for index in range(k - len(shared))]
+    image_ids = shared + [f"image{index}" for index in range(k - len(shared))]
+    rng.shuffle(text_ids)
+    rng.shuffle(image_ids)
+    # the shared listings are at the end of the image ranking, the worst case for the legacy loop
+    image_ids.sort(key=lambda id: id.startswith("id"))
+    results = {"ids": [text_ids], "documents": [[f"doc {id}" for id in text_ids]]}
+    results_image = {"ids": [image_ids], "uris": [[f"{id}.png" for id in image_ids]]}
+    return results, results_image
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Fusion microbenchmark")
+    arg_parser.add_argument("--k", type=int, nargs="+", default=[100, 1000, 10000], help="Result list sizes")
+    arg_parser.add_argument("--overlap", type=float, default=0.01, help="Fraction of ids in both lists (default: 0.01)")
+    arg_parser.add_argument("--max-samples", type=int, default=3, help="Number of selected listings (default: 3)")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'k':>8} {'legacy ms':>12} {'rrf ms':>10} {'weighted ms':>12}")
+    for k in args.k:
+        results, results_image = make_results(k, args.overlap, rng)
+        number = max(1, 10000 // k)
+        legacy = timeit.timeit(lambda: legacy_selection(results, results_image, args.max_samples), number=number)
+        rrf = timeit.timeit(lambda: fuse(results, results_image, args.max_samples, method="rrf"), number=number)
+        weighted = timeit.timeit(lambda: fuse(results, results_image, args.max_samples, method="weighted"), number=number)
+        print(f"{k:>8} {1000 * legacy / number:>12.3f} {1000 * rrf / number:>10.3f} {1000 * weighted / number:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_image_ingest.py
+
+Benchmark for the image ingestion pipeline: images per second depending on the number of
+processes decoding the images.
+
+Synthetic PNG images are written to a temporary directory and embedded without cache. By default
+the OpenCLIP model is used, with --fake only decoding and resizing is measured.
+
+Usage:
+    python benchmarks/bench_image_ingest.py --images 256 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from image_ingest import ImageEmbedder
+
+
+class FakeEmbeddingFunction:
+    def __call__(self, input):
+        return [np.asarray(image, dtype=np.float32).mean(axis=(0, 1)) for image in input]
+
+
+def write_images(directory, count, size):
+    rng = np.random.default_rng(0)
+    uris = []
+    for index in range(count):
+        path = os.path.join(directory, f"{index}.png")
+        pixels = rng.integers(0, 255, size=(size, size, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path)
+        uris.append(path)
+    return uris
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Images per second against the number of workers")
+    arg_parser.add_argument("--images", type=int, default=128, help="Number of images (default: 128)")
+    arg_parser.add_argument("--size", type=int, default=768, help="Side length of the images (default: 768)")
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Numbers of workers")
+    arg_parser.add_argument("--batch-size", type=int, default=32, help="Number of images embedded at once (default: 32)")
+    arg_parser.add_argument("--fake", action="store_true", help="Use a fake embedding function instead of OpenCLIP")
+    args = arg_parser.parse_args()
+
+    if args.fake:
+        embedding_function = FakeEmbeddingFunction()
+    else:
+        import chromadb.utils.embedding_functions as embedding_functions
+        embedding_function = embedding_functions.OpenCLIPEmbeddingFunction()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uris = write_images(directory, args.images, args.size)
+
+        print(f"{'workers':>8} {'seconds':>10} {'images/s':>10}")
+        for workers in args.workers:
+            with ImageEmbedder(embedding_function, workers=workers, batch_size=args.batch_size) as embedder:
+                start = time.perf_counter()
+                embedder(uris)
+                elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:>10.3f} {args.images / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+bench_logging.py
+
+Benchmark for the time spent logging on the thread of a request.
+
+A request logs about a dozen lines and the JSON trace of its spans. They are written directly by the
+handlers (sync), or put into a queue which a background thread writes (queue), as text or as JSON.
+The ingestion of 10k listings logs its progress after every listing, after every batch or throttled.
+The log file is written to a temporary directory and stdout is replaced by /dev/null.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 2000 --listings 10000
+"""
+
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from logger_config import Throttle, create_handlers
+
+# lines logged by one recommendation request
+request_lines = 12
+trace = json.dumps({"trace_id": "0" * 32, "name": "get_results", "seconds": 1.234,
+                    "spans": [{"name": f"stage.{index}", "seconds": 0.1} for index in range(12)]})
+
+
+def create_logger(name, log_file, devnull, use_queue, json_format):
+    """
+    Create a logger writing to the log file and /dev/null.
+
+    Returns:
+        tuple: The logger and its QueueListener, None without queue.
+    """
+    handlers = create_handlers(log_file, json_format=json_format, stream=devnull)
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if use_queue:
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+    return logger, listener
+
+
+def log_request(logger, index):
+    for line in range(request_lines):
+        logger.info(f"Request {index}: step {line} done in {0.01 * line:.2f}s")
+    logger.info(trace)
+
+
+def measure(name, directory, devnull, use_queue, json_format, function, count):
+    """
+    Call the function count times and return the time per call on the calling thread and with draining the queue.
+
+    Returns:
+        tuple: Microseconds per call on the caller, microseconds per call until everything is written.
+    """
+    logger, listener = create_logger(name, os.path.join(directory, f"{name}.log"), devnull, use_queue, json_format)
+    start = time.perf_counter()
+    for index in range(count):
+        function(logger, index)
+    caller = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - start
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+    return caller / count * 1e6, total / count * 1e6
+
+
+def ingestion(mode, listings, batch_size):
+    """
+    Function logging the progress of an ingestion of the listings.
+
+    Args:
+        mode (str): 'per_listing', 'per_batch' or 'throttled'.
+        listings (int): Number of listings.
+        batch_size (int): Listings per batch.
+
+    Returns:
+        callable: Function of the logger and the run index.
+    """
+    def run(logger, _):
+        throttle = Throttle(interval=5.0)
+        for index in range(1, listings + 1):
+            if mode == "per_listing" or (index % batch_size == 0 and (mode == "per_batch" or throttle.ready())):
+                logger.info(f"Ingested {index} listings ({index} embedded, 0 unchanged), 1234.5 listings/s")
+        logger.info(f"Ingested {listings} listings ({listings} embedded, 0 unchanged), 1234.5 listings/s")
+    return run
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Logging overhead per request and per ingestion")
+    arg_parser.add_argument("--requests", type=int, default=2000, help="Number of logged requests (default: 2000)")
+    arg_parser.add_argument("--listings", type=int, default=10000, help="Number of ingested listings (default: 10000)")
+    arg_parser.add_argument("--batch-size", type=int, default=100, help="Listings per batch (default: 100)")
+    arg_parser.add_argument("--runs", type=int, default=5, help="Number of ingestions (default: 5)")
+    args = arg_parser.parse_args()
+
+    modes = {
+        "sync text": (False, False),
+        "queue text": (True, False),
+        "sync json": (False, True),
+        "queue json": (True, True),
+    }
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        print(f"Per request ({request_lines} lines and the trace):")
+        for mode, (use_queue, json_format) in modes.items():
+            caller, total = measure(f"request_{mode.replace(' ', '_')}", directory, devnull, use_queue, json_format,
+                                    log_request, args.requests)
+            print(f"  {mode:12} {caller:8.1f} us on the request thread, {total:8.1f} us until written")
+
+        print(f"Per ingestion of {args.listings} listings (batches of {args.batch_size}):")
+        for progress in ("per_listing", "per_batch", "throttled"):
+            for mode in ("sync text", "queue text"):
+                use_queue, json_format = modes[mode]
+                caller, total = measure(f"ingest_{progress}_{mode.replace(' ', '_')}", directory, devnull, use_queue,
+                                        json_format, ingestion(progress, args.listings, args.batch_size), args.runs)
+                print(f"  {progress:12} {mode:12} {caller / 1000:8.2f} ms on the ingestion thread, "
+                      f"{total / 1000:8.2f} ms until written")
+
+
+if __name__ == "__main__":
+    main()
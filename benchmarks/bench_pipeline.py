@@ -0,0 +1,221 @@
+"""
+bench_pipeline.py
+
+Offline end-to-end benchmark of the recommendation pipeline with the fake LLM and embedding
+backends of fakes.py.
+
+For every dataset size synthetic listings are ingested into a fresh database. Then get_results()
+is called with varying answers and the latency of every pipeline stage and of the whole call is
+reported as p50/p95/p99. Finally clients post the form concurrently to the Flask app on a threaded
+WSGI server and the throughput is measured. The recommendation cache is disabled and every request
+has different answers, so each request runs the whole pipeline.
+
+The report can be written as JSON to track regressions between commits.
+
+Usage:
+    python benchmarks/bench_pipeline.py --listings 20 1000 100000 --requests 50 --clients 8 --json report.json
+"""
+
+import argparse
+import configparser
+import http.client
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from werkzeug.serving import make_server
+
+import llm
+import pipeline
+import resources
+import server
+import user_data
+from database import Database
+from fakes import fake_backends, write_dataset
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def percentiles(values):
+    """p50, p95 and p99 of the values in seconds."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "count": 0}
+    values = sorted(values)
+
+    def at(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+    return {"p50": statistics.median(values), "p95": at(0.95), "p99": at(0.99), "count": len(values)}
+
+
+def bench_settings(llm_limit):
+    """Settings of the repository with the caches in memory and the recommendation cache disabled."""
+    settings = configparser.ConfigParser()
+    settings.read(os.path.join(REPO_DIR, "settings.ini"))
+    settings.read_dict({
+        "server": {"preload": "false", "streaming": "false"},
+        "cache": {"recommendations": "false", "embeddings_path": "", "descriptions_path": ""},
+        "history": {"backend": "memory"},
+        "limits": {"llm": str(llm_limit), "queue_timeout": "300"},
+    })
+    return settings
+
+
+def all_answers(count):
+    """Distinct answers, based on the example customers with a request number appended."""
+    examples = [user_data.get_info()[1], user_data.get_info2()[1], user_data.get_info3()[1]]
+    return [[*examples[index % len(examples)][:-1], f"{examples[index % len(examples)][-1]} (request {index})"]
+            for index in range(count)]
+
+
+def form(answers):
+    fields = ["size", "priorities", "amenities", "transport", "urban", "style"]
+    return urlencode(dict(zip(fields, answers)))
+
+
+def post(port, body):
+    """Post the form, follow the redirect to the results page and return (status, seconds)."""
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    connection.request("POST", "/results", body=body, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    response = connection.getresponse()
+    response.read()
+    status = response.status
+    if status == 303:
+        connection.request("GET", response.getheader("Location"))
+        response = connection.getresponse()
+        response.read()
+        status = response.status
+    connection.close()
+    return status, time.perf_counter() - start
+
+
+def bench_dataset(count, args):
+    """Ingest a synthetic dataset and measure the pipeline and the web server on it."""
+    recorded = []
+
+    class RecordingTimings(pipeline.StageTimings):
+        def __init__(self):
+            super().__init__()
+            recorded.append(self)
+
+    with tempfile.TemporaryDirectory() as directory, \
+            fake_backends(llm_latency=args.llm_latency, token_latency=args.token_latency,
+                          embedding_latency=args.embedding_latency), \
+            patch("llm.StageTimings", RecordingTimings):
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            resources.registry.clear()
+            resources.registry.get(("settings", "settings.ini"), lambda: bench_settings(args.llm_limit))
+
+            filename = write_dataset(directory, count, seed=args.seed)
+            # a database directory per dataset, ChromaDB shares the clients of the same path
+            db = resources.registry.get(("database", True), lambda: Database(
+                persist_directory=os.path.join(directory, "chroma"), embedding_cache=resources.get_embedding_cache()))
+            ingest = db.add_data_to_collections(filename, batch_size=args.batch_size)
+
+            answers = all_answers(args.requests + args.clients * args.client_requests)
+            latencies = []
+            for request_answers in answers[:args.requests]:
+                start = time.perf_counter()
+                llm.get_results(request_answers)
+                latencies.append(time.perf_counter() - start)
+
+            stages = {}
+            for timings in recorded:
+                for name, seconds in timings.as_dict().items():
+                    stages.setdefault(name, []).append(seconds)
+
+            http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+            threading.Thread(target=http_server.serve_forever, daemon=True).start()
+            bodies = [form(request_answers) for request_answers in answers[args.requests:]]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                responses = list(executor.map(lambda body: post(http_server.server_port, body), bodies))
+            elapsed = time.perf_counter() - start
+            http_server.shutdown()
+            http_server.server_close()
+        finally:
+            os.chdir(cwd)
+            resources.registry.clear()
+
+    ok = [seconds for status, seconds in responses if status == 200]
+    return {
+        "listings": count,
+        "ingest": {"seconds": ingest["seconds"], "listings_per_second": count / ingest["seconds"]},
+        "get_results": percentiles(latencies),
+        "stages": {name: percentiles(values) for name, values in sorted(stages.items())},
+        "server": {
+            "clients": args.clients,
+            "requests": len(responses),
+            "ok": len(ok),
+            "rejected": sum(1 for status, _ in responses if status == 503),
+            "requests_per_second": len(ok) / elapsed,
+            "latency": percentiles(ok),
+        },
+    }
+
+
+def print_report(result):
+    def row(name, values):
+        if not values["count"]:
+            return f"  {name:<24} {'-':>9}"
+        return (f"  {name:<24} {1000 * values['p50']:>9.1f} {1000 * values['p95']:>9.1f} "
+                f"{1000 * values['p99']:>9.1f}")
+
+    print(f"{result['listings']} listings, ingest {result['ingest']['listings_per_second']:.0f} listings/s")
+    print(f"  {'ms':<24} {'p50':>9} {'p95':>9} {'p99':>9}")
+    print(row("get_results", result["get_results"]))
+    for name, values in result["stages"].items():
+        print(row(name, values))
+    web = result["server"]
+    print(f"  server: {web['clients']} clients, {web['ok']}/{web['requests']} ok, "
+          f"{web['requests_per_second']:.2f} requests/s")
+    print(row("server request", web["latency"]))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the recommendation pipeline")
+    arg_parser.add_argument("--listings", type=int, nargs="+", default=[20, 1000, 10000],
+                            help="Dataset sizes (default: 20 1000 10000)")
+    arg_parser.add_argument("--requests", type=int, default=30, help="Sequential get_results calls (default: 30)")
+    arg_parser.add_argument("--clients", type=int, default=8, help="Concurrent clients of the web server (default: 8)")
+    arg_parser.add_argument("--client-requests", type=int, default=4, help="Requests per client (default: 4)")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds to the first token of an LLM call (default: 0.2)")
+    arg_parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per generated token (default: 0.002)")
+    arg_parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embedding call (default: 0.05)")
+    arg_parser.add_argument("--llm-limit", type=int, default=8, help="Concurrent LLM calls (default: 8)")
+    arg_parser.add_argument("--batch-size", type=int, default=500, help="Listings per ingest batch (default: 500)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic listings (default: 0)")
+    arg_parser.add_argument("--json", help="Write the report to this JSON file")
+    args = arg_parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    report = {
+        "parameters": {key: value for key, value in vars(args).items() if key != "json"},
+        "results": [],
+    }
+    for count in args.listings:
+        result = bench_dataset(count, args)
+        report["results"].append(result)
+        print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+bench_prompts.py
+
+Benchmark for the prompt tokens of the LLM calls of one recommendation request.
+
+The calls of llm.LLM are made with the fake chat model of fakes.py, which records the prompts. The
+tokens of every prompt are counted with the questionnaire sent as one message per question and answer
+(history = full) and as one compact message (history = compact). The descriptions of the houses are
+written from the profile, the tokens of the profile chat session which the results prompt formerly
+replayed are reported as saved. The time to count and fit a prompt is reported as the overhead of
+the token budget.
+
+Usage:
+    python benchmarks/bench_prompts.py --listings 6 --encoding o200k_base
+"""
+
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fakes import FakeChatModel
+from database import data_template
+from generate_listings import generate_listings
+from llm import LLM, profile_query
+import llm_history
+import resources
+from token_budget import TokenBudget, Tokenizer, reply_overhead
+import user_data
+
+
+class RecordingChatModel(FakeChatModel):
+    """Fake chat model which records the messages of every prompt."""
+    prompts: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages)
+        return super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        structured = super().with_structured_output(schema, **kwargs)
+
+        def record(prompt):
+            self.prompts.append(prompt.to_messages())
+            return structured.invoke(prompt)
+        return type(structured)(record)
+
+
+def run_calls(budget, listings, profile=None):
+    """
+    Make the LLM calls of one request and record their prompts.
+
+    Args:
+        budget (TokenBudget): Token budget of the calls.
+        listings (list[str]): Documents of the recommended houses.
+        profile (str): Customer profile of the description calls, the generated one if None. The profile
+            of the fake model repeats its prompt, so the comparison uses the same profile in all modes.
+
+    Returns:
+        dict: Messages of the prompt per call name and the customer profile.
+    """
+    resources.registry.clear()
+    resources.registry.get("token_budget", lambda: budget)
+    model = RecordingChatModel(prompts=[])
+    with patch("llm.ChatOpenAI", return_value=model):
+        real_estate_llm = LLM(open_ai=True)
+
+    questions, answers = user_data.get_info()
+    history_dic = {"questions": questions, "answers": answers}
+    session_id, session_id_image = llm_history.new_session_id(), llm_history.new_session_id()
+    try:
+        generated = real_estate_llm.conversation(history_dic, session_id=session_id)
+        real_estate_llm.conversation_image(history_dic, session_id=session_id_image)
+    finally:
+        llm_history.delete_session(session_id)
+        llm_history.delete_session(session_id_image)
+    profile = profile if profile is not None else generated
+    samples = "".join(f"{listing}\n-------------------------------\n" for listing in listings)
+    real_estate_llm.results(samples, profile)
+    real_estate_llm.describe_listing(profile, listings[0])
+
+    names = ("profile", "profile_image", "results", "describe_listing")
+    return dict(zip(names, model.prompts)), profile
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prompt tokens per LLM call with full and compact history")
+    arg_parser.add_argument("--listings", type=int, default=6, help="Houses described in the results call (default: 6)")
+    arg_parser.add_argument("--encoding", default="", help="tiktoken encoding, empty to estimate the tokens (default)")
+    arg_parser.add_argument("--runs", type=int, default=1000, help="Prompts fitted to measure the overhead (default: 1000)")
+    args = arg_parser.parse_args()
+
+    tokenizer = Tokenizer(args.encoding or None)
+    listings = [data_template.format(listing["Neighborhood"], listing["Price"], listing["Bedrooms"],
+                                     listing["Bathrooms"], listing["HouseSize"], listing["Description"],
+                                     listing["NeighborhoodDescription"])
+                for listing in generate_listings(args.listings)]
+
+    prompts = {}
+    prompts["full"], profile = run_calls(TokenBudget(tokenizer=tokenizer, compact=False), listings)
+    prompts["compact"], _ = run_calls(TokenBudget(tokenizer=tokenizer, compact=True), listings, profile)
+
+    print(f"Prompt tokens per call ({args.encoding or 'estimated'}):")
+    print(f"  {'call':18} {'full':>8} {'compact':>8} {'saved':>8}")
+    totals = {"full": 0, "compact": 0}
+    for call in prompts["full"]:
+        full, compact = (tokenizer.count_messages(prompts[mode][call]) for mode in ("full", "compact"))
+        totals["full"] += full
+        totals["compact"] += compact
+        print(f"  {call:18} {full:8} {compact:8} {1 - compact / full:8.1%}")
+    print(f"  {'request':18} {totals['full']:8} {totals['compact']:8} {1 - totals['compact'] / totals['full']:8.1%}")
+
+    # the results prompt formerly replayed the profile session: questionnaire, profile query and profile
+    replayed = prompts["full"]["profile"][1:-1] + [HumanMessage(profile_query), AIMessage(profile)]
+    saved = tokenizer.count_messages(replayed) - reply_overhead - tokenizer.count(profile)
+    print(f"Tokens of the profile session no longer replayed by the results call: {saved}")
+
+    budget = TokenBudget(tokenizer=tokenizer)
+    messages = prompts["full"]["results"]
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        budget.fit("results", messages)
+    print(f"Compacting and counting the results prompt: {(time.perf_counter() - start) / args.runs * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+bench_registry.py
+
+Benchmark for the cold and warm latency of llm.get_results.
+
+The cold run starts with an empty resource registry, so it includes building the LLM clients,
+the ChromaDB client and loading the CLIP weights. The warm runs reuse the shared resources.
+
+Usage:
+    python benchmarks/bench_registry.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import resources
+import user_data
+from llm import get_results
+
+
+def timed_call(answers):
+    start = time.perf_counter()
+    get_results(answers)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Cold vs warm get_results latency")
+    arg_parser.add_argument("--runs", type=int, default=5, help="Number of warm runs (default: 5)")
+    args = arg_parser.parse_args()
+
+    _, answers = user_data.get_info()
+
+    resources.registry.clear()
+    cold = timed_call(answers)
+
+    warm = [timed_call(answers) for _ in range(args.runs)]
+
+    print(f"cold:        {cold:8.3f} s")
+    print(f"warm mean:   {statistics.mean(warm):8.3f} s")
+    print(f"warm median: {statistics.median(warm):8.3f} s")
+    print(f"speedup:     {cold / statistics.median(warm):8.2f} x")
+
+
+if __name__ == '__main__':
+    main()
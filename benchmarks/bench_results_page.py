@@ -0,0 +1,91 @@
+"""
+bench_results_page.py
+
+Benchmark of the results page: render time per page and bytes transferred for the HTML and the
+house images.
+
+The render time of the cached template is compared with compiling the template source on every
+request, as render_template_string did. The transferred bytes compare the full-size PNGs with
+the thumbnails a browser picks from the srcset at 1x and 2x pixel density, and the HTML with and
+without gzip.
+
+Usage:
+    python benchmarks/bench_results_page.py --cards 3 --renders 1000
+"""
+
+import argparse
+import configparser
+import os
+import sys
+import tempfile
+import timeit
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import render_template, render_template_string
+
+import resources
+import server
+from result_store import ResultStore
+from thumbnails import file_digest, make_thumbnails, thumbnail_name
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Results page benchmark")
+    arg_parser.add_argument("--cards", type=int, default=3, help="Number of houses on the page (default: 3)")
+    arg_parser.add_argument("--renders", type=int, default=1000, help="Number of renders to time (default: 1000)")
+    arg_parser.add_argument("--widths", type=int, nargs="+", default=[300, 600], help="Thumbnail widths (default: 300 600)")
+    args = arg_parser.parse_args()
+
+    image_dir = os.path.join(server.app.root_path, "house_images")
+    images = sorted(os.listdir(image_dir), key=lambda name: int(os.path.splitext(name)[0]))[:args.cards]
+    cards = [{"id": f"listing-{index}", "image": f"house_images/{name}",
+              "description": "A bright family home close to parks and schools. " * 8}
+             for index, name in enumerate(images)]
+
+    with tempfile.TemporaryDirectory() as thumbnail_dir:
+        for name in images:
+            make_thumbnails(os.path.join(image_dir, name), thumbnail_dir, widths=tuple(args.widths))
+
+        settings = configparser.ConfigParser()
+        settings.read_dict({"images": {"thumbnail_dir": thumbnail_dir,
+                                       "thumbnail_widths": ",".join(map(str, args.widths))}})
+        resources.registry.clear()
+        resources.registry.get("result_store", ResultStore).put("bench", cards)
+
+        with patch("server.resources.get_settings", return_value=settings), server.app.test_request_context():
+            with open(os.path.join(server.app.root_path, "templates", "results.html")) as file:
+                source = file.read()
+            render_template("results.html", cards=cards, token="bench")
+            compiled = timeit.timeit(lambda: render_template("results.html", cards=cards, token="bench"),
+                                     number=args.renders)
+            uncompiled = timeit.timeit(lambda: render_template_string(source, cards=cards, token="bench"),
+                                       number=args.renders)
+
+            client = server.app.test_client()
+            plain = client.get("/results/bench").data
+            compressed = client.get("/results/bench", headers={"Accept-Encoding": "gzip"}).data
+
+        thumbnail_bytes = {
+            (extension, width): sum(os.path.getsize(os.path.join(thumbnail_dir, thumbnail_name(
+                file_digest(os.path.join(image_dir, name)), width, extension))) for name in images)
+            for width in args.widths for extension in ("webp", "jpg")
+        }
+
+    print(f"Render time per page ({len(cards)} cards)")
+    print(f"  compiled per request {1e6 * uncompiled / args.renders:>10.1f} us")
+    print(f"  cached template      {1e6 * compiled / args.renders:>10.1f} us")
+    print("HTML bytes")
+    print(f"  uncompressed {len(plain):>10}")
+    print(f"  gzip         {len(compressed):>10}")
+
+    print("Image bytes per page")
+    original = sum(os.path.getsize(os.path.join(image_dir, name)) for name in images)
+    print(f"  original PNG {original:>10}")
+    for (extension, width), size in thumbnail_bytes.items():
+        print(f"  {extension:<4} {width:>4}w    {size:>10}")
+
+
+if __name__ == '__main__':
+    main()
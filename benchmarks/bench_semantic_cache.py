@@ -0,0 +1,143 @@
+"""
+bench_semantic_cache.py
+
+Benchmark for the semantic cache of the LLM answers.
+
+Customers are simulated by the questionnaire of user_data.py with answers which are varied in case,
+punctuation and filler words, so their prompts are paraphrases of each other. The profile of every
+customer is generated by llm.LLM with the fake chat model of fakes.py and a bag-of-words embedding,
+with and without the semantic cache. The hit rate, the generation time saved and the time of a cache
+lookup for a growing number of cached prompts are reported.
+
+Usage:
+    python benchmarks/bench_semantic_cache.py --customers 50 --llm-latency 0.2 --threshold 0.95
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from benchmarks.fakes import FakeChatModel
+from llm import LLM
+import llm_history
+from llm_history import SessionStore
+import resources
+from semantic_cache import SemanticCache
+import user_data
+
+fillers = ["", "I think ", "Ideally ", "Probably "]
+
+
+def word_embedding(texts, dimension=1024):
+    """
+    Embedding function counting the hashed words of the texts, so paraphrases with the same words are similar.
+    """
+    vectors = []
+    for text in texts:
+        vector = np.zeros(dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.sha256(word.encode("utf-8")).hexdigest(), 16) % dimension] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+def paraphrase(answer, rng):
+    """
+    Vary the case, the punctuation and the filler words of an answer.
+    """
+    answer = rng.choice(fillers) + answer
+    answer = answer.lower() if rng.random() < 0.5 else answer
+    return answer.rstrip(".") + rng.choice(["", ".", "!"])
+
+
+def run(customers, llm_latency, cache, seed):
+    """
+    Generate the profiles of the customers.
+
+    Args:
+        customers (int): Number of customers.
+        llm_latency (float): Seconds of every call of the fake chat model.
+        cache (SemanticCache): The semantic cache, None to call the model every time.
+        seed (int): Seed of the paraphrases.
+
+    Returns:
+        float: Wall time in seconds.
+    """
+    resources.registry.clear()
+    resources.registry.get("history_store", lambda: SessionStore(max_sessions=10, ttl=3600))
+    resources.registry.get(("semantic_cache", True), lambda: cache)
+    with patch("llm.ChatOpenAI", return_value=FakeChatModel(first_token_latency=llm_latency)):
+        real_estate_llm = LLM(open_ai=True)
+
+    rng = random.Random(seed)
+    questions, answers = user_data.get_info()
+    start = time.perf_counter()
+    for _ in range(customers):
+        history_dic = {"questions": questions, "answers": [paraphrase(answer, rng) for answer in answers]}
+        session_id = llm_history.new_session_id()
+        try:
+            real_estate_llm.conversation(history_dic, session_id=session_id)
+        finally:
+            llm_history.delete_session(session_id)
+    elapsed = time.perf_counter() - start
+    resources.registry.clear()
+    return elapsed
+
+
+def lookup_time(directory, entries, runs=200):
+    """
+    Time of a lookup in a partition with the given number of cached prompts.
+    """
+    cache = SemanticCache(word_embedding, path=os.path.join(directory, f"lookup-{entries}.sqlite3"),
+                          max_entries=entries)
+    rng = np.random.default_rng(0)
+    for _ in range(entries):
+        vector = rng.standard_normal(1024).astype(np.float32)
+        cache.put("profile", "partition", vector / np.linalg.norm(vector), "profile", 1.0)
+    vector = cache.embed("three bedrooms and a garden")
+    start = time.perf_counter()
+    for _ in range(runs):
+        cache.get("profile", "partition", vector)
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Hit rate and saved time of the semantic cache")
+    arg_parser.add_argument("--customers", type=int, default=50, help="Simulated customers (default: 50)")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per LLM call (default: 0.2)")
+    arg_parser.add_argument("--threshold", type=float, default=0.95, help="Similarity threshold (default: 0.95)")
+    arg_parser.add_argument("--entries", type=int, nargs="+", default=[100, 1000, 10000],
+                            help="Cached prompts of the lookup timing (default: 100 1000 10000)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the paraphrases (default: 0)")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uncached = run(args.customers, args.llm_latency, None, args.seed)
+        cache = SemanticCache(word_embedding, path=os.path.join(directory, "semantic.sqlite3"),
+                              threshold=args.threshold)
+        cached = run(args.customers, args.llm_latency, cache, args.seed)
+        stats = cache.stats().get("profile", {"hits": 0, "misses": 0, "seconds_saved": 0.0, "hit_rate": 0.0})
+
+        print(f"Profiles of {args.customers} customers, threshold {args.threshold}:")
+        print(f"  without cache: {uncached:8.2f} s")
+        print(f"  with cache:    {cached:8.2f} s")
+        print(f"  hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.1%}, "
+              f"generation time saved {stats['seconds_saved']:.2f} s")
+
+        print("Lookup time per cached prompts:")
+        for entries in args.entries:
+            print(f"  {entries:8} {lookup_time(directory, entries) * 1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+bench_startup.py
+
+Benchmark for the startup of the web server.
+
+The import of server.py is profiled with `python -X importtime` and the modules with the largest
+cumulative import time are listed. The time to the first response is measured from starting a
+process with the server until the form at "/" is answered. Modules of the recommendation pipeline
+(LangChain, ChromaDB, torch, ...) must not be imported before the first recommendation request.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5 --budget 1.0
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# top-level packages which are only needed to compute recommendations
+heavy_modules = ("llm", "database", "langchain", "langchain_core", "langchain_openai", "langchain_ollama",
+                 "chromadb", "torch", "open_clip", "numpy", "PIL")
+
+serve_script = """
+import sys
+from werkzeug.serving import make_server
+import server
+make_server("127.0.0.1", int(sys.argv[1]), server.app, threaded=True).serve_forever()
+"""
+
+
+def import_times(module="server", top=15):
+    """
+    Profile the import of a module with -X importtime in a new process.
+
+    Args:
+        module (str): The module.
+        top (int): Number of modules in the result.
+
+    Returns:
+        tuple: Total seconds of the import and (seconds, module) of the slowest imports by cumulative time.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             cwd=root, capture_output=True, text=True, check=True)
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative) / 1e6, name.strip()))
+    total = next(seconds for seconds, name in reversed(entries) if name == module)
+    return total, sorted(entries, reverse=True)[:top]
+
+
+def loaded_modules(module="server"):
+    """
+    Top-level packages of the recommendation pipeline which are loaded after importing a module and getting "/".
+
+    Args:
+        module (str): The module.
+
+    Returns:
+        list[str]: The loaded packages.
+    """
+    script = (f"import sys\nimport {module}\n{module}.app.test_client().get('/')\n"
+              f"print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy_modules!r}))))")
+    process = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    # the loggers write to stdout as well, the packages are on the last line
+    return process.stdout.splitlines()[-1].split()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(timeout=60.0):
+    """
+    Start the server in a new process and measure the time until "/" is answered.
+
+    Args:
+        timeout (float): Maximum seconds to wait for the server.
+
+    Returns:
+        float: Seconds from starting the process to the first response.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", serve_script, str(port)], cwd=root,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    response.read()
+                    return time.perf_counter() - start
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {process.returncode}")
+                time.sleep(0.01)
+        raise TimeoutError(f"No response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Import time and time to first response of the server")
+    arg_parser.add_argument("--runs", type=int, default=5, help="Number of server starts (default: 5)")
+    arg_parser.add_argument("--top", type=int, default=15, help="Number of listed imports (default: 15)")
+    arg_parser.add_argument("--budget", type=float,
+                            help="Fail if the median time to the first response exceeds this many seconds")
+    args = arg_parser.parse_args()
+
+    total, slowest = import_times(top=args.top)
+    print(f"import server: {total * 1000:.0f} ms")
+    for seconds, name in slowest:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    heavy = loaded_modules()
+    print(f"Pipeline modules loaded for the form: {', '.join(heavy) if heavy else 'none'}")
+
+    times = [time_to_first_response() for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f"Time to first response: median {median * 1000:.0f} ms, min {min(times) * 1000:.0f} ms, "
+          f"max {max(times) * 1000:.0f} ms over {args.runs} starts")
+
+    if heavy or (args.budget is not None and median > args.budget):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+bench_vector_store.py
+
+Benchmark of the similarity search of the ChromaDB and the numpy backend of database.Database.
+
+Random normalized vectors with the typed metadata of the listings are added to a ChromaDB collection
+and to a NumpyCollection of vector_store.py. The p50/p95 latency of single queries, of batches of
+queries and of queries with a `where` filter are reported per catalog size, with the recall@k of
+ChromaDB's approximate search against the exact search of the numpy backend.
+
+Usage:
+    python benchmarks/bench_vector_store.py --listings 1000 10000 50000 --dimension 3072 -k 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import chromadb
+import numpy as np
+
+from vector_store import NumpyClient, normalize
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1e3
+
+
+def timed(function, queries):
+    """
+    Latency of a search function for every query.
+
+    Returns:
+        tuple[list[float], list]: Seconds and result of every query.
+    """
+    seconds, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(function(query))
+        seconds.append(time.perf_counter() - start)
+    return seconds, results
+
+
+def fill(collection, vectors, metadatas, batch_size):
+    ids = [f"listing-{index}" for index in range(len(vectors))]
+    for start in range(0, len(vectors), batch_size):
+        end = start + batch_size
+        collection.upsert(ids=ids[start:end], embeddings=vectors[start:end], metadatas=metadatas[start:end],
+                          documents=[f"Listing {index}" for index in range(start, min(end, len(vectors)))])
+
+
+def run(directory, listings, dimension, k, queries, batch):
+    """
+    Build both backends with the same vectors and measure their searches.
+
+    Returns:
+        dict: Latencies in ms per backend and kind of search, and the recall@k of ChromaDB.
+    """
+    rng = np.random.default_rng(listings)
+    vectors = normalize(rng.standard_normal((listings, dimension)))
+    metadatas = [{"bedrooms": int(rng.integers(1, 6)), "price": int(rng.integers(200, 2000)) * 1000}
+                 for _ in range(listings)]
+    query_vectors = normalize(rng.standard_normal((queries, dimension)))
+    where = {"$and": [{"bedrooms": {"$gte": 3}}, {"price": {"$lte": 800000}}]}
+
+    chroma_client = chromadb.PersistentClient(path=os.path.join(directory, f"chroma-{listings}"))
+    chroma = chroma_client.get_or_create_collection(f"bench_{listings}")
+    start = time.perf_counter()
+    fill(chroma, vectors, metadatas, min(5000, chroma_client.get_max_batch_size()))
+    chroma_ingest = time.perf_counter() - start
+
+    numpy_collection = NumpyClient(os.path.join(directory, f"numpy-{listings}")).get_or_create_collection("bench")
+    start = time.perf_counter()
+    fill(numpy_collection, vectors, metadatas, 5000)
+    numpy_ingest = time.perf_counter() - start
+
+    report = {"ingest": {"chroma": chroma_ingest, "numpy": numpy_ingest}}
+    batches = [query_vectors[start:start + batch] for start in range(0, queries, batch)]
+    exact = None
+    for name, collection in (("numpy", numpy_collection), ("chroma", chroma)):
+        single, results = timed(lambda query: collection.query(query_embeddings=query[None, :], n_results=k,
+                                                               include=["distances"]), query_vectors)
+        batched, _ = timed(lambda queries: collection.query(query_embeddings=queries, n_results=k,
+                                                            include=["distances"]), batches)
+        filtered, _ = timed(lambda query: collection.query(query_embeddings=query[None, :], n_results=k, where=where,
+                                                           include=["distances"]), query_vectors)
+        ids = [result["ids"][0] for result in results]
+        if exact is None:
+            exact = ids
+        recall = np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(ids, exact)])
+        report[name] = {
+            "single_p50": percentile(single, 50), "single_p95": percentile(single, 95),
+            "batch_per_query": percentile(batched, 50) / batch,
+            "filtered_p50": percentile(filtered, 50), "filtered_p95": percentile(filtered, 95),
+            "recall": recall,
+        }
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Search latency of the ChromaDB and the numpy backend")
+    arg_parser.add_argument("--listings", type=int, nargs="+", default=[1000, 10000, 50000],
+                            help="Catalog sizes (default: 1000 10000 50000)")
+    arg_parser.add_argument("--dimension", type=int, default=3072,
+                            help="Dimension of the vectors, 3072 for text-embedding-3-large (default: 3072)")
+    arg_parser.add_argument("-k", type=int, default=10, help="Results per query (default: 10)")
+    arg_parser.add_argument("--queries", type=int, default=200, help="Queries per catalog size (default: 200)")
+    arg_parser.add_argument("--batch", type=int, default=20, help="Queries per batched query (default: 20)")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for listings in args.listings:
+            report = run(directory, listings, args.dimension, args.k, args.queries, args.batch)
+            print(f"{listings} listings, dimension {args.dimension}, k={args.k}: ingest chroma "
+                  f"{report['ingest']['chroma']:.1f} s, numpy {report['ingest']['numpy']:.1f} s, "
+                  f"matrix {listings * args.dimension * 4 / 2**20:.0f} MiB")
+            print(f"  {'backend':8} {'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>11} {'where p50':>10} "
+                  f"{'where p95':>10} {'recall':>7}")
+            for name in ("chroma", "numpy"):
+                row = report[name]
+                print(f"  {name:8} {row['single_p50']:8.2f} {row['single_p95']:8.2f} {row['batch_per_query']:11.3f} "
+                      f"{row['filtered_p50']:10.2f} {row['filtered_p95']:10.2f} {row['recall']:7.1%}")
+
+
+if __name__ == "__main__":
+    main()
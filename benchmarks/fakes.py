@@ -0,0 +1,181 @@
+"""
+fakes.py
+
+Deterministic stand-ins for the LLM and the embedding models, so the recommendation pipeline can be
+measured offline without paying for API calls.
+
+- FakeChatModel: LangChain chat model which answers the profile, description and structured
+  description prompts of llm.LLM with text derived from the prompt. It sleeps for a configurable
+  time to the first token and per token, and supports streaming and async calls.
+- FakeEmbeddingFunction: ChromaDB embedding function for texts and images, returning normalized
+  vectors derived from a hash of the input after a configurable latency.
+- fake_backends(): context manager which makes LLM() and Database() use the fakes.
+- write_dataset(): synthetic listings of generate_listings.py with a small pool of placeholder images.
+
+Usage:
+    with fake_backends(llm_latency=0.5, token_latency=0.01, embedding_latency=0.05):
+        images, descriptions, ids = llm.get_results(answers)
+"""
+
+import asyncio
+from contextlib import contextmanager
+import hashlib
+import os
+import re
+import time
+from unittest.mock import patch
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from generate_listings import write_listings, write_placeholder_images
+
+
+def _tokens(text):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering the prompts of llm.LLM deterministically after an artificial latency.
+    """
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _answer(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "available real estates" in prompt:
+            listings = [block for block in prompt.split("-------------------------------") if "Neighborhood:" in block]
+            return "\n\n".join(f"**{index}. {self._neighborhood(block)}** {self._description(block)}"
+                               for index, block in enumerate(listings, start=1))
+        # the answers of the customer, without the final instruction
+        answers = " ".join(str(message.content) for message in messages if message.type == "human")
+        answers = answers[:-len(str(messages[-1].content))].strip() if messages[-1].type == "human" else answers
+        if "visual aspects" in prompt:
+            return f"Visual profile: {answers}"
+        return f"Profile of the customer: {answers}"
+
+    @staticmethod
+    def _neighborhood(text):
+        match = re.search(r"Neighborhood: (.*)", text)
+        return match.group(1).strip() if match else "House"
+
+    def _description(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        return (f"This home in {self._neighborhood(text)} matches the wishes of the customer ({digest}). "
+                "It offers the space, the neighborhood and the style the customer asked for.")
+
+    @staticmethod
+    def _usage(messages, text):
+        # whitespace separated words as a stand-in for tokens
+        input_tokens = sum(len(_tokens(str(message.content))) for message in messages)
+        output_tokens = len(_tokens(text))
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._answer(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(_tokens(text)))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._answer(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(_tokens(text)))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        text = self._answer(messages)
+        for token in _tokens(text):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+    def with_structured_output(self, schema, **kwargs):
+        def describe(prompt):
+            text = prompt.to_string()
+            description = self._description(text)
+            time.sleep(self.first_token_latency + self.token_latency * len(_tokens(description)))
+            return schema(description=description)
+        return RunnableLambda(describe)
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """
+    Embedding function for texts and images returning deterministic normalized vectors.
+    """
+
+    def __init__(self, dimension=512, latency=0.0, per_item_latency=0.0):
+        """
+        Initialize the embedding function.
+
+        Args:
+            dimension (int): Dimension of the vectors.
+            latency (float): Seconds per call.
+            per_item_latency (float): Additional seconds per embedded input.
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+
+    def __call__(self, input):
+        time.sleep(self.latency + self.per_item_latency * len(input))
+        vectors = []
+        for item in input:
+            data = item.encode("utf-8") if isinstance(item, str) else np.asarray(item)[::8, ::8].tobytes()
+            seed = int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+
+@contextmanager
+def fake_backends(llm_latency=0.0, token_latency=0.0, embedding_latency=0.0, dimension=512):
+    """
+    Make LLM() use FakeChatModel and Database() use FakeEmbeddingFunction for texts and images.
+
+    Args:
+        llm_latency (float): Seconds until the first token of every LLM call.
+        token_latency (float): Seconds per generated token.
+        embedding_latency (float): Seconds per call of the embedding functions.
+        dimension (int): Dimension of the embedding vectors.
+    """
+    chat_model = FakeChatModel(first_token_latency=llm_latency, token_latency=token_latency)
+    embedding_text = FakeEmbeddingFunction(dimension=dimension, latency=embedding_latency)
+    embedding_image = FakeEmbeddingFunction(dimension=dimension, latency=embedding_latency)
+    with patch("llm.ChatOpenAI", return_value=chat_model), \
+            patch("llm.ChatOllama", return_value=chat_model), \
+            patch("database.embedding_functions.OpenAIEmbeddingFunction", return_value=embedding_text), \
+            patch("database.embedding_functions.OllamaEmbeddingFunction", return_value=embedding_text), \
+            patch("database.embedding_functions.OpenCLIPEmbeddingFunction", return_value=embedding_image):
+        yield
+
+
+def write_dataset(directory, count, seed=0, images=16, image_size=64):
+    """
+    Write synthetic listings of generate_listings.py to a JSONL file and the placeholder images they point to.
+
+    Args:
+        directory (str): Target directory.
+        count (int): Number of listings.
+        seed (int): Seed of the dataset.
+        images (int): Number of placeholder images.
+        image_size (int): Side length of the placeholder images.
+
+    Returns:
+        str: Path of the JSONL file.
+    """
+    image_dir = os.path.join(directory, "house_images")
+    write_placeholder_images(image_dir, images, size=image_size, seed=seed)
+    path = os.path.join(directory, f"listings-{count}.jsonl")
+    write_listings(path, count, seed=seed, images=images, image_dir=image_dir)
+    return path
@@ -0,0 +1,115 @@
+"""
+load_test.py
+
+Local load test of the web server with a simulated recommendation pipeline.
+
+The server runs in this process on a threaded WSGI server, and the pipeline is replaced by a fake
+which sleeps for the LLM and embedding latencies while holding the stage limits. Clients post the
+form at increasing concurrency; the report shows the throughput, the latency percentiles of the
+successful requests and how many requests were rejected with 503, and how fast.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1 4 16 64 --max-active 8 --max-queue 16
+"""
+
+import argparse
+import configparser
+import http.client
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from werkzeug.serving import make_server
+
+import resources
+import server
+
+FORM = urlencode({"size": "3 bedrooms", "priorities": "garden", "amenities": "pool", "transport": "bus",
+                  "urban": "suburban", "style": "modern"})
+
+
+def make_fake_get_results(llm_latency, embedding_latency):
+    """Pipeline with two profile calls, two query embeddings and one description call."""
+    def fake_get_results(answers):
+        for _ in range(2):
+            with resources.get_stage_limit("llm"):
+                time.sleep(llm_latency)
+        with resources.get_stage_limit("embedding_text"):
+            time.sleep(embedding_latency)
+        with resources.get_stage_limit("embedding_image"):
+            time.sleep(embedding_latency)
+        with resources.get_stage_limit("llm"):
+            time.sleep(2 * llm_latency)
+        return ["house_images/0.png"], ["A nice house"], ["listing-0"]
+    return fake_get_results
+
+
+def post(port):
+    """Post the form and return (status, seconds)."""
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    connection.request("POST", "/results", body=FORM, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    status = connection.getresponse().status
+    connection.close()
+    return status, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load test of the web server")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="Concurrent clients")
+    arg_parser.add_argument("--requests", type=int, default=4, help="Requests per client (default: 4)")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per simulated LLM call (default: 0.2)")
+    arg_parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per simulated embedding (default: 0.05)")
+    arg_parser.add_argument("--max-active", type=int, default=8, help="Requests running at once (default: 8)")
+    arg_parser.add_argument("--max-queue", type=int, default=16, help="Requests waiting for a slot (default: 16)")
+    arg_parser.add_argument("--llm-limit", type=int, default=8, help="Concurrent LLM calls (default: 8)")
+    args = arg_parser.parse_args()
+
+    settings = configparser.ConfigParser()
+    settings.read_dict({
+        "server": {"streaming": "false", "compression": "false"},
+        "limits": {"max_active": str(args.max_active), "max_queue": str(args.max_queue), "queue_timeout": "60",
+                   "llm": str(args.llm_limit)},
+    })
+
+    with patch("resources.get_settings", return_value=settings), \
+            patch("server.get_results", side_effect=make_fake_get_results(args.llm_latency, args.embedding_latency)):
+        resources.registry.clear()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        port = http_server.server_port
+
+        print(f"{'clients':>8} {'ok':>6} {'503':>6} {'ok/s':>8} {'p50 s':>8} {'p99 s':>8} {'503 p99 s':>10}")
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda _: post(port), range(concurrency * args.requests)))
+            elapsed = time.perf_counter() - start
+
+            ok = [seconds for status, seconds in results if status == 303]
+            rejected = [seconds for status, seconds in results if status == 503]
+            print(f"{concurrency:>8} {len(ok):>6} {len(rejected):>6} {len(ok) / elapsed:>8.2f} "
+                  f"{statistics.median(ok) if ok else float('nan'):>8.3f} {percentile(ok, 0.99):>8.3f} "
+                  f"{percentile(rejected, 0.99):>10.3f}")
+
+        http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+compression.py
+
+This module compresses the text responses of the web server with gzip.
+
+Complete responses are compressed at once if they are large enough. Streamed responses are
+compressed chunk by chunk with a sync flush after every chunk, so every house card still reaches
+the browser as soon as it is generated.
+"""
+
+import gzip
+import zlib
+
+compressible_types = ("text/html", "text/plain", "text/css", "application/javascript", "application/json")
+
+
+def accepts_gzip(request):
+    """
+    Check whether the client accepts gzip encoded responses.
+
+    Args:
+        request (flask.Request): The request.
+
+    Returns:
+        bool: True if gzip is accepted.
+    """
+    return request.accept_encodings["gzip"] > 0
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress a stream of chunks, flushing the compressor after every chunk.
+
+    Args:
+        chunks (iterable[bytes | str]): Chunks of the response body.
+        level (int): Compression level from 1 (fastest) to 9 (smallest).
+
+    Yields:
+        bytes: Chunks of the gzip stream.
+    """
+    # wbits 16 + MAX_WBITS writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # e.g. the request context of a streamed template is released on close
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(request, response, level=6, min_size=500):
+    """
+    Compress a response with gzip if the client accepts it and the content type benefits from it.
+
+    Args:
+        request (flask.Request): The request.
+        response (flask.Response): The response.
+        level (int): Compression level from 1 (fastest) to 9 (smallest).
+        min_size (int): Complete responses smaller than this number of bytes are sent uncompressed.
+
+    Returns:
+        flask.Response: The response, compressed or unchanged.
+    """
+    if response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in compressible_types:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if not accepts_gzip(request):
+        return response
+
+    if response.is_streamed:
+        response.response = gzip_stream(response.response, level=level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level))
+
+    response.headers["Content-Encoding"] = "gzip"
+    return response
@@ -0,0 +1,95 @@
+"""
+constraints.py
+
+This module extracts hard constraints on price, bedrooms, bathrooms and house size from the answers
+of the questionnaire and converts them into ChromaDB `where` filters on the typed listing metadata.
+
+Examples of recognized constraints:
+- "a three-bedroom house", "at least 2 bathrooms", "no more than 4 bedrooms"
+- "under $800,000", "budget of 1.2 million", "between $500k and $700k"
+- "at least 2000 sqft", "up to 1500 square feet"
+"""
+
+import re
+
+from listings import parse_number
+from recommendation_cache import normalize_answer
+
+upper_words = r"(?:under|below|less than|at most|up to|no more than|not more than|maximum|max|budget of|budget)"
+lower_words = r"(?:over|above|more than|at least|no less than|minimum|min)"
+# amounts with a currency sign or a magnitude suffix, to tell prices apart from other numbers
+amount = r"(?:\$\s*\d[\d.]*(?:\s*(?:k|thousand|m|million)\b)?|\d[\d.]*\s*(?:k|thousand|million)\b|\d[\d.]*\$)"
+
+room_patterns = {
+    "bedrooms": r"(?:bed\s?rooms?|beds?|br)\b",
+    "bathrooms": r"(?:bath\s?rooms?|baths?|ba)\b",
+}
+size_pattern = r"(?:sq\.?\s?ft|sqft|square\s?feet|square\s?foot|sf)\b"
+
+
+def _bound(qualifier):
+    if qualifier and re.fullmatch(upper_words, qualifier):
+        return "$lte"
+    return "$gte"
+
+
+def _merge(constraints, field, operator, value):
+    bounds = constraints.setdefault(field, {})
+    if operator == "$gte":
+        bounds[operator] = max(value, bounds.get(operator, value))
+    else:
+        bounds[operator] = min(value, bounds.get(operator, value))
+
+
+def extract_constraints(answers):
+    """
+    Extract constraints on the numeric listing fields from the answers.
+
+    Room counts without qualifier are treated as a minimum, prices without qualifier as a maximum.
+
+    Args:
+        answers (list): List of user answers.
+
+    Returns:
+        dict: Mapping from metadata field to bounds, e.g. {"bedrooms": {"$gte": 3}}.
+    """
+    constraints = {}
+    text = " ".join(normalize_answer(answer) for answer in answers)
+
+    for field, unit in room_patterns.items():
+        for qualifier, number in re.findall(rf"(?:({upper_words}|{lower_words})\s+)?(\d+)\s*\+?\s*{unit}", text):
+            _merge(constraints, field, _bound(qualifier), int(number))
+
+    def between(match):
+        _merge(constraints, "price", "$gte", parse_number(match.group(1)))
+        _merge(constraints, "price", "$lte", parse_number(match.group(2)))
+        return " "
+
+    text = re.sub(rf"between\s+({amount})\s+and\s+({amount})", between, text)
+    for qualifier, value in re.findall(rf"(?:({upper_words}|{lower_words})\s+)?({amount})", text):
+        operator = "$gte" if qualifier and re.fullmatch(lower_words, qualifier) else "$lte"
+        _merge(constraints, "price", operator, parse_number(value))
+
+    for qualifier, number in re.findall(rf"(?:({upper_words}|{lower_words})\s+)?(\d+)\s*{size_pattern}", text):
+        _merge(constraints, "house_size", _bound(qualifier), int(number))
+
+    return constraints
+
+
+def to_where(constraints):
+    """
+    Convert constraints into a ChromaDB `where` filter.
+
+    Args:
+        constraints (dict): Mapping from metadata field to bounds.
+
+    Returns:
+        dict | None: The filter, None if there are no constraints.
+    """
+    clauses = [{field: {operator: value}} for field, bounds in sorted(constraints.items())
+               for operator, value in sorted(bounds.items())]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
@@ -1,41 +1,50 @@
 """
-create_images.py
+create_images_dalle.py
 
 This script generates realistic real estate images for property listings using OpenAI's GPT and DALL-E models.
-It reads property data from a JSON file, creates vivid image prompts with GPT, generates images via DALL-E,
+It reads property data from a JSON or JSONL file, creates vivid image prompts with GPT, generates images via DALL-E,
 saves the images locally, and updates the dataset with image paths.
 
+The listings are processed by a pool of workers with rate limited and retried API calls (generation_jobs.py).
+Finished listings are recorded in a checkpoint file, so an interrupted run continues where it stopped. Images are
+named by the hash of the listing, so listings in the same neighborhood with the same number of bedrooms don't
+overwrite each other's images.
+
 Usage:
-    python create_images.py
+    python create_images_dalle.py --workers 4 --rate 0.5
 
 Dependencies:
     - openai
-    - langchain_community
-    - scikit-image
     - data/data.json (input dataset)
 """
 
+import argparse
 import json
 import os
-from openai import OpenAI
-from langchain_community.utilities.dalle_image_generator import DallEAPIWrapper
-from skimage import io
+import urllib.request
+
+from generation_jobs import Checkpoint, JobRunner, output_name
+from listings import content_hash, iter_listings
+from logger_config import Logger
+logger = Logger(name="CreateImagesDalle").get_logger()
 
-# Initialize OpenAI clients
-client = OpenAI()
-prompt_client = OpenAI()
+# System prompt to instruct GPT to generate a DALL-E prompt
+system_prompt = """You are a generator for DALL-E prompts. Rewrite the following house description as a short, vivid prompt for DALL·E,
+               suitable for a professional real estate catalog photo.
+               Include architectural style, atmosphere, lighting, and outdoor features, but do NOT include text in the image."""
 
-# Load your dataset
-with open("data/data.json", "r") as f:
-    data = json.load(f)
 
-output_dir = "house_images"
-os.makedirs(output_dir, exist_ok=True)
+def house_prompt(house):
+    """
+    Build the description of a house from which the DALL-E prompt is written.
 
-for house in data["RealEstateObj"]:
-    # 1. Create a good image generation prompt with a chat model
-    # Build prompt from data
-    prompt = (
+    Args:
+        house (dict): The listing.
+
+    Returns:
+        str: The description.
+    """
+    return (
         f"A realistic real estate photo of a {house['Bedrooms']}-bedroom, "
         f"{house['Bathrooms']}-bathroom home in {house['Neighborhood']}, "
         f"about {house['HouseSize']} sqft. "
@@ -44,33 +53,103 @@ for house in data["RealEstateObj"]:
         f"Photo should be from outside."
     )
 
-    # System prompt to instruct GPT to generate a DALL-E prompt
-    system_promt = """You are a generator for DALL-E prompts. Rewrite the following house description as a short, vivid prompt for DALL·E,
-               suitable for a professional real estate catalog photo. 
-               Include architectural style, atmosphere, lighting, and outdoor features, but do NOT include text in the image."""
 
-    # Create image prompt using GPT
+def image_prompt(client, house):
+    """
+    Create the image prompt of a house using GPT.
+
+    Args:
+        client (openai.OpenAI): The OpenAI client.
+        house (dict): The listing.
+
+    Returns:
+        str: The image prompt.
+    """
     response = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": system_promt},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": house_prompt(house)}
         ]
     )
+    return response.choices[0].message.content
+
+
+def generate_image(client, prompt, filename):
+    """
+    Generate an image with DALL-E and save it.
+
+    Args:
+        client (openai.OpenAI): The OpenAI client.
+        prompt (str): The image prompt.
+        filename (str): Path of the image.
+    """
+    response = client.images.generate(model="dall-e-3", prompt=prompt, n=1, size="1024x1024")
+    with urllib.request.urlopen(response.data[0].url, timeout=60) as image:
+        data = image.read()
+
+    # write to a temporary file first, so an interrupted run leaves no broken image
+    temporary = f"{filename}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, filename)
+
+
+def create_images(houses, client, runner, output_dir="house_images"):
+    """
+    Generate the images of all listings which are not in the checkpoint of the runner.
+
+    Args:
+        houses (iterable): The listings.
+        client (openai.OpenAI): The OpenAI client.
+        runner (JobRunner): Runner of the jobs.
+        output_dir (str): Directory of the images.
+
+    Returns:
+        list[dict]: The listings with an image, with 'ImagePath' added.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def job(house):
+        filename = os.path.join(output_dir, output_name(house))
+        if not os.path.exists(filename):
+            prompt = runner.call(image_prompt, client, house)
+            logger.info(f"Create image for {house['Neighborhood']}")
+            runner.call(generate_image, client, prompt, filename)
+        return {"ImagePath": filename}
+
+    def valid(house, result):
+        # images which were deleted or written to another output directory are generated again
+        filename = os.path.join(output_dir, output_name(house))
+        return result.get("ImagePath") == filename and os.path.exists(filename)
+
+    jobs = ((f"listing-{content_hash(house)[:32]}", house) for house in houses)
+    return [{**house, **result} for _, house, result in runner.run(job, jobs, valid=valid)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate images of the listings with DALL-E")
+    arg_parser.add_argument("--data-file", default="data/data.json", help="JSON or JSONL file with the listings (default: data/data.json)")
+    arg_parser.add_argument("--output-dir", default="house_images", help="Directory of the images (default: house_images)")
+    arg_parser.add_argument("--output-file", default="houses_with_images.json", help="Dataset with image paths (default: houses_with_images.json)")
+    arg_parser.add_argument("--checkpoint", default=".cache/create_images_dalle.jsonl", help="File of the finished listings")
+    arg_parser.add_argument("--workers", type=int, default=4, help="Listings processed at once (default: 4)")
+    arg_parser.add_argument("--rate", type=float, default=1.0, help="API calls per second (default: 1.0)")
+    arg_parser.add_argument("--retries", type=int, default=5, help="Retries of a failed API call (default: 5)")
+    args = arg_parser.parse_args()
 
-    image_prompt = response.choices[0].message.content
+    from openai import OpenAI
 
-    # 2. Call DallE with langchain wrapper (OpenAI API had problems with the used api key)
-    image_url = DallEAPIWrapper().run(image_prompt)
-    image_data = io.imread(image_url)
+    # retries are done by the runner, which also respects the rate limit
+    client = OpenAI(max_retries=0)
+    runner = JobRunner(workers=args.workers, rate=args.rate, retries=args.retries, checkpoint=Checkpoint(args.checkpoint))
+    houses = create_images(iter_listings(args.data_file), client, runner, output_dir=args.output_dir)
 
-    # Save image to output directory
-    filename = os.path.join(output_dir, f"{house['Neighborhood'].lower()}_{house['Bedrooms']}br.png")
-    io.imsave(filename, image_data)
+    # Save updated dataset with image paths
+    with open(args.output_file, "w") as f:
+        json.dump({"RealEstateObj": houses}, f, indent=2)
+    logger.info(f"Wrote {len(houses)} listings to {args.output_file}, {runner.stats['failed']} failed")
 
-    # Add image path to JSON entry
-    house["ImagePath"] = filename
 
-# Save updated dataset with image paths
-with open("houses_with_images.json", "w") as f:
-    json.dump(data, f, indent=2)
+if __name__ == '__main__':
+    main()
@@ -2,77 +2,258 @@
 create_images_diff.py
 
 This script generates images for real estate listings using Stable Diffusion.
-It reads real estate data from a JSON file, generates a short vivid prompt for each listing using a language model,
-and then uses Stable Diffusion to create and save an image for each listing. The image path is added to the dataset.
+It reads real estate data from a JSON or JSONL file, generates a short vivid prompt for each listing using a language model,
+and then uses Stable Diffusion to create and save an image for each listing.
+
+The Stable Diffusion pipeline is loaded once and renders the prompts in batches. Images which already exist are
+skipped, so an interrupted run can be resumed. With --cpu the pipeline runs in float32 with fewer steps and a
+smaller resolution, which is feasible without a GPU. The time per image is logged after every batch.
+The image prompts are written by a pool of workers with rate limited and retried calls, and recorded in a
+checkpoint file (generation_jobs.py).
+
+Usage:
+    python create_images_diff.py --data-file data/data.json --batch-size 4
+    python create_images_diff.py --cpu --steps 15 --size 384
 """
 
-import json
+import argparse
 import os
-from openai import OpenAI
-from diffusers import StableDiffusionPipeline
-import torch
+import time
 
+from generation_jobs import Checkpoint, JobRunner
+from listings import content_hash, iter_listings
 from logger_config import Logger
 logger = Logger(name="CreateImages").get_logger()
 
+model_id = "stable-diffusion-v1-5/stable-diffusion-v1-5"
+
+system_prompt = """You are a generator for image generation prompts. Rewrite the following house description as a short vivid prompt,
+        suitable for a professional real estate catalog photo. The houses should have different colors and styles. The prompt must be short
+        so it fits the 77 token limit of CLIP."""
+
+# inference steps and image size without a GPU
+cpu_steps = 20
+cpu_size = 384
+
+
+def house_prompt(house):
+    """
+    Build the description of a house from which the image prompt is written.
+
+    Args:
+        house (dict): The listing.
+
+    Returns:
+        str: The description.
+    """
+    return (
+        f"A realistic real estate photo (exterior) of a {house['Bedrooms']}-bedroom, "
+        f"{house['Bathrooms']}-bathroom home in {house['Neighborhood']}, "
+        f"about {house['HouseSize']} sqft. "
+        f"{house['Description']} Neighborhood: {house['NeighborhoodDescription']}. "
+    )
+
+
+def image_prompt(client, house):
+    """
+    Generate a concise, vivid prompt for image generation using a chat model.
+
+    Args:
+        client (openai.OpenAI): The OpenAI client.
+        house (dict): The listing.
+
+    Returns:
+        str: The image prompt.
+    """
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": house_prompt(house)}
+        ]
+    )
+    return response.choices[0].message.content
+
+
+def load_pipeline(model=model_id, cpu=False):
+    """
+    Load the Stable Diffusion pipeline.
+
+    Args:
+        model (str): Name of the model on the Hugging Face hub or a local path.
+        cpu (bool): Run on the CPU in float32, otherwise in float16 on the GPU if there is one.
+
+    Returns:
+        diffusers.StableDiffusionPipeline: The pipeline.
+    """
+    # imported here, so the script can be imported and tested without torch and diffusers
+    import torch
+    from diffusers import StableDiffusionPipeline
+
+    use_gpu = not cpu and torch.cuda.is_available()
+    logger.info(f"Load {model} on {'cuda' if use_gpu else 'cpu'}")
+    pipe = StableDiffusionPipeline.from_pretrained(model, torch_dtype=torch.float16 if use_gpu else torch.float32)
+    if use_gpu:
+        pipe = pipe.to("cuda")
+    else:
+        # lower peak memory at little cost on the CPU
+        pipe.enable_attention_slicing()
+    return pipe
+
+
+def pending_houses(houses, output_dir, skip_existing=True):
+    """
+    Select the houses whose image still has to be generated.
+
+    Args:
+        houses (iterable): The listings.
+        output_dir (str): Directory of the images, the image of the i-th listing is '<i>.png'.
+        skip_existing (bool): Skip listings whose image exists.
+
+    Yields:
+        tuple: (filename, house) for every listing without an image.
+    """
+    for index, house in enumerate(houses):
+        filename = os.path.join(output_dir, f"{index}.png")
+        if skip_existing and os.path.exists(filename):
+            logger.debug(f"Skip {filename}, it exists")
+            continue
+        yield filename, house
+
+
+def batches(items, batch_size):
+    """
+    Split an iterable into lists of at most batch_size items.
+
+    Args:
+        items (iterable): The items.
+        batch_size (int): Maximum number of items per list.
+
+    Yields:
+        list: The next batch.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_images(pipe, prompts, filenames, steps=None, size=None):
+    """
+    Render a batch of prompts with one call of the pipeline and save the images.
+
+    Args:
+        pipe (diffusers.StableDiffusionPipeline): The pipeline.
+        prompts (list[str]): The image prompts.
+        filenames (list[str]): Paths of the images, in the order of the prompts.
+        steps (int): Number of inference steps, None for the default of the pipeline.
+        size (int): Width and height of the images, None for the default of the pipeline.
+
+    Returns:
+        float: Seconds per image.
+    """
+    kwargs = {}
+    if steps is not None:
+        kwargs["num_inference_steps"] = steps
+    if size is not None:
+        kwargs["height"] = kwargs["width"] = size
+
+    start = time.perf_counter()
+    images = pipe(prompts, **kwargs).images
+    for image, filename in zip(images, filenames):
+        # write to a temporary file first, so an interrupted run leaves no broken image that would be skipped
+        temporary = f"{filename}.tmp.png"
+        image.save(temporary)
+        os.replace(temporary, filename)
+        logger.info(f"Write image as {filename}")
+    return (time.perf_counter() - start) / len(prompts)
+
+
+def create_images(houses, client, pipe, output_dir="house_images", batch_size=4, steps=None, size=None,
+                  skip_existing=True, runner=None):
+    """
+    Generate the images of all listings.
+
+    The image prompts are written concurrently by the runner and recorded in its checkpoint, the images
+    are rendered in batches as the prompts arrive.
+
+    Args:
+        houses (iterable): The listings.
+        client (openai.OpenAI): The OpenAI client for the image prompts.
+        pipe (diffusers.StableDiffusionPipeline): The pipeline.
+        output_dir (str): Directory of the images.
+        batch_size (int): Number of prompts rendered at once.
+        steps (int): Number of inference steps, None for the default of the pipeline.
+        size (int): Width and height of the images, None for the default of the pipeline.
+        skip_existing (bool): Skip listings whose image exists.
+        runner (JobRunner): Runner of the prompt generation, one worker without checkpoint file if None.
+
+    Returns:
+        dict: Number of generated 'images' and the rendering 'seconds_per_image'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if runner is None:
+        runner = JobRunner(workers=1)
+
+    def job(entry):
+        _, house = entry
+        logger.info(f"Create prompt for {house['Neighborhood']}")
+        return runner.call(image_prompt, client, house)
+
+    # prompts are keyed by the content of the listing, so a changed listing gets a new prompt
+    jobs = ((content_hash(house), (filename, house)) for filename, house in pending_houses(houses, output_dir, skip_existing))
+
+    generated = 0
+    seconds = 0.0
+    for batch in batches(runner.run(job, jobs), batch_size):
+        prompts = [prompt for _, _, prompt in batch]
+        filenames = [filename for _, (filename, _), _ in batch]
+        per_image = generate_images(pipe, prompts, filenames, steps=steps, size=size)
+        generated += len(batch)
+        seconds += per_image * len(batch)
+        logger.info(f"Rendered {len(batch)} images in {per_image:.2f}s per image, {generated} images in total")
+
+    seconds_per_image = seconds / generated if generated else 0.0
+    return {"images": generated, "seconds_per_image": seconds_per_image}
+
+
 def main():
+    arg_parser = argparse.ArgumentParser(description="Generate images of the listings with Stable Diffusion")
+    arg_parser.add_argument("--data-file", default="data/data.json", help="JSON or JSONL file with the listings (default: data/data.json)")
+    arg_parser.add_argument("--output-dir", default="house_images", help="Directory of the images (default: house_images)")
+    arg_parser.add_argument("--batch-size", type=int, default=4, help="Number of prompts rendered at once (default: 4)")
+    arg_parser.add_argument("--model", default=model_id, help=f"Stable Diffusion model (default: {model_id})")
+    arg_parser.add_argument("--cpu", action="store_true",
+                            help=f"Run on the CPU in float32, by default with {cpu_steps} steps at {cpu_size}x{cpu_size}")
+    arg_parser.add_argument("--steps", type=int, help="Number of inference steps")
+    arg_parser.add_argument("--size", type=int, help="Width and height of the images, a multiple of 8")
+    arg_parser.add_argument("--overwrite", action="store_true", help="Generate images which already exist again")
+    arg_parser.add_argument("--checkpoint", default=".cache/create_images_diff.jsonl", help="File of the written image prompts")
+    arg_parser.add_argument("--workers", type=int, default=4, help="Image prompts written at once (default: 4)")
+    arg_parser.add_argument("--rate", type=float, default=2.0, help="Chat API calls per second (default: 2.0)")
+    args = arg_parser.parse_args()
+
     logger.info("Start CreateImages")
+    from openai import OpenAI
 
     logger.info("Create OpenAI client")
-    client = OpenAI()
+    # retries are done by the runner, which also respects the rate limit
+    client = OpenAI(max_retries=0)
+    runner = JobRunner(workers=args.workers, rate=args.rate, checkpoint=Checkpoint(args.checkpoint))
 
-    # Load your dataset
-    with open("data/data.json", "r") as f:
-        data = json.load(f)
+    steps = args.steps if args.steps is not None else (cpu_steps if args.cpu else None)
+    size = args.size if args.size is not None else (cpu_size if args.cpu else None)
+    pipe = load_pipeline(args.model, cpu=args.cpu)
 
-    output_dir = "house_images"
-    os.makedirs(output_dir, exist_ok=True)
-
-    for idx, house in enumerate(data["RealEstateObj"]):
-        logger.info(f"Create prompt for {house["Neighborhood"]}")
-
-        # 1. Create a good image generation prompt with a chat model
-        # Build prompt from data
-        prompt = (
-            f"A realistic real estate photo (exterior) of a {house['Bedrooms']}-bedroom, "
-            f"{house['Bathrooms']}-bathroom home in {house['Neighborhood']}, "
-            f"about {house['HouseSize']} sqft. "
-            f"{house['Description']} Neighborhood: {house['NeighborhoodDescription']}. "
-        )
-
-        system_promt = """You are a generator for image generation prompts. Rewrite the following house description as a short vivid prompt,
-                suitable for a professional real estate catalog photo. The houses should have different colors and styles. The prompt must be short
-                so it fits the 77 token limit of CLIP."""
-
-        # Generate a concise, vivid prompt for image generation using a chat model
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_promt},
-                {"role": "user", "content": prompt}
-            ]
-        )
-
-        image_prompt = response.choices[0].message.content
-
-        # 2. Call stable diffusion model to generate the image
-        logger.info(f"Create image for {house["Neighborhood"]}")
-        logger.debug(f"Prompt for {house["Neighborhood"]}: {image_prompt}")
-        pipe = StableDiffusionPipeline.from_pretrained(
-            'stable-diffusion-v1-5/stable-diffusion-v1-5',
-            torch_dtype=torch.float16
-        )
-        if torch.cuda.is_available():
-            pipe = pipe.to("cuda")
-
-        image = pipe(image_prompt).images[0]
-
-        # Save image to disk
-        filename = os.path.join(output_dir, f"{idx}.png")
-        logger.info(f"Write image as {filename}")
-        image.save(filename)
+    stats = create_images(iter_listings(args.data_file), client, pipe, output_dir=args.output_dir,
+                          batch_size=args.batch_size, steps=steps, size=size, skip_existing=not args.overwrite,
+                          runner=runner)
 
-    logger.info("Finished CreateImages")
+    logger.info(f"Finished CreateImages: {stats['images']} images, {stats['seconds_per_image']:.2f}s per image")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -3,10 +3,13 @@ database.py
 
 This module provides a Database class for managing real estate data using ChromaDB.
 It supports storing and searching textual and image data with embedding functions.
+With the numpy backend the collections are stored by vector_store.py instead of ChromaDB, and the
+text index can be compressed by truncating and quantizing the embeddings (quantization.py).
 """
 
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
+import numpy as np
 from chromadb.utils.data_loaders import ImageLoader
 
 import argparse
@@ -14,8 +17,16 @@ import configparser
 from datetime import datetime
 import json
 import os
-
-from logger_config import Logger
+import time
+
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from image_ingest import ImageEmbedder
+from listings import content_hash, iter_listings, listing_id, listing_metadata
+import metrics
+from quantization import create_index
+import resources
+from vector_store import NumpyClient
+from logger_config import Logger, Throttle
 logger = Logger(name="RealEstateDB").get_logger()
 
 data_template = \
@@ -27,13 +38,57 @@ HouseSize: {}
 Description: {}
 NeighborhoodDescription: {}"""
 
+def as_list(query):
+    """
+    Wrap a single query string into a list.
+
+    Args:
+        query (str | list[str]): One or several queries.
+
+    Returns:
+        list[str]: The queries.
+    """
+    return [query] if isinstance(query, str) else list(query)
+
+
+def database_settings(settings):
+    """
+    Backend and storage directory of the database configured in the [database] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        dict: Keyword arguments 'backend', 'persist_directory' and 'text_index' of Database.
+    """
+    backend = settings.get("database", "backend", fallback="chroma").strip().lower()
+    default_path = ".vectors" if backend == "numpy" else ".chroma_db"
+    return {"backend": backend, "persist_directory": settings.get("database", f"{backend}_path", fallback=default_path),
+            "text_index": create_index(settings)}
+
+
+def result_count(results):
+    """
+    Number of results of the first query of a ChromaDB query result.
+
+    Args:
+        results (dict): The query result.
+
+    Returns:
+        int: Number of ids returned for the first query.
+    """
+    ids = results.get("ids") if isinstance(results, dict) else None
+    return len(ids[0]) if ids else 0
+
+
 class Database:
     """
     Database class for managing real estate data in ChromaDB.
 
     Supports adding data, and performing similarity searches on text and images.
     """
-    def __init__(self, persist_directory=".chroma_db", collection_name="real_estate", open_ai=True):
+    def __init__(self, persist_directory=".chroma_db", collection_name="real_estate", open_ai=True, embedding_cache=None,
+                 backend="chroma", text_index=None, image_index=None):
         """
         Initialize the Database with embedding functions and collections.
 
@@ -41,9 +96,16 @@ class Database:
             persist_directory (str): Directory for persistent storage.
             collection_name (str): Name for the collection.
             open_ai (bool): Whether to use OpenAI embeddings or Ollama.
+            embedding_cache (EmbeddingCache): Cache for the query embeddings, an in-memory cache is used if None.
+            backend (str): 'chroma' for ChromaDB, 'numpy' for the memory-mapped matrices of vector_store.py.
+            text_index (CompressedIndex): Compression of the text embeddings, only supported by the numpy backend.
+            image_index (ImageIndex): Table of the image paths by listing id for the web server, not written if None.
         """
         self.persist_directory = persist_directory
         self.collection_name=collection_name
+        self.backend = backend
+        self.text_index = text_index
+        self.image_index = image_index
         if open_ai:
             self.embedding_text = embedding_functions.OpenAIEmbeddingFunction(
                 model_name="text-embedding-3-large",
@@ -54,7 +116,26 @@ class Database:
             self.embedding_text = embedding_functions.OllamaEmbeddingFunction(model_name="mxbai-embed-large")
 
         self.embedding_image = embedding_functions.OpenCLIPEmbeddingFunction()
-        self.db = chromadb.PersistentClient(path=persist_directory)
+
+        # query embeddings are looked up in the cache before calling the embedding model
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
+        self.cached_embedding_text = CachedEmbeddingFunction(self.embedding_text, self.embedding_cache,
+                                                             limit=resources.get_stage_limit("embedding_text"))
+        self.cached_embedding_image = CachedEmbeddingFunction(self.embedding_image, self.embedding_cache,
+                                                              limit=resources.get_stage_limit("embedding_image"))
+
+        if backend == "numpy":
+            self.db = NumpyClient(path=persist_directory)
+        elif backend == "chroma":
+            self.db = chromadb.PersistentClient(path=persist_directory)
+            if text_index is not None:
+                logger.warning("The compression of the text embeddings needs the numpy backend, it is ignored")
+                self.text_index = None
+        else:
+            raise ValueError(f"Unknown database backend: {backend}")
+
+        # callbacks without arguments which are called after new data was added
+        self.ingest_listeners = []
 
         self.create_collections()
 
@@ -63,15 +144,18 @@ class Database:
         Create or retrieve the text and image collections in the database.
         """
         logger.info("Creating or loading the collections for text and images")
+        # only the numpy backend compresses the text index
+        index = {"index": self.text_index} if self.text_index is not None else {}
         self.col_text = self.db.get_or_create_collection(
             name="real_estate_description",
             embedding_function=self.embedding_text,
             metadata={
                 "description": "Real-estate textual description",
                 "created": str(datetime.now())
-            })
+            },
+            **index)
         
-        data_loader = ImageLoader()
+        self.data_loader = ImageLoader()
         self.col_image = self.db.get_or_create_collection(
             name="real_estate_image",
             embedding_function=self.embedding_image,
@@ -79,71 +163,387 @@ class Database:
                 "description": "Real-estate textual description",
                 "created": str(datetime.now()),
                 },
-            data_loader=data_loader
+            data_loader=self.data_loader
             )
         
-    def add_data_to_collections(self, filename):
+    def add_data_to_collections(self, filename, batch_size=100, image_workers=1, image_batch_size=32):
         """
-        Add real estate data from a JSON file to the text and image collections.
+        Add real estate data from a JSON or JSONL file to the text and image collections.
+
+        The file is read as a stream and written in batches. Listings keep their explicit "id" or get
+        an id from the name of the file and their position, their content hash tells which listings
+        changed, so only new or changed listings are embedded again when the file is re-ingested.
+        Listings of the file which are no longer in it are removed. Images are decoded by a pool of processes and embedded in batches, their vectors are kept in
+        the embedding cache.
 
         Args:
-            filename (str): Path to the JSON file containing real estate data.
+            filename (str): Path to the JSON or JSONL file containing real estate data.
+            batch_size (int): Number of listings written to the collections at once.
+            image_workers (int): Number of processes decoding the images.
+            image_batch_size (int): Number of images embedded at once.
+
+        Returns:
+            dict: Number of listings read, embedded, skipped, with updated metadata, without a readable image
+                and removed, and the duration in seconds.
         """
-        logger.info("Loading data")
-        try:
-            with open(filename, 'r') as file:
-                data = json.load(file)
-        except FileNotFoundError:
+        logger.info(f"Loading data from {filename}")
+        stats = {"listings": 0, "embedded": 0, "skipped": 0, "metadata_updated": 0, "missing_images": 0, "removed": 0,
+                 "seconds": 0.0}
+        start = time.perf_counter()
+
+        if not os.path.isfile(filename):
             logger.error(f"Error: file not found: {filename}")
-        except json.JSONDecodeError:
-            logger.error("Error: Failed to decode JSON from the file.")
+            return stats
+
+        try:
+            with ImageEmbedder(self.embedding_image, cache=self.embedding_cache,
+                               workers=image_workers, batch_size=image_batch_size) as image_embedder:
+                batch = []
+                seen = set()
+                # progress is logged at most every few seconds, the final summary always
+                progress = Throttle(interval=5.0)
+                for index, obj in enumerate(iter_listings(filename)):
+                    batch.append((index, obj))
+                    if len(batch) >= batch_size:
+                        seen.update(self._ingest_batch(batch, filename, stats, image_embedder))
+                        batch = []
+                        if progress.ready():
+                            self._log_progress(stats, start)
+                if batch:
+                    seen.update(self._ingest_batch(batch, filename, stats, image_embedder))
+            # only a completely read file tells which listings were removed from it
+            stats["removed"] = self._remove_stale(filename, seen)
+        except json.JSONDecodeError as error:
+            logger.error(f"Error: Failed to decode JSON from the file: {error}")
+
+        stats["seconds"] = time.perf_counter() - start
+        self._log_progress(stats, start)
+
+        if stats["embedded"] or stats["removed"]:
+            # new listings are encoded with the trained index, which is trained again when the collection has grown
+            if self.text_index is not None and self.col_text.index_stale():
+                self.col_text.reindex()
+            self.update_collection_version()
+
+        return stats
+
+    def _ingest_batch(self, batch, filename, stats, image_embedder):
+        """
+        Upsert the new and changed listings of a batch into the text and image collections.
+
+        A listing is stored when both collections have its content hash. Text embeddings which are
+        already stored for the same content, e.g. when only the image is missing, are reused.
+
+        Args:
+            batch (list): List of (index, listing) tuples.
+            filename (str): Path of the source file, stored in the metadata.
+            stats (dict): Counters which are updated.
+            image_embedder (ImageEmbedder): Embedder for the images of the listings.
+
+        Returns:
+            list[str]: Ids of the listings of the batch.
+        """
+        ids = [listing_id(obj, filename, index) for index, obj in batch]
+        hashes = [content_hash(obj) for _, obj in batch]
 
-        objects = data["RealEstateObj"]
-        ids = []
+        stored_text = self._stored_metadatas(self.col_text, ids)
+        stored_image = self._stored_metadatas(self.col_image, ids)
+
+        new_ids = []
         documents = []
         metadatas = []
         uris = []
-        logger.info("Starting loop")
-        for index, obj in enumerate(objects):
-            logger.info(f"Adding data for {obj["Neighborhood"]}")
-            ids.append(f"id{index}")
+        # unchanged listings which were stored without the typed metadata only get their metadata updated
+        update_ids = []
+        update_metadatas = []
+        # image paths of the stored listings for the image index
+        images = []
+        seen = set()
+        for (index, obj), id, digest in zip(batch, ids, hashes):
+            if id in seen:
+                continue
+            seen.add(id)
+            image_uri = obj.get("ImagePath", f"house_images/{index}.png")
+            metadata = {"source" : filename, "index": index, "image": image_uri, "content_hash": digest}
+            metadata.update(listing_metadata(obj))
+
+            stored = stored_text.get(id)
+            if stored is not None and stored.get("content_hash") == digest \
+                    and stored_image.get(id, {}).get("content_hash") == digest:
+                images.append((id, stored.get("image", image_uri)))
+                if any(key not in stored for key in metadata):
+                    update_ids.append(id)
+                    update_metadatas.append({**metadata, "index": stored.get("index", index), "image": stored.get("image", image_uri)})
+                continue
+
+            new_ids.append(id)
             documents.append(data_template.format(obj["Neighborhood"], obj["Price"], obj["Bedrooms"], obj["Bathrooms"],obj["HouseSize"], obj["Description"], obj["NeighborhoodDescription"]))
-            image_uri = f"house_images/{index}.png"
-            metadatas.append({"source" : filename, "index": index, "image": image_uri})
+            metadatas.append(metadata)
             uris.append(image_uri)
 
-        logger.info("Loop finished")
+        stats["listings"] += len(batch)
+        stats["skipped"] += len(batch) - len(new_ids)
+
+        if update_ids:
+            self.col_text.update(ids=update_ids, metadatas=update_metadatas)
+            self.col_image.update(ids=update_ids, metadatas=update_metadatas)
+            stats["metadata_updated"] += len(update_ids)
+
+        if not new_ids:
+            self._index_images(images)
+            return ids
+
+        # both embeddings are computed before writing, so a listing is stored in both collections or in none
+        image_embeddings = image_embedder(uris)
+        found = [position for position, vector in enumerate(image_embeddings) if vector is not None]
+        if len(found) < len(new_ids):
+            missing = [uris[position] for position, vector in enumerate(image_embeddings) if vector is None]
+            logger.warning(f"Skipping {len(missing)} listings without a readable image: {', '.join(missing[:5])}")
+            stats["missing_images"] += len(missing)
+            if not found:
+                self._index_images(images)
+                return ids
+            new_ids, documents, metadatas, uris, image_embeddings = (
+                [values[position] for position in found]
+                for values in (new_ids, documents, metadatas, uris, image_embeddings)
+            )
+        text_embeddings = self._text_embeddings(documents, [metadata["content_hash"] for metadata in metadatas])
+
+        self.col_text.upsert(ids=new_ids, embeddings=text_embeddings, documents=documents, metadatas=metadatas)
+        self.col_image.upsert(ids=new_ids, embeddings=image_embeddings, uris=uris, metadatas=metadatas)
+        stats["embedded"] += len(new_ids)
+        self._index_images(images + list(zip(new_ids, uris)))
+        return ids
+
+    def _index_images(self, images):
+        if self.image_index is not None:
+            self.image_index.put_many(images)
+
+    def _remove_stale(self, filename, seen, batch_size=1000):
+        """
+        Remove the listings of a source file which are no longer in it.
+
+        This also replaces the listings stored with the ids of older versions of this module.
+
+        Args:
+            filename (str): Path of the source file.
+            seen (set[str]): Ids of the listings in the file.
+            batch_size (int): Number of listings deleted at once.
+
+        Returns:
+            int: Number of removed listings.
+        """
+        sources = list({filename, os.path.normpath(filename)})
+        stored = self.col_text.get(where={"source": {"$in": sources}}, include=[])["ids"]
+        stale = [id for id in stored if id not in seen]
+        for start in range(0, len(stale), batch_size):
+            self.col_text.delete(ids=stale[start:start + batch_size])
+            self.col_image.delete(ids=stale[start:start + batch_size])
+            if self.image_index is not None:
+                self.image_index.delete(stale[start:start + batch_size])
+        if stale:
+            logger.info(f"Removed {len(stale)} listings which are no longer in {filename}")
+        return len(stale)
+
+    @staticmethod
+    def _stored_metadatas(collection, ids):
+        stored = collection.get(ids=ids, include=["metadatas"])
+        return {id: metadata or {} for id, metadata in zip(stored["ids"], stored["metadatas"])}
+
+    def _text_embeddings(self, documents, hashes):
+        """
+        Embed the documents, reusing the text embeddings stored for the same content hash.
+
+        Args:
+            documents (list[str]): The documents of the listings.
+            hashes (list[str]): Content hash of every listing.
+
+        Returns:
+            list: Embedding for every document.
+        """
+        stored = self.col_text.get(where={"content_hash": {"$in": list(set(hashes))}}, include=["embeddings", "metadatas"])
+        by_hash = {metadata["content_hash"]: embedding
+                   for metadata, embedding in zip(stored["metadatas"], stored["embeddings"])}
+        embeddings = [by_hash.get(digest) for digest in hashes]
+        missing = [position for position, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            for position, embedding in zip(missing, self.embedding_text([documents[position] for position in missing])):
+                embeddings[position] = embedding
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+    def reindex(self):
+        """
+        Rebuild the text index with the compression of the settings from the stored embeddings.
+
+        The listings are not embedded again.
+
+        Returns:
+            dict: Number of listings, bytes per listing of the codes and the full embeddings and the parameters.
+
+        Raises:
+            ValueError: If the database doesn't use the numpy backend.
+        """
+        if self.backend != "numpy":
+            raise ValueError("Only the text index of the numpy backend can be rebuilt")
+        stats = self.col_text.reindex()
+        self.update_collection_version()
+        return stats
+
+    def copy_from_chroma(self, persist_directory=".chroma_db", batch_size=1000):
+        """
+        Copy the listings and their embeddings from a ChromaDB directory into the collections.
+
+        Used to switch to the numpy backend without embedding the listings again.
+
+        Args:
+            persist_directory (str): Directory of the ChromaDB database.
+            batch_size (int): Number of listings copied at once.
+
+        Returns:
+            int: Number of copied listings.
+        """
+        source = chromadb.PersistentClient(path=persist_directory)
+        copied = 0
+        for name, target in (("real_estate_description", self.col_text), ("real_estate_image", self.col_image)):
+            collection = source.get_collection(name=name)
+            for offset in range(0, collection.count(), batch_size):
+                batch = collection.get(limit=batch_size, offset=offset,
+                                       include=["embeddings", "documents", "metadatas", "uris"])
+                target.upsert(ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"],
+                              metadatas=batch["metadatas"], uris=batch["uris"])
+                if target is self.col_text:
+                    copied += len(batch["ids"])
+                else:
+                    self._index_images(zip(batch["ids"], batch["uris"] or []))
+            logger.info(f"Copied {collection.count()} listings of {name} from {persist_directory}")
+        if self.text_index is not None:
+            self.col_text.reindex()
+        self.update_collection_version()
+        return copied
+
+    def index_images(self, batch_size=1000):
+        """
+        Write the image paths of all stored listings into the image index.
+
+        Used for databases which were ingested before the image index existed.
+
+        Args:
+            batch_size (int): Number of listings read at once.
+
+        Returns:
+            int: Number of indexed listings.
+        """
+        if self.image_index is None:
+            raise ValueError("The database has no image index")
+        indexed = 0
+        for offset in range(0, self.col_image.count(), batch_size):
+            batch = self.col_image.get(limit=batch_size, offset=offset, include=["uris"])
+            self.image_index.put_many(zip(batch["ids"], batch["uris"] or []))
+            indexed += len(batch["ids"])
+        logger.info(f"Indexed the image paths of {indexed} listings")
+        return indexed
+
+    def _log_progress(self, stats, start):
+        elapsed = time.perf_counter() - start
+        throughput = stats["listings"] / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Ingested {stats['listings']} listings ({stats['embedded']} embedded, {stats['skipped']} unchanged, "
+            f"{stats['missing_images']} without image), "
+            f"{throughput:.1f} listings/s"
+        )
+
+    def collection_version(self):
+        """
+        Version of the collections, which changes whenever data is added.
+
+        The version is read from the stored collection metadata, so changes made by other processes are seen.
+
+        Returns:
+            str: The version of the collections.
+        """
+        collection = self.db.get_collection(name="real_estate_description", embedding_function=self.embedding_text)
+        metadata = collection.metadata or {}
+        return str(metadata.get("version", metadata.get("created", "")))
+
+    def update_collection_version(self):
+        """
+        Set a new version of the collections and notify the ingest listeners.
+        """
+        metadata = dict(self.col_text.metadata or {})
+        metadata["version"] = str(datetime.now())
+        self.col_text.modify(metadata=metadata)
+        logger.info(f"Collection version is {metadata['version']}")
 
-        logger.info("Adding text data to collection")
-        self.col_text.add(ids=ids, documents=documents, metadatas=metadatas)
-        logger.info("Adding image data to collection")
-        self.col_image.add(ids=ids, uris=uris)
+        for listener in self.ingest_listeners:
+            listener()
 
-    def similarity_search_text(self, query, k=3):
+    def similarity_search_text(self, query, k=3, where=None):
         """
         Perform a similarity search on the text collection.
 
         Args:
             query (str): The query string.
             k (int): Number of results to return.
+            where (dict): Filter on the listing metadata, only matching listings are searched.
 
         Returns:
             dict: Search results from the text collection.
         """
-        return self.col_text.query(query_texts=query, n_results=k)
+        query_embeddings = self.cached_embedding_text(as_list(query))
+        with metrics.span(f"{self.backend}.query", collection="text", k=k, filtered=where is not None) as attributes:
+            results = self.col_text.query(query_embeddings=query_embeddings, n_results=k, where=where)
+            attributes["results"] = result_count(results)
+        metrics.search_results.observe(attributes["results"], collection="text")
+        return results
     
-    def similarity_search_image(self, query, k=3):
+    def similarity_search_image(self, query, k=3, where=None):
         """
         Perform a similarity search on the image collection.
 
         Args:
             query (str): The query string.
             k (int): Number of results to return.
+            where (dict): Filter on the listing metadata, only matching listings are searched.
 
         Returns:
             dict: Search results from the image collection.
         """
-        return self.col_image.query(query_texts=query, include=['uris'], n_results=k)
+        query_embeddings = self.cached_embedding_image(as_list(query))
+        with metrics.span(f"{self.backend}.query", collection="image", k=k, filtered=where is not None) as attributes:
+            results = self.col_image.query(query_embeddings=query_embeddings, include=['uris', 'distances'], n_results=k, where=where)
+            attributes["results"] = result_count(results)
+        metrics.search_results.observe(attributes["results"], collection="image")
+        return results
+
+    def count(self, where=None, limit=None):
+        """
+        Number of listings in the database.
+
+        Args:
+            where (dict): Filter on the listing metadata, only matching listings are counted.
+            limit (int): Stop counting the matching listings at this number, for threshold checks.
+
+        Returns:
+            int: Number of listings in the text collection, at most limit.
+        """
+        if where is None:
+            count = self.col_text.count()
+            return min(count, limit) if limit is not None else count
+        return len(self.col_text.get(where=where, limit=limit, include=[])["ids"])
+
+    def image_uri(self, listing_id):
+        """
+        Path of the image of a listing.
+
+        Args:
+            listing_id (str): Id of the listing.
+
+        Returns:
+            str | None: The image path, None if the listing doesn't exist.
+        """
+        result = self.col_image.get(ids=[listing_id], include=["uris"])
+        uris = result.get("uris") or []
+        return uris[0] if uris else None
 
 
 
@@ -159,11 +559,20 @@ def main():
     parser.read("settings.ini")
 
     open_ai = parser.getboolean("DEFAULT", "open_ai")
-    db = Database(open_ai=open_ai)
+    # the persistent embedding cache keeps the image vectors for re-indexing
+    db = Database(open_ai=open_ai, embedding_cache=resources.get_embedding_cache(),
+                  image_index=resources.get_image_index(), **database_settings(parser))
 
     # CLI argument parsing
     arg_parser = argparse.ArgumentParser(description="ChromaDB Real Estate Database CLI")
     arg_parser.add_argument("--add-data", action="store_true", help="Add data from JSON file to collections")
+    arg_parser.add_argument("--data-file", default="./data/data.json", help="JSON or JSONL file with the listings (default: ./data/data.json)")
+    arg_parser.add_argument("--batch-size", type=int, default=100, help="Number of listings added at once (default: 100)")
+    arg_parser.add_argument("--image-workers", type=int, default=os.cpu_count(), help="Number of processes decoding images (default: number of CPUs)")
+    arg_parser.add_argument("--image-batch-size", type=int, default=32, help="Number of images embedded at once (default: 32)")
+    arg_parser.add_argument("--copy-from-chroma", metavar="DIRECTORY", help="Copy the listings and embeddings of a ChromaDB directory, e.g. .chroma_db, into the configured backend")
+    arg_parser.add_argument("--reindex", action="store_true", help="Rebuild the compressed text index of the numpy backend with the [database] settings")
+    arg_parser.add_argument("--index-images", action="store_true", help="Write the image paths of the stored listings into the image index of the web server")
     arg_parser.add_argument("--text-search", help="Perform a text similarity search")
     arg_parser.add_argument("--image-search", help="Perform an image similarity search")
     arg_parser.add_argument("-k", type=int, default=3, help="Number of results to return (default: 3)")
@@ -171,7 +580,22 @@ def main():
 
     if args.add_data:
         logger.info("Adding data to the database collections")
-        db.add_data_to_collections("./data/data.json")
+        db.add_data_to_collections(args.data_file, batch_size=args.batch_size,
+                                   image_workers=args.image_workers, image_batch_size=args.image_batch_size)
+
+    if args.copy_from_chroma:
+        logger.info(f"Copying the collections of {args.copy_from_chroma} to the {db.backend} backend")
+        db.copy_from_chroma(args.copy_from_chroma)
+
+    if args.reindex:
+        logger.info("Rebuilding the text index")
+        stats = db.reindex()
+        print(f"Indexed {stats['listings']} listings with {stats['params']}: {stats['code_bytes']} bytes per listing "
+              f"instead of {stats['full_bytes']} bytes of the full embeddings")
+
+    if args.index_images:
+        logger.info("Indexing the image paths")
+        print(f"Indexed the image paths of {db.index_images()} listings")
 
     if args.text_search:
         logger.info("Database text search test")
@@ -0,0 +1,152 @@
+"""
+description_cache.py
+
+This module caches the descriptions of single listings written for a customer profile.
+
+Descriptions are keyed by the listing id with the hash of the listing text (listing_key) and the
+hash of the customer profile. An edited listing keeps its id, the hash of its text makes sure that
+its old descriptions are not used anymore. The cache keeps a bounded number of descriptions in
+memory and can persist them in a bounded SQLite table (sqlite_lru.py).
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+from sqlite_lru import SQLiteLRU
+from logger_config import Logger
+logger = Logger(name="DescriptionCache").get_logger()
+
+
+def profile_hash(profile):
+    """
+    Hash of a customer profile.
+
+    Args:
+        profile (str): The customer profile.
+
+    Returns:
+        str: Hex digest of the profile, ignoring differences in whitespace.
+    """
+    return hashlib.sha256(" ".join(profile.split()).encode("utf-8")).hexdigest()
+
+
+def listing_key(listing_id, document):
+    """
+    Key of a listing in the cache, changes when the text of the listing changes.
+
+    Args:
+        listing_id (str): Id of the listing.
+        document (str): Text of the listing.
+
+    Returns:
+        str: The id and the hash of the text.
+    """
+    return f"{listing_id}:{hashlib.sha256(document.encode('utf-8')).hexdigest()[:16]}"
+
+
+class DescriptionCache:
+    """
+    Bounded LRU cache of listing descriptions with optional persistence in SQLite.
+    """
+
+    def __init__(self, max_entries=1000, path=None, max_disk_entries=100000):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of descriptions in memory.
+            path (str): Path of the SQLite file for persistence, None for memory only.
+            max_disk_entries (int): Maximum number of descriptions in the SQLite file.
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SQLiteLRU(path, "descriptions", ("listing_id", "profile"), ("description",),
+                               max_disk_entries) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, listing_id, profile):
+        """
+        Look up the description of a listing for a profile.
+
+        Args:
+            listing_id (str): Key of the listing, see listing_key().
+            profile (str): The customer profile.
+
+        Returns:
+            str | None: The description, None if it is not cached.
+        """
+        key = (listing_id, profile_hash(profile))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        description = None
+        if self._disk is not None:
+            row = self._disk.get(key)
+            if row is not None:
+                description = row[0]
+
+        with self._lock:
+            if description is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store_in_memory(key, description)
+            return description
+
+    def put(self, listing_id, profile, description):
+        """
+        Store the description of a listing for a profile.
+
+        Args:
+            listing_id (str): Key of the listing, see listing_key().
+            profile (str): The customer profile.
+            description (str): The description.
+        """
+        key = (listing_id, profile_hash(profile))
+        with self._lock:
+            self._store_in_memory(key, description)
+
+        if self._disk is not None:
+            self._disk.put(key, (description,))
+
+    def _store_in_memory(self, key, description):
+        self._entries[key] = description
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Hit and miss counters.
+
+        Returns:
+            dict: 'hits', 'misses' and the number of 'entries' in memory.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def create_cache(settings):
+    """
+    Create the description cache configured in the [cache] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        DescriptionCache: The cache, without persistence if no path is configured.
+    """
+    path = settings.get("cache", "descriptions_path", fallback=".cache/descriptions.sqlite3")
+    return DescriptionCache(
+        max_entries=settings.getint("cache", "descriptions_entries", fallback=1000),
+        path=path or None,
+        max_disk_entries=settings.getint("cache", "descriptions_disk_entries", fallback=100000),
+    )
@@ -0,0 +1,237 @@
+"""
+embedding_cache.py
+
+This module provides a content-addressed cache for embeddings and a wrapper that adds the cache to
+ChromaDB embedding functions.
+
+Embeddings are keyed by the model id and the SHA-256 hash of the input. The cache keeps a bounded
+number of vectors in memory and can persist a bounded number in a SQLite table (sqlite_lru.py), so
+repeated and retried queries skip the embedding round-trip or the local model inference. Bulk
+ingestion only uses the SQLite table, so it doesn't evict the query vectors from memory.
+"""
+
+from collections import OrderedDict, defaultdict
+from contextlib import nullcontext
+import hashlib
+import threading
+
+import numpy as np
+
+import metrics
+from sqlite_lru import SQLiteLRU
+from logger_config import Logger
+logger = Logger(name="EmbeddingCache").get_logger()
+
+
+def content_hash(data):
+    """
+    SHA-256 hash of a text or binary content.
+
+    Args:
+        data (str | bytes): The content.
+
+    Returns:
+        str: Hex digest of the content.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_id(embedding_function):
+    """
+    Identifier of the model behind an embedding function.
+
+    Args:
+        embedding_function: ChromaDB embedding function.
+
+    Returns:
+        str: Name of the embedding function and its model.
+    """
+    try:
+        name = embedding_function.name()
+    except (AttributeError, NotImplementedError):
+        name = None
+    if not isinstance(name, str):
+        name = type(embedding_function).__name__
+    parts = [name]
+    for attribute in ("model_name", "checkpoint"):
+        value = getattr(embedding_function, attribute, None)
+        if value:
+            parts.append(str(value))
+    return ":".join(parts)
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embedding vectors with optional persistence in SQLite.
+
+    Hits and misses are counted per model.
+    """
+
+    def __init__(self, max_entries=10000, path=None, max_disk_entries=100000):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of vectors in memory.
+            path (str): Path of the SQLite file for persistence, None for memory only.
+            max_disk_entries (int): Maximum number of vectors in the SQLite file.
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SQLiteLRU(path, "embeddings", ("model", "key"), ("dtype", "vector"),
+                               max_disk_entries) if path else None
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get_many(self, model, keys, memory=True):
+        """
+        Look up the vectors for several keys.
+
+        Args:
+            model (str): Identifier of the embedding model.
+            keys (list[str]): Content hashes of the inputs.
+            memory (bool): Keep the vectors found on disk in memory, False for bulk ingestion.
+
+        Returns:
+            list: Vector for every key, None for keys which are not cached.
+        """
+        vectors = []
+        missing = []
+        with self._lock:
+            for index, key in enumerate(keys):
+                vector = self._entries.get((model, key))
+                if vector is not None:
+                    self._entries.move_to_end((model, key))
+                else:
+                    missing.append(index)
+                vectors.append(vector)
+
+        if missing and self._disk is not None:
+            rows = self._disk.get_many([(model, keys[index]) for index in missing])
+            for index, row in zip(missing, rows):
+                if row is not None:
+                    vectors[index] = np.frombuffer(row[1], dtype=row[0])
+
+        with self._lock:
+            for index in missing:
+                if memory and vectors[index] is not None:
+                    self._store_in_memory((model, keys[index]), vectors[index])
+            found = sum(vector is not None for vector in vectors)
+            self.hits[model] += found
+            self.misses[model] += len(keys) - found
+
+        return vectors
+
+    def put_many(self, model, keys, vectors, memory=True):
+        """
+        Store the vectors for several keys.
+
+        Args:
+            model (str): Identifier of the embedding model.
+            keys (list[str]): Content hashes of the inputs.
+            vectors (list): Embedding vectors.
+            memory (bool): Keep the vectors in memory, False for bulk ingestion.
+        """
+        vectors = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+        if memory:
+            with self._lock:
+                for key, vector in zip(keys, vectors):
+                    self._store_in_memory((model, key), vector)
+
+        if self._disk is not None:
+            self._disk.put_many([((model, key), (vector.dtype.str, vector.tobytes()))
+                                 for key, vector in zip(keys, vectors)])
+
+    def _store_in_memory(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Hit and miss counters and hit rate per model.
+
+        Returns:
+            dict: Mapping from model id to its counters.
+        """
+        with self._lock:
+            stats = {}
+            for model in set(self.hits) | set(self.misses):
+                total = self.hits[model] + self.misses[model]
+                stats[model] = {
+                    "hits": self.hits[model],
+                    "misses": self.misses[model],
+                    "hit_rate": self.hits[model] / total if total else 0.0,
+                }
+            return stats
+
+
+class CachedEmbeddingFunction:
+    """
+    Wrapper around a ChromaDB embedding function which looks up the inputs in an EmbeddingCache
+    and only embeds the inputs which are not cached.
+    """
+
+    def __init__(self, embedding_function, cache, model=None, limit=None):
+        """
+        Initialize the wrapper.
+
+        Args:
+            embedding_function: ChromaDB embedding function computing the embeddings.
+            cache (EmbeddingCache): Cache for the embeddings.
+            model (str): Identifier of the model, derived from the embedding function if None.
+            limit (StageLimit): Limit of the concurrent calls to the embedding function, None for no limit.
+        """
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model = model or model_id(embedding_function)
+        self.limit = limit
+
+    def __call__(self, input):
+        """
+        Embed the inputs, using cached vectors where possible.
+
+        Args:
+            input (list[str]): Texts to embed.
+
+        Returns:
+            list: Embedding vector for every input.
+        """
+        keys = [content_hash(item) for item in input]
+        vectors = self.cache.get_many(self.model, keys)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        metrics.cache_lookup("embeddings", True, len(input) - len(missing))
+        metrics.cache_lookup("embeddings", False, len(missing))
+
+        if missing:
+            with self.limit or nullcontext(), metrics.span("embedding", model=self.model, inputs=len(missing)):
+                computed = self.embedding_function([input[index] for index in missing])
+            self.cache.put_many(self.model, [keys[index] for index in missing], computed)
+            for index, vector in zip(missing, computed):
+                vectors[index] = np.asarray(vector, dtype=np.float32)
+
+        return vectors
+
+
+def create_cache(settings):
+    """
+    Create the embedding cache configured in the [cache] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        EmbeddingCache: The cache, without persistence if no path is configured.
+    """
+    path = settings.get("cache", "embeddings_path", fallback=".cache/embeddings.sqlite3")
+    return EmbeddingCache(
+        max_entries=settings.getint("cache", "embeddings_entries", fallback=10000),
+        path=path or None,
+        max_disk_entries=settings.getint("cache", "embeddings_disk_entries", fallback=100000),
+    )
@@ -0,0 +1,144 @@
+"""
+fusion.py
+
+This module combines the results of the text and the image similarity search into one ranked list
+of listings.
+
+Listings that appear in both result lists are scored with one of the methods:
+- rrf: reciprocal rank fusion, the sum of weight / (rrf_k + rank) over both lists.
+- weighted: weighted sum of the distances, each list min-max normalized to [0, 1].
+- image_rank: the rank in the image search, ties broken by the text rank.
+
+If fewer than max_samples listings appear in both lists, the searches are repeated with a larger k.
+"""
+
+from logger_config import Logger
+logger = Logger(name="Fusion").get_logger()
+
+METHODS = ("rrf", "weighted", "image_rank")
+
+
+def _ranks(results):
+    return {id: rank for rank, id in enumerate(results["ids"][0])}
+
+
+def _normalized_distances(results):
+    distances = (results.get("distances") or [None])[0]
+    if not distances:
+        return {id: rank / max(1, len(results["ids"][0]) - 1) for rank, id in enumerate(results["ids"][0])}
+    low, high = min(distances), max(distances)
+    scale = high - low if high > low else 1.0
+    return {id: (distance - low) / scale for id, distance in zip(results["ids"][0], distances)}
+
+
+def fuse(results, results_image, max_samples=3, method="rrf", rrf_k=60, text_weight=0.5, image_weight=0.5):
+    """
+    Rank the listings which are in the results of both the text and the image search.
+
+    Args:
+        results (dict): Result of the text similarity search.
+        results_image (dict): Result of the image similarity search.
+        max_samples (int): Maximum number of listings returned.
+        method (str): Scoring method, one of 'rrf', 'weighted' or 'image_rank'.
+        rrf_k (int): Rank offset of the reciprocal rank fusion.
+        text_weight (float): Weight of the text search.
+        image_weight (float): Weight of the image search.
+
+    Returns:
+        list[dict]: Best listings with 'id', 'document', 'uri' and 'score', best first.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+
+    text_rank = _ranks(results)
+    image_rank = _ranks(results_image)
+    candidates = text_rank.keys() & image_rank.keys()
+
+    if method == "rrf":
+        scores = {id: text_weight / (rrf_k + text_rank[id] + 1) + image_weight / (rrf_k + image_rank[id] + 1)
+                  for id in candidates}
+    elif method == "weighted":
+        text_distance = _normalized_distances(results)
+        image_distance = _normalized_distances(results_image)
+        scores = {id: -(text_weight * text_distance[id] + image_weight * image_distance[id]) for id in candidates}
+    else:
+        scores = {id: -image_rank[id] - text_rank[id] / (len(text_rank) + 1) for id in candidates}
+
+    best = sorted(candidates, key=lambda id: (-scores[id], image_rank[id]))[:max_samples]
+
+    uris = (results_image.get("uris") or [None])[0]
+    return [
+        {
+            "id": id,
+            "document": results["documents"][0][text_rank[id]],
+            "uri": uris[image_rank[id]] if uris else None,
+            "score": scores[id],
+        }
+        for id in best
+    ]
+
+
+def select_listings(db, profile, profile_image, results, results_image, max_samples=3, k_text=6, k_image=15,
+                    method="rrf", rrf_k=60, text_weight=0.5, image_weight=0.5, where=None):
+    """
+    Fuse the search results and widen the searches until max_samples listings are found.
+
+    Every round doubles k of both searches, until enough listings appear in both result lists or
+    the searches return the whole collection.
+
+    Args:
+        db (Database): Database with the text and image collections.
+        profile (str): Query of the text search.
+        profile_image (str): Query of the image search.
+        results (dict): Result of the first text similarity search.
+        results_image (dict): Result of the first image similarity search.
+        max_samples (int): Number of listings to select.
+        k_text (int): k used for the first text search.
+        k_image (int): k used for the first image search.
+        method (str): Scoring method, one of 'rrf', 'weighted' or 'image_rank'.
+        rrf_k (int): Rank offset of the reciprocal rank fusion.
+        text_weight (float): Weight of the text search.
+        image_weight (float): Weight of the image search.
+        where (dict): Filter on the listing metadata used for the searches.
+
+    Returns:
+        list[dict]: Best listings with 'id', 'document', 'uri' and 'score', best first.
+    """
+    # the listings are only counted if the first searches don't find enough listings
+    count = None
+    while True:
+        selected = fuse(results, results_image, max_samples=max_samples, method=method, rrf_k=rrf_k,
+                        text_weight=text_weight, image_weight=image_weight)
+        if len(selected) >= max_samples:
+            return selected
+        if count is None:
+            count = db.count(where=where)
+        if k_text >= count and k_image >= count:
+            return selected
+
+        k_text = min(2 * k_text, count)
+        k_image = min(2 * k_image, count)
+        logger.info(f"Found {len(selected)} of {max_samples} listings, widening search to k={k_text}/{k_image}")
+        results = db.similarity_search_text(profile, k=k_text, where=where)
+        results_image = db.similarity_search_image(profile_image, k=k_image, where=where)
+
+
+def fusion_settings(settings):
+    """
+    Read the fusion parameters from the [fusion] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        dict: Keyword arguments for select_listings().
+    """
+    return {
+        "max_samples": settings.getint("fusion", "max_samples", fallback=3),
+        "k_text": settings.getint("fusion", "k_text", fallback=6),
+        "k_image": settings.getint("fusion", "k_image", fallback=15),
+        "method": settings.get("fusion", "method", fallback="rrf"),
+        "rrf_k": settings.getint("fusion", "rrf_k", fallback=60),
+        "text_weight": settings.getfloat("fusion", "text_weight", fallback=0.5),
+        "image_weight": settings.getfloat("fusion", "image_weight", fallback=0.5),
+    }
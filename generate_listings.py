@@ -0,0 +1,323 @@
+"""
+generate_listings.py
+
+This script generates large numbers of synthetic real estate listings from templates, without a
+language model, to test ingestion and search at production scale.
+
+The listings have the fields of create_data.RealEstate. Neighborhoods have their own price level
+and character, house types determine the number of rooms and the size, and the descriptions are
+composed from phrases for the house type, its features and the kind of buyer it suits. Every
+listing is derived from the seed and its position only, so the same seed always gives the same
+listings and a range of listings can be generated without the ones before it.
+
+Listings are written to a JSONL file one by one, so memory use doesn't grow with their number.
+Optionally the listings point to placeholder images of houses, whose facade colour matches the
+description.
+
+Usage:
+    python generate_listings.py --count 1000000 --output data/listings.jsonl --images 100 --image-dir house_images_synthetic
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+from logger_config import Logger
+logger = Logger(name="GenerateListings").get_logger()
+
+# name: (price per square foot, character, sentences about the neighborhood)
+neighborhoods = {
+    "Green Oaks": (320, "green", ["Community gardens and bike paths connect the tree-lined streets.",
+                                  "The organic grocery store and the Green Bean Cafe are a short walk away."]),
+    "Sunnyvale": (410, "family", ["Sunnyvale Park hosts weekend picnics and summer festivals.",
+                                  "The schools in Sunnyvale are among the best rated in the region."]),
+    "Maple Heights": (280, "family", ["Playgrounds and a community pool are at the heart of the neighborhood.",
+                                      "Families appreciate the quiet cul-de-sacs and friendly neighbors."]),
+    "Downtown": (650, "urban", ["Restaurants, theaters and nightlife are around the corner.",
+                                "The subway and several bus lines make a car unnecessary."]),
+    "Harbor Point": (720, "waterfront", ["The marina and the waterfront promenade are steps away.",
+                                         "Residents enjoy sunsets over the bay and fresh seafood at the harbor."]),
+    "Riverside": (350, "green", ["Walking trails follow the river through the neighborhood.",
+                                 "Kayak rentals and riverside cafes make weekends relaxed."]),
+    "Silver Lake": (300, "quiet", ["Silver Lake has a strong sense of community and a relaxed pace.",
+                                   "Local cafes and a weekly farmers market bring neighbors together."]),
+    "Old Town": (380, "historic", ["Cobblestone streets and historic buildings give Old Town its charm.",
+                                   "Boutiques, galleries and bakeries line the main square."]),
+    "Pine Ridge": (260, "rural", ["Pine forests and mountain views surround the neighborhood.",
+                                  "The secluded setting offers privacy and starry nights."]),
+    "Tech Park": (540, "urban", ["Coworking spaces and the light rail station are nearby.",
+                                 "Young professionals enjoy the food halls and fitness studios."]),
+    "Lakeview": (460, "waterfront", ["The lake offers swimming in summer and skating in winter.",
+                                     "A boardwalk connects the homes with the beach and the boat club."]),
+    "Cedar Park": (240, "family", ["Cedar Park has sports fields, a library and a community center.",
+                                   "Affordable homes and good schools attract young families."]),
+}
+
+# name: (bedrooms range, bathrooms range, square feet range, price factor)
+house_types = {
+    "studio apartment": ((1, 1), (1, 1), (400, 700), 1.1),
+    "condo": ((1, 3), (1, 2), (650, 1500), 1.05),
+    "townhouse": ((2, 4), (1, 3), (1200, 2200), 1.0),
+    "bungalow": ((2, 3), (1, 2), (900, 1600), 0.95),
+    "craftsman home": ((3, 4), (2, 3), (1600, 2800), 1.0),
+    "ranch-style home": ((3, 5), (2, 3), (1800, 3200), 0.9),
+    "colonial house": ((3, 5), (2, 4), (2200, 3800), 1.05),
+    "farmhouse": ((3, 5), (2, 3), (2000, 4000), 0.8),
+    "modern villa": ((4, 6), (3, 5), (3200, 6500), 1.35),
+    "Mediterranean villa": ((4, 7), (3, 6), (3500, 7500), 1.4),
+}
+
+facade_colors = ["white", "red", "blue", "yellow", "gray", "green", "beige", "brown"]
+
+# RGB values of the facade colours in the placeholder images
+color_values = {
+    "white": (235, 235, 230), "red": (170, 40, 35), "blue": (60, 90, 160), "yellow": (230, 200, 80),
+    "gray": (130, 130, 135), "green": (70, 130, 80), "beige": (215, 195, 160), "brown": (120, 80, 50),
+}
+
+features = {
+    "green": ["solar panels", "a vegetable garden", "a rainwater collection system", "a heat pump"],
+    "family": ["a large backyard", "a playroom", "a two-car garage", "a fenced garden"],
+    "urban": ["a rooftop terrace", "floor-to-ceiling windows", "a concierge service", "a home office"],
+    "waterfront": ["a private dock", "a deck overlooking the water", "a boathouse", "an outdoor shower"],
+    "quiet": ["a cozy reading nook", "a sunroom", "a small garden", "a wood-burning fireplace"],
+    "historic": ["original hardwood floors", "high ceilings", "restored crown moldings", "a bay window"],
+    "rural": ["a wraparound porch", "a barn", "several acres of land", "a stone fireplace"],
+    "any": ["a modern kitchen with stainless steel appliances", "a walk-in closet", "central air conditioning",
+            "an open floor plan", "a finished basement", "a swimming pool", "a home gym", "smart home features",
+            "a spacious living room", "an en-suite master bathroom", "a laundry room", "a guest suite"],
+}
+
+buyers = {
+    1: ["singles", "young professionals", "first-time buyers"],
+    2: ["couples", "first-time buyers", "retirees who want to downsize"],
+    3: ["small families", "couples who work from home", "growing families"],
+    4: ["families with children", "families who love to entertain"],
+    5: ["large families", "multi-generational households"],
+}
+
+openings = [
+    "Welcome to this {adjective} {bedrooms}-bedroom, {bathrooms}-bathroom {house_type} in {neighborhood}.",
+    "This {adjective} {house_type} in {neighborhood} offers {bedrooms} bedrooms and {bathrooms} bathrooms.",
+    "Discover this {adjective} {color} {house_type} with {bedrooms} bedrooms in the heart of {neighborhood}.",
+    "Set in {neighborhood}, this {adjective} {house_type} has {bedrooms} bedrooms, {bathrooms} bathrooms and {size} sqft.",
+]
+
+adjectives = ["charming", "spacious", "bright", "elegant", "cozy", "stylish", "beautifully renovated",
+              "light-filled", "well-kept", "newly built"]
+
+feature_sentences = [
+    "Highlights include {first} and {second}.",
+    "The home features {first}, complemented by {second}.",
+    "Enjoy {first} and {second}.",
+    "You will love {first} as well as {second}.",
+]
+
+closings = [
+    "It is ideal for {buyer}.",
+    "A perfect fit for {buyer}.",
+    "This home is designed for {buyer}.",
+    "An excellent choice for {buyer} looking for {character} living.",
+]
+
+character_words = {"green": "sustainable", "family": "family-friendly", "urban": "urban", "waterfront": "waterfront",
+                   "quiet": "peaceful", "historic": "historic", "rural": "countryside"}
+
+
+def listing_random(seed, index):
+    """
+    Random generator of one listing, derived from the seed and the position of the listing.
+
+    Args:
+        seed (int): Seed of the whole dataset.
+        index (int): Position of the listing.
+
+    Returns:
+        random.Random: The generator.
+    """
+    return random.Random(f"{seed}:{index}")
+
+
+def generate_listing(index, seed=0, images=0, image_dir="house_images"):
+    """
+    Generate one listing.
+
+    Args:
+        index (int): Position of the listing.
+        seed (int): Seed of the dataset.
+        images (int): Number of placeholder images, 0 for listings without 'ImagePath'.
+        image_dir (str): Directory of the placeholder images.
+
+    Returns:
+        dict: The listing with the fields of create_data.RealEstate and 'ImagePath' if images are used.
+    """
+    rng = listing_random(seed, index)
+    neighborhood = rng.choice(list(neighborhoods))
+    price_per_sqft, character, neighborhood_sentences = neighborhoods[neighborhood]
+    house_type = rng.choice(list(house_types))
+    (min_bedrooms, max_bedrooms), (min_bathrooms, max_bathrooms), (min_size, max_size), factor = house_types[house_type]
+
+    bedrooms = rng.randint(min_bedrooms, max_bedrooms)
+    bathrooms = min(rng.randint(min_bathrooms, max_bathrooms), bedrooms + 1)
+    size = int(round(rng.uniform(min_size, max_size) * (0.8 + 0.1 * bedrooms / max_bedrooms), -1))
+    price = int(round(size * price_per_sqft * factor * rng.uniform(0.85, 1.2), -3))
+
+    # the facade colour is the colour of the placeholder image, so text and image describe the same house
+    if images:
+        image_index = rng.randrange(images)
+        color = facade_colors[image_index % len(facade_colors)]
+    else:
+        color = rng.choice(facade_colors)
+
+    first, second = rng.sample(features[character] + features["any"], 2)
+    buyer = rng.choice(buyers[min(bedrooms, 5)])
+    values = {"adjective": rng.choice(adjectives), "bedrooms": bedrooms, "bathrooms": bathrooms,
+              "house_type": house_type, "neighborhood": neighborhood, "color": color, "size": f"{size:,}",
+              "first": first, "second": second, "buyer": buyer, "character": character_words[character]}
+    description = " ".join([
+        rng.choice(openings).format(**values),
+        f"The {color} facade and {rng.choice(['large windows', 'a covered porch', 'a pitched roof', 'a flat roof'])} "
+        "give it a distinctive look.",
+        rng.choice(feature_sentences).format(**values),
+        rng.choice(closings).format(**values),
+    ])
+
+    listing = {
+        "Neighborhood": neighborhood,
+        "Price": f"${price:,}",
+        "Bedrooms": bedrooms,
+        "Bathrooms": bathrooms,
+        "HouseSize": size,
+        "Description": description,
+        "NeighborhoodDescription": " ".join(rng.sample(neighborhood_sentences, len(neighborhood_sentences))),
+    }
+    if images:
+        listing["ImagePath"] = os.path.join(image_dir, f"{image_index}.png")
+    return listing
+
+
+def generate_listings(count, seed=0, start=0, images=0, image_dir="house_images"):
+    """
+    Generate listings one after the other.
+
+    Args:
+        count (int): Number of listings.
+        seed (int): Seed of the dataset.
+        start (int): Position of the first listing, to generate a part of a dataset.
+        images (int): Number of placeholder images, 0 for listings without 'ImagePath'.
+        image_dir (str): Directory of the placeholder images.
+
+    Yields:
+        dict: One listing after the other.
+    """
+    for index in range(start, start + count):
+        yield generate_listing(index, seed=seed, images=images, image_dir=image_dir)
+
+
+def write_listings(filename, count, seed=0, start=0, images=0, image_dir="house_images"):
+    """
+    Write generated listings to a JSONL file, one listing per line.
+
+    Args:
+        filename (str): Path of the JSONL file.
+        count (int): Number of listings.
+        seed (int): Seed of the dataset.
+        start (int): Position of the first listing.
+        images (int): Number of placeholder images, 0 for listings without 'ImagePath'.
+        image_dir (str): Directory of the placeholder images.
+
+    Returns:
+        int: Number of written listings.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    written = 0
+    with open(filename, "w") as file:
+        for listing in generate_listings(count, seed=seed, start=start, images=images, image_dir=image_dir):
+            file.write(json.dumps(listing))
+            file.write("\n")
+            written += 1
+            if written % 100000 == 0:
+                logger.info(f"Wrote {written} listings")
+    return written
+
+
+def write_placeholder_images(image_dir, images, size=256, seed=0):
+    """
+    Write simple drawings of houses, the facade colour of image i is facade_colors[i % len(facade_colors)].
+
+    Existing images are kept.
+
+    Args:
+        image_dir (str): Target directory.
+        images (int): Number of images.
+        size (int): Width and height of the images in pixels.
+        seed (int): Seed for the variation of the drawings.
+
+    Returns:
+        int: Number of written images.
+    """
+    from PIL import Image, ImageDraw
+
+    os.makedirs(image_dir, exist_ok=True)
+    written = 0
+    for index in range(images):
+        path = os.path.join(image_dir, f"{index}.png")
+        if os.path.exists(path):
+            continue
+        rng = listing_random(seed, f"image-{index}")
+        image = Image.new("RGB", (size, size), (135 + rng.randrange(60), 185 + rng.randrange(40), 235))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, int(size * 0.75), size, size], fill=(70 + rng.randrange(40), 140, 60))
+
+        left, right = int(size * rng.uniform(0.1, 0.25)), int(size * rng.uniform(0.75, 0.9))
+        top, bottom = int(size * rng.uniform(0.4, 0.5)), int(size * 0.8)
+        facade = color_values[facade_colors[index % len(facade_colors)]]
+        draw.rectangle([left, top, right, bottom], fill=facade)
+        roof = (90 + rng.randrange(60), 50 + rng.randrange(30), 40)
+        draw.polygon([(left - size // 20, top), (right + size // 20, top), ((left + right) // 2, int(size * 0.2))], fill=roof)
+
+        window = size // 10
+        for column in range(rng.randint(2, 4)):
+            x = left + window // 2 + column * (window + window // 2)
+            if x + window < right:
+                draw.rectangle([x, top + window // 2, x + window, top + window + window // 2], fill=(200, 225, 240))
+        door = (left + right) // 2
+        draw.rectangle([door - window // 2, bottom - int(window * 1.6), door + window // 2, bottom], fill=(80, 50, 30))
+
+        image.save(path)
+        written += 1
+    return written
+
+
+def main():
+    """
+    Main function to generate listings and placeholder images from the command line.
+    """
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic real estate listings from templates")
+    arg_parser.add_argument("--count", type=int, default=1000, help="Number of listings (default: 1000)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the dataset (default: 0)")
+    arg_parser.add_argument("--start", type=int, default=0, help="Position of the first listing (default: 0)")
+    arg_parser.add_argument("--output", default="data/listings.jsonl", help="JSONL file (default: data/listings.jsonl)")
+    arg_parser.add_argument("--images", type=int, default=0, help="Number of placeholder images, 0 for none (default: 0)")
+    arg_parser.add_argument("--image-dir", default="house_images_synthetic", help="Directory of the placeholder images")
+    arg_parser.add_argument("--image-size", type=int, default=256, help="Size of the placeholder images (default: 256)")
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    if args.images:
+        written = write_placeholder_images(args.image_dir, args.images, size=args.image_size, seed=args.seed)
+        logger.info(f"Wrote {written} placeholder images to {args.image_dir}")
+
+    count = write_listings(args.output, args.count, seed=args.seed, start=args.start,
+                           images=args.images, image_dir=args.image_dir)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Wrote {count} listings to {args.output} in {elapsed:.1f}s ({count / elapsed:.0f} listings/s)")
+
+
+if __name__ == '__main__':
+    main()
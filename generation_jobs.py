@@ -0,0 +1,270 @@
+"""
+generation_jobs.py
+
+This module runs the generation jobs of the data preparation scripts, e.g. writing an image prompt
+and an image for every listing, concurrently and resumably.
+
+- RateLimiter: token bucket which limits the calls per second to an API across all worker threads.
+- Checkpoint: JSONL file with the results of the finished jobs. A restarted run skips them.
+- JobRunner: runs a job function for every item in a bounded pool of threads. Calls made through
+  JobRunner.call() are rate limited and retried with exponential backoff on rate limit, server
+  and connection errors. Results are checkpointed as soon as a job is done.
+- output_name(): file names derived from the content of a listing, so different listings never
+  write to the same file and a changed listing gets a new file.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import json
+import os
+import random
+import threading
+import time
+
+from listings import content_hash
+from logger_config import Logger
+logger = Logger(name="GenerationJobs").get_logger()
+
+# HTTP status codes which are worth a retry
+retry_statuses = {408, 409, 429, 500, 502, 503, 504}
+
+
+def output_name(listing, extension="png"):
+    """
+    File name derived from the content of a listing.
+
+    Args:
+        listing (dict): The listing.
+        extension (str): File extension.
+
+    Returns:
+        str: '<hash of the listing fields>.<extension>'.
+    """
+    return f"{content_hash(listing)[:32]}.{extension}"
+
+
+def is_retryable(error):
+    """
+    Check whether a failed API call should be retried.
+
+    Args:
+        error (Exception): The error of the call.
+
+    Returns:
+        bool: True for rate limits, server errors, timeouts and connection errors.
+    """
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in retry_statuses
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of calls per second, shared by threads.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize the limiter.
+
+        Args:
+            rate (float): Calls per second, 0 or None for no limit.
+            burst (int): Number of calls which can be made at once after a pause.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a call is allowed.
+        """
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    Results of finished jobs, appended to a JSONL file.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the checkpoint and load the results of a previous run.
+
+        Args:
+            path (str): Path of the JSONL file, None to keep the results in memory only.
+        """
+        self.path = path
+        self._results = {}
+        self._lock = threading.Lock()
+
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line is incomplete if the previous run was killed while writing it
+                        logger.warning(f"Ignoring incomplete line in checkpoint {path}")
+                        continue
+                    self._results[entry["key"]] = entry["result"]
+            logger.info(f"Loaded {len(self._results)} finished jobs from {path}")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def get(self, key):
+        """
+        Result of a finished job.
+
+        Args:
+            key (str): Key of the job.
+
+        Returns:
+            object: The result, None if the job is not finished.
+        """
+        with self._lock:
+            return self._results.get(key)
+
+    def put(self, key, result):
+        """
+        Record the result of a finished job.
+
+        Args:
+            key (str): Key of the job.
+            result (object): JSON serializable result.
+        """
+        with self._lock:
+            self._results[key] = result
+            if self.path is not None:
+                with open(self.path, "a") as file:
+                    file.write(json.dumps({"key": key, "result": result}) + "\n")
+
+
+class JobRunner:
+    """
+    Runs jobs in a bounded pool of threads with rate limited, retried API calls and a checkpoint.
+    """
+
+    def __init__(self, workers=4, rate=None, retries=5, backoff=1.0, max_backoff=60.0, checkpoint=None):
+        """
+        Initialize the runner.
+
+        Args:
+            workers (int): Number of jobs running at once.
+            rate (float): API calls per second over all workers, None for no limit.
+            retries (int): Number of retries of a failed API call.
+            backoff (float): Seconds before the first retry, doubled for every further retry.
+            max_backoff (float): Maximum seconds between two retries.
+            checkpoint (Checkpoint): Results of finished jobs, an in-memory checkpoint if None.
+        """
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate, burst=workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+        self.stats = {"done": 0, "skipped": 0, "failed": 0, "retries": 0}
+        self._lock = threading.Lock()
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call an API function, waiting for the rate limit and retrying on transient errors.
+
+        Args:
+            function (callable): The API call.
+            *args: Positional arguments of the call.
+            **kwargs: Keyword arguments of the call.
+
+        Returns:
+            object: The result of the call.
+        """
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if attempt >= self.retries or not is_retryable(error):
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Retry {attempt + 1}/{self.retries} in {delay:.1f}s after {type(error).__name__}: {error}")
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+
+    def _run_job(self, job, key, item):
+        try:
+            result = job(item)
+        except Exception as error:
+            logger.error(f"Job {key} failed: {type(error).__name__}: {error}")
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        self.checkpoint.put(key, result)
+        with self._lock:
+            self.stats["done"] += 1
+        return result
+
+    def run(self, job, items, valid=None):
+        """
+        Run a job for every item which is not in the checkpoint.
+
+        At most twice the number of workers jobs are submitted at once, so the items can be a
+        stream of any length.
+
+        Args:
+            job (callable): Function of one item returning a JSON serializable result.
+            items (iterable): (key, item) tuples, the key identifies the job in the checkpoint.
+            valid (callable): Function of an item and its checkpointed result telling whether the result
+                can still be used, e.g. whether its output file exists. Jobs with invalid results are run again.
+
+        Yields:
+            tuple: (key, item, result) in the order of the items, for finished and checkpointed jobs.
+                Failed jobs are logged and left out, they are run again by the next run.
+        """
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for key, item in items:
+                if key in self.checkpoint and (valid is None or valid(item, self.checkpoint.get(key))):
+                    with self._lock:
+                        self.stats["skipped"] += 1
+                    pending.append((key, item, None))
+                else:
+                    pending.append((key, item, executor.submit(self._run_job, job, key, item)))
+                while len(pending) > 2 * self.workers or (pending and pending[0][2] is None):
+                    yield from self._finish(pending.popleft())
+            while pending:
+                yield from self._finish(pending.popleft())
+
+        logger.info(f"Jobs: {self.stats}")
+
+    def _finish(self, entry):
+        key, item, future = entry
+        result = self.checkpoint.get(key) if future is None else future.result()
+        if result is not None:
+            yield key, item, result
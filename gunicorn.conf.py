@@ -0,0 +1,31 @@
+"""
+gunicorn.conf.py
+
+Configuration of gunicorn for the production server, read from the [server] and [limits] sections
+of settings.ini:
+
+    gunicorn wsgi:app
+
+Every worker process has its own copy of the models and its own admission queue, so the limits in
+the [limits] section apply per worker. The results pages are shared by the workers through the
+SQLite file of `results_path`, without it a page can only be shown again by the worker which created
+it and a single worker must be used. The threads of a worker serve the active requests, the
+requests waiting in the admission queue and some spare threads which answer 503, images and
+static files without waiting.
+"""
+
+import configparser
+
+settings = configparser.ConfigParser()
+settings.read("settings.ini")
+
+bind = settings.get("server", "bind", fallback="0.0.0.0:8000")
+workers = settings.getint("server", "workers", fallback=2)
+worker_class = "gthread"
+threads = (settings.getint("limits", "max_active", fallback=8) + settings.getint("limits", "max_queue", fallback=16)
+           + settings.getint("server", "spare_threads", fallback=8))
+# the recommendation pipeline takes several seconds, streamed pages even longer
+timeout = settings.getint("server", "timeout", fallback=120)
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
@@ -0,0 +1,109 @@
+"""
+image_index.py
+
+This module keeps the image path of every stored listing in a small SQLite table.
+
+The table is written when listings are ingested, copied or removed by database.Database, so the web
+server can serve /image/<listing_id> with one indexed lookup instead of building the database with
+ChromaDB, the text embedding function and the CLIP model. `python database.py --index-images` writes
+the table for the listings of a database ingested before it existed. The path of the table is set
+by `images_path` in the [database] section of settings.ini.
+"""
+
+import os
+import sqlite3
+import threading
+
+from logger_config import Logger
+logger = Logger(name="ImageIndex").get_logger()
+
+
+class ImageIndex:
+    """
+    Image paths of the listings by listing id, in a SQLite file shared by several processes.
+    """
+
+    def __init__(self, path):
+        """
+        Open or create the table.
+
+        Args:
+            path (str): Path of the SQLite file.
+        """
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS images (listing_id TEXT PRIMARY KEY, image TEXT)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def image_path(self, listing_id):
+        """
+        Image path of a listing.
+
+        Args:
+            listing_id (str): Id of the listing.
+
+        Returns:
+            str | None: The image path, None if the listing isn't stored.
+        """
+        row = self._connection().execute("SELECT image FROM images WHERE listing_id = ?", (listing_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_many(self, items):
+        """
+        Store or replace the image paths of listings.
+
+        Args:
+            items (list[tuple]): (listing id, image path) tuples.
+        """
+        items = [(listing_id, image) for listing_id, image in items if image]
+        if not items:
+            return
+        connection = self._connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO images VALUES (?, ?)", items)
+
+    def delete(self, listing_ids):
+        """
+        Remove the image paths of listings, unknown ids are ignored.
+
+        Args:
+            listing_ids (list[str]): Ids of the listings.
+        """
+        connection = self._connection()
+        with connection:
+            connection.executemany("DELETE FROM images WHERE listing_id = ?", [(id,) for id in listing_ids])
+
+    def count(self):
+        """
+        Number of listings with an image path.
+
+        Returns:
+            int: The number of rows.
+        """
+        return self._connection().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+
+def create_image_index(settings):
+    """
+    Create the image index configured in the [database] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        ImageIndex: The index.
+    """
+    return ImageIndex(settings.get("database", "images_path", fallback=".cache/images.sqlite3"))
@@ -0,0 +1,203 @@
+"""
+image_ingest.py
+
+This module embeds the images of the real estate listings for the real_estate_image collection.
+
+Images are decoded and resized in a pool of worker processes and embedded with CLIP in batches,
+so the model runs one forward pass per batch instead of one per image. The vectors are stored in
+the embedding cache under the hash of the image file, so re-indexing does not embed unchanged
+images again.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from embedding_cache import content_hash, model_id
+from logger_config import Logger
+logger = Logger(name="ImageIngest").get_logger()
+
+
+def load_image(uri, size=224):
+    """
+    Decode an image and resize it so that its shorter side has the given size, cropped to a square.
+
+    Args:
+        uri (str): Path of the image file.
+        size (int): Side length of the resulting image.
+
+    Returns:
+        np.ndarray: RGB image with shape (size, size, 3).
+    """
+    with Image.open(uri) as image:
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        width, height = image.size
+        scale = size / min(width, height)
+        image = image.resize((max(size, round(width * scale)), max(size, round(height * scale))), Image.BICUBIC)
+        left = (image.width - size) // 2
+        top = (image.height - size) // 2
+        image = image.crop((left, top, left + size, top + size))
+        return np.asarray(image)
+
+
+def try_load_image(uri, size=224):
+    """
+    Decode an image like load_image, without raising for a missing or unreadable file.
+
+    Args:
+        uri (str): Path of the image file.
+        size (int): Side length of the resulting image.
+
+    Returns:
+        np.ndarray: RGB image with shape (size, size, 3), None if the image can't be read.
+    """
+    try:
+        return load_image(uri, size)
+    except OSError:
+        return None
+
+
+def file_hash(uri):
+    """
+    Hash of the content of an image file.
+
+    Args:
+        uri (str): Path of the image file.
+
+    Returns:
+        str: Hex digest of the file.
+    """
+    with open(uri, "rb") as file:
+        return content_hash(file.read())
+
+
+def embed_batch(embedding_function, images):
+    """
+    Embed a batch of images.
+
+    For the OpenCLIP embedding function the images are encoded with one forward pass of the model,
+    other embedding functions are called with the whole batch.
+
+    Args:
+        embedding_function: ChromaDB embedding function for images.
+        images (list[np.ndarray]): The images.
+
+    Returns:
+        list[np.ndarray]: Normalized embedding for every image.
+    """
+    model = getattr(embedding_function, "_model", None)
+    if model is None:
+        return [np.asarray(vector, dtype=np.float32) for vector in embedding_function(images)]
+
+    torch = embedding_function._torch
+    batch = torch.stack([
+        embedding_function._preprocess(Image.fromarray(image)) for image in images
+    ]).to(embedding_function.device)
+    with torch.no_grad():
+        features = model.encode_image(batch)
+        features /= features.norm(dim=-1, keepdim=True)
+    return list(features.cpu().numpy().astype(np.float32))
+
+
+class ImageEmbedder:
+    """
+    Embeds image files with a pool of decoding processes and batched model inference.
+
+    Use it as a context manager so the worker processes are shut down afterwards.
+    """
+
+    def __init__(self, embedding_function, cache=None, workers=1, batch_size=32, size=224):
+        """
+        Initialize the embedder.
+
+        Args:
+            embedding_function: ChromaDB embedding function for images.
+            cache (EmbeddingCache): Cache for the image vectors, None to always embed.
+            workers (int): Number of processes decoding the images, 1 decodes in the calling process.
+            batch_size (int): Number of images embedded at once.
+            size (int): Side length the images are resized to.
+        """
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.workers = workers
+        self.batch_size = batch_size
+        self.size = size
+        self.model = model_id(embedding_function)
+        self.embedded = 0
+        self.cached = 0
+        self.failed = 0
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _load_images(self, uris):
+        sizes = [self.size] * len(uris)
+        if self._executor is None:
+            return map(try_load_image, uris, sizes)
+        chunksize = max(1, len(uris) // (4 * self.workers))
+        return self._executor.map(try_load_image, uris, sizes, chunksize=chunksize)
+
+    def _file_hash(self, uri):
+        try:
+            return file_hash(uri)
+        except OSError:
+            return None
+
+    def __call__(self, uris):
+        """
+        Embed the image files.
+
+        Missing or unreadable images don't abort the call, their embedding is None.
+
+        Args:
+            uris (list[str]): Paths of the image files.
+
+        Returns:
+            list[np.ndarray]: Embedding for every image, None for the images which can't be read.
+        """
+        keys = [self._file_hash(uri) for uri in uris]
+        readable = [index for index, key in enumerate(keys) if key is not None]
+        vectors = [None] * len(uris)
+        if self.cache is not None and readable:
+            cached = self.cache.get_many(self.model, [keys[index] for index in readable], memory=False)
+            for index, vector in zip(readable, cached):
+                vectors[index] = vector
+        missing = [index for index in readable if vectors[index] is None]
+        self.cached += len(readable) - len(missing)
+
+        batch = []
+        for index, image in zip(missing, self._load_images([uris[index] for index in missing])):
+            if image is None:
+                continue
+            batch.append((index, image))
+            if len(batch) >= self.batch_size:
+                self._embed(batch, keys, vectors)
+                batch = []
+        if batch:
+            self._embed(batch, keys, vectors)
+
+        failed = sum(vector is None for vector in vectors)
+        if failed:
+            self.failed += failed
+            logger.warning(f"{failed} of {len(uris)} images could not be read")
+        return vectors
+
+    def _embed(self, batch, keys, vectors):
+        indices = [index for index, _ in batch]
+        embeddings = embed_batch(self.embedding_function, [image for _, image in batch])
+        for index, vector in zip(indices, embeddings):
+            vectors[index] = vector
+        if self.cache is not None:
+            # the vectors of the ingestion only go to disk, so they don't evict the query vectors from memory
+            self.cache.put_many(self.model, [keys[index] for index in indices], embeddings, memory=False)
+        self.embedded += len(batch)
@@ -0,0 +1,165 @@
+"""
+limits.py
+
+This module limits how much work the web server accepts and how many calls run at once against
+the slow backends.
+
+- AdmissionQueue: a bounded number of requests runs the recommendation pipeline at once, a bounded
+  number waits for a slot. Further requests are rejected immediately, so the server answers
+  with 503 and Retry-After instead of piling up requests which time out anyway.
+- StageLimit: a semaphore for one backend (the LLM, the text or the image embedding model), used
+  as a context manager in threads and with `async with` in the concurrent pipeline.
+
+The limits are configured in the [limits] section of settings.ini and apply per worker process.
+"""
+
+import asyncio
+import threading
+
+from logger_config import Logger
+logger = Logger(name="Limits").get_logger()
+
+# stages with a concurrency limit and their default limits
+stage_defaults = {"llm": 8, "embedding_text": 8, "embedding_image": 2}
+
+
+class AdmissionQueue:
+    """
+    Admission control with a bounded number of active and waiting requests.
+    """
+
+    def __init__(self, max_active=8, max_queue=16, timeout=30.0):
+        """
+        Initialize the queue.
+
+        Args:
+            max_active (int): Number of requests which run at the same time.
+            max_queue (int): Number of requests which wait for a slot, further requests are rejected.
+            timeout (float): Seconds a request waits for a slot before it is rejected.
+        """
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue if all slots are taken.
+
+        Returns:
+            bool: True if the request was admitted and has to call release(), False if it was rejected.
+        """
+        with self._condition:
+            if self.active >= self.max_active:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self.active < self.max_active, timeout=self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    logger.warning(f"Request waited {self.timeout}s without a free slot")
+                    return False
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        """
+        Give back the slot of an admitted request.
+        """
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        """
+        Current load and counters.
+
+        Returns:
+            dict: 'active', 'waiting', 'admitted' and 'rejected'.
+        """
+        with self._condition:
+            return {"active": self.active, "waiting": self.waiting, "admitted": self.admitted, "rejected": self.rejected}
+
+
+class StageLimit:
+    """
+    Limits the number of concurrent calls to a backend.
+    """
+
+    def __init__(self, name, limit):
+        """
+        Initialize the limit.
+
+        Args:
+            name (str): Name of the stage, used in log messages.
+            limit (int): Maximum number of concurrent calls.
+        """
+        self.name = name
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        # the semaphore is shared with threads, so waiting must not block the event loop
+        if not self._semaphore.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(self._semaphore.acquire))
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # the thread keeps waiting, the slot it gets is given back at once
+                waiter.add_done_callback(self._release_acquired)
+                raise
+        return self
+
+    def _release_acquired(self, waiter):
+        if not waiter.cancelled() and waiter.exception() is None and waiter.result():
+            self._semaphore.release()
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+def create_admission_queue(settings):
+    """
+    Create the admission queue configured in the [limits] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        AdmissionQueue: The queue.
+    """
+    return AdmissionQueue(
+        max_active=settings.getint("limits", "max_active", fallback=8),
+        max_queue=settings.getint("limits", "max_queue", fallback=16),
+        timeout=settings.getfloat("limits", "queue_timeout", fallback=30.0),
+    )
+
+
+def create_stage_limit(settings, name):
+    """
+    Create the concurrency limit of a stage configured in the [limits] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+        name (str): Name of the stage, a key of stage_defaults.
+
+    Returns:
+        StageLimit: The limit.
+    """
+    return StageLimit(name, settings.getint("limits", name, fallback=stage_defaults[name]))
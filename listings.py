@@ -0,0 +1,178 @@
+"""
+listings.py
+
+This module reads real estate listings from JSON and JSONL files and derives stable identifiers and content hashes for them.
+
+Both formats are read as a stream, so the memory usage does not grow with the size of the file:
+- JSON files contain an object with the list of listings in "RealEstateObj" (as written by create_data.py)
+  or a top-level list of listings.
+- JSONL files contain one listing per line.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+decoder = json.JSONDecoder()
+
+listing_fields = ["Neighborhood", "Price", "Bedrooms", "Bathrooms", "HouseSize", "Description", "NeighborhoodDescription"]
+
+# typed metadata fields used for filtering and the listing fields they are parsed from
+numeric_fields = {"price": "Price", "bedrooms": "Bedrooms", "bathrooms": "Bathrooms", "house_size": "HouseSize"}
+
+multipliers = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "million": 1_000_000}
+
+
+def listing_id(listing, source, index):
+    """
+    Stable identifier of a listing.
+
+    A listing with an explicit "id" keeps it, otherwise the id is derived from the name of the source
+    file and the position of the listing in it. An edited listing keeps its id, its content_hash tells
+    that it changed.
+
+    Args:
+        listing (dict): The listing.
+        source (str): Path of the file the listing was read from.
+        index (int): Position of the listing in the file.
+
+    Returns:
+        str: The identifier.
+    """
+    if "id" in listing:
+        return str(listing["id"])
+    return f"{os.path.splitext(os.path.basename(source))[0]}-{index}"
+
+
+def content_hash(listing):
+    """
+    Hash of the listing fields, used to detect changed listings.
+
+    Args:
+        listing (dict): The listing.
+
+    Returns:
+        str: Hex digest of the listing fields.
+    """
+    content = {field: listing.get(field) for field in listing_fields}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def iter_listings(filename, chunk_size=1 << 16):
+    """
+    Iterate over the listings of a JSON or JSONL file without loading the whole file.
+
+    Args:
+        filename (str): Path to the file, files ending with .jsonl are read line by line.
+        chunk_size (int): Number of characters read at once from JSON files.
+
+    Yields:
+        dict: One listing after the other.
+    """
+    with open(filename, "r") as file:
+        if filename.endswith(".jsonl"):
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(file, chunk_size=chunk_size)
+
+
+def iter_json_array(file, key="RealEstateObj", chunk_size=1 << 16):
+    """
+    Iterate over the elements of a JSON list, either at top level or in the given key of the top-level object.
+
+    Args:
+        file (file): Opened text file.
+        key (str): Key of the list if the top level is an object.
+        chunk_size (int): Number of characters read at once.
+
+    Yields:
+        object: One list element after the other.
+    """
+    buffer = ""
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        chunk = file.read(chunk_size)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+    # find the opening bracket of the list
+    while True:
+        stripped = buffer.lstrip()
+        if stripped.startswith("["):
+            buffer = stripped[1:]
+            break
+        marker = buffer.find(f'"{key}"')
+        bracket = buffer.find("[", marker) if marker >= 0 else -1
+        if bracket >= 0:
+            buffer = buffer[bracket + 1:]
+            break
+        if eof:
+            raise ValueError(f"No list of listings found in the file (expected a list or the key '{key}')")
+        fill()
+
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("]"):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        yield element
+        buffer = buffer[end:]
+
+
+def parse_number(value):
+    """
+    Parse a number from a free-form value like "$650,000", "500.000$", "$1.2M", "750k" or "2100 sqft".
+
+    Groups of three digits separated by "," or "." are treated as thousands.
+
+    Args:
+        value (str | int | float): The value.
+
+    Returns:
+        int | None: The parsed number, None if the value contains no number.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    match = re.search(r"(\d[\d,.]*)\s*(k|thousand|m|million)?\b", str(value).lower())
+    if match is None:
+        return None
+
+    digits = match.group(1).rstrip(".,")
+    if re.fullmatch(r"\d{1,3}([.,]\d{3})+", digits):
+        number = float(re.sub(r"[.,]", "", digits))
+    else:
+        number = float(digits.replace(",", ""))
+    return int(number * multipliers.get(match.group(2), 1))
+
+
+def listing_metadata(listing):
+    """
+    Typed numeric metadata of a listing, used for filtering in the similarity searches.
+
+    Args:
+        listing (dict): The listing.
+
+    Returns:
+        dict: Parsed values of the fields in numeric_fields, fields which can't be parsed are missing.
+    """
+    metadata = {}
+    for key, field in numeric_fields.items():
+        number = parse_number(listing.get(field)) if listing.get(field) is not None else None
+        if number is not None:
+            metadata[key] = number
+    return metadata
@@ -15,12 +15,70 @@ from langchain.prompts import (
     MessagesPlaceholder,
     ChatPromptTemplate
 )
+from concurrent.futures import ThreadPoolExecutor
 import configparser
+import contextvars
 import re
 
+from pydantic import BaseModel, Field
+
 import llm_history
+import metrics
+import recommendation_cache
+import resources
+import token_budget
 import user_data
-from database import Database
+from constraints import extract_constraints, to_where
+from description_cache import listing_key
+from fusion import fusion_settings, select_listings
+from pipeline import StageTimings, run_searches
+from semantic_cache import CachedChatModel, constraints_key
+
+from logger_config import Logger
+logger = Logger(name="LLM").get_logger()
+
+profile_query = """
+                "Here is a list with questions and answers of a customer who is looking for a real estate.
+                Please write a short profile of the customer with
+                - price range
+                - number of bedrooms
+                - numbr of bathrooms
+                - size of the house
+                - wishes for the house
+                - wishes for the neighborhood
+        """
+
+profile_image_query = """
+                "Here is a list with questions and answers of a customer who is looking for a real estate.
+                Please write a short profile of the customer with only the visual aspects which can be seen
+                from outside. Like the colour, windows size, garden.
+        """
+
+results_query = """
+        For each of these houses write an individual description from the available information. Use only information which is available in the description.
+        Don't just repeat the data set. Write for each house in the descritption why it matched the users needs.        
+        """
+
+# start of the description of a house in the generated text, e.g. "**1. "
+description_marker = re.compile(r"\*\*\d+\.\s")
+
+listing_query = """
+        Here is a real estate that should be recommended to the customer:
+
+        -------------------
+
+        {listing}
+
+        -------------------
+
+        Write an individual description of this house from the available information. Use only information which is available in the description.
+        Don't just repeat the data set. Write in the description why it matches the customer's needs.
+        """
+
+
+class HouseDescription(BaseModel):
+    """Description of one recommended house for the customer."""
+    description: str = Field(description="Description of the house and why it matches the customer's needs")
 
 
 class LLM:
@@ -46,7 +104,13 @@ class LLM:
         else:
             model_name = "llama3.2:1b-instruct-fp16"
             self.llm = ChatOllama(temperature=0.0, model=model_name)
-        
+
+        # answers of similar profile and results prompts are taken from the semantic cache
+        semantic_cache = resources.get_semantic_cache(open_ai=open_ai)
+        if semantic_cache is not None:
+            self.llm = CachedChatModel(chat_model=self.llm, semantic_cache=semantic_cache, model_name=model_name)
+
+        self.model_name = model_name
         self.model = self.llm
         system_prompt = """
         You are AI that will recommend user a real estates based on their answers to personal questions. 
@@ -54,104 +118,151 @@ class LLM:
         Ask user questions now.
         """
 
-        prompt_template = ChatPromptTemplate.from_messages([
+        self.prompt_template = ChatPromptTemplate.from_messages([
         SystemMessagePromptTemplate.from_template(system_prompt),
         MessagesPlaceholder(variable_name="history"),
         HumanMessagePromptTemplate.from_template("{query}"),])
-        self.pipeline = prompt_template | self.model
+        self.pipeline = self.prompt_template | self.model
+        self.budget = resources.get_token_budget()
 
-    def conversation(self, history_dic):
+    def _pipeline_with_history(self, history_dic, session_id, call):
         """
-        Generate a customer profile based on a history of questions and answers.
+        Prefill the session history with the questionnaire and wrap the pipeline with it.
 
         Args:
             history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+            session_id (str): Session identifier of the chat history.
+            call (str): Name of the call, which selects its token budget.
 
         Returns:
-            str: Generated customer profile.
+            RunnableWithMessageHistory: The pipeline using the session history.
         """
         # prefill history
-        history = llm_history.get_by_session_id("id_1")
+        history = llm_history.get_by_session_id(session_id)
 
-        for question, answer in zip(history_dic["questions"], history_dic["answers"]):
-            history.add_ai_message(question)
-            history.add_user_message(answer)
+        if self.budget.compact:
+            # one message with all questions and answers instead of two messages per question
+            history.add_user_message(token_budget.questionnaire(history_dic["questions"], history_dic["answers"]))
+        else:
+            for question, answer in zip(history_dic["questions"], history_dic["answers"]):
+                history.add_ai_message(question)
+                history.add_user_message(answer)
 
-        pipeline_with_history = RunnableWithMessageHistory(
-            self.pipeline,
+        return RunnableWithMessageHistory(
+            self.prompt_template | self.budget.runnable(call) | self.model,
             get_session_history=llm_history.get_by_session_id,
             input_messages_key="query",
             history_messages_key="history"
         )
 
-        query = """
-                "Here is a list with questions and answers of a customer who is looking for a real estate.
-                Please write a short profile of the customer with
-                - price range
-                - number of bedrooms
-                - numbr of bathrooms
-                - size of the house
-                - wishes for the house
-                - wishes for the neighborhood
+    def conversation(self, history_dic, session_id="id_1"):
         """
+        Generate a customer profile based on a history of questions and answers.
 
-        result = pipeline_with_history.invoke(
-            {"query": query},
-            config={"session_id": "id_1"}
-        )
+        Args:
+            history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+            session_id (str): Session identifier of the chat history.
+
+        Returns:
+            str: Generated customer profile.
+        """
+        pipeline_with_history = self._pipeline_with_history(history_dic, session_id, "profile")
+        # the semantic cache only shares answers between customers with the same hard constraints
+        metadata = {"call": "profile", "constraints": constraints_key(history_dic["answers"])}
+
+        with resources.get_stage_limit("llm"), metrics.llm_call("profile", self.model_name) as usage:
+            result = pipeline_with_history.invoke(
+                {"query": profile_query},
+                config={"session_id": session_id, "callbacks": [usage], "metadata": metadata}
+            )
+
+        return result.content
+
+    async def aconversation(self, history_dic, session_id="id_1"):
+        """
+        Asynchronous version of conversation().
+
+        Args:
+            history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+            session_id (str): Session identifier of the chat history.
+
+        Returns:
+            str: Generated customer profile.
+        """
+        pipeline_with_history = self._pipeline_with_history(history_dic, session_id, "profile")
+        metadata = {"call": "profile", "constraints": constraints_key(history_dic["answers"])}
+
+        async with resources.get_stage_limit("llm"):
+            with metrics.llm_call("profile", self.model_name) as usage:
+                result = await pipeline_with_history.ainvoke(
+                    {"query": profile_query},
+                    config={"session_id": session_id, "callbacks": [usage], "metadata": metadata}
+                )
 
         return result.content
     
-    def conversation_image(self, history_dic):
+    def conversation_image(self, history_dic, session_id="id_2"):
         """
         Generate a customer profile focusing only on visual aspects (e.g., exterior features).
 
         Args:
             history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+            session_id (str): Session identifier of the chat history.
 
         Returns:
             str: Generated visual profile.
         """
-        # prefill history
-        history = llm_history.get_by_session_id("id_2")
+        pipeline_with_history = self._pipeline_with_history(history_dic, session_id, "profile_image")
+        metadata = {"call": "profile_image", "constraints": constraints_key(history_dic["answers"])}
 
-        for question, answer in zip(history_dic["questions"], history_dic["answers"]):
-            history.add_ai_message(question)
-            history.add_user_message(answer)
+        with resources.get_stage_limit("llm"), metrics.llm_call("profile_image", self.model_name) as usage:
+            result = pipeline_with_history.invoke(
+                {"query": profile_image_query},
+                config={"session_id": session_id, "callbacks": [usage], "metadata": metadata}
+            )
 
-        pipeline_with_history = RunnableWithMessageHistory(
-            self.pipeline,
-            get_session_history=llm_history.get_by_session_id,
-            input_messages_key="query",
-            history_messages_key="history"
-        )
+        return result.content
 
-        query = """
-                "Here is a list with questions and answers of a customer who is looking for a real estate.
-                Please write a short profile of the customer with only the visual aspects which can be seen
-                from outside. Like the colour, windows size, garden.
+    async def aconversation_image(self, history_dic, session_id="id_2"):
         """
+        Asynchronous version of conversation_image().
 
-        result = pipeline_with_history.invoke(
-            {"query": query},
-            config={"session_id": "id_2"}
-        )
+        Args:
+            history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+            session_id (str): Session identifier of the chat history.
+
+        Returns:
+            str: Generated visual profile.
+        """
+        pipeline_with_history = self._pipeline_with_history(history_dic, session_id, "profile_image")
+        metadata = {"call": "profile_image", "constraints": constraints_key(history_dic["answers"])}
+
+        async with resources.get_stage_limit("llm"):
+            with metrics.llm_call("profile_image", self.model_name) as usage:
+                result = await pipeline_with_history.ainvoke(
+                    {"query": profile_image_query},
+                    config={"session_id": session_id, "callbacks": [usage], "metadata": metadata}
+                )
 
         return result.content
     
-    def results(self, context):
+    def _results_pipeline(self):
         """
-        Generate individual descriptions for each recommended house, explaining why it matches user needs.
+        Pipeline writing the descriptions of the recommended houses for the customer profile.
 
-        Args:
-            context (str): Context string containing available real estate information.
+        The prompt contains the customer profile instead of the chat history of the profile, which
+        the descriptions don't need.
 
         Returns:
-            str: Generated descriptions for each house.
+            Runnable: The pipeline, invoked with 'query', 'profile' and 'context'.
         """
         system_prompt = """
         You are AI that will recommend user a real estates based on their answers to personal questions. 
-        You will only use information about the customer needs that are in the users answers or than can be concluded from the answers.
+        You will only use information about the customer needs that are in the customer profile or than can be concluded from it.
+
+        Here is the profile of the customer:
+
+        {profile}
 
         Here are some available real estates that should be recommended to the user
 
@@ -162,83 +273,394 @@ class LLM:
         -------------------
         """
 
-        query = """
-        For each of these houses write an individual description from the available information. Use only information which is available in the description.
-        Don't just repeat the data set. Write for each house in the descritption why it matched the users needs.        
+        prompt_template = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(system_prompt),
+            HumanMessagePromptTemplate.from_template("{query}"),
+        ])
+
+        return prompt_template | self.budget.runnable("results") | self.llm
+
+    def results(self, context, profile):
+        """
+        Generate individual descriptions for each recommended house, explaining why it matches user needs.
+
+        Args:
+            context (str): Context string containing available real estate information.
+            profile (str): Customer profile.
+
+        Returns:
+            str: Generated descriptions for each house.
         """
+        pipeline = self._results_pipeline()
 
-        #print("SYSTEMPROMPT:\n", system_prompt, "\n\nPROMPT;\n", query, "\n\nCONTEXT:\n", context)
+        with resources.get_stage_limit("llm"), metrics.llm_call("results", self.model_name) as usage:
+            result = pipeline.invoke({"query": results_query, "profile": profile, "context": context},
+                                     config={"callbacks": [usage], "metadata": {"call": "results"}})
+
+        return result.content
+
+    def describe_listing(self, profile, listing):
+        """
+        Generate the description of a single recommended house with structured output.
+
+        The prompt contains the customer profile instead of the chat history, so the descriptions of
+        several houses can be generated independently and concurrently.
+
+        Args:
+            profile (str): Customer profile.
+            listing (str): Data of the house.
+
+        Returns:
+            str: Description of the house, explaining why it matches the user needs.
+        """
+        system_prompt = """
+        You are AI that will recommend user a real estates based on their answers to personal questions. 
+        You will only use information about the customer needs that are in the customer profile or than can be concluded from it.
+
+        Here is the profile of the customer:
+
+        {profile}
+        """
 
         prompt_template = ChatPromptTemplate.from_messages([
             SystemMessagePromptTemplate.from_template(system_prompt),
-            MessagesPlaceholder(variable_name="history"),
-            HumanMessagePromptTemplate.from_template("{query}"),
+            HumanMessagePromptTemplate.from_template(listing_query),
         ])
+        pipeline = (prompt_template | self.budget.runnable("describe_listing")
+                    | self.llm.with_structured_output(HouseDescription))
 
-        pipeline = prompt_template | self.llm
+        with resources.get_stage_limit("llm"), metrics.llm_call("describe_listing", self.model_name) as usage:
+            result = pipeline.invoke({"profile": profile, "listing": listing},
+                                     config={"callbacks": [usage], "metadata": {"call": "describe_listing"}})
 
-        pipeline_with_history = RunnableWithMessageHistory(
-            pipeline,
-            get_session_history=llm_history.get_by_session_id,
-            input_messages_key="query",
-            history_messages_key="history"
-        )
+        return result.description.strip()
 
-        result = pipeline_with_history.invoke({"query": query, "context": context,}, config={"session_id": "id_1"})
+    def results_stream(self, context, profile):
+        """
+        Streaming version of results(), yielding the text of the descriptions as the model generates it.
 
-        return result.content
+        Args:
+            context (str): Context string containing available real estate information.
+            profile (str): Customer profile.
+
+        Yields:
+            str: Chunks of the generated descriptions.
+        """
+        pipeline = self._results_pipeline()
+
+        with resources.get_stage_limit("llm"), metrics.llm_call("results", self.model_name) as usage:
+            for chunk in pipeline.stream({"query": results_query, "profile": profile, "context": context},
+                                         config={"callbacks": [usage], "metadata": {"call": "results"}}):
+                if chunk.content:
+                    yield chunk.content
     
-def get_results(answers):
+def eligible_filter(db, answers, min_listings):
     """
-    Main function to get recommended real estate images and descriptions based on user answers.
+    Build the metadata filter from the constraints in the answers.
+
+    The filter is dropped if fewer than min_listings listings fulfill the constraints.
 
     Args:
+        db (Database): Database with the text and image collections.
         answers (list): List of user answers.
+        min_listings (int): Minimum number of eligible listings.
+
+    Returns:
+        dict | None: The `where` filter for the searches.
+    """
+    where = to_where(extract_constraints(answers))
+    if where is None:
+        return None
+
+    # only the threshold matters, the matching listings are not all counted
+    eligible = db.count(where=where, limit=min_listings)
+    if eligible < min_listings:
+        logger.info(f"Only {eligible} listings fulfill {where}, searching without filter")
+        return None
+
+    logger.info(f"Searching the listings fulfilling {where}")
+    return where
+
+
+def split_descriptions(text):
+    """
+    Split the generated text into the descriptions of the houses.
+
+    Args:
+        text (str): Generated descriptions, each starting with a marker like "**1. ".
 
     Returns:
-        tuple: (images, datasets) where images is a list of image URIs and datasets is a list of descriptions.
+        list[str]: The descriptions.
     """
-    real_estate_llm = LLM(open_ai=True)
+    datasets = description_marker.split(text)
+    return [d.strip() for d in datasets if d.strip()]
+
+
+def iter_descriptions(chunks):
+    """
+    Split a stream of generated text into the descriptions of the houses.
+
+    A description is complete as soon as the marker of the next one appears, the last one at the end of the stream.
+    The descriptions are the same as split_descriptions() of the whole text.
+
+    Args:
+        chunks (iterable[str]): Chunks of the generated text.
+
+    Yields:
+        str: One description after the other.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        parts = description_marker.split(buffer)
+        for part in parts[:-1]:
+            if part.strip():
+                yield part.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _trace_log():
+    """Whether the trace of every request is logged, set in the [metrics] section of settings.ini."""
+    return resources.get_settings().getboolean("metrics", "trace_log", fallback=True)
+
+
+def _cached_results(answers):
+    """
+    Look up the recommendations for the answers in the recommendation cache.
+
+    Returns:
+        tuple: (cache, key, cached) with cache None if caching is disabled and cached None on a miss.
+    """
+    cache = resources.get_recommendation_cache(open_ai=True)
+    if cache is None:
+        return None, None, None
+
+    real_estate_llm = resources.get_llm(open_ai=True)
+    db = resources.get_database(open_ai=True)
+    key = recommendation_cache.cache_key(answers, real_estate_llm.model_name, db.collection_version())
+    with metrics.span("cache.recommendations") as attributes:
+        cached = cache.get(key)
+        attributes["hit"] = cached is not None
+    metrics.cache_lookup("recommendations", cached is not None)
+    logger.info(f"Recommendation cache {'hit' if cached else 'miss'}: {cache.stats()}")
+    return cache, key, cached
+
+
+def _select_listings(answers, mode, timings):
+    """
+    Generate the profiles, run the similarity searches and select the recommended listings.
+
+    Args:
+        answers (list): List of user answers.
+        mode (str): Pipeline execution mode, 'sequential' or 'concurrent'.
+        timings (StageTimings): Collector for the stage durations.
+
+    Returns:
+        tuple: (selected, profile, session_id, session_id_image) with the selected listings ('id', 'document'
+            and 'uri'), the customer profile and the chat sessions which have to be deleted by the caller.
+    """
+    real_estate_llm = resources.get_llm(open_ai=True)
+    db = resources.get_database(open_ai=True)
 
     questions, _ = user_data.get_info()
-    profile = real_estate_llm.conversation(history_dic={"questions": questions, "answers": answers})
+    history_dic = {"questions": questions, "answers": answers}
 
-    profile_image = real_estate_llm.conversation_image(history_dic={"questions": questions, "answers": answers})
-    #print(profile_image)
-    
-    db = Database(open_ai=True)
-
-    # First similarity search over the textual description
-    results = db.similarity_search_text(profile, k=6)
-    content = results["documents"][0]
-
-    # Second similarity search over the images
-    results_image = db.similarity_search_image(profile_image, k=15)
-    content_image = results_image["uris"][0]
-
-    # choose three samples
-    samples = ""
-    num_samples = 0
-    max_samples = 3
-    images = []
-    # get the 3 best image matches that are also good matches in the text search
-    for idx, id in enumerate(results_image['ids'][0]):
-        if num_samples >= max_samples:
-            break
-        if id in results['ids'][0]:
-            images.append(results_image['uris'][0][idx])
-            idx_results = results['ids'][0].index(id)
-            samples += f"{results['documents'][0][idx_results]}\n-------------------------------\n"
-            num_samples += 1
-
-    answer_for_customer = real_estate_llm.results(samples)
-    
-    datasets = re.split(r"\*\*\d+\.\s", answer_for_customer)
-    datasets = [d.strip() for d in datasets if d.strip()]
+    # every request has its own chat sessions, so requests don't share or grow the history
+    session_id = llm_history.new_session_id()
+    session_id_image = llm_history.new_session_id()
+
+    try:
+        fusion_kwargs = fusion_settings(resources.get_settings())
+
+        # hard constraints of the customer restrict the searches to the eligible listings
+        with timings.stage("constraints"):
+            where = None
+            if resources.get_settings().getboolean("pipeline", "prefilter", fallback=True):
+                where = eligible_filter(db, answers, fusion_kwargs["max_samples"])
+
+        # Profiles for the text and the image search and the similarity searches over both collections
+        profile, results, profile_image, results_image = run_searches(
+            real_estate_llm, db, history_dic, timings, mode=mode,
+            k_text=fusion_kwargs["k_text"], k_image=fusion_kwargs["k_image"],
+            session_id=session_id, session_id_image=session_id_image, where=where)
+
+        # choose the best listings that are good matches in both the text and the image search
+        with timings.stage("fusion"):
+            selected = select_listings(db, profile, profile_image, results, results_image, where=where,
+                                       **fusion_kwargs)
+    except BaseException:
+        # the sessions are only returned to the caller, which deletes them, if the selection succeeds
+        llm_history.delete_session(session_id)
+        llm_history.delete_session(session_id_image)
+        raise
 
-    return images, datasets
+    return selected, profile, session_id, session_id_image
 
 
+def describe_listings(real_estate_llm, profile, selected, cache=None):
+    """
+    Generate the descriptions of the selected listings one per listing, concurrently.
+
+    Descriptions are looked up in the cache by listing id, listing text and profile first, only the
+    missing ones are generated.
+
+    Args:
+        real_estate_llm (LLM): Language model wrapper.
+        profile (str): Customer profile.
+        selected (list[dict]): Selected listings with 'id' and 'document'.
+        cache (DescriptionCache): Cache of the descriptions, None to always generate them.
+
+    Yields:
+        str: Description of every listing in the order of the selected listings, each as soon as it and
+            all before it are generated.
+    """
+    keys = {listing["id"]: listing_key(listing["id"], listing["document"]) for listing in selected}
+    cached = {listing["id"]: cache.get(keys[listing["id"]], profile) for listing in selected} if cache is not None else {}
+    missing = [listing for listing in selected if cached.get(listing["id"]) is None]
+    if cache is not None:
+        metrics.cache_lookup("descriptions", True, len(selected) - len(missing))
+        metrics.cache_lookup("descriptions", False, len(missing))
+
+    with ThreadPoolExecutor(max_workers=max(1, len(missing))) as executor:
+        # every call runs in a copy of the current context, so its spans belong to the trace of the request
+        futures = {listing["id"]: executor.submit(contextvars.copy_context().run, real_estate_llm.describe_listing,
+                                                  profile, listing["document"])
+                   for listing in missing}
+        for listing in selected:
+            if listing["id"] not in futures:
+                yield cached[listing["id"]]
+                continue
+            description = futures[listing["id"]].result()
+            if cache is not None:
+                cache.put(keys[listing["id"]], profile, description)
+            yield description
+
+
+def _descriptions(real_estate_llm, profile, selected, method):
+    """
+    Generate the descriptions of the selected listings with the configured method.
+
+    Args:
+        real_estate_llm (LLM): Language model wrapper.
+        profile (str): Customer profile.
+        selected (list[dict]): Selected listings with 'id' and 'document'.
+        method (str): 'per_listing' for one structured call per listing, 'combined' for one call
+            for all listings whose answer is split at the "**N. " markers.
+
+    Yields:
+        str: One description after the other.
+    """
+    if method == "per_listing":
+        yield from describe_listings(real_estate_llm, profile, selected, cache=resources.get_description_cache())
+    else:
+        samples = "".join(f"{listing['document']}\n-------------------------------\n" for listing in selected)
+        yield from iter_descriptions(real_estate_llm.results_stream(samples, profile))
+
+
+def get_results(answers, mode=None):
+    """
+    Main function to get recommended real estate images and descriptions based on user answers.
+
+    Args:
+        answers (list): List of user answers.
+        mode (str): Pipeline execution mode, 'sequential' or 'concurrent'. Defaults to the
+            mode in the [pipeline] section of settings.ini.
+
+    Returns:
+        tuple: (images, datasets, ids) where images is a list of image URIs, datasets is a list of descriptions
+            and ids is a list of the listing ids.
+    """
+    if mode is None:
+        mode = resources.get_settings().get("pipeline", "mode", fallback="concurrent")
+    method = resources.get_settings().get("pipeline", "descriptions", fallback="per_listing")
+
+    with metrics.trace("get_results", log=_trace_log()) as trace:
+        trace.attributes.update(mode=mode, descriptions=method)
+        timings = StageTimings()
+
+        cache, key, cached = _cached_results(answers)
+        trace.attributes["cached"] = cached is not None
+        if cached is not None:
+            return cached
+
+        real_estate_llm = resources.get_llm(open_ai=True)
+        selected, profile, session_id, session_id_image = _select_listings(answers, mode, timings)
+        trace.attributes["listings"] = len(selected)
+
+        try:
+            with timings.stage("descriptions"):
+                datasets = list(_descriptions(real_estate_llm, profile, selected, method))
+            timings.report()
+        finally:
+            llm_history.delete_session(session_id)
+            llm_history.delete_session(session_id_image)
+
+        ids = [listing["id"] for listing in selected]
+        images = [listing["uri"] for listing in selected]
+
+        if cache is not None:
+            cache.put(key, (images, datasets, ids))
+
+        return images, datasets, ids
+
+
+def stream_results(answers, mode=None):
+    """
+    Streaming version of get_results(), yielding every recommended house as soon as its description is complete.
+
+    With one description per listing the descriptions are generated concurrently and yielded in the order of
+    the listings. Otherwise the descriptions are split from the token stream of the LLM, so the first house is
+    available when the model has written its description instead of after the whole answer.
+
+    Args:
+        answers (list): List of user answers.
+        mode (str): Pipeline execution mode, 'sequential' or 'concurrent'. Defaults to the
+            mode in the [pipeline] section of settings.ini.
+
+    Yields:
+        tuple: (id, image, description) with the listing id, the image URI and the description of one house.
+    """
+    if mode is None:
+        mode = resources.get_settings().get("pipeline", "mode", fallback="concurrent")
+    method = resources.get_settings().get("pipeline", "descriptions", fallback="per_listing")
+
+    with metrics.trace("stream_results", log=_trace_log()) as trace:
+        trace.attributes.update(mode=mode, descriptions=method)
+        timings = StageTimings()
+
+        cache, key, cached = _cached_results(answers)
+        trace.attributes["cached"] = cached is not None
+        if cached is not None:
+            images, datasets, ids = cached
+            yield from zip(ids, images, datasets)
+            return
+
+        real_estate_llm = resources.get_llm(open_ai=True)
+        selected, profile, session_id, session_id_image = _select_listings(answers, mode, timings)
+        trace.attributes["listings"] = len(selected)
+
+        datasets = []
+        try:
+            with timings.stage("descriptions"):
+                for description in _descriptions(real_estate_llm, profile, selected, method):
+                    if not datasets:
+                        timings.mark("first_description")
+                    datasets.append(description)
+                    if len(datasets) <= len(selected):
+                        listing = selected[len(datasets) - 1]
+                        yield listing["id"], listing["uri"], description
+            timings.report()
+        finally:
+            llm_history.delete_session(session_id)
+            llm_history.delete_session(session_id_image)
+
+        if cache is not None:
+            cache.put(key, (
+                [listing["uri"] for listing in selected], datasets, [listing["id"] for listing in selected]
+            ))
+
 
 def main():
     """
@@ -251,38 +673,21 @@ def main():
     open_ai = parser.getboolean("DEFAULT", "open_ai")
     print("Open AI: ", open_ai)
 
-    real_estate_llm = LLM(open_ai=open_ai)
+    real_estate_llm = resources.get_llm(open_ai=open_ai)
+    db = resources.get_database(open_ai=open_ai)
 
     questions, answers = user_data.get_info()
-    profile = real_estate_llm.conversation(history_dic={"questions": questions, "answers": answers})
+    fusion_kwargs = fusion_settings(resources.get_settings())
 
-    profile_image = real_estate_llm.conversation_image(history_dic={"questions": questions, "answers": answers})
-    #print(profile_image)
-    
-    db = Database(open_ai=open_ai)
-
-    # First similarity search over the textual description
-    results = db.similarity_search_text(profile, k=6)
-    content = results["documents"][0]
-
-    # Second similarity search over the images
-    results_image = db.similarity_search_image(profile_image, k=15)
-    content_image = results_image["uris"][0]
-
-    # choose three samples
-    samples = ""
-    num_samples = 0
-    max_samples = 3
-    # get the 3 best image matches that are also good matches in the text search
-    for idx, id in enumerate(results_image['ids'][0]):
-        if num_samples >= max_samples:
-            break
-        if id in results['ids'][0]:
-            idx_results = results['ids'][0].index(id)
-            samples += f"{results['documents'][0][idx_results]}\n-------------------------------\n"
-            num_samples += 1
-
-    answer_for_customer = real_estate_llm.results(samples)
+    profile, results, profile_image, results_image = run_searches(
+        real_estate_llm, db, {"questions": questions, "answers": answers}, StageTimings(), mode="sequential",
+        k_text=fusion_kwargs["k_text"], k_image=fusion_kwargs["k_image"])
+
+    # choose the best listings that are good matches in both the text and the image search
+    selected = select_listings(db, profile, profile_image, results, results_image, **fusion_kwargs)
+    samples = "".join(f"{listing['document']}\n-------------------------------\n" for listing in selected)
+
+    answer_for_customer = real_estate_llm.results(samples, profile)
     print(answer_for_customer)
 
 if __name__ == '__main__':
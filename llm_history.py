@@ -1,24 +1,28 @@
 """
 llm_history.py
 
-This module provides an in-memory chat message history implementation for use with
-LangChain's chat and message history interfaces. It allows storing, retrieving, and
-managing chat histories per session, with a configurable limit on the number of messages.
+This module provides chat message history implementations for use with LangChain's chat and
+message history interfaces. It allows storing, retrieving, and managing chat histories per session,
+with a configurable limit on the number of messages.
+
+Sessions are kept in a bounded store which evicts the least recently used sessions, sessions that
+were not used for longer than a time to live and sessions exceeding a memory cap. The store is
+either in memory or in a SQLite database (WAL mode) that can be shared by several worker processes.
 """
 
+from collections import OrderedDict
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
 from pydantic import BaseModel, Field
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import BaseMessage
-from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
 
-from langchain.prompts import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    MessagesPlaceholder,
-    ChatPromptTemplate
-)
+import resources
 
-store = {}
 
 class InMemoryHistory(BaseChatMessageHistory, BaseModel):
     """
@@ -55,11 +59,327 @@ class InMemoryHistory(BaseChatMessageHistory, BaseModel):
         """
         self.messages = []
 
+    def size(self) -> int:
+        """
+        Approximate memory used by the message contents.
+
+        Returns:
+            int: Number of characters of all stored messages.
+        """
+        return sum(len(str(message.content)) for message in self.messages)
+
+
+class SessionStore:
+    """
+    Bounded in-memory store of chat histories.
+
+    Sessions are evicted in least recently used order when there are more than `max_sessions`
+    sessions or the stored messages exceed `max_size` characters. Sessions not accessed for
+    `ttl` seconds are removed as well.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=3600, max_size=10_000_000, k=50):
+        """
+        Initialize an empty session store.
+
+        Args:
+            max_sessions (int): Maximum number of sessions.
+            ttl (float): Time to live of a session in seconds since its last access.
+            max_size (int): Maximum number of characters of all stored messages.
+            k (int): Maximum number of messages per session.
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_size = max_size
+        self.k = k
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """
+        Retrieve the history of a session, creating it if it does not exist.
+
+        Args:
+            session_id (str): The session identifier.
+
+        Returns:
+            BaseChatMessageHistory: The chat message history for the session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._sessions:
+                history, _ = self._sessions.pop(session_id)
+            else:
+                history = InMemoryHistory(k=self.k)
+            self._sessions[session_id] = (history, now)
+            self._evict(now)
+            return history
+
+    def delete(self, session_id: str) -> None:
+        """
+        Remove a session from the store.
+
+        Args:
+            session_id (str): The session identifier.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def size(self) -> int:
+        """
+        Approximate memory used by all sessions.
+
+        Returns:
+            int: Number of characters of all stored messages.
+        """
+        with self._lock:
+            return sum(history.size() for history, _ in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def _evict(self, now):
+        """
+        Remove expired sessions and the least recently used sessions above the limits.
+        The most recently used session is never evicted.
+        """
+        while len(self._sessions) > 1:
+            oldest_id, (history, last_access) = next(iter(self._sessions.items()))
+            if now - last_access > self.ttl or len(self._sessions) > self.max_sessions:
+                del self._sessions[oldest_id]
+            else:
+                break
+
+        if self.max_size is not None:
+            total = sum(history.size() for history, _ in self._sessions.values())
+            while total > self.max_size and len(self._sessions) > 1:
+                _, (history, _) = self._sessions.popitem(last=False)
+                total -= history.size()
+
+
+class SQLiteHistory(BaseChatMessageHistory):
+    """
+    Chat message history of one session stored in a SQLite database.
+
+    Only the last `k` messages of a session are kept.
+    """
+
+    def __init__(self, store, session_id, k=50):
+        """
+        Initialize the history of a session.
+
+        Args:
+            store (SQLiteSessionStore): The store holding the database connection.
+            session_id (str): The session identifier.
+            k (int): Maximum number of messages to retain in history.
+        """
+        self.store = store
+        self.session_id = session_id
+        self.k = k
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        """
+        Messages of the session in chronological order.
+        """
+        rows = self.store.connection().execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id",
+            (self.session_id,)
+        ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def add_messages(self, messages: list[BaseMessage]) -> None:
+        """
+        Add messages to the history, removing any messages beyond the last `k` messages.
+
+        Args:
+            messages (list[BaseMessage]): Messages to add to the history.
+        """
+        connection = self.store.connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(self.session_id, json.dumps(message)) for message in messages_to_dict(messages)]
+            )
+            connection.execute(
+                """DELETE FROM messages WHERE session_id = ? AND id NOT IN
+                   (SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)""",
+                (self.session_id, self.session_id, self.k)
+            )
+
+    def clear(self) -> None:
+        """
+        Clear the history by removing all stored messages.
+        """
+        connection = self.store.connection()
+        with connection:
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+
+
+class SQLiteSessionStore:
+    """
+    Session store in a SQLite database in WAL mode, which can be shared by several processes.
+
+    Sessions are evicted in least recently used order when there are more than `max_sessions`
+    sessions, and sessions not accessed for `ttl` seconds are removed.
+    """
+
+    def __init__(self, path=".history.sqlite3", max_sessions=1000, ttl=3600, k=50):
+        """
+        Initialize the store and create the tables if needed.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            max_sessions (int): Maximum number of sessions.
+            ttl (float): Time to live of a session in seconds since its last access.
+            k (int): Maximum number of messages per session.
+        """
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.k = k
+        self._local = threading.local()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL)"
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS messages (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, message TEXT)"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_access ON sessions (last_access)")
+
+    def connection(self):
+        """
+        Database connection of the calling thread.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """
+        Retrieve the history of a session, creating it if it does not exist.
+
+        Args:
+            session_id (str): The session identifier.
+
+        Returns:
+            BaseChatMessageHistory: The chat message history for the session.
+        """
+        now = time.time()
+        connection = self.connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, now)
+            )
+            self._evict(connection, now, session_id)
+        return SQLiteHistory(self, session_id, k=self.k)
+
+    def delete(self, session_id: str) -> None:
+        """
+        Remove a session from the store.
+
+        Args:
+            session_id (str): The session identifier.
+        """
+        connection = self.connection()
+        with connection:
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def __contains__(self, session_id):
+        row = self.connection().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def _evict(self, connection, now, current_id):
+        """
+        Remove expired sessions and the least recently used sessions above the limit.
+        """
+        expired = connection.execute(
+            "SELECT session_id FROM sessions WHERE last_access < ? AND session_id != ?",
+            (now - self.ttl, current_id)
+        ).fetchall()
+        overflow = connection.execute(
+            "SELECT session_id FROM sessions WHERE session_id != ? ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+            (current_id, self.max_sessions - 1)
+        ).fetchall()
+        evicted = {row[0] for row in expired + overflow}
+        if evicted:
+            connection.executemany("DELETE FROM messages WHERE session_id = ?", [(id,) for id in evicted])
+            connection.executemany("DELETE FROM sessions WHERE session_id = ?", [(id,) for id in evicted])
+
+
+def create_store(settings):
+    """
+    Create the session store configured in the [history] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        SessionStore | SQLiteSessionStore: The session store.
+    """
+    backend = settings.get("history", "backend", fallback="memory")
+    max_sessions = settings.getint("history", "max_sessions", fallback=1000)
+    ttl = settings.getfloat("history", "ttl", fallback=3600)
+    k = settings.getint("history", "max_messages", fallback=50)
+
+    if backend == "sqlite":
+        path = settings.get("history", "sqlite_path", fallback=".history.sqlite3")
+        return SQLiteSessionStore(path=path, max_sessions=max_sessions, ttl=ttl, k=k)
+    if backend == "memory":
+        max_size = settings.getint("history", "max_size", fallback=10_000_000)
+        return SessionStore(max_sessions=max_sessions, ttl=ttl, max_size=max_size, k=k)
+
+    raise ValueError(f"Unknown history backend: {backend}")
+
+
+def get_store():
+    """
+    Return the shared session store of the process.
+
+    Returns:
+        SessionStore | SQLiteSessionStore: The session store.
+    """
+    return resources.registry.get("history_store", lambda: create_store(resources.get_settings()))
+
+
+def new_session_id() -> str:
+    """
+    Create a new unique session identifier.
+
+    Returns:
+        str: The session identifier.
+    """
+    return uuid.uuid4().hex
+
+
 def get_by_session_id(session_id: str) -> BaseChatMessageHistory:
     """
     Retrieve the chat message history for a given session ID.
 
-    If no history exists for the session, a new InMemoryHistory is created.
+    If no history exists for the session, a new one is created.
 
     Args:
         session_id (str): The session identifier.
@@ -67,6 +387,14 @@ def get_by_session_id(session_id: str) -> BaseChatMessageHistory:
     Returns:
         BaseChatMessageHistory: The chat message history for the session.
     """
-    if session_id not in store:
-        store[session_id] = InMemoryHistory()
-    return store[session_id]
\ No newline at end of file
+    return get_store().get(session_id)
+
+
+def delete_session(session_id: str) -> None:
+    """
+    Remove the chat message history of a session.
+
+    Args:
+        session_id (str): The session identifier.
+    """
+    get_store().delete(session_id)
@@ -1,34 +1,246 @@
+"""
+logger_config.py
+
+Logging to the log file and stdout for all modules of the project.
+
+The handlers are created once per process and shared by all loggers, so creating a Logger for the
+same name again doesn't duplicate the output. The [logging] section of settings.ini configures:
+
+- queue: the loggers only put the records into a queue, a background thread (QueueListener) writes
+  them to the file and stdout, so requests don't wait for the disk or the terminal.
+- format: 'text' or 'json' with one JSON object per line.
+- file and level: the log file and the level of the loggers.
+
+Throttle and Sampler limit the messages logged in hot loops, e.g. progress messages of an ingestion.
+"""
+
+import atexit
+import configparser
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+
+text_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+stream_format = '%(levelname)s - %(message)s'
+
+# attributes of every LogRecord, everything else was passed with extra=
+_record_attributes = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object with time, level, logger, message and extra fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _record_attributes})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def logging_settings(filename="settings.ini"):
+    """
+    Read the [logging] section of the settings.
+
+    Args:
+        filename (str): Path of the settings file.
+
+    Returns:
+        dict: 'queue' (bool), 'json' (bool), 'file' (str) and 'level' (int).
+    """
+    settings = configparser.ConfigParser()
+    settings.read(filename)
+    return {
+        "queue": settings.getboolean("logging", "queue", fallback=True),
+        "json": settings.get("logging", "format", fallback="text").strip().lower() == "json",
+        "file": settings.get("logging", "file", fallback="project.log"),
+        "level": logging.getLevelName(settings.get("logging", "level", fallback="INFO").strip().upper()),
+    }
+
+
+def create_handlers(log_file, json_format=False, stream=None):
+    """
+    Create the handlers which write to the log file and to a stream.
+
+    Args:
+        log_file (str): Path of the log file.
+        json_format (bool): Write JSON lines instead of text.
+        stream (file): Stream of the second handler, sys.stdout if None.
+
+    Returns:
+        list[logging.Handler]: The file handler and the stream handler.
+    """
+    file_handler = logging.FileHandler(log_file)
+    stream_handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(text_format))
+        stream_handler.setFormatter(logging.Formatter(stream_format))
+    return [file_handler, stream_handler]
+
+
+# handlers shared by the loggers, keyed by log file, queue mode and format
+_shared_handlers = {}
+_listeners = []
+_lock = threading.Lock()
+
+
+def shared_handlers(log_file, use_queue=True, json_format=False):
+    """
+    Return the handlers of the process for a log file, creating them on first use.
+
+    Args:
+        log_file (str): Path of the log file.
+        use_queue (bool): Return a QueueHandler whose records are written by a background thread.
+        json_format (bool): Write JSON lines instead of text.
+
+    Returns:
+        list[logging.Handler]: The handlers to add to a logger.
+    """
+    key = (os.path.abspath(log_file), use_queue, json_format)
+    with _lock:
+        if key not in _shared_handlers:
+            handlers = create_handlers(log_file, json_format=json_format)
+            if use_queue:
+                records = queue.SimpleQueue()
+                listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+                listener.start()
+                _listeners.append(listener)
+                handlers = [logging.handlers.QueueHandler(records)]
+            _shared_handlers[key] = handlers
+        return _shared_handlers[key]
+
+
+def flush():
+    """
+    Wait until the queued records are written.
+    """
+    with _lock:
+        for listener in _listeners:
+            listener.stop()
+            listener.start()
+
+
+def _stop_listeners():
+    with _lock:
+        for listener in _listeners:
+            listener.stop()
+
+
+def _restart_listeners():
+    # the thread of a listener doesn't exist in a forked child process, e.g. a gunicorn worker
+    for listener in _listeners:
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(_stop_listeners)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners)
+
+
+class Throttle:
+    """
+    Lets a message through at most once per interval, e.g. for progress messages in a loop.
+    """
+
+    def __init__(self, interval=5.0):
+        """
+        Initialize the throttle, the first call is let through.
+
+        Args:
+            interval (float): Minimum seconds between two messages.
+        """
+        self.interval = interval
+        self.suppressed = 0
+        self._last = None
+        self._lock = threading.Lock()
+
+    def ready(self):
+        """
+        Check whether a message should be logged now.
+
+        Returns:
+            bool: True if the interval has passed since the last message.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._last is None or now - self._last >= self.interval:
+                self._last = now
+                return True
+            self.suppressed += 1
+            return False
+
+
+class Sampler:
+    """
+    Lets every n-th message through.
+    """
+
+    def __init__(self, every=100):
+        """
+        Initialize the sampler, the first call is let through.
+
+        Args:
+            every (int): Log one of this many messages.
+        """
+        self.every = every
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def ready(self):
+        """
+        Check whether a message should be logged now.
+
+        Returns:
+            bool: True for the first and then every n-th call.
+        """
+        with self._lock:
+            self._count += 1
+            return (self._count - 1) % self.every == 0
+
 
 class Logger:
     """
     Logger class to handle logging to both file and stdout.
     """
-    def __init__(self, name=__name__, log_file="project.log", level=logging.INFO):
+    def __init__(self, name=__name__, log_file=None, level=None, use_queue=None, json_format=None):
+        """
+        Initialize the logger, options which are None are read from the [logging] section of settings.ini.
+
+        Args:
+            name (str): Name of the logger.
+            log_file (str): Path of the log file.
+            level (int): Level of the logger.
+            use_queue (bool): Write the records in a background thread.
+            json_format (bool): Write JSON lines instead of text.
+        """
+        config = logging_settings()
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(level)
+        self.logger.setLevel(level if level is not None else config["level"])
         self.logger.propagate = False  # Prevent double logging
-        self._setup_file_handler(log_file, level)
-        self._setup_stream_handler(level)
-
-    def _setup_file_handler(self, log_file, level):
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(level)
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
-
-    def _setup_stream_handler(self, level):
-        stream_handler = logging.StreamHandler(sys.stdout)
-        stream_handler.setLevel(level)
-        stream_formatter = logging.Formatter(
-            '%(levelname)s - %(message)s'
+        handlers = shared_handlers(
+            log_file if log_file is not None else config["file"],
+            use_queue=use_queue if use_queue is not None else config["queue"],
+            json_format=json_format if json_format is not None else config["json"],
         )
-        stream_handler.setFormatter(stream_formatter)
-        self.logger.addHandler(stream_handler)
+        for handler in handlers:
+            if handler not in self.logger.handlers:
+                self.logger.addHandler(handler)
 
     def get_logger(self):
         return self.logger
@@ -0,0 +1,469 @@
+"""
+metrics.py
+
+This module collects metrics and traces of the recommendation pipeline.
+
+- Counter, Gauge and Histogram: metrics with labels, rendered in the Prometheus text format by
+  MetricsRegistry.render() for the /metrics endpoint of the web server.
+- trace(): context manager around one request. Spans opened with span() while it is active are
+  recorded with their start, duration and attributes, and the whole trace is logged as one JSON
+  line when the request is done. The active trace is kept in a context variable, so spans of
+  coroutines and of threads started with contextvars.copy_context() belong to their request.
+- span(): times a part of the request, observes the duration in the histogram span_seconds and
+  adds it to the active trace.
+- llm_call(): span around an LLM call which counts the calls and the input and output tokens.
+- prompt_tokens(): counted and trimmed tokens of the prompts (token_budget.py).
+
+The metrics are kept per process, with several gunicorn workers every worker has its own.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import json
+import math
+import threading
+import time
+import uuid
+
+from logger_config import Logger
+logger = Logger(name="Metrics").get_logger()
+trace_logger = Logger(name="Trace").get_logger()
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """
+    Base class of the metrics, holding the values per combination of label values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        """
+        Initialize the metric.
+
+        Args:
+            name (str): Name of the metric.
+            help (str): Description of the metric.
+            labels (tuple[str]): Names of the labels.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Metric {self.name} has the labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        """
+        Lines of the metric in the Prometheus text format.
+
+        Returns:
+            list[str]: HELP and TYPE line and one line per sample.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, e.g. of calls or tokens.
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float): Increment, not negative.
+            **labels: Values of the labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Current value of the counter, 0 if it was never increased.
+        """
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    Value which goes up and down, read from a function when the metrics are rendered.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, function):
+        """
+        Initialize the gauge.
+
+        Args:
+            name (str): Name of the metric.
+            help (str): Description of the metric.
+            function (callable): Function without arguments returning the current value.
+        """
+        super().__init__(name, help)
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception as error:
+            logger.warning(f"Gauge {self.name} failed: {error}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. durations, in cumulative buckets.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=default_buckets):
+        """
+        Initialize the histogram.
+
+        Args:
+            name (str): Name of the metric.
+            help (str): Description of the metric.
+            labels (tuple[str]): Names of the labels.
+            buckets (tuple[float]): Upper bounds of the buckets, +Inf is added.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """
+        Record a value.
+
+        Args:
+            value (float): The observed value.
+            **labels: Values of the labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        """
+        Number of observed values.
+        """
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of the process.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty registry.
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        """
+        Return the counter with the name, registering it on first use.
+        """
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, function):
+        """
+        Register a gauge which reads its value from a function, replacing a gauge with the same name.
+        """
+        with self._lock:
+            self._metrics[name] = Gauge(name, help, function)
+            return self._metrics[name]
+
+    def histogram(self, name, help, labels=(), buckets=default_buckets):
+        """
+        Return the histogram with the name, registering it on first use.
+        """
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        """
+        All metrics in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+span_seconds = registry.histogram("span_seconds", "Duration of the parts of a request", labels=("span",))
+request_seconds = registry.histogram("recommendation_seconds", "Duration of the recommendation requests",
+                                     labels=("name",))
+llm_calls = registry.counter("llm_calls_total", "Number of LLM calls", labels=("call",))
+llm_tokens = registry.counter("llm_tokens_total", "Number of LLM tokens", labels=("call", "kind"))
+llm_prompt_tokens = registry.histogram("llm_prompt_tokens", "Counted tokens of the prompts sent to the LLM",
+                                       labels=("call",), buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000))
+llm_prompt_tokens_trimmed = registry.counter("llm_prompt_tokens_trimmed_total",
+                                             "Prompt tokens removed to keep the token budget", labels=("call",))
+cache_requests = registry.counter("cache_requests_total", "Cache lookups", labels=("cache", "result"))
+search_results = registry.histogram("search_results", "Number of results of the similarity searches",
+                                    labels=("collection",), buckets=(0, 1, 3, 6, 15, 30, 60, 120, 240))
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """
+    Spans of one request.
+    """
+
+    def __init__(self, name, trace_id=None):
+        """
+        Initialize the trace, the reference time of the spans is the time of creation.
+
+        Args:
+            name (str): Name of the request type, e.g. 'get_results'.
+            trace_id (str): Identifier of the request, a random one if None.
+        """
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, begin, seconds, attributes):
+        with self._lock:
+            self.spans.append({"name": name, "start": round(begin - self.start, 6), "seconds": round(seconds, 6),
+                               **attributes})
+
+    def as_dict(self):
+        """
+        The trace as a JSON serializable dictionary.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"trace_id": self.trace_id, "name": self.name,
+                "seconds": round(time.perf_counter() - self.start, 6), **self.attributes, "spans": spans}
+
+
+def current_trace():
+    """
+    The trace of the current request.
+
+    Returns:
+        Trace | None: The active trace, None outside of a request.
+    """
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name, log=True, trace_id=None):
+    """
+    Trace a request, logging the spans as one JSON line at the end.
+
+    Args:
+        name (str): Name of the request type, also the label of recommendation_seconds.
+        log (bool): Write the trace to the log.
+        trace_id (str): Identifier of the request, a random one if None.
+
+    Yields:
+        Trace: The trace, attributes can be added to its 'attributes' dictionary.
+    """
+    current = Trace(name, trace_id=trace_id)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except BaseException as error:
+        current.attributes["error"] = type(error).__name__
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # a generator which is resumed in another context, e.g. a streamed response
+            _current_trace.set(None)
+        request_seconds.observe(time.perf_counter() - current.start, name=name)
+        if log:
+            trace_logger.info(json.dumps(current.as_dict()))
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a part of the request.
+
+    Args:
+        name (str): Name of the span, also the label of span_seconds.
+        **attributes: Attributes of the span in the trace.
+
+    Yields:
+        dict: The attributes, further attributes such as result counts can be added.
+    """
+    begin = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        record_span(name, begin, time.perf_counter() - begin, attributes)
+
+
+def record_span(name, begin, seconds, attributes=None):
+    """
+    Record a span which was timed by the caller.
+
+    Args:
+        name (str): Name of the span.
+        begin (float): Start as time.perf_counter() value.
+        seconds (float): Duration.
+        attributes (dict): Attributes of the span in the trace.
+    """
+    span_seconds.observe(seconds, span=name)
+    active = _current_trace.get()
+    if active is not None:
+        active.add(name, begin, seconds, attributes or {})
+
+
+_usage_handler = None
+
+
+def _usage_handler_class():
+    """
+    LangChain callback handler summing the token usage of the LLM responses.
+
+    The class is built on first use, so importing this module doesn't import LangChain.
+    """
+    global _usage_handler
+    if _usage_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TokenUsageHandler(BaseCallbackHandler):
+            def __init__(self):
+                self.input_tokens = 0
+                self.output_tokens = 0
+                self._lock = threading.Lock()
+
+            def on_llm_end(self, response, **kwargs):
+                for generations in response.generations:
+                    for generation in generations:
+                        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                        with self._lock:
+                            self.input_tokens += usage.get("input_tokens", 0)
+                            self.output_tokens += usage.get("output_tokens", 0)
+
+        _usage_handler = TokenUsageHandler
+    return _usage_handler
+
+
+@contextmanager
+def llm_call(call, model=None):
+    """
+    Span around an LLM call, counting the call and its tokens.
+
+    Args:
+        call (str): Name of the call, e.g. 'profile' or 'describe_listing'.
+        model (str): Name of the model, an attribute of the span.
+
+    Yields:
+        BaseCallbackHandler: Callback which has to be passed to the LangChain call to collect the tokens.
+    """
+    usage = _usage_handler_class()()
+    with span(f"llm.{call}", model=model) as attributes:
+        try:
+            yield usage
+        finally:
+            input_tokens, output_tokens = usage.input_tokens, usage.output_tokens
+            attributes.update(input_tokens=input_tokens, output_tokens=output_tokens)
+            llm_calls.inc(call=call)
+            llm_tokens.inc(input_tokens, call=call, kind="input")
+            llm_tokens.inc(output_tokens, call=call, kind="output")
+
+
+def prompt_tokens(call, tokens, trimmed=0):
+    """
+    Record the counted tokens of a prompt.
+
+    Args:
+        call (str): Name of the call, e.g. 'profile'.
+        tokens (int): Tokens of the prompt sent to the LLM.
+        trimmed (int): Tokens removed from the prompt to keep the budget.
+    """
+    llm_prompt_tokens.observe(tokens, call=call)
+    if trimmed:
+        llm_prompt_tokens_trimmed.inc(trimmed, call=call)
+
+
+def cache_lookup(cache, hit, count=1):
+    """
+    Count lookups of a cache.
+
+    Args:
+        cache (str): Name of the cache.
+        hit (bool): Whether the lookups were hits.
+        count (int): Number of lookups.
+    """
+    if count:
+        cache_requests.inc(count, cache=cache, result="hit" if hit else "miss")
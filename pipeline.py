@@ -0,0 +1,206 @@
+"""
+pipeline.py
+
+This module runs the retrieval part of the recommendation pipeline: generating the two customer
+profiles and running the text and image similarity searches. The stages can be executed one after
+the other or concurrently, and the duration of every stage is recorded.
+
+In concurrent mode the two profile generations run in parallel using LangChain's ainvoke, and each
+similarity search starts as soon as its own profile is ready.
+"""
+
+import asyncio
+from contextlib import contextmanager
+import time
+
+import metrics
+from logger_config import Logger
+logger = Logger(name="Pipeline").get_logger()
+
+MODES = ("sequential", "concurrent")
+
+
+class StageTimings:
+    """
+    Records start and end time of named pipeline stages relative to the start of the request.
+
+    Every stage is also recorded as a span 'stage.<name>' in the metrics and the trace of the request.
+    """
+
+    def __init__(self):
+        """
+        Initialize the timings, the reference time is the time of creation.
+        """
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that measures the duration of a stage.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.stages[name] = (begin - self.start, end - self.start)
+            metrics.record_span(f"stage.{name}", begin, end - begin)
+
+    def mark(self, name):
+        """
+        Record the time from the start of the request until now as a stage, e.g. the time to the first content.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        now = time.perf_counter()
+        self.stages[name] = (0.0, now - self.start)
+        metrics.record_span(f"stage.{name}", self.start, now - self.start)
+
+    def duration(self, name):
+        """
+        Duration of a stage in seconds.
+
+        Args:
+            name (str): Name of the stage.
+
+        Returns:
+            float: Duration of the stage.
+        """
+        begin, end = self.stages[name]
+        return end - begin
+
+    def total(self):
+        """
+        Wall time from the start of the request until the end of the last finished stage.
+
+        Returns:
+            float: Wall time in seconds.
+        """
+        return max((end for _, end in self.stages.values()), default=0.0)
+
+    def as_dict(self):
+        """
+        Durations of all stages and the total wall time.
+
+        Returns:
+            dict: Mapping from stage name to duration in seconds, plus 'total'.
+        """
+        durations = {name: self.duration(name) for name in self.stages}
+        durations["total"] = self.total()
+        return durations
+
+    def report(self):
+        """
+        Log the duration of all stages, the summed stage time and the wall time.
+        """
+        for name, (begin, end) in sorted(self.stages.items(), key=lambda item: item[1][0]):
+            logger.info(f"Stage {name}: {end - begin:.3f}s (start {begin:.3f}s, end {end:.3f}s)")
+        summed = sum(self.duration(name) for name in self.stages)
+        logger.info(f"Stages summed {summed:.3f}s, wall time {self.total():.3f}s")
+
+
+def run_searches_sequential(llm, db, history_dic, timings, k_text=6, k_image=15, session_id="id_1",
+                            session_id_image="id_2", where=None):
+    """
+    Generate both profiles and run both similarity searches one after the other.
+
+    Args:
+        llm (LLM): Language model wrapper.
+        db (Database): Database with the text and image collections.
+        history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+        timings (StageTimings): Collector for the stage durations.
+        k_text (int): Number of results of the text search.
+        k_image (int): Number of results of the image search.
+        session_id (str): Session identifier of the chat history for the profile.
+        session_id_image (str): Session identifier of the chat history for the visual profile.
+        where (dict): Filter on the listing metadata for both searches.
+
+    Returns:
+        tuple: (profile, results, profile_image, results_image)
+    """
+    with timings.stage("profile"):
+        profile = llm.conversation(history_dic=history_dic, session_id=session_id)
+    with timings.stage("profile_image"):
+        profile_image = llm.conversation_image(history_dic=history_dic, session_id=session_id_image)
+    with timings.stage("search_text"):
+        results = db.similarity_search_text(profile, k=k_text, where=where)
+    with timings.stage("search_image"):
+        results_image = db.similarity_search_image(profile_image, k=k_image, where=where)
+
+    return profile, results, profile_image, results_image
+
+
+async def run_searches_async(llm, db, history_dic, timings, k_text=6, k_image=15, session_id="id_1",
+                             session_id_image="id_2", where=None):
+    """
+    Generate both profiles concurrently and start each similarity search as soon as its profile is ready.
+
+    The database queries are blocking and run in worker threads.
+
+    Args:
+        llm (LLM): Language model wrapper.
+        db (Database): Database with the text and image collections.
+        history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+        timings (StageTimings): Collector for the stage durations.
+        k_text (int): Number of results of the text search.
+        k_image (int): Number of results of the image search.
+        session_id (str): Session identifier of the chat history for the profile.
+        session_id_image (str): Session identifier of the chat history for the visual profile.
+        where (dict): Filter on the listing metadata for both searches.
+
+    Returns:
+        tuple: (profile, results, profile_image, results_image)
+    """
+    async def text_branch():
+        with timings.stage("profile"):
+            profile = await llm.aconversation(history_dic=history_dic, session_id=session_id)
+        with timings.stage("search_text"):
+            results = await asyncio.to_thread(db.similarity_search_text, profile, k_text, where)
+        return profile, results
+
+    async def image_branch():
+        with timings.stage("profile_image"):
+            profile_image = await llm.aconversation_image(history_dic=history_dic, session_id=session_id_image)
+        with timings.stage("search_image"):
+            results_image = await asyncio.to_thread(db.similarity_search_image, profile_image, k_image, where)
+        return profile_image, results_image
+
+    (profile, results), (profile_image, results_image) = await asyncio.gather(text_branch(), image_branch())
+
+    return profile, results, profile_image, results_image
+
+
+def run_searches(llm, db, history_dic, timings, mode="concurrent", k_text=6, k_image=15,
+                 session_id="id_1", session_id_image="id_2", where=None):
+    """
+    Generate both profiles and run both similarity searches in the given execution mode.
+
+    Args:
+        llm (LLM): Language model wrapper.
+        db (Database): Database with the text and image collections.
+        history_dic (dict): Dictionary with 'questions' and 'answers' lists.
+        timings (StageTimings): Collector for the stage durations.
+        mode (str): Either 'sequential' or 'concurrent'.
+        k_text (int): Number of results of the text search.
+        k_image (int): Number of results of the image search.
+        session_id (str): Session identifier of the chat history for the profile.
+        session_id_image (str): Session identifier of the chat history for the visual profile.
+        where (dict): Filter on the listing metadata for both searches.
+
+    Returns:
+        tuple: (profile, results, profile_image, results_image)
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+
+    if mode == "sequential":
+        return run_searches_sequential(llm, db, history_dic, timings, k_text=k_text, k_image=k_image,
+                                       session_id=session_id, session_id_image=session_id_image, where=where)
+
+    return asyncio.run(run_searches_async(llm, db, history_dic, timings, k_text=k_text, k_image=k_image,
+                                          session_id=session_id, session_id_image=session_id_image, where=where))
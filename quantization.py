@@ -0,0 +1,419 @@
+"""
+quantization.py
+
+This module compresses the embeddings of the numpy backend (vector_store.py) for a smaller and faster
+search index.
+
+- truncate(): keeps the first dimensions of the embeddings and normalizes them again. Embedding models
+  trained with Matryoshka representation learning, e.g. text-embedding-3-large, put the most important
+  information into the first dimensions, so a shortened vector ranks almost like the full one.
+- Int8Quantizer: one byte per dimension, scaled per dimension to the range of the stored vectors.
+- ProductQuantizer: splits a vector into subvectors and stores the index of the nearest of 256
+  centroids (k-means) for each, one byte per subvector. Similarities are computed with a lookup table
+  of the query and the centroids without decoding the vectors.
+- CompressedIndex: the truncation and the quantizer of a collection with the number of candidates
+  per result which are rescored with the full float32 embeddings.
+
+The compression is configured in the [database] section of settings.ini and applied with
+`python database.py --reindex`.
+"""
+
+import numpy as np
+
+from logger_config import Logger
+logger = Logger(name="Quantization").get_logger()
+
+# rows of product quantization codes scored at once, bounds the memory of the lookups
+block_size = 16384
+# bytes of the buffer of decoded int8 codes, small enough to stay in the CPU cache
+decode_buffer_bytes = 1 << 20
+# vectors used to train the quantizers
+training_sample = 20000
+# vectors needed to train a quantizer, smaller collections are searched with the full embeddings
+min_training_rows = 1000
+
+
+def truncate(vectors, dimensions):
+    """
+    Keep the first dimensions of vectors and scale them to unit length.
+
+    Args:
+        vectors (np.ndarray): One vector per row.
+        dimensions (int): Number of dimensions kept, all if 0 or at least the dimension of the vectors.
+
+    Returns:
+        np.ndarray: The float32 vectors.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions and dimensions < vectors.shape[1]:
+        vectors = vectors[:, :dimensions]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def kmeans(vectors, clusters, iterations=20, seed=0):
+    """
+    Cluster vectors with Lloyd's algorithm.
+
+    Args:
+        vectors (np.ndarray): One vector per row.
+        clusters (int): Number of centroids, at most the number of vectors.
+        iterations (int): Number of iterations.
+        seed (int): Seed of the initial centroids.
+
+    Returns:
+        np.ndarray: The centroids, one per row.
+    """
+    rng = np.random.default_rng(seed)
+    clusters = min(clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (vectors ** 2).sum(axis=1, keepdims=True) - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # empty clusters get a random vector
+        centroids[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()))]
+    return centroids
+
+
+class Int8Quantizer:
+    """
+    Scalar quantization to one signed byte per dimension.
+    """
+    kind = "int8"
+    dtype = np.int8
+
+    def __init__(self, scale=None):
+        """
+        Initialize the quantizer.
+
+        Args:
+            scale (np.ndarray): Factor per dimension from the vector to the code, set by fit() if None.
+        """
+        self.scale = scale
+
+    def width(self, dimension):
+        """Bytes of the code of a vector."""
+        return dimension
+
+    def fit(self, vectors):
+        """
+        Scale every dimension to the largest absolute value in the vectors.
+
+        Args:
+            vectors (np.ndarray): Training vectors.
+        """
+        largest = np.abs(vectors).max(axis=0)
+        self.scale = (127.0 / np.where(largest > 0, largest, 127.0)).astype(np.float32)
+
+    def encode(self, vectors):
+        """
+        Codes of vectors, values outside the trained range are clipped.
+
+        Args:
+            vectors (np.ndarray): One vector per row.
+
+        Returns:
+            np.ndarray: int8 codes, one row per vector.
+        """
+        return np.clip(np.rint(vectors * self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, queries, codes):
+        """
+        Approximate dot products of queries with the encoded vectors.
+
+        Args:
+            queries (np.ndarray): Query vectors.
+            codes (np.ndarray): Codes of the vectors.
+
+        Returns:
+            np.ndarray: Scores with one row per query.
+        """
+        weighted = (queries / self.scale).astype(np.float32)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        # the codes are decoded block by block into one buffer, a float32 copy of all codes would cost the saved memory
+        rows = max(1, decode_buffer_bytes // (4 * codes.shape[1]))
+        buffer = np.empty((rows, codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), rows):
+            block = codes[start:start + rows]
+            np.copyto(buffer[:len(block)], block, casting="unsafe")
+            scores[:, start:start + len(block)] = weighted @ buffer[:len(block)].T
+        return scores
+
+    def state(self):
+        """Arrays of the trained quantizer."""
+        return {"scale": self.scale}
+
+
+class ProductQuantizer:
+    """
+    Product quantization with 256 centroids per subvector, one byte per subvector.
+    """
+    kind = "pq"
+    dtype = np.uint8
+
+    def __init__(self, subvectors, codebooks=None):
+        """
+        Initialize the quantizer.
+
+        Args:
+            subvectors (int): Number of subvectors, the dimension must be a multiple of it.
+            codebooks (np.ndarray): Centroids (subvectors x 256 x subvector dimension), set by fit() if None.
+        """
+        self.subvectors = subvectors
+        self.codebooks = codebooks
+
+    def width(self, dimension):
+        """Bytes of the code of a vector."""
+        return self.subvectors
+
+    def _split(self, vectors):
+        if vectors.shape[1] % self.subvectors:
+            raise ValueError(f"Dimension {vectors.shape[1]} is not a multiple of {self.subvectors} subvectors")
+        return vectors.reshape(len(vectors), self.subvectors, vectors.shape[1] // self.subvectors)
+
+    def fit(self, vectors):
+        """
+        Train the centroids of every subvector with k-means.
+
+        Args:
+            vectors (np.ndarray): Training vectors.
+        """
+        parts = self._split(vectors)
+        codebooks = np.zeros((self.subvectors, 256, parts.shape[2]), dtype=np.float32)
+        for part in range(self.subvectors):
+            centroids = kmeans(np.ascontiguousarray(parts[:, part]), 256, seed=part)
+            codebooks[part, :len(centroids)] = centroids
+            # unused codes of small training sets repeat the first centroid
+            codebooks[part, len(centroids):] = centroids[0]
+        self.codebooks = codebooks
+
+    def encode(self, vectors):
+        """
+        Index of the nearest centroid of every subvector.
+
+        Args:
+            vectors (np.ndarray): One vector per row.
+
+        Returns:
+            np.ndarray: uint8 codes, one row per vector and one column per subvector.
+        """
+        parts = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((len(parts), self.subvectors), dtype=np.uint8)
+        norms = (self.codebooks ** 2).sum(axis=2)
+        for part in range(self.subvectors):
+            distances = norms[part] - 2 * parts[:, part] @ self.codebooks[part].T
+            codes[:, part] = distances.argmin(axis=1)
+        return codes
+
+    def scores(self, queries, codes):
+        """
+        Approximate dot products of queries with the encoded vectors from a lookup table per query.
+
+        Args:
+            queries (np.ndarray): Query vectors.
+            codes (np.ndarray): Codes of the vectors.
+
+        Returns:
+            np.ndarray: Scores with one row per query.
+        """
+        # dot products of every query subvector with the centroids of its subspace, flattened per query
+        tables = np.einsum("qps,pcs->qpc", self._split(np.asarray(queries, dtype=np.float32)), self.codebooks)
+        tables = tables.reshape(len(queries), -1)
+        offsets = np.arange(self.subvectors, dtype=np.intp) * 256
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            indices = codes[start:start + block_size].astype(np.intp) + offsets
+            for query, table in enumerate(tables):
+                scores[query, start:start + block_size] = table[indices].sum(axis=1)
+        return scores
+
+    def state(self):
+        """Arrays of the trained quantizer."""
+        return {"codebooks": self.codebooks}
+
+
+class CompressedIndex:
+    """
+    Truncation and quantization of the embeddings of a collection.
+    """
+
+    def __init__(self, dimensions=0, quantization="none", subvectors=96, rescore=4):
+        """
+        Initialize an untrained index.
+
+        Args:
+            dimensions (int): Dimensions kept of every embedding, all if 0.
+            quantization (str): 'none' for float32, 'int8' or 'pq'.
+            subvectors (int): Subvectors of the product quantization.
+            rescore (int): Candidates per result which are rescored with the full float32 embeddings,
+                0 to rank by the compressed scores only.
+        """
+        if quantization not in ("none", "int8", "pq"):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.subvectors = subvectors
+        self.rescore = rescore
+        if quantization == "int8":
+            self.quantizer = Int8Quantizer()
+        elif quantization == "pq":
+            self.quantizer = ProductQuantizer(subvectors)
+        else:
+            self.quantizer = None
+
+    @property
+    def enabled(self):
+        """True if the embeddings are truncated or quantized."""
+        return bool(self.dimensions) or self.quantizer is not None
+
+    def params(self):
+        """
+        Parameters which determine the codes, an index has to be rebuilt when they change.
+
+        Returns:
+            dict: Dimensions, quantization and subvectors.
+        """
+        return {"dimensions": self.dimensions, "quantization": self.quantization,
+                "subvectors": self.subvectors if self.quantization == "pq" else 0}
+
+    def dtype(self):
+        """Type of the codes."""
+        return self.quantizer.dtype if self.quantizer is not None else np.float32
+
+    def width(self, dimension):
+        """
+        Number of code values of a vector.
+
+        Args:
+            dimension (int): Dimension of the full embeddings.
+        """
+        truncated = min(self.dimensions, dimension) if self.dimensions else dimension
+        return self.quantizer.width(truncated) if self.quantizer is not None else truncated
+
+    def trainable(self, count):
+        """
+        Check whether a collection is large enough to train the index.
+
+        A truncation needs no training, a quantizer needs min_training_rows vectors, e.g. k-means
+        can't find 256 centroids per subvector in a few vectors.
+
+        Args:
+            count (int): Number of stored embeddings.
+
+        Returns:
+            bool: True if fit() can be called with the embeddings.
+        """
+        return self.quantizer is None or count >= min_training_rows
+
+    def training_rows(self, count):
+        """
+        Number of vectors fit() trains the quantizer on.
+
+        Args:
+            count (int): Number of stored embeddings.
+
+        Returns:
+            int: The size of the training sample, 0 without a quantizer.
+        """
+        return min(count, training_sample) if self.quantizer is not None else 0
+
+    def fit(self, vectors):
+        """
+        Train the quantizer on a sample of the full embeddings.
+
+        Args:
+            vectors (np.ndarray): Full normalized embeddings.
+        """
+        if self.quantizer is None:
+            return
+        if len(vectors) > training_sample:
+            rows = np.sort(np.random.default_rng(0).choice(len(vectors), training_sample, replace=False))
+            vectors = vectors[rows]
+        logger.info(f"Training the {self.quantization} quantizer on {len(vectors)} vectors")
+        self.quantizer.fit(truncate(vectors, self.dimensions))
+
+    def encode(self, vectors):
+        """
+        Codes of full embeddings.
+
+        Args:
+            vectors (np.ndarray): Full normalized embeddings.
+
+        Returns:
+            np.ndarray: One row of codes per vector.
+        """
+        vectors = truncate(vectors, self.dimensions)
+        return self.quantizer.encode(vectors) if self.quantizer is not None else vectors
+
+    def scores(self, queries, codes):
+        """
+        Approximate cosine similarities of full query embeddings with encoded vectors.
+
+        Args:
+            queries (np.ndarray): Full normalized query embeddings.
+            codes (np.ndarray): Codes of the vectors.
+
+        Returns:
+            np.ndarray: Scores with one row per query.
+        """
+        queries = truncate(queries, self.dimensions)
+        if self.quantizer is not None:
+            return self.quantizer.scores(queries, codes)
+        return queries @ codes.T
+
+    def save(self, path):
+        """
+        Write the parameters and the trained quantizer to a .npz file.
+
+        Args:
+            path (str): Path of the file.
+        """
+        state = self.quantizer.state() if self.quantizer is not None else {}
+        with open(path, "wb") as file:
+            np.savez(file, dimensions=self.dimensions, quantization=self.quantization,
+                     subvectors=self.subvectors, **state)
+
+    @classmethod
+    def load(cls, path, rescore=4):
+        """
+        Read an index written by save().
+
+        Args:
+            path (str): Path of the file.
+            rescore (int): Candidates per result which are rescored.
+
+        Returns:
+            CompressedIndex: The trained index.
+        """
+        with np.load(path) as data:
+            index = cls(dimensions=int(data["dimensions"]), quantization=str(data["quantization"]),
+                        subvectors=int(data["subvectors"]), rescore=rescore)
+            if index.quantization == "int8":
+                index.quantizer.scale = data["scale"]
+            elif index.quantization == "pq":
+                index.quantizer.codebooks = data["codebooks"]
+        return index
+
+
+def create_index(settings):
+    """
+    Create the compression of the text index configured in the [database] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        CompressedIndex | None: The untrained index, None if the embeddings are not compressed.
+    """
+    index = CompressedIndex(
+        dimensions=settings.getint("database", "text_dimensions", fallback=0),
+        quantization=settings.get("database", "text_quantization", fallback="none").strip().lower(),
+        subvectors=settings.getint("database", "pq_subvectors", fallback=96),
+        rescore=settings.getint("database", "rescore", fallback=4),
+    )
+    return index if index.enabled else None
@@ -0,0 +1,196 @@
+"""
+recommendation_cache.py
+
+This module provides a two-tier cache for the results of the recommendation pipeline.
+
+The results are keyed by a hash of the normalized questionnaire answers together with the model
+name and the version of the database collections. Entries are kept in an in-memory LRU tier
+backed by an on-disk SQLite tier (sqlite_lru.py), so they survive restarts and can be shared
+between processes.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import threading
+
+from sqlite_lru import SQLiteLRU
+from logger_config import Logger
+logger = Logger(name="RecommendationCache").get_logger()
+
+number_words = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+    "single": "1", "double": "2", "couple": "2",
+}
+
+# layout of the cached results, part of the key so entries in an older layout are not read
+value_format = 2
+
+
+def normalize_answer(answer):
+    """
+    Normalize an answer so that trivially different spellings map to the same text.
+
+    Lowercases the text, replaces number words by digits, removes punctuation except
+    characters used in prices and collapses whitespace.
+
+    Args:
+        answer (str): The answer of the user.
+
+    Returns:
+        str: The normalized answer.
+    """
+    text = answer.lower()
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    text = re.sub(r"[^\w$.\s]|(?<!\d)\.|\.(?!\d)|_", " ", text)
+    words = [number_words.get(word, word) for word in text.split()]
+    return " ".join(words)
+
+
+def cache_key(answers, model_name, collection_version):
+    """
+    Compute the cache key for a set of answers.
+
+    Args:
+        answers (list): List of user answers.
+        model_name (str): Name of the language model.
+        collection_version (str): Version of the database collections.
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    payload = json.dumps({
+        "answers": [normalize_answer(answer) for answer in answers],
+        "model": model_name,
+        "collection_version": collection_version,
+        "format": value_format,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    """
+    Cache for (images, datasets, ids) results with an in-memory LRU tier and an optional on-disk tier.
+    """
+
+    def __init__(self, max_entries=256, path=None, max_disk_entries=10000):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of entries in memory.
+            path (str): Path of the SQLite file of the on-disk tier, None for memory only.
+            max_disk_entries (int): Maximum number of entries on disk.
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SQLiteLRU(path, "recommendations", ("key",), ("value",), max_disk_entries) if path else None
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            tuple | None: (images, datasets, ids) or None if the key is not cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._entries[key]
+
+        value = None
+        if self._disk is not None:
+            row = self._disk.get((key,))
+            if row is not None:
+                value = tuple(json.loads(row[0]))
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store_in_memory(key, value)
+            return value
+
+    def put(self, key, value):
+        """
+        Store a result in both tiers.
+
+        Args:
+            key (str): The cache key.
+            value (tuple): (images, datasets, ids) result of the pipeline.
+        """
+        value = tuple(list(part) for part in value)
+        with self._lock:
+            self._store_in_memory(key, value)
+
+        if self._disk is not None:
+            self._disk.put((key,), (json.dumps(value),))
+
+    def _store_in_memory(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Remove all entries from both tiers, e.g. after new data was ingested.
+        """
+        logger.info("Invalidating recommendation cache")
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        """
+        Hit and miss counters of the cache.
+
+        Returns:
+            dict: Counters and the number of entries in memory.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+def create_cache(settings):
+    """
+    Create the recommendation cache configured in the [cache] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        RecommendationCache | None: The cache or None if it is disabled.
+    """
+    if not settings.getboolean("cache", "recommendations", fallback=True):
+        return None
+
+    path = settings.get("cache", "recommendations_path", fallback=".cache/recommendations.sqlite3")
+    return RecommendationCache(
+        max_entries=settings.getint("cache", "recommendations_entries", fallback=256),
+        path=path or None,
+        max_disk_entries=settings.getint("cache", "recommendations_disk_entries", fallback=10000),
+    )
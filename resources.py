@@ -0,0 +1,287 @@
+"""
+resources.py
+
+This module provides a process-wide registry for the expensive objects of the recommendation
+pipeline. The LLM clients, the ChromaDB client and the embedding functions (including the CLIP
+weights) are built lazily on first use and then shared by all requests of the process.
+"""
+
+import configparser
+import threading
+
+from logger_config import Logger
+logger = Logger(name="Resources").get_logger()
+
+
+class ResourceRegistry:
+    """
+    Thread-safe registry that builds each resource once and shares it afterwards.
+
+    Resources are identified by a hashable key and created by a factory function on first access.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty registry.
+        """
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._instances = {}
+
+    def get(self, key, factory):
+        """
+        Return the resource for the given key, building it with the factory if needed.
+
+        Only one thread builds a resource, other threads requesting the same key wait for it.
+        Different keys are built independently of each other.
+
+        Args:
+            key (hashable): Identifier of the resource.
+            factory (callable): Function without arguments that creates the resource.
+
+        Returns:
+            object: The shared resource.
+        """
+        try:
+            return self._instances[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in self._instances:
+                logger.info(f"Building resource {key}")
+                self._instances[key] = factory()
+            return self._instances[key]
+
+    def is_loaded(self, key):
+        """
+        Check whether a resource was already built.
+
+        Args:
+            key (hashable): Identifier of the resource.
+
+        Returns:
+            bool: True if the resource exists in the registry.
+        """
+        return key in self._instances
+
+    def clear(self):
+        """
+        Remove all resources from the registry. They are rebuilt on next access.
+        """
+        with self._lock:
+            self._instances.clear()
+            self._key_locks.clear()
+
+
+registry = ResourceRegistry()
+
+
+def get_settings(filename="settings.ini"):
+    """
+    Return the shared, parsed settings file.
+
+    Args:
+        filename (str): Path to the settings file.
+
+    Returns:
+        configparser.ConfigParser: The parsed settings.
+    """
+    def factory():
+        parser = configparser.ConfigParser()
+        parser.read(filename)
+        return parser
+
+    return registry.get(("settings", filename), factory)
+
+
+def get_llm(open_ai=True):
+    """
+    Return the shared LLM instance.
+
+    Args:
+        open_ai (bool): If True, use OpenAI model; otherwise, use Ollama.
+
+    Returns:
+        LLM: The shared LLM.
+    """
+    def factory():
+        from llm import LLM
+        return LLM(open_ai=open_ai)
+
+    return registry.get(("llm", open_ai), factory)
+
+
+def get_database(open_ai=True):
+    """
+    Return the shared Database instance with the backend of the [database] section of the settings.
+
+    Args:
+        open_ai (bool): Whether to use OpenAI embeddings or Ollama.
+
+    Returns:
+        Database: The shared database.
+    """
+    def factory():
+        from database import Database, database_settings
+        return Database(open_ai=open_ai, embedding_cache=get_embedding_cache(), image_index=get_image_index(),
+                        **database_settings(get_settings()))
+
+    return registry.get(("database", open_ai), factory)
+
+
+def get_image_index():
+    """
+    Return the shared table of the image paths of the listings.
+
+    Returns:
+        ImageIndex: The shared index.
+    """
+    def factory():
+        from image_index import create_image_index
+        return create_image_index(get_settings())
+
+    return registry.get("image_index", factory)
+
+
+def get_embedding_cache():
+    """
+    Return the shared cache for query embeddings.
+
+    Returns:
+        EmbeddingCache: The shared cache.
+    """
+    def factory():
+        from embedding_cache import create_cache
+        return create_cache(get_settings())
+
+    return registry.get("embedding_cache", factory)
+
+
+def get_recommendation_cache(open_ai=True):
+    """
+    Return the shared recommendation cache, which is invalidated when data is added to the database.
+
+    Args:
+        open_ai (bool): Whether to use the OpenAI backends.
+
+    Returns:
+        RecommendationCache | None: The cache or None if it is disabled in the settings.
+    """
+    def factory():
+        from recommendation_cache import create_cache
+        cache = create_cache(get_settings())
+        if cache is not None:
+            get_database(open_ai=open_ai).ingest_listeners.append(cache.invalidate)
+        return cache
+
+    return registry.get(("recommendation_cache", open_ai), factory)
+
+
+def get_semantic_cache(open_ai=True):
+    """
+    Return the shared cache of the LLM answers for similar prompts.
+
+    The prompts are embedded with the cached text embedding function of the database.
+
+    Args:
+        open_ai (bool): Whether to use the OpenAI backends.
+
+    Returns:
+        SemanticCache | None: The cache or None if it is disabled in the settings.
+    """
+    def factory():
+        from semantic_cache import create_cache
+        # the database is only built when the first prompt is embedded
+        return create_cache(get_settings(), lambda texts: get_database(open_ai=open_ai).cached_embedding_text(texts))
+
+    return registry.get(("semantic_cache", open_ai), factory)
+
+
+def get_description_cache():
+    """
+    Return the shared cache for the descriptions of single listings.
+
+    Returns:
+        DescriptionCache: The shared cache.
+    """
+    def factory():
+        from description_cache import create_cache
+        return create_cache(get_settings())
+
+    return registry.get("description_cache", factory)
+
+
+def get_token_budget():
+    """
+    Return the shared token budget of the LLM prompts.
+
+    Returns:
+        TokenBudget: The shared budget.
+    """
+    def factory():
+        from token_budget import create_budget
+        return create_budget(get_settings())
+
+    return registry.get("token_budget", factory)
+
+
+def get_result_store():
+    """
+    Return the shared store of the recommendations per results page.
+
+    Returns:
+        ResultStore: The shared store.
+    """
+    def factory():
+        from result_store import create_store
+        return create_store(get_settings())
+
+    return registry.get("result_store", factory)
+
+
+def get_admission_queue():
+    """
+    Return the shared admission queue in front of the recommendation pipeline.
+
+    Returns:
+        AdmissionQueue: The shared queue.
+    """
+    def factory():
+        from limits import create_admission_queue
+        return create_admission_queue(get_settings())
+
+    return registry.get("admission_queue", factory)
+
+
+def get_stage_limit(name):
+    """
+    Return the shared concurrency limit of a pipeline stage.
+
+    Args:
+        name (str): Name of the stage, 'llm', 'embedding_text' or 'embedding_image'.
+
+    Returns:
+        StageLimit: The shared limit.
+    """
+    def factory():
+        from limits import create_stage_limit
+        return create_stage_limit(get_settings(), name)
+
+    return registry.get(("stage_limit", name), factory)
+
+
+def preload(open_ai=True):
+    """
+    Eagerly build all resources so the first request does not pay for it.
+
+    Args:
+        open_ai (bool): Whether to use the OpenAI backends.
+    """
+    logger.info("Preloading resources")
+    get_llm(open_ai=open_ai)
+    get_database(open_ai=open_ai)
+    logger.info("Preloading finished")
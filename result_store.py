@@ -0,0 +1,180 @@
+"""
+result_store.py
+
+This module keeps the recommendations of the web server per request.
+
+Every results page gets a random token, and its recommendations are stored under that token until
+they expire, so concurrent users don't overwrite each other's results and a results page can be
+shown again with GET /results/<token>. The store also remembers the image paths of the recently
+recommended listings, so images can be served by their stable listing id without a database lookup.
+
+Without a path the results are kept in the memory of the process. With a path they are stored in
+bounded SQLite tables (sqlite_lru.py), so every worker process of the production server can show
+the results page of a token created by another worker.
+"""
+
+from collections import OrderedDict
+import json
+import secrets
+import threading
+import time
+
+from sqlite_lru import SQLiteLRU
+from logger_config import Logger
+logger = Logger(name="ResultStore").get_logger()
+
+
+def new_token():
+    """
+    Create a random token for a results page.
+
+    Returns:
+        str: URL-safe token.
+    """
+    return secrets.token_urlsafe(16)
+
+
+class ResultStore:
+    """
+    Thread-safe store of the recommendations per token with TTL and LRU eviction, in memory or in SQLite.
+    """
+
+    def __init__(self, ttl=3600, max_entries=1000, max_image_paths=10000, path=None):
+        """
+        Initialize the store.
+
+        Args:
+            ttl (float): Seconds since the last access after which a result expires.
+            max_entries (int): Maximum number of stored results, the least recently used are evicted.
+            max_image_paths (int): Maximum number of remembered image paths, the least recently used are evicted.
+            path (str): Path of the SQLite file shared by the worker processes, None for memory only.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_image_paths = max_image_paths
+        self.path = path
+        self._entries = OrderedDict()
+        self._image_paths = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SQLiteLRU(path, "results", ("token",), ("cards",), max_entries, ttl=ttl) if path else None
+        self._disk_image_paths = SQLiteLRU(path, "image_paths", ("listing_id",), ("image",),
+                                           max_image_paths) if path else None
+
+    def put(self, token, cards):
+        """
+        Store the recommendations of a results page.
+
+        Args:
+            token (str): Token of the results page.
+            cards (list[dict]): Recommendations with 'id', 'image' and 'description'.
+        """
+        cards = list(cards)
+        if self._disk is not None:
+            self._disk.put((token,), (json.dumps(cards),))
+            self._disk_image_paths.put_many([((card["id"],), (card["image"],)) for card in cards])
+            return
+        with self._lock:
+            self._evict_expired()
+            self._entries[token] = (time.monotonic(), cards)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            for card in cards:
+                self._store_image_path(card["id"], card["image"])
+
+    def get(self, token):
+        """
+        Look up the recommendations of a results page.
+
+        Args:
+            token (str): Token of the results page.
+
+        Returns:
+            list[dict] | None: The recommendations, None if the token is unknown or expired.
+        """
+        if self._disk is not None:
+            row = self._disk.get((token,))
+            return json.loads(row[0]) if row is not None else None
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            self._entries[token] = (time.monotonic(), entry[1])
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def image_path(self, listing_id):
+        """
+        Image path of a listing which was part of a stored result.
+
+        Args:
+            listing_id (str): Id of the listing.
+
+        Returns:
+            str | None: The image path, None if the listing wasn't recently recommended.
+        """
+        if self._disk_image_paths is not None:
+            row = self._disk_image_paths.get((listing_id,))
+            return row[0] if row is not None else None
+        with self._lock:
+            path = self._image_paths.get(listing_id)
+            if path is not None:
+                self._image_paths.move_to_end(listing_id)
+            return path
+
+    def add_image_path(self, listing_id, path):
+        """
+        Remember the image path of a listing.
+
+        Args:
+            listing_id (str): Id of the listing.
+            path (str): The image path.
+        """
+        if self._disk_image_paths is not None:
+            self._disk_image_paths.put((listing_id,), (path,))
+            return
+        with self._lock:
+            self._store_image_path(listing_id, path)
+
+    def _store_image_path(self, listing_id, path):
+        self._image_paths[listing_id] = path
+        self._image_paths.move_to_end(listing_id)
+        while len(self._image_paths) > self.max_image_paths:
+            self._image_paths.popitem(last=False)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        while self._entries:
+            token, (accessed, _) = next(iter(self._entries.items()))
+            if now - accessed <= self.ttl:
+                break
+            del self._entries[token]
+
+    def __len__(self):
+        if self._disk is not None:
+            return self._disk.count()
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+
+def create_store(settings):
+    """
+    Create the result store configured in the [server] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        ResultStore: The store, in the memory of the process if no path is configured.
+    """
+    path = settings.get("server", "results_path", fallback="")
+    return ResultStore(
+        ttl=settings.getfloat("server", "results_ttl", fallback=3600),
+        max_entries=settings.getint("server", "results_max_entries", fallback=1000),
+        max_image_paths=settings.getint("server", "image_paths_max_entries", fallback=10000),
+        path=path or None,
+    )
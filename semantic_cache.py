@@ -0,0 +1,397 @@
+"""
+semantic_cache.py
+
+This module caches the answers of the chat model for similar prompts.
+
+Prompts are not compared by their exact text but by the similarity of their embeddings, so the close
+paraphrases of the answers of different customers can share a profile. Every call type (profile,
+profile_image, results) has its own entries, selected by the 'call' metadata of the LangChain call.
+
+- SemanticCache: the embeddings and answers of earlier prompts in a SQLite file with an LRU cap per
+  call type. Prompts are only compared with prompts of the same call type, the same model, the
+  same system message and the same hard constraints of the answers (constraints.py), so answers
+  which only differ in the budget or the number of bedrooms don't share a profile. The system
+  message of the results call contains the profile and the houses, so its answers are only used
+  for the same houses. The vectors of the compared prompts are kept in
+  memory as one matrix per partition, so a lookup is one matrix-vector product.
+- CachedChatModel: chat model wrapping the model of llm.LLM. A prompt whose embedding has a cosine
+  similarity of at least the threshold with a cached prompt is answered from the cache, otherwise the
+  wrapped model is called and its answer is stored. Calls without 'call' metadata and structured
+  output are passed through.
+
+Hits, misses and the generation time saved by hits are recorded as metrics. The cache is configured
+in the [cache] section of settings.ini.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from constraints import extract_constraints
+import metrics
+from logger_config import Logger
+logger = Logger(name="SemanticCache").get_logger()
+
+# rows added to the matrix of a partition when it is full, at least as many as it has
+matrix_chunk = 256
+
+seconds_saved = metrics.registry.counter("semantic_cache_seconds_saved_total",
+                                         "Generation seconds of the answers returned by the semantic cache",
+                                         labels=("call",))
+
+
+def partition_key(call, model, messages, constraints=""):
+    """
+    Key of the prompts which are compared with each other.
+
+    Args:
+        call (str): Name of the call, e.g. 'profile'.
+        model (str): Name of the model.
+        messages (list[BaseMessage]): Messages of the prompt.
+        constraints (str): Hard constraints of the answers of the prompt, see constraints_key().
+
+    Returns:
+        str: Hash of the call, the model, the constraints and the system message of the prompt.
+    """
+    system = messages[0].content if messages and messages[0].type == "system" else ""
+    return hashlib.sha256(f"{call}\0{model}\0{constraints}\0{system}".encode("utf-8")).hexdigest()
+
+
+def constraints_key(answers):
+    """
+    Hard constraints of the answers of a customer as text, passed as 'constraints' metadata of the calls.
+
+    Args:
+        answers (list): List of user answers.
+
+    Returns:
+        str: The constraints of extract_constraints() as JSON.
+    """
+    return json.dumps(extract_constraints(answers), sort_keys=True)
+
+
+def prompt_text(messages):
+    """
+    Text of a prompt which is embedded, the messages after the system message.
+
+    Args:
+        messages (list[BaseMessage]): Messages of the prompt.
+
+    Returns:
+        str: One line per message with its type.
+    """
+    if messages and messages[0].type == "system" and len(messages) > 1:
+        messages = messages[1:]
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+class SemanticCache:
+    """
+    Answers of earlier prompts, looked up by the similarity of the prompt embeddings.
+    """
+
+    def __init__(self, embedding_function, path, max_entries=1000, threshold=0.95, calls=None):
+        """
+        Initialize the cache.
+
+        Args:
+            embedding_function (callable): Function of a list of texts returning their embedding vectors.
+            path (str): Path of the SQLite file.
+            max_entries (int): Maximum number of answers per call type, the least recently used are removed.
+            threshold (float): Minimum cosine similarity of a cached prompt to use its answer.
+            calls (set[str]): Call types which are cached, all if None.
+        """
+        self.embedding_function = embedding_function
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.calls = calls
+        # vectors per partition: (ids, matrix of normalized vectors with a row per id and spare rows, call)
+        self._index = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT, call TEXT, partition TEXT, vector BLOB,
+                   response TEXT, seconds REAL, last_access REAL)"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_partition ON responses (partition)")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (call, last_access)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def caches(self, call):
+        """
+        Check whether the answers of a call type are cached.
+
+        Args:
+            call (str | None): Name of the call.
+
+        Returns:
+            bool: True if the call type is cached.
+        """
+        return call is not None and (self.calls is None or call in self.calls)
+
+    def embed(self, text):
+        """
+        Embed a prompt.
+
+        Args:
+            text (str): Text of the prompt.
+
+        Returns:
+            np.ndarray: The normalized embedding vector.
+        """
+        vector = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _partition(self, call, partition):
+        # vectors of a partition are loaded from the file on first use, under the lock, so an answer
+        # stored meanwhile by put() is either loaded here or appended by put()
+        with self._lock:
+            entry = self._index.get(partition)
+            if entry is None:
+                rows = self._connection().execute(
+                    "SELECT id, vector FROM responses WHERE partition = ?", (partition,)).fetchall()
+                ids = [row[0] for row in rows]
+                matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+                entry = (ids, matrix, call)
+                self._index[partition] = entry
+            return entry
+
+    def _count(self, call, key, value=1):
+        with self._lock:
+            stats = self._stats.setdefault(call, {"hits": 0, "misses": 0, "seconds_saved": 0.0})
+            stats[key] += value
+
+    def get(self, call, partition, vector):
+        """
+        Look up the answer of the most similar cached prompt.
+
+        Args:
+            call (str): Name of the call.
+            partition (str): Partition of the prompt, see partition_key().
+            vector (np.ndarray): Normalized embedding of the prompt.
+
+        Returns:
+            tuple | None: (answer, generation seconds, similarity) or None if no cached prompt is similar enough.
+        """
+        ids, matrix, _ = self._partition(call, partition)
+        result = None
+        if matrix is not None and matrix.shape[1] == vector.shape[0]:
+            # the rows after the ids are spare rows of put()
+            similarities = matrix[:len(ids)] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                connection = self._connection()
+                row = connection.execute("SELECT response, seconds FROM responses WHERE id = ?", (ids[best],)).fetchone()
+                if row is not None:
+                    with connection:
+                        connection.execute("UPDATE responses SET last_access = ? WHERE id = ?", (time.time(), ids[best]))
+                    result = (row[0], row[1], similarity)
+
+        if result is None:
+            self._count(call, "misses")
+        else:
+            self._count(call, "hits")
+            self._count(call, "seconds_saved", result[1])
+            seconds_saved.inc(result[1], call=call)
+        metrics.cache_lookup(f"semantic_{call}", result is not None)
+        return result
+
+    def put(self, call, partition, vector, response, seconds):
+        """
+        Store the answer of a prompt and remove the least recently used answers of the call type above the cap.
+
+        Args:
+            call (str): Name of the call.
+            partition (str): Partition of the prompt, see partition_key().
+            vector (np.ndarray): Normalized embedding of the prompt.
+            response (str): Answer of the model.
+            seconds (float): Time the model took for the answer.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO responses (call, partition, vector, response, seconds, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (call, partition, vector.tobytes(), response, seconds, time.time()))
+            row_id = cursor.lastrowid
+            evicted = connection.execute(
+                """SELECT id, partition FROM responses WHERE call = ?
+                   ORDER BY last_access DESC LIMIT -1 OFFSET ?""", (call, self.max_entries)).fetchall()
+            connection.executemany("DELETE FROM responses WHERE id = ?", [(id,) for id, _ in evicted])
+
+        with self._lock:
+            # only the rows of the removed answers are dropped from the cached matrices
+            for evicted_partition in {partition for _, partition in evicted}:
+                entry = self._index.get(evicted_partition)
+                if entry is not None:
+                    removed = {id for id, other in evicted if other == evicted_partition}
+                    ids, matrix, _ = entry
+                    keep = [row for row, id in enumerate(ids) if id not in removed]
+                    self._index[evicted_partition] = ([ids[row] for row in keep],
+                                                      matrix[keep] if keep else None, call)
+            entry = self._index.get(partition)
+            # the answer is already in a partition which was loaded after it was written
+            if entry is not None and row_id not in entry[0]:
+                ids, matrix, _ = entry
+                if matrix is None:
+                    matrix = np.empty((matrix_chunk, vector.shape[0]), dtype=np.float32)
+                elif len(ids) == len(matrix):
+                    # the matrix grows by chunks instead of being copied for every answer
+                    spare = np.empty((max(matrix_chunk, len(matrix)), matrix.shape[1]), dtype=np.float32)
+                    matrix = np.concatenate([matrix, spare])
+                # lookups only read the rows of their ids, the new row is written behind them
+                matrix[len(ids)] = vector
+                self._index[partition] = (ids + [row_id], matrix, call)
+
+    def stats(self):
+        """
+        Hit and miss counters and the saved generation seconds per call type.
+
+        Returns:
+            dict: Counters per call type with the hit rate.
+        """
+        with self._lock:
+            stats = {}
+            for call, counters in self._stats.items():
+                total = counters["hits"] + counters["misses"]
+                stats[call] = {**counters, "hit_rate": counters["hits"] / total if total else 0.0}
+            return stats
+
+
+def _metadata_of(config):
+    return (config or {}).get("metadata") or {}
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    Chat model answering prompts similar to earlier ones from a SemanticCache.
+    """
+    chat_model: BaseChatModel
+    # 'cache' is the exact-match cache of LangChain
+    semantic_cache: Any
+    model_name: str = ""
+
+    @property
+    def _llm_type(self):
+        return f"semantic-cache-{self.chat_model._llm_type}"
+
+    def stream(self, input, config=None, *, stop=None, **kwargs):
+        # BaseChatModel.stream doesn't pass the run manager with the metadata to _stream
+        yield from super().stream(input, config, stop=stop, semantic_metadata=_metadata_of(config), **kwargs)
+
+    async def astream(self, input, config=None, *, stop=None, **kwargs):
+        async for chunk in super().astream(input, config, stop=stop, semantic_metadata=_metadata_of(config),
+                                           **kwargs):
+            yield chunk
+
+    def _lookup(self, messages, run_manager, metadata=None):
+        if metadata is None:
+            metadata = (run_manager.metadata or {}) if run_manager is not None else {}
+        call = metadata.get("call")
+        if not self.semantic_cache.caches(call):
+            return None, None, None
+        partition = partition_key(call, self.model_name, messages, metadata.get("constraints", ""))
+        with metrics.span("cache.semantic", call=call) as attributes:
+            try:
+                vector = self.semantic_cache.embed(prompt_text(messages))
+                cached = self.semantic_cache.get(call, partition, vector)
+            except Exception as error:
+                # the answer is generated without the cache if e.g. the embedding API fails
+                logger.warning(f"Semantic cache lookup failed: {type(error).__name__}: {error}")
+                return None, None, None
+            attributes["hit"] = cached is not None
+            if cached is not None:
+                attributes["similarity"] = round(cached[2], 4)
+        return (call, partition, vector), cached, time.perf_counter()
+
+    def _store(self, key, text, start):
+        if key is not None and text:
+            call, partition, vector = key
+            self.semantic_cache.put(call, partition, vector, text, time.perf_counter() - start)
+
+    @staticmethod
+    def _cached_result(cached):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=cached[0]))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key, cached, start = self._lookup(messages, run_manager)
+        if cached is not None:
+            return self._cached_result(cached)
+        result = self.chat_model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._store(key, result.generations[0].message.content, start)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        # the embedding function is blocking, to_thread keeps the context with the trace of the request
+        key, cached, start = await asyncio.to_thread(self._lookup, messages, run_manager)
+        if cached is not None:
+            return self._cached_result(cached)
+        result = await self.chat_model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        await asyncio.to_thread(self._store, key, result.generations[0].message.content, start)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, semantic_metadata=None, **kwargs):
+        key, cached, start = self._lookup(messages, run_manager, semantic_metadata)
+        if cached is not None:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=cached[0]))
+            return
+        text = ""
+        for chunk in self.chat_model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            text += chunk.message.content if isinstance(chunk.message.content, str) else ""
+            yield chunk
+        self._store(key, text, start)
+
+    def with_structured_output(self, schema, **kwargs):
+        # structured answers are not cached, the descriptions per listing have their own cache
+        return self.chat_model.with_structured_output(schema, **kwargs)
+
+
+def create_cache(settings, embedding_function):
+    """
+    Create the semantic cache configured in the [cache] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+        embedding_function (callable): Function of a list of texts returning their embedding vectors.
+
+    Returns:
+        SemanticCache | None: The cache or None if it is disabled.
+    """
+    if not settings.getboolean("cache", "semantic", fallback=False):
+        return None
+    calls = settings.get("cache", "semantic_calls", fallback="profile,profile_image,results")
+    return SemanticCache(
+        embedding_function,
+        path=settings.get("cache", "semantic_path", fallback=".cache/semantic.sqlite3"),
+        max_entries=settings.getint("cache", "semantic_entries", fallback=1000),
+        threshold=settings.getfloat("cache", "semantic_threshold", fallback=0.95),
+        calls={call.strip() for call in calls.split(",") if call.strip()},
+    )
@@ -7,14 +7,87 @@ with images and descriptions.
 
 Endpoints:
 - "/" (GET): Show the input form.
-- "/results" (POST): Process form and show recommendations.
-- "/image/<int:num>" (GET): Serve images for recommendations.
+- "/results" (POST): Process form and show recommendations. With `streaming = true` in the [server]
+  section of settings.ini the page is sent in chunks, every house as soon as its description is complete.
+  Otherwise the client is redirected to the stored results. If too many requests are in progress the
+  request is rejected with 503 and Retry-After.
+- "/results/<token>" (GET): Show the stored recommendations of an earlier request.
+- "/image/<listing_id>" (GET): Serve the image of a listing, cacheable by browsers and proxies.
+- "/thumbnails/<name>" (GET): Serve the precomputed thumbnails written by thumbnails.py.
+- "/metrics" (GET): Metrics of the pipeline in the Prometheus text format, if enabled in the [metrics] section.
+
+The templates in templates/ are compiled once and cached, and text responses are compressed with gzip.
+The recommendation pipeline (llm.py) is imported on the first recommendation request, so the server
+starts quickly and serves the form without loading LangChain, ChromaDB or the embedding models.
+
+For production use run the app with gunicorn and the settings in gunicorn.conf.py:
+    gunicorn wsgi:app
 """
 
-from flask import Flask, render_template_string, send_file
-from llm import get_results 
+from flask import Flask, abort, redirect, render_template, send_file, send_from_directory, stream_template, url_for
+from collections import OrderedDict
+import configparser
+import os
+import threading
+from urllib.parse import quote
+
+from compression import compress_response
+import metrics
+from result_store import new_token
+import resources
+from thumbnails import file_digest, formats, thumbnail_name, thumbnail_settings
+from logger_config import Logger
+logger = Logger(name="Server").get_logger()
 
 app = Flask(__name__)
+# compiled templates are cached and not checked for changes on every render
+app.jinja_env.auto_reload = False
+
+# strong ETags of the image files, keyed by path, with the modification time and size they were computed for
+image_etags = OrderedDict()
+# srcset attributes of the images with thumbnails, keyed by image hash
+image_srcsets = OrderedDict()
+# maximum number of entries of both, the least recently used are evicted and computed again when needed
+max_image_cache_entries = 10000
+image_cache_lock = threading.Lock()
+
+http_requests = metrics.registry.counter("http_requests_total", "HTTP requests", labels=("endpoint", "status"))
+admission_rejected = metrics.registry.counter("admission_rejected_total", "Requests rejected by the admission queue")
+metrics.registry.gauge("admission_active", "Recommendation requests running",
+                       lambda: resources.get_admission_queue().stats()["active"])
+metrics.registry.gauge("admission_waiting", "Recommendation requests waiting for a slot",
+                       lambda: resources.get_admission_queue().stats()["waiting"])
+
+def get_results(answers):
+    """
+    Compute the recommendations with llm.get_results.
+
+    llm is imported on the first call, so the server starts and serves the form without loading
+    LangChain, ChromaDB and the embedding models.
+
+    Args:
+        answers (list): The user's answers.
+
+    Returns:
+        tuple: Image paths, descriptions and listing ids of the recommended properties.
+    """
+    from llm import get_results
+    return get_results(answers)
+
+
+def stream_results(answers):
+    """
+    Stream the recommendations with llm.stream_results, which is imported on the first call.
+
+    Args:
+        answers (list): The user's answers.
+
+    Returns:
+        iterator: (listing id, image path, description) tuples.
+    """
+    from llm import stream_results
+    return stream_results(answers)
+
 
 def compute_results(size, priorities, amenities, transport, urban, style):
     """
@@ -29,12 +102,128 @@ def compute_results(size, priorities, amenities, transport, urban, style):
         style (str): Preferred house style.
 
     Returns:
-        tuple: (list of image file paths, list of descriptions)
+        list[dict]: Recommended properties with listing 'id', 'image' file path and 'description'.
     """
     answers = [size, priorities, amenities, transport, urban, style]
-    chosen_images, descriptions = get_results(answers)
+    chosen_images, descriptions, ids = get_results(answers)
+
+    return [{"id": id, "image": image, "description": description}
+            for id, image, description in zip(ids, chosen_images, descriptions)]
+
+
+def stream_cards(answers, token):
+    """
+    Stream the recommended properties and store them under the token once all are generated.
+
+    Args:
+        answers (list): The user's answers.
+        token (str): Token of the results page.
+
+    Yields:
+        dict: Recommended property with listing 'id', 'image' file path and 'description'.
+    """
+    cards = []
+    for id, image, description in stream_results(answers):
+        card = {"id": id, "image": image, "description": description}
+        cards.append(card)
+        yield card
+    resources.get_result_store().put(token, cards)
+
+
+def image_etag(path):
+    """
+    Strong ETag of an image file, the hash of its content.
+
+    Args:
+        path (str): Path of the image file.
+
+    Returns:
+        str: The ETag.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = cache_get(image_etags, path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    etag = file_digest(path)
+    cache_put(image_etags, path, (version, etag))
+    return etag
+
+
+def cache_get(cache, key):
+    """
+    Look up a value of image_etags or image_srcsets and mark it as recently used.
+    """
+    with image_cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def cache_put(cache, key, value):
+    """
+    Store a value in image_etags or image_srcsets and evict the least recently used entries.
+    """
+    with image_cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_image_cache_entries:
+            cache.popitem(last=False)
+
+
+@app.template_global()
+def image_url(listing_id, image):
+    """
+    URL of the image of a listing, versioned by the hash of the image file.
+
+    A listing keeps its id when it is edited, the version changes the URL when its image changes,
+    so the immutable responses of /image/<listing_id> are not served from stale caches.
+
+    Args:
+        listing_id (str): Id of the listing.
+        image (str): Path of the image file.
+
+    Returns:
+        str: The URL.
+    """
+    url = f"/image/{quote(str(listing_id), safe='')}"
+    path = os.path.join(app.root_path, image)
+    if not os.path.isfile(path):
+        return url
+    return f"{url}?v={image_etag(path)[:12]}"
 
-    return chosen_images, descriptions
+
+@app.template_global()
+def thumbnail_srcsets(image):
+    """
+    URLs of the thumbnails of an image for the srcset attributes of the results page.
+
+    Args:
+        image (str): Path of the original image.
+
+    Returns:
+        dict | None: 'webp' and 'jpg' srcset attributes and 'src' with the smallest JPEG thumbnail,
+            None if the thumbnails of the image weren't written yet.
+    """
+    path = os.path.join(app.root_path, image)
+    if not os.path.isfile(path):
+        return None
+    digest = image_etag(path)
+    srcsets = cache_get(image_srcsets, digest)
+    if srcsets is not None:
+        return srcsets
+
+    thumbnail_dir, widths = thumbnail_settings(resources.get_settings())
+    srcsets = {}
+    for extension in formats:
+        names = [(width, thumbnail_name(digest, width, extension)) for width in widths]
+        if not all(os.path.isfile(os.path.join(app.root_path, thumbnail_dir, name)) for _, name in names):
+            return None
+        srcsets[extension] = ", ".join(f"/thumbnails/{name} {width}w" for width, name in names)
+    srcsets["src"] = f"/thumbnails/{thumbnail_name(digest, min(widths), 'jpg')}"
+    cache_put(image_srcsets, digest, srcsets)
+    return srcsets
 
 
 @app.route("/", methods=["GET"])
@@ -42,47 +231,7 @@ def form():
     """
     Render the HTML form for collecting user preferences.
     """
-    html = """
-    <html>
-    <head>
-        <title>Find Your Home</title>
-        <style>
-            body { font-family: Arial, sans-serif; background: #f8f9fa; padding: 20px; }
-            h1 { text-align: center; }
-            form { max-width: 600px; margin: auto; background: white; padding: 20px; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); }
-            label { display: block; margin-top: 15px; font-weight: bold; }
-            input, textarea { width: 100%; padding: 8px; margin-top: 5px; border: 1px solid #ccc; border-radius: 6px; }
-            button { margin-top: 20px; padding: 10px 20px; background: #007BFF; color: white; border: none; border-radius: 6px; cursor: pointer; }
-            button:hover { background: #0056b3; }
-        </style>
-    </head>
-    <body>
-        <h1>Tell Us About Your Dream Home</h1>
-        <form action="/results" method="post">
-            <label>How big do you want your house to be?</label>
-            <input type="text" name="size" required>
-
-            <label>What are 3 most important things for you in choosing this property?</label>
-            <textarea name="priorities" required></textarea>
-
-            <label>Which amenities would you like?</label>
-            <textarea name="amenities" required></textarea>
-
-            <label>Which transportation options are important to you?</label>
-            <textarea name="transport" required></textarea>
-
-            <label>How urban do you want your neighborhood to be?</label>
-            <input type="text" name="urban" required>
-
-            <label>How should your house look like?</label>
-            <textarea name="style" required></textarea>
-
-            <button type="submit">Find Recommendations</button>
-        </form>
-    </body>
-    </html>
-    """
-    return render_template_string(html)
+    return render_template("form.html")
 
 
 from flask import request
@@ -90,9 +239,8 @@ from flask import request
 @app.route("/results", methods=["POST"])
 def results():
     """
-    Handle form submission, compute recommendations, and render results page.
+    Handle form submission, compute recommendations, and render or redirect to the results page.
     """
-    global images
     # Collect answers
     size = request.form["size"]
     priorities = request.form["priorities"]
@@ -101,59 +249,156 @@ def results():
     urban = request.form["urban"]
     style = request.form["style"]
 
+    token = new_token()
+
+    queue = resources.get_admission_queue()
+    if not queue.acquire():
+        return overloaded()
+
+    if resources.get_settings().getboolean("server", "streaming", fallback=False):
+        # the cards are rendered while the recommendations are generated
+        cards = stream_cards([size, priorities, amenities, transport, urban, style], token)
+        response = app.response_class(stream_template("results.html", cards=cards, token=token), mimetype="text/html")
+        # proxies must not buffer the chunks
+        response.headers["X-Accel-Buffering"] = "no"
+        # the slot is held until the page is sent completely or the client disconnects
+        response.call_on_close(queue.release)
+        return response
+
     # Run computation
-    images, descriptions = compute_results(size, priorities, amenities, transport, urban, style)
-    pairs = list(zip(images, descriptions))
-
-    # Show results
-    html = """
-    <html>
-    <head>
-        <title>Recommendations</title>
-        <style>
-            body { font-family: Arial, sans-serif; background: #f8f9fa; padding: 20px; }
-            h1 { text-align: center; margin-bottom: 40px; }
-            .card { display: flex; align-items: flex-start; background: white; border-radius: 12px;
-                    box-shadow: 0 2px 8px rgba(0,0,0,0.1); margin: 20px auto; max-width: 800px; overflow: hidden; }
-            .card img { width: 300px; border-right: 1px solid #ddd; }
-            .card-content { padding: 20px; flex: 1; }
-        </style>
-    </head>
-    <body>
-        <h1>Your Personalized Real Estate Recommendations</h1>
-        {% for img, desc in pairs %}
-            <div class="card">
-                <img src="/image/{{ loop.index0 }}" alt="Recommendation {{ loop.index }}">
-                <div class="card-content">
-                    <p>{{ desc }}</p>
-                </div>
-            </div>
-        {% endfor %}
-    </body>
-    </html>
-    """
-    return render_template_string(html, pairs=pairs)
-
-
-@app.route("/image/<int:num>")
-def image(num):
-    """
-    Serve the image file for the given recommendation index.
+    try:
+        cards = compute_results(size, priorities, amenities, transport, urban, style)
+    finally:
+        queue.release()
+    resources.get_result_store().put(token, cards)
+
+    # reloading the results page doesn't submit the form again
+    return redirect(url_for("stored_results", token=token), code=303)
+
+
+def overloaded():
+    """
+    Response for requests rejected by the admission queue.
+
+    Returns:
+        Response: 503 Service Unavailable with the Retry-After header from the [limits] section of settings.ini.
+    """
+    admission_rejected.inc()
+    retry_after = resources.get_settings().getint("limits", "retry_after", fallback=5)
+    logger.warning(f"Rejected request, {resources.get_admission_queue().stats()}")
+    response = app.response_class("Too many requests at the moment, please try again in a few seconds.",
+                                  status=503, mimetype="text/plain")
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+@app.route("/results/<token>")
+def stored_results(token):
+    """
+    Show the stored recommendations of an earlier request.
 
     Args:
-        num (int): Index of the image to serve.
+        token (str): Token of the results page.
+
+    Returns:
+        Response: Results page or 404 error if the results expired.
+    """
+    cards = resources.get_result_store().get(token)
+    if cards is None:
+        return "These results have expired", 404
+    return render_template("results.html", cards=cards, token=token)
+
+
+@app.route("/image/<listing_id>")
+def image(listing_id):
+    """
+    Serve the image file of a listing.
+
+    The results page links the image with the hash of the file in the URL (image_url), so the response
+    can be cached indefinitely. Revalidation requests with If-None-Match are answered with 304 Not Modified.
+
+    Args:
+        listing_id (str): Id of the listing.
 
     Returns:
         Response: Image file or 404 error.
     """
-    global images
-    if 0 <= num < len(images):
-        return send_file(images[num], mimetype="image/png")
-    else:
-        return "No such image", 404
+    path = resources.get_result_store().image_path(listing_id)
+    if path is None:
+        # e.g. for the page of an expired result, the image index is read without loading the database
+        path = resources.get_image_index().image_path(listing_id)
+    if path is None:
+        abort(404)
+    path = os.path.join(app.root_path, path)
+    if not os.path.isfile(path):
+        abort(404)
+
+    max_age = resources.get_settings().getint("server", "image_max_age", fallback=31536000)
+    response = send_file(path, etag=image_etag(path), max_age=max_age, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/thumbnails/<name>")
+def thumbnail(name):
+    """
+    Serve a precomputed thumbnail. The names contain the hash of the image, so they never change.
+
+    Args:
+        name (str): File name of the thumbnail.
+
+    Returns:
+        Response: Thumbnail file or 404 error.
+    """
+    thumbnail_dir, _ = thumbnail_settings(resources.get_settings())
+    max_age = resources.get_settings().getint("server", "image_max_age", fallback=31536000)
+    response = send_from_directory(thumbnail_dir, name, max_age=max_age)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+
+    Returns:
+        Response: The metrics or 404 error if the endpoint is disabled in the [metrics] section of settings.ini.
+    """
+    if not resources.get_settings().getboolean("metrics", "endpoint", fallback=True):
+        abort(404)
+    return app.response_class(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.after_request
+def count_request(response):
+    """
+    Count the requests per endpoint and status code.
+    """
+    http_requests.inc(endpoint=request.endpoint or "none", status=response.status_code)
+    return response
+
+
+@app.after_request
+def compress(response):
+    """
+    Compress text responses with gzip if enabled in the [server] section of settings.ini.
+    """
+    settings = resources.get_settings()
+    if not settings.getboolean("server", "compression", fallback=True):
+        return response
+    return compress_response(request, response, level=settings.getint("server", "compression_level", fallback=6))
 
 if __name__ == "__main__":
     """
     Run the Flask development server.
     """
+    parser = configparser.ConfigParser()
+    parser.read("settings.ini")
+
+    if parser.getboolean("server", "preload", fallback=False):
+        resources.preload(open_ai=True)
+
     app.run(debug=True)
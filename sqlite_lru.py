@@ -0,0 +1,193 @@
+"""
+sqlite_lru.py
+
+This module provides the on-disk tier of the caches: a SQLite table with a bounded number of rows
+which evicts the least recently used ones.
+
+Every row has a last_access time which is indexed, so the oldest rows are found without sorting the
+table. The number of rows is counted again after every batch of new rows, and only if it exceeds the
+maximum the oldest rows are deleted, a tenth of the maximum at once. Rows which weren't read for
+longer than an optional ttl are not returned anymore. The connections are per thread and the table
+can be shared by several processes.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from logger_config import Logger
+logger = Logger(name="SQLiteLRU").get_logger()
+
+
+class SQLiteLRU:
+    """
+    SQLite table of cache entries with LRU eviction.
+    """
+
+    def __init__(self, path, table, key_columns, value_columns, max_entries=None, ttl=None):
+        """
+        Open or create the table.
+
+        Args:
+            path (str): Path of the SQLite file.
+            table (str): Name of the table.
+            key_columns (tuple[str]): Columns of the primary key.
+            value_columns (tuple[str]): Columns of the cached value.
+            max_entries (int): Maximum number of rows, None for no limit.
+            ttl (float): Seconds since the last access after which a row expires, None for no expiry.
+        """
+        self.path = path
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.value_columns = tuple(value_columns)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # rows deleted at once, and new rows after which the table is counted again
+        self.batch = max(1, max_entries // 10) if max_entries else 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            columns = ", ".join(self.key_columns + self.value_columns)
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ({columns}, last_access REAL, "
+                f"PRIMARY KEY ({', '.join(self.key_columns)}))"
+            )
+            # tables of older versions without an access time
+            if "last_access" not in [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN last_access REAL")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._where = " AND ".join(f"{column} = ?" for column in self.key_columns)
+        self._count = self.count()
+
+    def connection(self):
+        """
+        SQLite connection of the calling thread.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """
+        Look up the value of a key and mark it as recently used.
+
+        Args:
+            key (tuple): Values of the key columns.
+
+        Returns:
+            tuple | None: Values of the value columns, None if the key is not stored.
+        """
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """
+        Look up the values of several keys and mark the found ones as recently used.
+
+        Args:
+            keys (list[tuple]): Values of the key columns of every key.
+
+        Returns:
+            list: Values of the value columns for every key, None for keys which are not stored or expired.
+        """
+        connection = self.connection()
+        now = time.time()
+        select = f"SELECT {', '.join(self.value_columns)} FROM {self.table} WHERE {self._where}"
+        # expired rows are left to the eviction of the least recently used rows
+        expiry = ()
+        if self.ttl is not None:
+            select += " AND last_access >= ?"
+            expiry = (now - self.ttl,)
+        values = [connection.execute(select, (*key, *expiry)).fetchone() for key in keys]
+        found = [key for key, value in zip(keys, values) if value is not None]
+        if found:
+            with connection:
+                connection.executemany(f"UPDATE {self.table} SET last_access = ? WHERE {self._where}",
+                                       [(now, *key) for key in found])
+        return values
+
+    def put(self, key, value):
+        """
+        Store the value of a key.
+
+        Args:
+            key (tuple): Values of the key columns.
+            value (tuple): Values of the value columns.
+        """
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """
+        Store several values and evict the least recently used rows if the table is too large.
+
+        Args:
+            items (list[tuple]): (key, value) tuples with the values of the key and the value columns.
+        """
+        if not items:
+            return
+        columns = self.key_columns + self.value_columns + ("last_access",)
+        now = time.time()
+        connection = self.connection()
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [(*key, *value, now) for key, value in items]
+            )
+        self._evict(len(items))
+
+    def _evict(self, added):
+        """
+        Delete the least recently used rows when the table has more than max_entries rows.
+
+        The rows are counted again once at least `batch` rows were added since the last count, and
+        the table is reduced to max_entries - batch rows, so eviction runs once per batch of new rows.
+        """
+        if self.max_entries is None:
+            return
+        with self._lock:
+            # estimate of the rows, replaced rows are counted as new ones
+            self._count += added
+            if self._count <= self.max_entries:
+                return
+            connection = self.connection()
+            count = self.count()
+            excess = count - (self.max_entries - self.batch)
+            if count > self.max_entries:
+                with connection:
+                    connection.execute(
+                        f"DELETE FROM {self.table} WHERE rowid IN "
+                        f"(SELECT rowid FROM {self.table} ORDER BY last_access LIMIT ?)", (excess,)
+                    )
+                logger.info(f"Evicted {excess} least recently used rows of {self.table}")
+                count -= excess
+            self._count = min(count, self.max_entries - self.batch)
+
+    def count(self):
+        """
+        Number of stored rows.
+
+        Returns:
+            int: The number of rows.
+        """
+        return self.connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        """
+        Delete all rows.
+        """
+        connection = self.connection()
+        with connection:
+            connection.execute(f"DELETE FROM {self.table}")
+        with self._lock:
+            self._count = 0
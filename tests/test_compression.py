@@ -0,0 +1,54 @@
+import gzip
+import zlib
+
+from flask import Flask, Response
+
+from compression import compress_response, gzip_stream
+
+app = Flask(__name__)
+PAGE = "<html><body>" + "<p>A nice house with a garden.</p>" * 100 + "</body></html>"
+
+
+def test_gzip_stream_flushes_every_chunk():
+    chunks = ["<p>first</p>", "<p>second</p>", "<p>third</p>"]
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    stream = gzip_stream(iter(chunks))
+
+    # every chunk can be decompressed as soon as it is received
+    for chunk in chunks:
+        assert decompressor.decompress(next(stream)).decode() == chunk
+    decompressor.decompress(b"".join(stream))
+    assert decompressor.eof
+
+
+def test_compresses_html():
+    with app.test_request_context(headers={"Accept-Encoding": "gzip, deflate"}):
+        from flask import request
+        response = compress_response(request, Response(PAGE, mimetype="text/html"))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert len(response.get_data()) < len(PAGE) / 10
+    assert gzip.decompress(response.get_data()).decode() == PAGE
+
+
+def test_compresses_streamed_html():
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        from flask import request
+        response = compress_response(request, Response(iter([PAGE[:500], PAGE[500:]]), mimetype="text/html"))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(b"".join(response.response)).decode() == PAGE
+
+
+def test_leaves_other_responses_unchanged():
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        from flask import request
+        image = compress_response(request, Response(b"\x89PNG" * 1000, mimetype="image/png"))
+        small = compress_response(request, Response("<p>small</p>", mimetype="text/html"))
+    with app.test_request_context():
+        from flask import request
+        not_accepted = compress_response(request, Response(PAGE, mimetype="text/html"))
+
+    for response in (image, small, not_accepted):
+        assert "Content-Encoding" not in response.headers
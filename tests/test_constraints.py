@@ -0,0 +1,29 @@
+import pytest
+
+import user_data
+from constraints import extract_constraints, to_where
+
+
+@pytest.mark.parametrize("answers, expected", [
+    (["A comfortable three-bedroom house."], {"bedrooms": {"$gte": 3}}),
+    (["At least 2 bathrooms and no more than 4 bedrooms."], {"bathrooms": {"$gte": 2}, "bedrooms": {"$lte": 4}}),
+    (["Under $800,000 please."], {"price": {"$lte": 800000}}),
+    (["Our budget is 1.2 million."], {"price": {"$lte": 1200000}}),
+    (["Between $500k and $700k."], {"price": {"$gte": 500000, "$lte": 700000}}),
+    (["More than $400,000 is fine."], {"price": {"$gte": 400000}}),
+    (["At least 2000 sqft."], {"house_size": {"$gte": 2000}}),
+    (["A quiet neighborhood and good schools."], {}),
+])
+def test_extract_constraints(answers, expected):
+    assert extract_constraints(answers) == expected
+
+
+def test_extract_constraints_from_questionnaire():
+    _, answers = user_data.get_info3()
+    assert extract_constraints(answers) == {"bedrooms": {"$gte": 4}}
+
+
+def test_to_where():
+    assert to_where({}) is None
+    assert to_where({"bedrooms": {"$gte": 3}}) == {"bedrooms": {"$gte": 3}}
+    assert to_where({"price": {"$gte": 1, "$lte": 2}}) == {"$and": [{"price": {"$gte": 1}}, {"price": {"$lte": 2}}]}
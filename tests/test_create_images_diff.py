@@ -0,0 +1,106 @@
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+import create_images_diff
+
+
+class FakePipeline:
+    """Stable Diffusion stand-in returning one small image per prompt."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompts, **kwargs):
+        self.calls.append((list(prompts), kwargs))
+        return SimpleNamespace(images=[Image.new("RGB", (8, 8)) for _ in prompts])
+
+
+def make_client():
+    client = MagicMock()
+    client.chat.completions.create.side_effect = lambda model, messages: SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=f"photo of {messages[1]['content'][:40]}"))])
+    return client
+
+
+def make_houses(count):
+    return [{"Neighborhood": f"Area {index}", "Bedrooms": 3, "Bathrooms": 2, "HouseSize": 1500,
+             "Description": "A house.", "NeighborhoodDescription": "Nice."} for index in range(count)]
+
+
+def test_prompts_are_rendered_in_batches(tmp_path):
+    pipe = FakePipeline()
+    stats = create_images_diff.create_images(make_houses(5), make_client(), pipe, output_dir=str(tmp_path),
+                                             batch_size=2, steps=10, size=256)
+
+    assert [len(prompts) for prompts, _ in pipe.calls] == [2, 2, 1]
+    assert pipe.calls[0][1] == {"num_inference_steps": 10, "height": 256, "width": 256}
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"{index}.png" for index in range(5)]
+    assert stats["images"] == 5
+    assert stats["seconds_per_image"] >= 0
+
+
+def test_existing_images_are_skipped(tmp_path):
+    Image.new("RGB", (8, 8)).save(tmp_path / "1.png")
+    client = make_client()
+    pipe = FakePipeline()
+    stats = create_images_diff.create_images(make_houses(3), client, pipe, output_dir=str(tmp_path), batch_size=4)
+
+    assert stats["images"] == 2
+    assert client.chat.completions.create.call_count == 2
+    assert "Area 1" not in " ".join(pipe.calls[0][0])
+    assert pipe.calls[0][1] == {}
+
+    stats = create_images_diff.create_images(make_houses(3), client, pipe, output_dir=str(tmp_path), batch_size=4)
+    assert stats == {"images": 0, "seconds_per_image": 0.0}
+
+
+def test_overwrite_generates_all_images(tmp_path):
+    Image.new("RGB", (8, 8)).save(tmp_path / "0.png")
+    stats = create_images_diff.create_images(make_houses(2), make_client(), FakePipeline(), output_dir=str(tmp_path),
+                                             skip_existing=False)
+    assert stats["images"] == 2
+
+
+def test_load_pipeline_once_on_cpu():
+    torch = MagicMock()
+    torch.cuda.is_available.return_value = True
+    diffusers = MagicMock()
+    with patch.dict(sys.modules, {"torch": torch, "diffusers": diffusers}):
+        pipe = create_images_diff.load_pipeline("model", cpu=True)
+
+    diffusers.StableDiffusionPipeline.from_pretrained.assert_called_once_with("model", torch_dtype=torch.float32)
+    pipe.to.assert_not_called()
+    pipe.enable_attention_slicing.assert_called_once()
+
+
+def test_load_pipeline_on_gpu():
+    torch = MagicMock()
+    torch.cuda.is_available.return_value = True
+    diffusers = MagicMock()
+    with patch.dict(sys.modules, {"torch": torch, "diffusers": diffusers}):
+        create_images_diff.load_pipeline("model")
+
+    diffusers.StableDiffusionPipeline.from_pretrained.assert_called_once_with("model", torch_dtype=torch.float16)
+    diffusers.StableDiffusionPipeline.from_pretrained.return_value.to.assert_called_once_with("cuda")
+
+
+def test_prompts_are_checkpointed(tmp_path):
+    from generation_jobs import Checkpoint, JobRunner
+
+    client = make_client()
+    checkpoint = str(tmp_path / "prompts.jsonl")
+    runner = JobRunner(workers=3, checkpoint=Checkpoint(checkpoint))
+    create_images_diff.create_images(make_houses(4), client, FakePipeline(), output_dir=str(tmp_path / "images"),
+                                     batch_size=3, runner=runner)
+    assert client.chat.completions.create.call_count == 4
+
+    pipe = FakePipeline()
+    runner = JobRunner(workers=3, checkpoint=Checkpoint(checkpoint))
+    stats = create_images_diff.create_images(make_houses(4), client, pipe, output_dir=str(tmp_path / "images"),
+                                             skip_existing=False, runner=runner)
+    assert stats["images"] == 4
+    assert client.chat.completions.create.call_count == 4
+    assert pipe.calls[0][0][0].startswith("photo of")
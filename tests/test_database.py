@@ -3,48 +3,80 @@ from unittest.mock import patch, MagicMock
 from database import Database
 
 class TestDatabase(unittest.TestCase):
-    @patch('database.OpenAIEmbeddings')
-    @patch('database.OllamaEmbeddings')
-    def test_init_openai(self, mock_ollama, mock_openai):
-        db = Database(open_ai=True)
-        mock_openai.assert_called_once_with(model="text-embedding-3-small")
-        self.assertTrue(hasattr(db, 'embeddings'))
-
-    @patch('database.OpenAIEmbeddings')
-    @patch('database.OllamaEmbeddings')
-    def test_init_ollama(self, mock_ollama, mock_openai):
-        db = Database(open_ai=False)
-        mock_ollama.assert_called_once_with(model="mxbai-embed-large")
-        self.assertTrue(hasattr(db, 'embeddings'))
-
-    @patch('database.JSONLoader')
-    @patch('database.Chroma')
-    def test_load_data(self, mock_chroma, mock_jsonloader):
-        mock_loader = MagicMock()
-        mock_loader.load.return_value = [MagicMock(page_content='content', metadata={'id': 1})]
-        mock_jsonloader.return_value = mock_loader
-        db = Database(open_ai=True)
-        db.embeddings = MagicMock()
-        db.load_data('fake.json')
-        mock_jsonloader.assert_called_once()
-        mock_chroma.from_documents.assert_called_once()
-        self.assertTrue(hasattr(db, 'db'))
-
-    @patch('database.Chroma')
-    def test_load_db(self, mock_chroma):
-        db = Database(open_ai=True)
-        db.embeddings = MagicMock()
-        db.load_db()
-        mock_chroma.assert_called_once()
-        self.assertTrue(hasattr(db, 'db'))
-
-    def test_similarity_search(self):
-        db = Database(open_ai=True)
-        db.db = MagicMock()
-        db.db.similarity_search.return_value = ['result1', 'result2']
-        results = db.similarity_search('query', k=2)
-        db.db.similarity_search.assert_called_once_with('query', 2)
-        self.assertEqual(results, ['result1', 'result2'])
+    def make_database(self, open_ai=True):
+        with patch('database.embedding_functions.OpenAIEmbeddingFunction') as mock_openai, \
+             patch('database.embedding_functions.OllamaEmbeddingFunction') as mock_ollama, \
+             patch('database.embedding_functions.OpenCLIPEmbeddingFunction') as mock_clip, \
+             patch('database.chromadb.PersistentClient') as mock_client:
+            db = Database(open_ai=open_ai)
+        return db, mock_openai, mock_ollama, mock_clip, mock_client
+
+    def test_init_openai(self):
+        db, mock_openai, mock_ollama, mock_clip, mock_client = self.make_database(open_ai=True)
+        mock_openai.assert_called_once()
+        self.assertEqual(mock_openai.call_args.kwargs["model_name"], "text-embedding-3-large")
+        mock_ollama.assert_not_called()
+        mock_client.assert_called_once_with(path=".chroma_db")
+        self.assertIs(db.embedding_text, mock_openai.return_value)
+        self.assertIs(db.embedding_image, mock_clip.return_value)
+
+    def test_init_ollama(self):
+        db, mock_openai, mock_ollama, _, _ = self.make_database(open_ai=False)
+        mock_ollama.assert_called_once_with(model_name="mxbai-embed-large")
+        mock_openai.assert_not_called()
+        self.assertIs(db.embedding_text, mock_ollama.return_value)
+
+    def test_create_collections(self):
+        db, _, _, _, mock_client = self.make_database()
+        names = [call.kwargs["name"] for call in mock_client.return_value.get_or_create_collection.call_args_list]
+        self.assertEqual(names, ["real_estate_description", "real_estate_image"])
+
+    def test_similarity_search_text(self):
+        db, _, _, _, _ = self.make_database()
+        db.embedding_text.return_value = [[0.1, 0.2]]
+        db.col_text = MagicMock()
+        db.col_text.query.return_value = {'ids': [['result1', 'result2']]}
+        results = db.similarity_search_text('query', k=2, where={'Bedrooms': 3})
+        kwargs = db.col_text.query.call_args.kwargs
+        self.assertEqual([list(vector) for vector in kwargs['query_embeddings']], [[0.1, 0.2]])
+        self.assertEqual(kwargs['n_results'], 2)
+        self.assertEqual(kwargs['where'], {'Bedrooms': 3})
+        self.assertEqual(results, {'ids': [['result1', 'result2']]})
+
+    def test_similarity_search_image(self):
+        db, _, _, _, _ = self.make_database()
+        db.embedding_image.return_value = [[0.3, 0.4]]
+        db.col_image = MagicMock()
+        db.similarity_search_image('red house', k=5)
+        kwargs = db.col_image.query.call_args.kwargs
+        self.assertEqual([list(vector) for vector in kwargs['query_embeddings']], [[0.3, 0.4]])
+        self.assertEqual(kwargs['include'], ['uris', 'distances'])
+        self.assertEqual(kwargs['n_results'], 5)
+        self.assertIsNone(kwargs['where'])
+
+    def test_query_embeddings_are_cached(self):
+        db, _, _, _, _ = self.make_database()
+        db.embedding_text.return_value = [[0.1, 0.2]]
+        db.col_text = MagicMock()
+        db.similarity_search_text('query')
+        db.similarity_search_text('query')
+        db.embedding_text.assert_called_once_with(['query'])
+
+    def test_count(self):
+        db, _, _, _, _ = self.make_database()
+        db.col_text = MagicMock()
+        db.col_text.count.return_value = 7
+        db.col_text.get.return_value = {'ids': ['a', 'b']}
+        self.assertEqual(db.count(), 7)
+        self.assertEqual(db.count(where={'Bedrooms': 2}), 2)
+
+    def test_image_uri(self):
+        db, _, _, _, _ = self.make_database()
+        db.col_image = MagicMock()
+        db.col_image.get.return_value = {'ids': ['id1'], 'uris': ['house_images/1.png']}
+        self.assertEqual(db.image_uri('id1'), 'house_images/1.png')
+        db.col_image.get.return_value = {'ids': [], 'uris': []}
+        self.assertIsNone(db.image_uri('missing'))
 
 if __name__ == '__main__':
     unittest.main()
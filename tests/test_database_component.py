@@ -1,26 +1,38 @@
+import os
+
 import pytest
-import chromadb
-import shutil
+
+from benchmarks.fakes import fake_backends
 from database import Database
 
-persist_directory=".test_chroma_db"
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 @pytest.fixture
-def db_client():
-    """Fixture provides a fresh DB client for each test"""
-    db = Database(open_ai=False, persist_directory=persist_directory)
-    db.load_data("data.json")
+def db_client(tmp_path, monkeypatch):
+    """Fixture provides a fresh DB in tmp_path with the listings of data/data.json and deterministic embeddings"""
+    # the listings point to the images in house_images relative to the repository
+    monkeypatch.chdir(repo_dir)
+    with fake_backends():
+        db = Database(open_ai=False, persist_directory=str(tmp_path / "chroma"))
+    db.add_data_to_collections("data/data.json")
     return db
 
 
 def test_create_db_from_json(db_client):
-    """Fixture provides a fresh DB client for each test, connected to an in-memory DB."""    
-    client = chromadb.PersistentClient(path=persist_directory)
-    collection = client.get_collection("real_estate")
-    all_data = collection.get()
+    assert db_client.count() == 17
+    assert db_client.col_image.count() == 17
+
+
+def test_search_after_ingest(db_client):
+    results = db_client.similarity_search_text("A family home with a large backyard", k=3)
+    assert len(results["ids"][0]) == 3
 
-    num_documents = len(all_data["ids"])
+    results = db_client.similarity_search_image("A red house with big windows", k=3)
+    assert all(uri.startswith("house_images/") for uri in results["uris"][0])
 
-    assert num_documents == 13
 
-    shutil.rmtree(persist_directory)
+def test_reingest_is_skipped(db_client):
+    stats = db_client.add_data_to_collections("data/data.json")
+    assert stats["embedded"] == 0
+    assert stats["skipped"] == 17
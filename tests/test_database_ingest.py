@@ -0,0 +1,226 @@
+import hashlib
+import json
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from chromadb.api.types import EmbeddingFunction
+from PIL import Image
+
+from database import Database
+from image_index import ImageIndex
+from listings import listing_id
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Deterministic embedding of texts and images which counts the embedded inputs."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += len(input)
+        vectors = []
+        for item in input:
+            data = item.encode("utf-8") if isinstance(item, str) else np.asarray(item).tobytes()
+            digest = hashlib.sha256(data).digest()
+            vectors.append(np.frombuffer(digest[:32], dtype=np.uint8).astype(np.float32) / 255.0)
+        return vectors
+
+
+def make_listings(count):
+    return [
+        {"Neighborhood": f"Area {index}", "Price": f"${500 + index},000", "Bedrooms": 1 + index % 4,
+         "Bathrooms": 1 + index % 2, "HouseSize": 1000 + 100 * index, "Description": f"House number {index}",
+         "NeighborhoodDescription": "Nice area"}
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "house_images").mkdir()
+    for index in range(10):
+        Image.new("RGB", (8, 8), (index * 20, 0, 0)).save(tmp_path / "house_images" / f"{index}.png")
+
+    text, image = FakeEmbeddingFunction(), FakeEmbeddingFunction()
+    with patch("database.embedding_functions.OpenAIEmbeddingFunction", return_value=text), \
+         patch("database.embedding_functions.OpenCLIPEmbeddingFunction", return_value=image):
+        db = Database(persist_directory=str(tmp_path / "chroma"), open_ai=True)
+    return db
+
+
+def write_json(path, listings):
+    path.write_text(json.dumps({"RealEstateObj": listings}))
+    return str(path)
+
+
+def test_ingest_in_batches(database, tmp_path):
+    filename = write_json(tmp_path / "data.json", make_listings(10))
+    stats = database.add_data_to_collections(filename, batch_size=3)
+
+    assert stats["listings"] == 10
+    assert stats["embedded"] == 10
+    assert database.col_text.count() == 10
+    assert database.col_image.count() == 10
+
+
+def test_reingest_only_embeds_new_listings(database, tmp_path):
+    listings = make_listings(10)
+    database.add_data_to_collections(write_json(tmp_path / "data.json", listings[:8]), batch_size=3)
+    calls = database.embedding_text.calls
+
+    stats = database.add_data_to_collections(write_json(tmp_path / "data.json", listings), batch_size=3)
+
+    assert stats["embedded"] == 2
+    assert stats["skipped"] == 8
+    assert database.embedding_text.calls - calls == 2
+    assert database.col_text.count() == 10
+
+
+def test_edited_and_removed_listings_are_replaced(database, tmp_path):
+    listings = make_listings(10)
+    filename = write_json(tmp_path / "data.json", listings)
+    database.add_data_to_collections(filename, batch_size=3)
+    calls = database.embedding_text.calls
+
+    edited = [{**listings[0], "Price": "$1,000,000"}] + list(reversed(listings[3:]))
+    stats = database.add_data_to_collections(write_json(tmp_path / "data.json", edited))
+
+    # the moved listings get other ids, the text embeddings stored for their content are reused
+    assert database.embedding_text.calls - calls == 1
+    assert stats["removed"] == 2
+    for collection in (database.col_text, database.col_image):
+        assert sorted(collection.get(include=[])["ids"]) == sorted(f"data-{index}" for index in range(8))
+    assert database.col_text.get(ids=["data-0"], include=["documents"])["documents"][0].startswith(
+        "Neighborhood: Area 0\nPrice: $1,000,000")
+
+
+def test_legacy_ids_are_replaced(database, tmp_path):
+    listings = make_listings(3)
+    filename = write_json(tmp_path / "data.json", listings)
+    ids = [f"id{index}" for index in range(3)]
+    vectors = [[float(index)] * 32 for index in range(3)]
+    database.col_text.add(ids=ids, embeddings=vectors, documents=["old"] * 3,
+                          metadatas=[{"source": filename, "index": index} for index in range(3)])
+    database.col_image.add(ids=ids, embeddings=vectors, uris=[f"house_images/{index}.png" for index in range(3)])
+
+    stats = database.add_data_to_collections(filename)
+
+    assert stats["embedded"] == 3 and stats["removed"] == 3
+    for collection in (database.col_text, database.col_image):
+        assert sorted(collection.get(include=[])["ids"]) == ["data-0", "data-1", "data-2"]
+
+
+def test_ingest_updates_version_and_notifies_listeners(database, tmp_path):
+    notified = []
+    database.ingest_listeners.append(lambda: notified.append(True))
+    version = database.collection_version()
+
+    filename = write_json(tmp_path / "data.json", make_listings(3))
+    database.add_data_to_collections(filename)
+    assert notified == [True]
+    assert database.collection_version() != version
+
+    database.add_data_to_collections(filename)
+    assert notified == [True]
+
+
+def test_search_after_ingest(database, tmp_path):
+    database.add_data_to_collections(write_json(tmp_path / "data.json", make_listings(5)))
+
+    results = database.similarity_search_text("House number 2", k=2)
+    assert len(results["ids"][0]) == 2
+    results_image = database.similarity_search_image("red house", k=2)
+    assert len(results_image["uris"][0]) == 2
+
+
+def test_image_uri(database, tmp_path):
+    listings = make_listings(3)
+    database.add_data_to_collections(write_json(tmp_path / "data.json", listings))
+
+    assert database.image_uri(listing_id(listings[2], "data.json", 2)) == "house_images/2.png"
+    assert database.image_uri("unknown") is None
+
+
+def test_image_index_follows_the_stored_listings(database, tmp_path):
+    database.image_index = ImageIndex(str(tmp_path / "images.sqlite3"))
+    listings = make_listings(4)
+    database.add_data_to_collections(write_json(tmp_path / "data.json", listings))
+
+    assert database.image_index.image_path("data-3") == "house_images/3.png"
+    database.add_data_to_collections(write_json(tmp_path / "data.json", listings[:2]))
+    assert database.image_index.image_path("data-3") is None
+    assert database.image_index.count() == 2
+
+    # a database ingested without the index gets it from the stored image paths
+    database.image_index = ImageIndex(str(tmp_path / "rebuilt.sqlite3"))
+    assert database.index_images(batch_size=1) == 2
+    assert database.image_index.image_path("data-1") == "house_images/1.png"
+
+
+def test_search_with_metadata_filter(database, tmp_path):
+    database.add_data_to_collections(write_json(tmp_path / "data.json", make_listings(10)))
+    where = {"$and": [{"bedrooms": {"$gte": 3}}, {"price": {"$lte": 508000}}]}
+
+    results = database.similarity_search_text("House", k=10, where=where)
+    results_image = database.similarity_search_image("House", k=10, where=where)
+
+    assert database.count(where=where) == 4
+    assert database.count(where=where, limit=3) == 3
+    assert database.count(limit=3) == 3
+    assert sorted(results["ids"][0]) == sorted(results_image["ids"][0])
+    for metadata in results["metadatas"][0]:
+        assert metadata["bedrooms"] >= 3 and metadata["price"] <= 508000
+
+
+def test_reingest_adds_missing_metadata_without_embedding(database, tmp_path):
+    filename = write_json(tmp_path / "data.json", make_listings(4))
+    database.add_data_to_collections(filename)
+    # simulate listings stored before the typed metadata was introduced
+    for collection in (database.col_text, database.col_image):
+        stored = collection.get(include=["embeddings", "metadatas", "documents", "uris"])
+        collection.delete(ids=stored["ids"])
+        collection.add(ids=stored["ids"], embeddings=stored["embeddings"], documents=stored["documents"],
+                       uris=stored["uris"], metadatas=[{"content_hash": m["content_hash"]} for m in stored["metadatas"]])
+    assert database.count(where={"bedrooms": {"$gte": 1}}) == 0
+    calls = database.embedding_text.calls
+
+    stats = database.add_data_to_collections(filename)
+
+    assert stats["metadata_updated"] == 4
+    assert database.embedding_text.calls == calls
+    assert database.count(where={"bedrooms": {"$gte": 1}}) == 4
+
+
+def test_listings_without_image_are_skipped(database, tmp_path):
+    listings = make_listings(10) + make_listings(15)[10:]
+    version = database.collection_version()
+
+    stats = database.add_data_to_collections(write_json(tmp_path / "data.json", listings), batch_size=4)
+
+    assert stats["missing_images"] == 5
+    assert stats["embedded"] == 10
+    assert database.col_text.count() == 10
+    assert database.col_image.count() == 10
+    assert database.collection_version() != version
+
+
+def test_reingest_completes_listings_missing_from_the_image_collection(database, tmp_path):
+    filename = write_json(tmp_path / "data.json", make_listings(4))
+    database.add_data_to_collections(filename)
+    database.col_image.delete(ids=database.col_image.get(include=[])["ids"][:2])
+    calls = database.embedding_text.calls
+
+    stats = database.add_data_to_collections(filename)
+
+    assert stats["embedded"] == 2
+    assert database.embedding_text.calls == calls
+    assert database.col_image.count() == 4
+
+
+def test_missing_file_is_logged(database, tmp_path):
+    stats = database.add_data_to_collections(str(tmp_path / "missing.json"))
+
+    assert stats["listings"] == 0
@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+import resources
+from description_cache import DescriptionCache
+from llm import LLM, describe_listings
+
+PROFILE = "The customer wants 3 bedrooms and a garden."
+
+
+class StructuredChatModel(FakeListChatModel):
+    """Fake chat model with structured output which describes the listing in the prompt after a delay."""
+    delay: float = 0.0
+    calls: list = []
+
+    def with_structured_output(self, schema, **kwargs):
+        def describe(prompt):
+            text = prompt.to_string()
+            self.calls.append(threading.current_thread().name)
+            time.sleep(self.delay)
+            name = re.search(r"Neighborhood: (.*)", text).group(1)
+            assert PROFILE in text
+            return schema(description=f"  A house in {name}.  ")
+        return RunnableLambda(describe)
+
+
+def make_listings(count):
+    return [{"id": f"listing-{index}", "uri": f"{index}.png", "document": f"Neighborhood: Area {index}\nPrice: 1"}
+            for index in range(count)]
+
+
+@pytest.fixture
+def real_estate_llm():
+    resources.registry.clear()
+    model = StructuredChatModel(responses=["unused"], delay=0.2, calls=[])
+    with patch("llm.ChatOpenAI", return_value=model):
+        yield LLM(open_ai=True)
+    resources.registry.clear()
+
+
+def test_describe_listing(real_estate_llm):
+    assert real_estate_llm.describe_listing(PROFILE, make_listings(1)[0]["document"]) == "A house in Area 0."
+
+
+def test_describe_listings_concurrently_in_order(real_estate_llm):
+    listings = make_listings(3)
+
+    start = time.perf_counter()
+    descriptions = list(describe_listings(real_estate_llm, PROFILE, listings))
+    elapsed = time.perf_counter() - start
+
+    assert descriptions == ["A house in Area 0.", "A house in Area 1.", "A house in Area 2."]
+    assert elapsed < 2 * real_estate_llm.llm.delay
+
+
+def test_describe_listings_uses_cache(real_estate_llm):
+    cache = DescriptionCache()
+    listings = make_listings(3)
+    list(describe_listings(real_estate_llm, PROFILE, listings[:2], cache=cache))
+    real_estate_llm.llm.calls.clear()
+
+    descriptions = list(describe_listings(real_estate_llm, PROFILE, listings, cache=cache))
+
+    assert descriptions[2] == "A house in Area 2."
+    assert len(real_estate_llm.llm.calls) == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_edited_listing_is_described_again(real_estate_llm):
+    cache = DescriptionCache()
+    listing = make_listings(1)[0]
+    list(describe_listings(real_estate_llm, PROFILE, [listing], cache=cache))
+
+    edited = {**listing, "document": "Neighborhood: Area 9\nPrice: 2"}
+    descriptions = list(describe_listings(real_estate_llm, PROFILE, [edited], cache=cache))
+
+    assert descriptions == ["A house in Area 9."]
+
+
+def test_description_cache_key_is_listing_and_profile(tmp_path):
+    path = str(tmp_path / "descriptions.sqlite3")
+    cache = DescriptionCache(path=path)
+    cache.put("listing-0", PROFILE, "A nice house")
+
+    assert cache.get("listing-0", PROFILE.replace(" ", "  ")) == "A nice house"
+    assert cache.get("listing-0", "Another profile") is None
+    assert cache.get("listing-1", PROFILE) is None
+    assert DescriptionCache(path=path).get("listing-0", PROFILE) == "A nice house"
+
+
+def test_description_cache_evicts_least_recently_used():
+    cache = DescriptionCache(max_entries=2)
+    for listing_id in ["a", "b", "c"]:
+        cache.put(listing_id, PROFILE, listing_id)
+
+    assert cache.get("a", PROFILE) is None
+    assert cache.get("c", PROFILE) == "c"
+
+
+def test_description_cache_bounds_the_disk_tier(tmp_path):
+    cache = DescriptionCache(max_entries=1, path=str(tmp_path / "descriptions.sqlite3"), max_disk_entries=10)
+    for index in range(15):
+        cache.put(f"listing-{index}", PROFILE, "A nice house")
+
+    assert cache._disk.count() <= 10
+    assert cache.get("listing-14", PROFILE) == "A nice house"
+    assert cache.get("listing-0", PROFILE) is None
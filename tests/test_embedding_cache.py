@@ -0,0 +1,78 @@
+import numpy as np
+
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+
+class CountingEmbeddingFunction:
+    def __init__(self, model_name="fake-model"):
+        self.model_name = model_name
+        self.inputs = []
+
+    def name(self):
+        return "counting"
+
+    def __call__(self, input):
+        self.inputs.extend(input)
+        return [np.array([len(text), 1.0], dtype=np.float32) for text in input]
+
+
+def test_cached_embedding_function_embeds_each_text_once():
+    embedding_function = CountingEmbeddingFunction()
+    cached = CachedEmbeddingFunction(embedding_function, EmbeddingCache())
+
+    first = cached(["house", "garden"])
+    second = cached(["garden", "house", "pool"])
+
+    assert embedding_function.inputs == ["house", "garden", "pool"]
+    np.testing.assert_array_equal(first[0], second[1])
+    np.testing.assert_array_equal(second[2], [4.0, 1.0])
+
+
+def test_cache_counts_hit_rate_per_model():
+    cache = EmbeddingCache()
+    text = CachedEmbeddingFunction(CountingEmbeddingFunction("text"), cache)
+    image = CachedEmbeddingFunction(CountingEmbeddingFunction("image"), cache)
+
+    text(["house"])
+    text(["house"])
+    image(["house"])
+
+    stats = cache.stats()
+    assert stats["counting:text"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert stats["counting:image"] == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+
+
+def test_cache_is_bounded():
+    cache = EmbeddingCache(max_entries=2)
+    cached = CachedEmbeddingFunction(CountingEmbeddingFunction(), cache)
+    cached(["a", "b", "c"])
+
+    assert len(cache._entries) == 2
+
+
+def test_cache_persists_to_disk(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddingFunction(CountingEmbeddingFunction(), EmbeddingCache(path=path))(["house"])
+
+    embedding_function = CountingEmbeddingFunction()
+    vectors = CachedEmbeddingFunction(embedding_function, EmbeddingCache(path=path))(["house"])
+
+    assert embedding_function.inputs == []
+    np.testing.assert_array_equal(vectors[0], [5.0, 1.0])
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = EmbeddingCache(max_entries=2, path=str(tmp_path / "embeddings.sqlite3"), max_disk_entries=10)
+    CachedEmbeddingFunction(CountingEmbeddingFunction(), cache)([f"house {index}" for index in range(15)])
+
+    assert cache._disk.count() <= 10
+
+
+def test_bulk_vectors_bypass_the_memory_tier(tmp_path):
+    cache = EmbeddingCache(max_entries=2, path=str(tmp_path / "embeddings.sqlite3"))
+    cache.put_many("text", ["query"], [[1.0, 0.0]])
+    cache.put_many("image", ["a", "b", "c"], [[0.0, 1.0]] * 3, memory=False)
+
+    assert list(cache._entries) == [("text", "query")]
+    assert cache.get_many("image", ["a"], memory=False)[0] is not None
+    assert list(cache._entries) == [("text", "query")]
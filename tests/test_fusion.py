@@ -0,0 +1,100 @@
+import pytest
+
+from fusion import fuse, select_listings
+
+
+def make_results(ids, distances=None, uris=False):
+    results = {"ids": [list(ids)], "documents": [[f"doc {id}" for id in ids]]}
+    if distances is not None:
+        results["distances"] = [list(distances)]
+    if uris:
+        results["uris"] = [[f"house_images/{id}.png" for id in ids]]
+    return results
+
+
+class FakeDatabase:
+    """Text and image search over a fixed ranking, returning the first k ids."""
+
+    def __init__(self, text_ids, image_ids):
+        self.text_ids = text_ids
+        self.image_ids = image_ids
+        self.queries = []
+        self.counts = 0
+
+    def count(self, where=None):
+        self.counts += 1
+        return len(self.text_ids)
+
+    def similarity_search_text(self, query, k=3, where=None):
+        self.queries.append(("text", k))
+        return make_results(self.text_ids[:k])
+
+    def similarity_search_image(self, query, k=3, where=None):
+        self.queries.append(("image", k))
+        return make_results(self.image_ids[:k], uris=True)
+
+
+def test_image_rank_matches_legacy_selection():
+    results = make_results(["a", "b", "c", "d"])
+    results_image = make_results(["x", "c", "a", "y", "d"], uris=True)
+
+    selected = fuse(results, results_image, max_samples=2, method="image_rank")
+
+    assert [listing["id"] for listing in selected] == ["c", "a"]
+    assert selected[0]["document"] == "doc c"
+    assert selected[0]["uri"] == "house_images/c.png"
+
+
+def test_rrf_prefers_listings_good_in_both_lists():
+    results = make_results(["a", "b", "c", "d", "e"])
+    results_image = make_results(["e", "d", "b", "c", "a"], uris=True)
+
+    assert fuse(results, results_image, max_samples=1, method="image_rank")[0]["id"] == "e"
+    assert fuse(results, results_image, max_samples=1, method="rrf")[0]["id"] == "b"
+    assert len(fuse(results, results_image, max_samples=3, method="rrf")) == 3
+
+
+def test_weighted_distances():
+    results = make_results(["a", "b"], distances=[0.1, 0.9])
+    results_image = make_results(["a", "b"], distances=[0.8, 0.2], uris=True)
+
+    assert fuse(results, results_image, method="weighted", text_weight=0.9, image_weight=0.1)[0]["id"] == "a"
+    assert fuse(results, results_image, method="weighted", text_weight=0.1, image_weight=0.9)[0]["id"] == "b"
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        fuse(make_results([]), make_results([]), method="best")
+
+
+def test_select_listings_widens_search_until_enough_listings():
+    text_ids = [f"t{index}" for index in range(40)]
+    image_ids = list(reversed(text_ids))
+    db = FakeDatabase(text_ids, image_ids)
+
+    selected = select_listings(db, "profile", "profile image", db.similarity_search_text("profile", k=6),
+                               db.similarity_search_image("profile image", k=15), max_samples=3, k_text=6, k_image=15)
+
+    assert len(selected) == 3
+    assert ("text", 24) in db.queries
+    assert len({listing["id"] for listing in selected}) == 3
+
+
+def test_select_listings_stops_at_collection_size():
+    db = FakeDatabase(["a", "b"], ["b", "a"])
+
+    selected = select_listings(db, "profile", "profile image", make_results(["a"]), make_results(["b"], uris=True),
+                               max_samples=3, k_text=1, k_image=1)
+
+    assert [listing["id"] for listing in selected] != []
+    assert len(selected) == 2
+
+
+def test_select_listings_only_counts_when_widening():
+    db = FakeDatabase(["a", "b", "c"], ["c", "b", "a"])
+
+    selected = select_listings(db, "profile", "profile image", make_results(["a", "b", "c"]),
+                               make_results(["c", "b", "a"], uris=True), max_samples=3)
+
+    assert len(selected) == 3
+    assert db.counts == 0
@@ -0,0 +1,63 @@
+import json
+import tracemalloc
+
+from PIL import Image
+
+from create_data import RealEstate
+from generate_listings import (facade_colors, generate_listing, generate_listings, write_listings,
+                               write_placeholder_images)
+from listings import iter_listings, listing_metadata
+
+
+def test_listings_are_deterministic():
+    assert list(generate_listings(20, seed=1)) == list(generate_listings(20, seed=1))
+    assert list(generate_listings(20, seed=1)) != list(generate_listings(20, seed=2))
+
+
+def test_range_of_listings_matches_full_dataset():
+    full = list(generate_listings(30, seed=3))
+    assert list(generate_listings(10, seed=3, start=20)) == full[20:]
+
+
+def test_listings_have_real_estate_fields():
+    for listing in generate_listings(200):
+        RealEstate(**listing)
+        metadata = listing_metadata(listing)
+        assert metadata["price"] > 0
+        assert 1 <= listing["Bathrooms"] <= listing["Bedrooms"] + 1
+        assert listing["Neighborhood"] in listing["Description"]
+        assert "ImagePath" not in listing
+
+
+def test_listings_vary():
+    listings = list(generate_listings(500))
+    assert len({listing["Neighborhood"] for listing in listings}) > 5
+    assert len({listing["Description"] for listing in listings}) == 500
+    assert len({listing["Price"] for listing in listings}) > 100
+
+
+def test_image_colour_matches_description():
+    for index in range(50):
+        listing = generate_listing(index, images=16, image_dir="images")
+        image_index = int(listing["ImagePath"].split("/")[-1].split(".")[0])
+        assert f"{facade_colors[image_index % len(facade_colors)]} facade" in listing["Description"]
+
+
+def test_write_listings_streams_jsonl(tmp_path):
+    filename = str(tmp_path / "listings.jsonl")
+    tracemalloc.start()
+    count = write_listings(filename, 20000, seed=5)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert count == 20000
+    assert peak < 1 << 20
+    first = json.loads(open(filename).readline())
+    assert first == generate_listing(0, seed=5)
+    assert sum(1 for _ in iter_listings(filename)) == 20000
+
+
+def test_write_placeholder_images(tmp_path):
+    assert write_placeholder_images(str(tmp_path), 3, size=32) == 3
+    assert Image.open(tmp_path / "2.png").size == (32, 32)
+    assert write_placeholder_images(str(tmp_path), 4, size=32) == 1
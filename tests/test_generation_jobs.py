@@ -0,0 +1,202 @@
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+from PIL import Image
+
+import create_images_dalle
+from generation_jobs import Checkpoint, JobRunner, RateLimiter, output_name
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """Local stand-in for the chat completion and image endpoints of the OpenAI API."""
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.server.state
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with state["lock"]:
+            state["requests"].append((self.path, request))
+            fail = state["failures"] > 0
+            state["failures"] -= fail
+        if fail:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}})
+        elif self.path.endswith("/chat/completions"):
+            content = f"Photo of {request['messages'][1]['content'][:60]}"
+            self.send_json(200, {"id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": request["model"],
+                                 "choices": [{"index": 0, "finish_reason": "stop",
+                                              "message": {"role": "assistant", "content": content}}]})
+        elif self.path.endswith("/images/generations"):
+            port = self.server.server_address[1]
+            self.send_json(200, {"created": 0, "data": [{"url": f"http://127.0.0.1:{port}/image.png"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), (200, 0, 0)).save(buffer, format="PNG")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(buffer.getvalue())))
+        self.end_headers()
+        self.wfile.write(buffer.getvalue())
+
+
+@pytest.fixture
+def fake_openai():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    server.state = {"lock": threading.Lock(), "requests": [], "failures": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+    yield client, server.state
+    server.shutdown()
+    server.server_close()
+
+
+def make_houses(count):
+    return [{"Neighborhood": "Sunnyvale", "Price": f"${500 + index},000", "Bedrooms": 3, "Bathrooms": 2,
+             "HouseSize": 1500, "Description": f"House {index}", "NeighborhoodDescription": "Nice."}
+            for index in range(count)]
+
+
+def test_output_names_are_content_addressed():
+    first, second = make_houses(2)
+    # same neighborhood and bedrooms, which collided with the former names
+    assert output_name(first) != output_name(second)
+    assert output_name(first) == output_name(dict(first, ImagePath="other.png"))
+    assert output_name(first, "jpg").endswith(".jpg")
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_runner_keeps_order_and_limits_workers():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def job(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(item)
+        return item * 2
+
+    runner = JobRunner(workers=3)
+    results = list(runner.run(job, ((str(index), index) for index in range(20))))
+    assert [result for _, _, result in results] == [index * 2 for index in range(20)]
+    assert max(peak) <= 3
+    assert runner.stats["done"] == 20
+
+
+def test_checkpoint_resumes_after_failure(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    calls = []
+
+    def failing(item):
+        calls.append(item)
+        if item == 2:
+            raise ValueError("broken listing")
+        return {"value": item}
+
+    runner = JobRunner(workers=2, checkpoint=Checkpoint(path))
+    assert [key for key, _, _ in runner.run(failing, ((str(index), index) for index in range(4)))] == ["0", "1", "3"]
+    assert runner.stats["failed"] == 1
+
+    # a killed run can leave an incomplete last line
+    with open(path, "a") as file:
+        file.write('{"key": "9", "res')
+
+    calls.clear()
+    runner = JobRunner(workers=2, checkpoint=Checkpoint(path))
+    results = list(runner.run(lambda item: {"value": item}, ((str(index), index) for index in range(4))))
+    assert calls == []
+    assert [result["value"] for _, _, result in results] == [0, 1, 2, 3]
+    assert runner.stats == {"done": 1, "skipped": 3, "failed": 0, "retries": 0}
+
+
+def test_call_retries_rate_limit_errors(fake_openai):
+    client, state = fake_openai
+    state["failures"] = 2
+    runner = JobRunner(workers=1, retries=3, backoff=0.01)
+
+    prompt = runner.call(create_images_dalle.image_prompt, client, make_houses(1)[0])
+    assert prompt.startswith("Photo of")
+    assert runner.stats["retries"] == 2
+    assert len(state["requests"]) == 3
+
+
+def test_call_gives_up_after_retries(fake_openai):
+    client, state = fake_openai
+    state["failures"] = 5
+    runner = JobRunner(workers=1, retries=1, backoff=0.01)
+
+    with pytest.raises(Exception) as error:
+        runner.call(create_images_dalle.image_prompt, client, make_houses(1)[0])
+    assert getattr(error.value, "status_code", None) == 429
+    assert len(state["requests"]) == 2
+
+
+def test_create_images_dalle_against_fake_endpoint(fake_openai, tmp_path):
+    client, state = fake_openai
+    state["failures"] = 1
+    houses = make_houses(5)
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    output_dir = str(tmp_path / "images")
+
+    runner = JobRunner(workers=3, rate=100, backoff=0.01, checkpoint=Checkpoint(checkpoint))
+    result = create_images_dalle.create_images(houses, client, runner, output_dir=output_dir)
+
+    assert [house["Description"] for house in result] == [house["Description"] for house in houses]
+    assert len({house["ImagePath"] for house in result}) == 5
+    assert all(Image.open(house["ImagePath"]).size == (8, 8) for house in result)
+    assert sorted(os.listdir(output_dir)) == sorted(output_name(house) for house in houses)
+
+    requests = len(state["requests"])
+    runner = JobRunner(workers=3, checkpoint=Checkpoint(checkpoint))
+    assert create_images_dalle.create_images(houses, client, runner, output_dir=output_dir) == result
+    assert len(state["requests"]) == requests
+
+
+def test_create_images_dalle_regenerates_missing_images(fake_openai, tmp_path):
+    client, state = fake_openai
+    houses = make_houses(3)
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    output_dir = str(tmp_path / "images")
+    result = create_images_dalle.create_images(houses, client, JobRunner(workers=2, checkpoint=Checkpoint(checkpoint)),
+                                               output_dir=output_dir)
+    os.remove(result[0]["ImagePath"])
+
+    runner = JobRunner(workers=2, checkpoint=Checkpoint(checkpoint))
+    assert create_images_dalle.create_images(houses, client, runner, output_dir=output_dir) == result
+    assert os.path.exists(result[0]["ImagePath"])
+    assert runner.stats["done"] == 1 and runner.stats["skipped"] == 2
+
+    # the checkpointed images of another output directory are not used
+    other_dir = str(tmp_path / "other")
+    runner = JobRunner(workers=2, checkpoint=Checkpoint(checkpoint))
+    moved = create_images_dalle.create_images(houses, client, runner, output_dir=other_dir)
+    assert all(house["ImagePath"].startswith(other_dir) and os.path.exists(house["ImagePath"]) for house in moved)
+    assert runner.stats["done"] == 3
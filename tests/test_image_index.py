@@ -0,0 +1,16 @@
+from image_index import ImageIndex
+
+
+def test_put_get_and_delete(tmp_path):
+    index = ImageIndex(str(tmp_path / "index" / "images.sqlite3"))
+    index.put_many([("a", "house_images/0.png"), ("b", "house_images/1.png"), ("c", None)])
+    index.put_many([("b", "house_images/2.png")])
+
+    assert index.image_path("a") == "house_images/0.png"
+    assert index.image_path("b") == "house_images/2.png"
+    assert index.image_path("c") is None
+    index.delete(["a", "unknown"])
+    assert index.image_path("a") is None
+    assert index.count() == 1
+    # another process reads the same table
+    assert ImageIndex(str(tmp_path / "index" / "images.sqlite3")).image_path("b") == "house_images/2.png"
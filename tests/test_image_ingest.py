@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from embedding_cache import EmbeddingCache
+from image_ingest import ImageEmbedder, load_image
+
+
+class MeanColorEmbeddingFunction:
+    """Embeds an image as its mean color and counts the calls."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, input):
+        self.batches.append(len(input))
+        return [np.asarray(image, dtype=np.float32).mean(axis=(0, 1)) for image in input]
+
+
+@pytest.fixture
+def uris(tmp_path):
+    uris = []
+    for index in range(7):
+        path = tmp_path / f"{index}.png"
+        Image.new("RGB", (64 + index, 48), (index * 30, 10, 200)).save(path)
+        uris.append(str(path))
+    return uris
+
+
+def test_load_image_resizes_and_crops(uris):
+    image = load_image(uris[0], size=32)
+
+    assert image.shape == (32, 32, 3)
+    assert tuple(image[16, 16]) == (0, 10, 200)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_embedder_keeps_order_and_batches(uris, workers):
+    embedding_function = MeanColorEmbeddingFunction()
+    with ImageEmbedder(embedding_function, workers=workers, batch_size=3, size=32) as embedder:
+        vectors = embedder(uris)
+
+    assert embedding_function.batches == [3, 3, 1]
+    for index, vector in enumerate(vectors):
+        np.testing.assert_allclose(vector, [index * 30, 10, 200], atol=1)
+
+
+def test_embedder_skips_cached_images(uris, tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    with ImageEmbedder(MeanColorEmbeddingFunction(), cache=EmbeddingCache(path=path)) as embedder:
+        first = embedder(uris)
+
+    embedding_function = MeanColorEmbeddingFunction()
+    with ImageEmbedder(embedding_function, cache=EmbeddingCache(path=path)) as embedder:
+        second = embedder(uris)
+
+    assert embedding_function.batches == []
+    assert embedder.cached == len(uris)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_embedder_returns_none_for_missing_images(uris, tmp_path, workers):
+    with ImageEmbedder(MeanColorEmbeddingFunction(), workers=workers, size=32) as embedder:
+        vectors = embedder([uris[0], str(tmp_path / "missing.png"), uris[1]])
+
+    assert vectors[1] is None
+    assert vectors[0] is not None and vectors[2] is not None
+    assert embedder.failed == 1
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from limits import AdmissionQueue, StageLimit
+
+
+def test_admission_queue_rejects_when_full():
+    queue = AdmissionQueue(max_active=1, max_queue=1, timeout=5)
+    assert queue.acquire()
+
+    waiter = threading.Thread(target=lambda: queue.acquire())
+    waiter.start()
+    while queue.stats()["waiting"] == 0:
+        time.sleep(0.001)
+
+    start = time.perf_counter()
+    assert not queue.acquire()
+    assert time.perf_counter() - start < 0.1
+
+    queue.release()
+    waiter.join()
+    assert queue.stats() == {"active": 1, "waiting": 0, "admitted": 2, "rejected": 1}
+
+
+def test_admission_queue_times_out():
+    queue = AdmissionQueue(max_active=1, max_queue=1, timeout=0.05)
+    assert queue.acquire()
+
+    assert not queue.acquire()
+    assert queue.stats()["rejected"] == 1
+
+
+def test_stage_limit_in_threads():
+    limit = StageLimit("llm", 2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with limit:
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+
+
+def test_stage_limit_in_event_loop():
+    limit = StageLimit("llm", 1)
+    order = []
+
+    async def call(name):
+        async with limit:
+            order.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            order.append(f"end {name}")
+
+    async def main():
+        await asyncio.gather(call("a"), call("b"))
+
+    asyncio.run(main())
+
+    assert order == ["start a", "end a", "start b", "end b"]
+
+
+def test_cancelled_wait_gives_the_slot_back():
+    limit = StageLimit("llm", 1)
+
+    async def wait():
+        async with limit:
+            pass
+
+    async def main():
+        limit.__enter__()
+        waiter = asyncio.create_task(wait())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limit.__exit__(None, None, None)
+        # the slot taken by the waiting thread after the cancellation is released again
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+
+    assert limit._semaphore.acquire(blocking=False)
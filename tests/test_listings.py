@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+
+from listings import content_hash, iter_json_array, iter_listings, listing_id, listing_metadata, parse_number
+
+LISTINGS = [
+    {"Neighborhood": "Green Oaks", "Price": "$650,000", "Bedrooms": 3, "Bathrooms": 2, "HouseSize": 2100,
+     "Description": "Eco-friendly [home] with {solar} panels", "NeighborhoodDescription": "Quiet"},
+    {"Neighborhood": "Downtown", "Price": "$1,200,000", "Bedrooms": 2, "Bathrooms": 2, "HouseSize": 1200,
+     "Description": "Condo", "NeighborhoodDescription": "Vibrant"},
+]
+
+
+def test_iter_json_array_with_small_chunks():
+    text = json.dumps({"RealEstateObj": LISTINGS}, indent=4)
+    assert list(iter_json_array(io.StringIO(text), chunk_size=7)) == LISTINGS
+
+
+def test_iter_json_array_top_level_list():
+    assert list(iter_json_array(io.StringIO(json.dumps(LISTINGS)), chunk_size=5)) == LISTINGS
+
+
+def test_iter_json_array_without_list():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"other": 1}')))
+
+
+def test_iter_listings_jsonl(tmp_path):
+    path = tmp_path / "listings.jsonl"
+    path.write_text("\n".join(json.dumps(listing) for listing in LISTINGS) + "\n")
+
+    assert list(iter_listings(str(path))) == LISTINGS
+
+
+def test_listing_id_is_stable_and_content_hash_detects_changes():
+    edited = {**LISTINGS[0], "Price": "$600,000"}
+
+    assert listing_id(LISTINGS[0], "data/data.json", 0) == listing_id(edited, "data/data.json", 0) == "data-0"
+    assert listing_id(LISTINGS[1], "data/data.json", 1) == "data-1"
+    assert listing_id({"id": 7}, "data/data.json", 0) == "7"
+    assert content_hash(LISTINGS[0]) == content_hash(dict(reversed(list(LISTINGS[0].items()))))
+    assert content_hash(LISTINGS[0]) != content_hash(edited)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$650,000", 650000), ("500.000$", 500000), ("$1.2M", 1200000), ("750k", 750000),
+    ("2100 sqft", 2100), (3, 3), ("unknown", None),
+])
+def test_parse_number(value, expected):
+    assert parse_number(value) == expected
+
+
+def test_listing_metadata():
+    assert listing_metadata(LISTINGS[0]) == {"price": 650000, "bedrooms": 3, "bathrooms": 2, "house_size": 2100}
+    assert listing_metadata({"Price": "on request", "Bedrooms": 2}) == {"bedrooms": 2}
@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+import llm_history
+import resources
+import user_data
+from llm import LLM
+from llm_history import SessionStore, SQLiteSessionStore
+
+
+class RecordingChatModel(FakeListChatModel):
+    """Fake chat model that records the size of every prompt."""
+    prompt_sizes: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompt_sizes.append((len(messages), sum(len(message.content) for message in messages)))
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@pytest.fixture
+def store():
+    resources.registry.clear()
+    store = SessionStore(max_sessions=10, ttl=3600)
+    resources.registry.get("history_store", lambda: store)
+    yield store
+    resources.registry.clear()
+
+
+def test_store_evicts_least_recently_used():
+    store = SessionStore(max_sessions=3)
+    for session_id in ["a", "b", "c"]:
+        store.get(session_id)
+    store.get("a")
+    store.get("d")
+
+    assert len(store) == 3
+    assert "b" not in store
+    assert "a" in store
+
+
+def test_store_evicts_expired_sessions():
+    store = SessionStore(ttl=10)
+    with patch("llm_history.time.monotonic", return_value=0.0):
+        store.get("old")
+    with patch("llm_history.time.monotonic", return_value=100.0):
+        store.get("new")
+
+    assert "old" not in store
+    assert "new" in store
+
+
+def test_store_respects_memory_cap():
+    store = SessionStore(max_size=100)
+    for session_id in range(10):
+        store.get(str(session_id)).add_user_message("x" * 30)
+
+    assert store.size() <= 100 + 30
+
+
+def test_sqlite_store_shares_history(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    first = SQLiteSessionStore(path=path, k=3)
+    second = SQLiteSessionStore(path=path, k=3)
+
+    history = first.get("session")
+    history.add_messages([HumanMessage(str(i)) for i in range(5)])
+
+    assert [message.content for message in second.get("session").messages] == ["2", "3", "4"]
+
+    second.delete("session")
+    assert "session" not in first
+
+
+def test_sqlite_store_evicts_least_recently_used(tmp_path):
+    store = SQLiteSessionStore(path=str(tmp_path / "history.sqlite3"), max_sessions=2)
+    for session_id in ["a", "b", "c"]:
+        store.get(session_id).add_user_message(session_id)
+
+    assert len(store) == 2
+    assert "a" not in store
+
+
+def test_prompt_size_constant_over_many_requests(store):
+    model = RecordingChatModel(responses=["profile"], prompt_sizes=[])
+    with patch("llm.ChatOpenAI", return_value=model):
+        real_estate_llm = LLM(open_ai=True)
+
+    questions, answers = user_data.get_info()
+    for _ in range(2000):
+        session_id = llm_history.new_session_id()
+        real_estate_llm.conversation({"questions": questions, "answers": answers}, session_id=session_id)
+        llm_history.delete_session(session_id)
+
+    assert len(model.prompt_sizes) == 2000
+    assert len(set(model.prompt_sizes)) == 1
+    assert len(store) == 0
@@ -0,0 +1,97 @@
+import configparser
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import llm
+import resources
+from llm import LLM, iter_descriptions, split_descriptions
+
+ANSWER = """Here are the houses:
+
+**1. Green Oaks** A quiet house with a garden.
+
+**2. Downtown** Close to the subway, 2 bedrooms.
+
+**10. Lakeside** A view of the lake."""
+
+
+class StreamingLLM:
+    """Stand-in for LLM which streams a fixed answer in small chunks and records how far it got."""
+
+    def __init__(self, answer, chunk_size=3):
+        self.answer = answer
+        self.chunk_size = chunk_size
+        self.sent = 0
+
+    def results_stream(self, context, profile):
+        for start in range(0, len(self.answer), self.chunk_size):
+            self.sent = start + self.chunk_size
+            yield self.answer[start:start + self.chunk_size]
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    resources.registry.clear()
+    yield resources.registry
+    resources.registry.clear()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 1000])
+def test_iter_descriptions_matches_split(chunk_size):
+    chunks = [ANSWER[start:start + chunk_size] for start in range(0, len(ANSWER), chunk_size)]
+
+    assert list(iter_descriptions(chunks)) == split_descriptions(ANSWER)
+
+
+def test_results_stream_matches_results():
+    with patch("llm.ChatOpenAI", return_value=FakeListChatModel(responses=[ANSWER, ANSWER])):
+        real_estate_llm = LLM(open_ai=True)
+
+    chunks = list(real_estate_llm.results_stream("context", "profile"))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == real_estate_llm.results("context", "profile")
+
+
+def test_stream_results_yields_houses_before_the_answer_is_complete():
+    streaming_llm = StreamingLLM(ANSWER)
+    resources.registry.get(("llm", True), lambda: streaming_llm)
+    ids = ["a", "b", "c"]
+    images = ["0.png", "1.png", "2.png"]
+    selected = [{"id": id, "uri": image, "document": "house"} for id, image in zip(ids, images)]
+    settings = configparser.ConfigParser()
+    settings.read_dict({"pipeline": {"descriptions": "combined"}})
+
+    with patch("llm._cached_results", return_value=(None, None, None)), \
+            patch("llm.resources.get_settings", return_value=settings), \
+            patch("llm._select_listings", return_value=(selected, "profile", "s1", "s2")):
+        stream = llm.stream_results(["answer"], mode="sequential")
+        first = next(stream)
+        sent_at_first = streaming_llm.sent
+        rest = list(stream)
+
+    assert first == ("a", "0.png", split_descriptions(ANSWER)[0])
+    assert sent_at_first < len(ANSWER)
+    assert [first] + rest == list(zip(ids, images, split_descriptions(ANSWER)))
+
+
+def test_stream_results_from_cache():
+    cached = (["0.png", "1.png"], ["first", "second"], ["a", "b"])
+    with patch("llm._cached_results", return_value=(object(), "key", cached)):
+        assert list(llm.stream_results(["answer"])) == [("a", "0.png", "first"), ("b", "1.png", "second")]
+
+
+def test_select_listings_deletes_the_sessions_on_errors():
+    resources.registry.get(("llm", True), lambda: object())
+    resources.registry.get(("database", True), lambda: object())
+    timings = llm.StageTimings()
+
+    with patch("llm.eligible_filter", return_value=None), \
+            patch("llm.run_searches", side_effect=TimeoutError("LLM timeout")), \
+            patch("llm.llm_history.delete_session") as delete_session:
+        with pytest.raises(TimeoutError):
+            llm._select_listings(["answer"], "sequential", timings)
+
+    assert delete_session.call_count == 2
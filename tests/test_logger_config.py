@@ -0,0 +1,97 @@
+import json
+import logging
+import sys
+
+import logger_config
+from logger_config import JsonFormatter, Logger, Sampler, Throttle
+
+
+def read_lines(path):
+    logger_config.flush()
+    with open(path, "r") as file:
+        return file.read().splitlines()
+
+
+def test_logger_created_twice_writes_one_line(tmp_path):
+    log_file = str(tmp_path / "test.log")
+    Logger(name="TestTwice", log_file=log_file, use_queue=False)
+    logger = Logger(name="TestTwice", log_file=log_file, use_queue=False).get_logger()
+
+    logger.info("only once")
+
+    lines = read_lines(log_file)
+    assert len(lines) == 1
+    assert lines[0].endswith("TestTwice - INFO - only once")
+
+
+def test_loggers_share_the_handlers(tmp_path):
+    log_file = str(tmp_path / "test.log")
+    first = Logger(name="TestShareA", log_file=log_file).get_logger()
+    second = Logger(name="TestShareB", log_file=log_file).get_logger()
+
+    assert first.handlers == second.handlers
+
+
+def test_queue_writes_records_in_background_thread(tmp_path):
+    log_file = str(tmp_path / "test.log")
+    logger = Logger(name="TestQueue", log_file=log_file, use_queue=True).get_logger()
+
+    assert isinstance(logger.handlers[0], logging.handlers.QueueHandler)
+    for index in range(100):
+        logger.info(f"message {index}")
+
+    lines = read_lines(log_file)
+    assert len(lines) == 100
+    assert lines[-1].endswith("message 99")
+
+
+def test_json_format_writes_one_object_per_line(tmp_path):
+    log_file = str(tmp_path / "test.log")
+    logger = Logger(name="TestJson", log_file=log_file, use_queue=True, json_format=True).get_logger()
+
+    logger.warning("listing %s", "abc", extra={"listing_id": "abc"})
+
+    entry = json.loads(read_lines(log_file)[0])
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "TestJson"
+    assert entry["message"] == "listing abc"
+    assert entry["listing_id"] == "abc"
+
+
+def test_json_formatter_adds_exception():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = logging.LogRecord("TestJson", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "failed"
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_logging_settings_read_from_file(tmp_path):
+    settings = tmp_path / "settings.ini"
+    settings.write_text("[logging]\nqueue = false\nformat = json\nlevel = debug\nfile = other.log\n")
+
+    config = logger_config.logging_settings(str(settings))
+
+    assert config == {"queue": False, "json": True, "file": "other.log", "level": logging.DEBUG}
+
+
+def test_throttle_lets_one_message_through_per_interval(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logger_config.time, "monotonic", lambda: now[0])
+    throttle = Throttle(interval=5.0)
+
+    assert throttle.ready()
+    now[0] += 1.0
+    assert not throttle.ready()
+    now[0] += 4.0
+    assert throttle.ready()
+    assert throttle.suppressed == 1
+
+
+def test_sampler_lets_every_nth_message_through():
+    sampler = Sampler(every=3)
+
+    assert [sampler.ready() for _ in range(7)] == [True, False, False, True, False, False, True]
@@ -0,0 +1,115 @@
+import asyncio
+import configparser
+import contextvars
+import json
+import threading
+
+import pytest
+
+import llm
+import metrics
+import resources
+import user_data
+from benchmarks.fakes import fake_backends, write_dataset
+from database import Database
+
+
+def test_counter_and_histogram_render_prometheus_format():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("test_calls_total", "Calls", labels=("call",))
+    counter.inc(call="profile")
+    counter.inc(2, call="profile")
+    histogram = registry.histogram("test_seconds", "Durations", labels=("span",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, span='a "quoted" span')
+
+    text = registry.render()
+    assert "# TYPE test_calls_total counter" in text
+    assert 'test_calls_total{call="profile"} 3' in text
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{span="a \\"quoted\\" span",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{span="a \\"quoted\\" span",le="1"} 2' in text
+    assert 'test_seconds_bucket{span="a \\"quoted\\" span",le="+Inf"} 3' in text
+    assert 'test_seconds_count{span="a \\"quoted\\" span"} 3' in text
+    assert 'test_seconds_sum{span="a \\"quoted\\" span"} 5.55' in text
+
+
+def test_labels_are_checked():
+    counter = metrics.MetricsRegistry().counter("test_total", "Test", labels=("cache", "result"))
+    with pytest.raises(ValueError):
+        counter.inc(cache="recommendations")
+
+
+def test_gauge_reads_function():
+    registry = metrics.MetricsRegistry()
+    registry.gauge("test_active", "Active", lambda: 4)
+    assert "test_active 4" in registry.render()
+
+
+def test_trace_collects_spans_of_coroutines_and_threads():
+    async def branch(name):
+        with metrics.span(name):
+            await asyncio.sleep(0.01)
+
+    async def both():
+        await asyncio.gather(branch("first"), branch("second"))
+
+    with metrics.trace("test", log=False) as trace:
+        asyncio.run(both())
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(lambda: metrics.record_span("thread", 0, 0.1),))
+        thread.start()
+        thread.join()
+        with metrics.span("outside", items=3) as attributes:
+            attributes["results"] = 2
+
+    spans = {span["name"]: span for span in trace.as_dict()["spans"]}
+    assert set(spans) == {"first", "second", "thread", "outside"}
+    assert spans["outside"]["items"] == 3 and spans["outside"]["results"] == 2
+    assert metrics.current_trace() is None
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = configparser.ConfigParser()
+    settings.read_dict({"cache": {"recommendations": "true", "recommendations_path": "", "embeddings_path": "",
+                                  "descriptions_path": ""}})
+    resources.registry.clear()
+    resources.registry.get(("settings", "settings.ini"), lambda: settings)
+    with fake_backends():
+        db = resources.registry.get(("database", True), lambda: Database(persist_directory=str(tmp_path / "chroma")))
+        db.add_data_to_collections(write_dataset(str(tmp_path), 30))
+        yield db
+    resources.registry.clear()
+
+
+def test_get_results_is_traced(offline, caplog):
+    tokens = metrics.llm_tokens.value(call="profile", kind="input")
+    misses = metrics.cache_requests.value(cache="recommendations", result="miss")
+    text_searches = metrics.search_results.count(collection="text")
+
+    _, answers = user_data.get_info()
+    with caplog.at_level("INFO", logger="Trace"):
+        llm.get_results(answers)
+
+    trace = json.loads([record.getMessage() for record in caplog.records if record.name == "Trace"][-1])
+    assert trace["name"] == "get_results" and trace["cached"] is False and trace["listings"] == 3
+    names = [span["name"] for span in trace["spans"]]
+    for name in ("stage.profile", "stage.profile_image", "stage.search_text", "stage.search_image", "stage.fusion",
+                 "stage.descriptions", "llm.profile", "llm.profile_image", "llm.describe_listing", "chroma.query",
+                 "embedding", "cache.recommendations"):
+        assert name in names
+    assert names.count("llm.describe_listing") == 3
+    profile = next(span for span in trace["spans"] if span["name"] == "llm.profile")
+    assert profile["input_tokens"] > 0 and profile["output_tokens"] > 0
+    queries = [span for span in trace["spans"] if span["name"] == "chroma.query"]
+    assert {span["collection"] for span in queries} == {"text", "image"}
+    assert all(span["results"] > 0 for span in queries)
+
+    assert metrics.llm_tokens.value(call="profile", kind="input") > tokens
+    assert metrics.cache_requests.value(cache="recommendations", result="miss") == misses + 1
+    assert metrics.search_results.count(collection="text") == text_searches + 1
+
+    hits = metrics.cache_requests.value(cache="recommendations", result="hit")
+    llm.get_results(answers)
+    assert metrics.cache_requests.value(cache="recommendations", result="hit") == hits + 1
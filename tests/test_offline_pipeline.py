@@ -0,0 +1,49 @@
+import configparser
+
+import pytest
+
+import llm
+import llm_history
+import resources
+from benchmarks.fakes import FakeChatModel, fake_backends, write_dataset
+from database import Database
+import user_data
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = configparser.ConfigParser()
+    settings.read_dict({
+        "cache": {"recommendations": "false", "embeddings_path": "", "descriptions_path": ""},
+        "fusion": {"max_samples": "3"},
+    })
+    resources.registry.clear()
+    resources.registry.get(("settings", "settings.ini"), lambda: settings)
+    with fake_backends():
+        db = resources.registry.get(("database", True), lambda: Database(persist_directory=str(tmp_path / "chroma")))
+        db.add_data_to_collections(write_dataset(str(tmp_path), 40))
+        yield db
+    resources.registry.clear()
+
+
+def test_fake_chat_model_answers_profile_prompt():
+    with fake_backends():
+        real_estate_llm = llm.LLM(open_ai=True)
+    assert isinstance(real_estate_llm.llm, FakeChatModel)
+
+    questions, answers = user_data.get_info()
+    profile = real_estate_llm.conversation({"questions": questions, "answers": answers}, session_id="fake-test")
+    assert profile.startswith("Profile of the customer:")
+    assert "red house" in profile
+    llm_history.delete_session("fake-test")
+
+
+def test_get_results_offline(offline):
+    _, answers = user_data.get_info()
+    images, descriptions, ids = llm.get_results(answers)
+
+    assert len(ids) == 3
+    assert len(descriptions) == 3
+    assert all(image.endswith(".png") for image in images)
+    assert all("matches the wishes of the customer" in description for description in descriptions)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from pipeline import StageTimings, run_searches
+
+DELAY = 0.1
+
+
+class SlowLLM:
+    def conversation(self, history_dic, session_id="id_1"):
+        time.sleep(DELAY)
+        return "profile"
+
+    def conversation_image(self, history_dic, session_id="id_2"):
+        time.sleep(2 * DELAY)
+        return "profile image"
+
+    async def aconversation(self, history_dic, session_id="id_1"):
+        await asyncio.sleep(DELAY)
+        return "profile"
+
+    async def aconversation_image(self, history_dic, session_id="id_2"):
+        await asyncio.sleep(2 * DELAY)
+        return "profile image"
+
+
+class SlowDatabase:
+    def similarity_search_text(self, query, k=3, where=None):
+        time.sleep(DELAY)
+        return {"ids": [[query]]}
+
+    def similarity_search_image(self, query, k=3, where=None):
+        time.sleep(DELAY)
+        return {"ids": [[query]]}
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent"])
+def test_run_searches_returns_profiles_and_results(mode):
+    timings = StageTimings()
+    profile, results, profile_image, results_image = run_searches(SlowLLM(), SlowDatabase(), {}, timings, mode=mode)
+
+    assert profile == "profile"
+    assert profile_image == "profile image"
+    assert results["ids"][0] == ["profile"]
+    assert results_image["ids"][0] == ["profile image"]
+    assert set(timings.stages) == {"profile", "profile_image", "search_text", "search_image"}
+
+
+def test_concurrent_mode_shortens_critical_path():
+    sequential = StageTimings()
+    run_searches(SlowLLM(), SlowDatabase(), {}, sequential, mode="sequential")
+    concurrent = StageTimings()
+    run_searches(SlowLLM(), SlowDatabase(), {}, concurrent, mode="concurrent")
+
+    # sequential: 1 + 2 + 1 + 1 delays, concurrent: longest branch with 2 + 1 delays
+    assert sequential.total() >= 5 * DELAY
+    assert concurrent.total() < 4 * DELAY
+
+
+def test_search_starts_when_own_profile_is_ready():
+    timings = StageTimings()
+    run_searches(SlowLLM(), SlowDatabase(), {}, timings, mode="concurrent")
+
+    text_search_start = timings.stages["search_text"][0]
+    image_profile_end = timings.stages["profile_image"][1]
+
+    assert text_search_start >= timings.stages["profile"][1]
+    assert text_search_start < image_profile_end
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        run_searches(SlowLLM(), SlowDatabase(), {}, StageTimings(), mode="parallel")
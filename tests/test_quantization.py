@@ -0,0 +1,146 @@
+import configparser
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import fake_backends
+from database import Database
+from quantization import CompressedIndex, Int8Quantizer, ProductQuantizer, create_index, truncate
+from vector_store import NumpyClient, normalize, top_k
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def embeddings(count, dimension=64, seed=0):
+    """Normalized vectors with decreasing variance per dimension, like Matryoshka embeddings."""
+    rng = np.random.default_rng(seed)
+    return normalize(rng.standard_normal((count, dimension)) / np.sqrt(1 + np.arange(dimension) / 4))
+
+
+def recall(found, expected):
+    return np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)])
+
+
+def exact_top(queries, vectors, k):
+    return top_k(queries @ vectors.T, k)[0].tolist()
+
+
+def test_truncate_keeps_the_first_dimensions_normalized():
+    vectors = truncate(np.array([[3.0, 4.0, 12.0], [0.0, 0.0, 1.0]]), 2)
+
+    assert np.allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_quantizers_approximate_the_similarities():
+    vectors, queries = embeddings(2000), embeddings(20, seed=1)
+    exact = queries @ vectors.T
+
+    for quantizer, tolerance in ((Int8Quantizer(), 0.02), (ProductQuantizer(16), 0.2)):
+        quantizer.fit(vectors)
+        codes = quantizer.encode(vectors)
+        assert codes.dtype.itemsize == 1
+        assert np.abs(quantizer.scores(queries, codes) - exact).mean() < tolerance
+
+
+def test_compressed_index_is_saved_and_loaded(tmp_path):
+    vectors = embeddings(500)
+    index = CompressedIndex(dimensions=32, quantization="pq", subvectors=8)
+    index.fit(vectors)
+    index.save(str(tmp_path / "index.npz"))
+
+    loaded = CompressedIndex.load(str(tmp_path / "index.npz"), rescore=2)
+
+    assert loaded.params() == {"dimensions": 32, "quantization": "pq", "subvectors": 8}
+    assert loaded.width(64) == 8
+    assert (loaded.encode(vectors) == index.encode(vectors)).all()
+    with pytest.raises(ValueError):
+        CompressedIndex(quantization="int4")
+
+
+@pytest.mark.parametrize("quantization, dimensions", [("none", 32), ("int8", 0), ("pq", 32)])
+def test_rescored_search_finds_the_exact_neighbors(tmp_path, quantization, dimensions):
+    vectors, queries = embeddings(3000), embeddings(20, seed=1)
+    index = CompressedIndex(dimensions=dimensions, quantization=quantization, subvectors=8, rescore=10)
+    collection = NumpyClient(str(tmp_path)).get_or_create_collection("text", index=index)
+    collection.upsert(ids=[f"id{row}" for row in range(2000)], embeddings=vectors[:2000])
+    assert collection.index_stale()
+
+    stats = collection.reindex()
+    # listings added after the index is built are encoded with it
+    collection.upsert(ids=[f"id{row}" for row in range(2000, 3000)], embeddings=vectors[2000:])
+
+    found = collection.query(query_embeddings=queries, n_results=10, include=["distances"])
+    expected = [[f"id{row}" for row in rows] for rows in exact_top(queries, vectors, 10)]
+    assert not collection.index_stale()
+    assert stats["code_bytes"] < stats["full_bytes"]
+    assert recall(found["ids"], expected) >= 0.95
+    # rescored distances are exact
+    nearest = vectors[int(found["ids"][0][0][2:])]
+    assert found["distances"][0][0] == pytest.approx(2 - 2 * float(queries[0] @ nearest), abs=1e-5)
+
+
+def test_index_with_other_settings_is_not_used(tmp_path):
+    vectors = embeddings(300)
+    client = NumpyClient(str(tmp_path))
+    collection = client.get_or_create_collection("text", index=CompressedIndex(dimensions=16, rescore=0))
+    collection.upsert(ids=[f"id{row}" for row in range(300)], embeddings=vectors)
+    collection.reindex()
+
+    reopened = NumpyClient(str(tmp_path)).get_or_create_collection("text", index=CompressedIndex(dimensions=32))
+    found = reopened.query(query_embeddings=vectors[:5], n_results=1)
+
+    assert reopened.index_stale()
+    assert found["ids"] == [[f"id{row}"] for row in range(5)]
+
+
+def test_small_collections_are_not_trained_and_grown_ones_are_retrained(tmp_path, monkeypatch):
+    monkeypatch.setattr("quantization.min_training_rows", 100)
+    vectors = embeddings(1000)
+    collection = NumpyClient(str(tmp_path)).get_or_create_collection(
+        "text", index=CompressedIndex(quantization="int8", rescore=2))
+    collection.upsert(ids=[f"id{row}" for row in range(50)], embeddings=vectors[:50])
+
+    assert not collection.index_stale()
+    assert collection.reindex()["params"] is None
+    assert collection.query(query_embeddings=vectors[:1], n_results=1)["ids"] == [["id0"]]
+
+    collection.upsert(ids=[f"id{row}" for row in range(50, 150)], embeddings=vectors[50:150])
+    assert collection.index_stale()
+    collection.reindex()
+    collection.upsert(ids=[f"id{row}" for row in range(150, 250)], embeddings=vectors[150:250])
+    assert not collection.index_stale()
+    collection.upsert(ids=[f"id{row}" for row in range(250, 300)], embeddings=vectors[250:300])
+    assert collection.index_stale()
+    collection.reindex()
+
+    reopened = NumpyClient(str(tmp_path)).get_or_create_collection(
+        "text", index=CompressedIndex(quantization="int8", rescore=2))
+    assert not reopened.index_stale()
+    monkeypatch.setattr("quantization.training_sample", 300)
+    reopened.upsert(ids=[f"id{row}" for row in range(300, 1000)], embeddings=vectors[300:])
+    # trained on the full sample
+    assert not reopened.index_stale()
+
+
+def test_database_reindex_with_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(repo_dir)
+    monkeypatch.setattr("quantization.min_training_rows", 10)
+    settings = configparser.ConfigParser()
+    settings.read_dict({"database": {"text_dimensions": "64", "text_quantization": "int8", "rescore": "3"}})
+    index = create_index(settings)
+    with fake_backends(dimension=128):
+        db = Database(open_ai=False, persist_directory=str(tmp_path / "vectors"), backend="numpy", text_index=index)
+        db.add_data_to_collections("data/data.json")
+        version = db.collection_version()
+
+        stats = db.reindex()
+
+        assert stats == {"listings": 17, "code_bytes": 64, "full_bytes": 512,
+                         "params": {"dimensions": 64, "quantization": "int8", "subvectors": 0}}
+        assert db.collection_version() != version
+        assert len(db.similarity_search_text("A family home with a large backyard", k=3)["ids"][0]) == 3
+        chroma = Database(open_ai=False, persist_directory=str(tmp_path / "chroma"), text_index=index)
+        assert chroma.text_index is None
+        with pytest.raises(ValueError):
+            chroma.reindex()
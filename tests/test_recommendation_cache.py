@@ -0,0 +1,53 @@
+from recommendation_cache import RecommendationCache, cache_key, normalize_answer
+
+ANSWERS = ["A three-bedroom house.", "Quiet neighborhood", "Garden", "Bus", "Suburban", "Red house"]
+RESULT = (["house_images/1.png"], ["A nice house"])
+
+
+def test_normalize_answer():
+    assert normalize_answer("A  Three-Bedroom house!") == "a 3 bedroom house"
+    assert normalize_answer("Below $650,000.") == "below $650000"
+    assert normalize_answer("3 bedrooms") == normalize_answer("Three bedrooms")
+
+
+def test_cache_key_uses_normalized_answers_model_and_version():
+    variant = ["a 3 bedroom house", "quiet  neighborhood", "garden.", "BUS", "suburban", "red house"]
+
+    assert cache_key(ANSWERS, "gpt-4o-mini", "v1") == cache_key(variant, "gpt-4o-mini", "v1")
+    assert cache_key(ANSWERS, "gpt-4o-mini", "v1") != cache_key(ANSWERS, "gpt-4o-mini", "v2")
+    assert cache_key(ANSWERS, "gpt-4o-mini", "v1") != cache_key(ANSWERS, "llama", "v1")
+
+
+def test_memory_tier_counts_hits_and_misses():
+    cache = RecommendationCache(max_entries=2)
+
+    assert cache.get("a") is None
+    cache.put("a", RESULT)
+    assert cache.get("a") == (["house_images/1.png"], ["A nice house"])
+
+    cache.put("b", RESULT)
+    cache.put("c", RESULT)
+    assert cache.get("a") is None
+
+    assert cache.stats() == {"hits": 1, "memory_hits": 1, "disk_hits": 0, "misses": 2, "entries": 2}
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache" / "recommendations.sqlite3")
+    RecommendationCache(path=path).put("a", RESULT)
+
+    cache = RecommendationCache(path=path)
+    assert cache.get("a") == (["house_images/1.png"], ["A nice house"])
+    assert cache.get("a") == (["house_images/1.png"], ["A nice house"])
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_invalidate_clears_both_tiers(tmp_path):
+    path = str(tmp_path / "recommendations.sqlite3")
+    cache = RecommendationCache(path=path)
+    cache.put("a", RESULT)
+    cache.invalidate()
+
+    assert cache.get("a") is None
+    assert RecommendationCache(path=path).get("a") is None
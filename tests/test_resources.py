@@ -0,0 +1,66 @@
+import threading
+import time
+from unittest.mock import patch
+
+import resources
+from resources import ResourceRegistry
+
+
+def test_registry_builds_once():
+    registry = ResourceRegistry()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return object()
+
+    first = registry.get("key", factory)
+    second = registry.get("key", factory)
+
+    assert first is second
+    assert len(calls) == 1
+
+
+def test_registry_builds_once_with_concurrent_access():
+    registry = ResourceRegistry()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("key", factory))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_registry_clear_rebuilds():
+    registry = ResourceRegistry()
+    first = registry.get("key", object)
+    registry.clear()
+
+    assert not registry.is_loaded("key")
+    assert registry.get("key", object) is not first
+
+
+@patch("database.Database")
+@patch("llm.LLM")
+def test_preload_builds_shared_resources(mock_llm, mock_database):
+    resources.registry.clear()
+    resources.preload(open_ai=True)
+
+    assert resources.get_llm(open_ai=True) is mock_llm.return_value
+    assert resources.get_database(open_ai=True) is mock_database.return_value
+    mock_llm.assert_called_once_with(open_ai=True)
+    mock_database.assert_called_once_with(open_ai=True, embedding_cache=resources.get_embedding_cache(),
+                                          image_index=resources.get_image_index(),
+                                          backend="chroma", persist_directory=".chroma_db", text_index=None)
+
+    resources.registry.clear()
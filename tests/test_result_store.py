@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+from result_store import ResultStore, new_token
+
+CARDS = [{"id": "listing-a", "image": "house_images/0.png", "description": "A nice house"}]
+
+
+def test_put_and_get():
+    store = ResultStore()
+    token = new_token()
+    store.put(token, CARDS)
+
+    assert store.get(token) == CARDS
+    assert store.get(new_token()) is None
+    assert store.image_path("listing-a") == "house_images/0.png"
+
+
+def test_tokens_are_unique():
+    assert len({new_token() for _ in range(1000)}) == 1000
+
+
+def test_evicts_expired_results():
+    store = ResultStore(ttl=10)
+    with patch("result_store.time.monotonic", return_value=100.0):
+        store.put("a", CARDS)
+        store.put("b", CARDS)
+    with patch("result_store.time.monotonic", return_value=105.0):
+        assert store.get("b") == CARDS
+    with patch("result_store.time.monotonic", return_value=112.0):
+        assert store.get("a") is None
+        assert store.get("b") == CARDS
+    assert len(store) == 1
+
+
+def test_evicts_least_recently_used():
+    store = ResultStore(max_entries=2)
+    store.put("a", CARDS)
+    store.put("b", CARDS)
+    store.get("a")
+    store.put("c", CARDS)
+
+    assert "a" in store
+    assert "b" not in store
+    assert len(store) == 2
+
+
+def test_evicts_least_recently_used_image_paths():
+    store = ResultStore(max_image_paths=2)
+    store.add_image_path("a", "a.png")
+    store.add_image_path("b", "b.png")
+    store.image_path("a")
+    store.add_image_path("c", "c.png")
+
+    assert store.image_path("a") == "a.png"
+    assert store.image_path("b") is None
+    assert store.image_path("c") == "c.png"
+
+
+def test_results_are_shared_by_the_stores_of_several_workers(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    worker = ResultStore(path=path)
+    other_worker = ResultStore(path=path)
+    worker.put("token", CARDS)
+
+    assert other_worker.get("token") == CARDS
+    assert other_worker.image_path("listing-a") == "house_images/0.png"
+    assert other_worker.get("unknown") is None
+
+
+def test_shared_results_expire(tmp_path):
+    store = ResultStore(ttl=10, path=str(tmp_path / "results.sqlite3"))
+    with patch("sqlite_lru.time.time", return_value=100.0):
+        store.put("a", CARDS)
+    with patch("sqlite_lru.time.time", return_value=105.0):
+        assert store.get("a") == CARDS
+    with patch("sqlite_lru.time.time", return_value=114.0):
+        assert store.get("a") == CARDS
+    with patch("sqlite_lru.time.time", return_value=125.0):
+        assert store.get("a") is None
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import re
+import threading
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import llm_history
+import metrics
+import resources
+from llm import LLM
+from llm_history import SessionStore
+from semantic_cache import CachedChatModel, SemanticCache, constraints_key, partition_key, prompt_text
+
+QUESTIONS = ["How large should your house be?", "What is important to you?"]
+
+
+def word_embedding(texts, dimension=256):
+    """Fake embedding function, bag of hashed words, so paraphrases with the same words are similar."""
+    vectors = []
+    for text in texts:
+        vector = np.zeros(dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.sha256(word.encode("utf-8")).hexdigest(), 16) % dimension] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+class CountingChatModel(FakeListChatModel):
+    """Fake chat model that counts its calls."""
+    calls: int = 0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(word_embedding, path=str(tmp_path / "semantic.sqlite3"), max_entries=3, threshold=0.9)
+
+
+def prompt(text, system="You write customer profiles."):
+    return [SystemMessage(system), HumanMessage(text)]
+
+
+def lookup(cache, call, messages):
+    return cache.get(call, partition_key(call, "model", messages), cache.embed(prompt_text(messages)))
+
+
+def store(cache, call, messages, answer, seconds=1.0):
+    cache.put(call, partition_key(call, "model", messages), cache.embed(prompt_text(messages)), answer, seconds)
+
+
+def test_similar_prompt_is_a_hit(cache):
+    store(cache, "profile", prompt("three bedrooms, a big garden and a quiet street"), "Family profile", 2.0)
+
+    answer, seconds, similarity = lookup(cache, "profile", prompt("A big garden, three bedrooms and a quiet street!"))
+
+    assert answer == "Family profile"
+    assert seconds == 2.0
+    assert similarity == pytest.approx(1.0)
+    assert lookup(cache, "profile", prompt("a penthouse downtown close to the subway")) is None
+    assert cache.stats()["profile"] == {"hits": 1, "misses": 1, "seconds_saved": 2.0, "hit_rate": 0.5}
+
+
+def test_entries_are_scoped_per_call_and_system_message(cache):
+    store(cache, "profile", prompt("three bedrooms and a garden"), "Family profile")
+
+    assert lookup(cache, "profile_image", prompt("three bedrooms and a garden")) is None
+    assert lookup(cache, "profile", prompt("three bedrooms and a garden", system="Other houses")) is None
+
+
+def test_least_recently_used_answers_are_removed(cache):
+    for index in range(3):
+        store(cache, "profile", prompt(f"answer number{index}"), f"profile {index}")
+    store(cache, "profile_image", prompt("answer number0"), "image profile")
+    assert lookup(cache, "profile", prompt("answer number0"))[0] == "profile 0"
+
+    store(cache, "profile", prompt("answer number3"), "profile 3")
+
+    assert lookup(cache, "profile", prompt("answer number1")) is None
+    assert lookup(cache, "profile", prompt("answer number0"))[0] == "profile 0"
+    assert lookup(cache, "profile", prompt("answer number3"))[0] == "profile 3"
+    assert lookup(cache, "profile_image", prompt("answer number0"))[0] == "image profile"
+
+
+def test_answers_are_persisted(cache, tmp_path):
+    store(cache, "profile", prompt("three bedrooms and a garden"), "Family profile")
+
+    reopened = SemanticCache(word_embedding, path=str(tmp_path / "semantic.sqlite3"))
+
+    assert lookup(reopened, "profile", prompt("a garden and three bedrooms"))[0] == "Family profile"
+
+
+def test_chat_model_answers_similar_prompts_from_cache(cache):
+    model = CountingChatModel(responses=["first", "second", "third"])
+    cached_model = CachedChatModel(chat_model=model, semantic_cache=cache, model_name="model")
+    config = {"metadata": {"call": "profile"}}
+
+    assert cached_model.invoke(prompt("three bedrooms and a garden"), config=config).content == "first"
+    assert cached_model.invoke(prompt("a garden and three bedrooms"), config=config).content == "first"
+    assert "".join(chunk.content for chunk in cached_model.stream(prompt("Three bedrooms and a garden."), config=config)) == "first"
+    answer = asyncio.run(cached_model.ainvoke(prompt("garden and three bedrooms"), config=config))
+    assert answer.content == "first"
+    assert model.calls == 1
+
+    # calls without the call type are not cached
+    assert cached_model.invoke(prompt("three bedrooms and a garden")).content == "second"
+    assert model.calls == 2
+
+
+def test_chat_model_without_embeddings_calls_the_model(cache):
+    def failing_embedding(texts):
+        raise ConnectionError("embedding API not reachable")
+
+    cache.embedding_function = failing_embedding
+    model = CountingChatModel(responses=["first"])
+    cached_model = CachedChatModel(chat_model=model, semantic_cache=cache, model_name="model")
+
+    assert cached_model.invoke(prompt("three bedrooms"), config={"metadata": {"call": "profile"}}).content == "first"
+    assert model.calls == 1
+
+
+def test_llm_profile_of_paraphrased_answers_from_cache(cache):
+    resources.registry.clear()
+    resources.registry.get("history_store", lambda: SessionStore(max_sessions=10, ttl=3600))
+    resources.registry.get(("semantic_cache", True), lambda: cache)
+    model = CountingChatModel(responses=["Profile: family", "Profile: other"])
+    try:
+        with patch("llm.ChatOpenAI", return_value=model):
+            real_estate_llm = LLM(open_ai=True)
+
+        profiles = []
+        for answers in (["3 bedrooms", "a big garden"], ["Three bedrooms", "A big garden."]):
+            session_id = llm_history.new_session_id()
+            profiles.append(real_estate_llm.conversation({"questions": QUESTIONS, "answers": answers}, session_id=session_id))
+            llm_history.delete_session(session_id)
+    finally:
+        resources.registry.clear()
+
+    assert profiles == ["Profile: family", "Profile: family"]
+    assert model.calls == 1
+    assert cache.stats()["profile"]["hits"] == 1
+
+
+def test_answers_with_other_constraints_are_not_shared(cache):
+    model = CountingChatModel(responses=["three bedrooms", "two bedrooms"])
+    cached_model = CachedChatModel(chat_model=model, semantic_cache=cache, model_name="model")
+
+    def ask(answer):
+        metadata = {"call": "profile", "constraints": constraints_key([answer])}
+        return cached_model.invoke(prompt(answer), config={"metadata": metadata}).content
+
+    assert ask("a house with 3 bedrooms and a big garden") == "three bedrooms"
+    assert ask("a house with 2 bedrooms and a big garden") == "two bedrooms"
+    assert ask("A house with 3 bedrooms and a big garden!") == "three bedrooms"
+    assert model.calls == 2
+
+
+def test_eviction_keeps_the_other_cached_rows(cache):
+    for index in range(3):
+        store(cache, "profile", prompt(f"answer number{index}"), f"profile {index}")
+    assert lookup(cache, "profile", prompt("answer number1"))[0] == "profile 1"
+    partition = partition_key("profile", "model", prompt("answer number0"))
+    assert len(cache._index[partition][0]) == 3
+
+    store(cache, "profile", prompt("answer number3"), "profile 3")
+
+    ids, matrix, _ = cache._index[partition]
+    assert len(ids) == 3 and matrix.shape[0] >= 3
+    assert lookup(cache, "profile", prompt("answer number0")) is None
+
+
+def test_answer_stored_while_the_partition_is_loaded_is_found(cache):
+    cache.max_entries = 100
+    store(cache, "profile", prompt("answer number0"), "profile 0")
+    connection = cache._connection()
+    stored = threading.Event()
+
+    class SlowConnection:
+        def __enter__(self):
+            return connection.__enter__()
+
+        def __exit__(self, *exc_info):
+            return connection.__exit__(*exc_info)
+
+        def execute(self, sql, parameters=()):
+            if not sql.startswith("SELECT id, vector"):
+                return connection.execute(sql, parameters)
+            rows = connection.execute(sql, parameters).fetchall()
+            # another thread stores an answer after the rows of the partition were read
+            writer = threading.Thread(target=lambda: (store(cache, "profile", prompt("answer number1"), "profile 1"),
+                                                      stored.set()))
+            writer.start()
+            stored.wait(0.2)
+            return MagicMock(fetchall=lambda: rows)
+
+    original = cache._connection
+    main = threading.current_thread()
+    with patch.object(cache, "_connection",
+                      side_effect=lambda: SlowConnection() if threading.current_thread() is main else original()):
+        lookup(cache, "profile", prompt("answer number0"))
+    stored.wait()
+
+    assert lookup(cache, "profile", prompt("answer number1"))[0] == "profile 1"
+    ids, _, _ = cache._index[partition_key("profile", "model", prompt("answer number0"))]
+    assert len(ids) == len(set(ids)) == 2
+
+
+def test_partition_matrix_grows_in_chunks(cache, monkeypatch):
+    monkeypatch.setattr("semantic_cache.matrix_chunk", 4)
+    cache.max_entries = 100
+    partition = partition_key("profile", "model", prompt("answer"))
+    lookup(cache, "profile", prompt("answer"))
+    matrices = set()  # capacities of the matrix
+    for index in range(9):
+        store(cache, "profile", prompt(f"answer number{index}"), f"profile {index}")
+        matrices.add(cache._index[partition][1].shape[0])
+
+    ids, matrix, _ = cache._index[partition]
+    assert len(ids) == 9 and matrix.shape[0] == 16
+    assert matrices == {4, 8, 16}
+    for index in range(9):
+        assert lookup(cache, "profile", prompt(f"answer number{index}"))[0] == f"profile {index}"
@@ -0,0 +1,245 @@
+import configparser
+import gzip
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import resources
+import server
+from image_index import ImageIndex
+from limits import AdmissionQueue
+from result_store import ResultStore
+from thumbnails import make_thumbnails
+
+FORM = {"size": "3 bedrooms", "priorities": "garden", "amenities": "pool", "transport": "bus",
+        "urban": "suburban", "style": "modern"}
+
+
+def make_settings(streaming, thumbnail_dir=".cache/thumbnails"):
+    settings = configparser.ConfigParser()
+    settings.read_dict({"server": {"streaming": str(streaming).lower()},
+                        "images": {"thumbnail_dir": thumbnail_dir, "thumbnail_widths": "300,600"}})
+    return settings
+
+
+@pytest.fixture
+def client():
+    resources.registry.clear()
+    resources.registry.get("result_store", ResultStore)
+    server.app.config["TESTING"] = True
+    yield server.app.test_client()
+    resources.registry.clear()
+
+
+def test_results_streams_cards_as_they_are_generated(client):
+    progress = []
+
+    def fake_stream_results(answers):
+        for index in range(3):
+            progress.append(index)
+            yield f"listing-{index}", f"house_images/{index}.png", f"Description {index}"
+
+    with patch("server.resources.get_settings", return_value=make_settings(True)), \
+            patch("server.stream_results", side_effect=fake_stream_results):
+        response = client.post("/results", data=FORM)
+        assert response.is_streamed
+
+        body = ""
+        chunks = iter(response.response)
+        while "Description 0" not in body:
+            body += next(chunks).decode()
+        assert progress == [0]
+
+        body += "".join(chunk.decode() for chunk in chunks)
+
+    assert body.index("Description 0") < body.index("Description 1") < body.index("Description 2")
+    assert '<img src="/image/listing-2?v=' in body
+
+    token = body.split('"/results/')[1].split('"')[0]
+    stored = client.get(f"/results/{token}").get_data(as_text=True)
+    assert "Description 2" in stored
+
+
+def test_results_without_streaming_redirects_to_stored_results(client):
+    with patch("server.resources.get_settings", return_value=make_settings(False)), \
+            patch("server.get_results", return_value=(["house_images/0.png"], ["Description 0"], ["listing-0"])):
+        response = client.post("/results", data=FORM)
+
+    assert response.status_code == 303
+    assert response.headers["Location"].startswith("/results/")
+    assert "Description 0" in client.get(response.headers["Location"]).get_data(as_text=True)
+
+
+def test_concurrent_requests_keep_their_own_results(client):
+    def fake_get_results(answers):
+        return [f"house_images/{answers[0]}.png"], [f"Description {answers[0]}"], [f"listing-{answers[0]}"]
+
+    locations = {}
+
+    def submit(size):
+        response = client.post("/results", data={**FORM, "size": size})
+        locations[size] = response.headers["Location"]
+
+    with patch("server.resources.get_settings", return_value=make_settings(False)), \
+            patch("server.get_results", side_effect=fake_get_results):
+        threads = [threading.Thread(target=submit, args=(str(index),)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for size, location in locations.items():
+        body = client.get(location).get_data(as_text=True)
+        assert f"Description {size}" in body
+        assert f'src="/image/listing-{size}?v=' in body
+
+
+def test_expired_results(client):
+    assert client.get("/results/unknown").status_code == 404
+
+
+def test_image_is_cacheable(client):
+    resources.get_result_store().add_image_path("listing-0", "house_images/0.png")
+
+    response = client.get("/image/listing-0")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 31536000
+    etag = response.headers["ETag"]
+    assert not etag.startswith("W/")
+
+    revalidated = client.get("/image/listing-0", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+
+
+def test_image_is_looked_up_in_the_image_index(client, tmp_path):
+    index = ImageIndex(str(tmp_path / "images.sqlite3"))
+    index.put_many([("listing-1", "house_images/1.png")])
+    resources.registry.get("image_index", lambda: index)
+
+    with patch("server.resources.get_database") as get_database:
+        assert client.get("/image/listing-1").status_code == 200
+        assert client.get("/image/unknown").status_code == 404
+
+    # the database with the embedding models isn't built for an image
+    get_database.assert_not_called()
+
+
+def test_image_etags_are_bounded(tmp_path):
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"{index}.png"
+        path.write_bytes(bytes([index]))
+        paths.append(str(path))
+
+    with patch("server.max_image_cache_entries", 2), patch("server.image_etags", server.OrderedDict()):
+        etag = server.image_etag(paths[0])
+        with open(paths[0], "ab") as file:
+            file.write(b"changed")
+        assert server.image_etag(paths[0]) != etag
+        assert len(server.image_etags) == 1
+
+        server.image_etag(paths[1])
+        server.image_etag(paths[0])
+        server.image_etag(paths[2])
+        assert list(server.image_etags) == [paths[0], paths[2]]
+
+
+def test_results_offer_thumbnails(client, tmp_path):
+    image = os.path.join(server.app.root_path, "house_images", "3.png")
+    make_thumbnails(image, str(tmp_path), widths=(300, 600))
+    resources.get_result_store().put("token", [{"id": "listing-3", "image": "house_images/3.png", "description": "A"}])
+
+    with patch("server.resources.get_settings", return_value=make_settings(False, thumbnail_dir=str(tmp_path))):
+        body = client.get("/results/token").get_data(as_text=True)
+        assert 'type="image/webp"' in body
+        assert "-300.webp 300w" in body and "-600.jpg 600w" in body
+
+        thumbnail_url = body.split('src="')[1].split('"')[0]
+        response = client.get(thumbnail_url)
+        assert response.status_code == 200
+        assert response.mimetype == "image/jpeg"
+        assert response.cache_control.immutable
+
+
+def test_results_without_thumbnails_use_the_original_image(client, tmp_path):
+    resources.get_result_store().put("token", [{"id": "listing-4", "image": "house_images/4.png", "description": "A"}])
+
+    with patch("server.resources.get_settings", return_value=make_settings(False, thumbnail_dir=str(tmp_path))):
+        body = client.get("/results/token").get_data(as_text=True)
+
+    assert '<img src="/image/listing-4?v=' in body
+    assert "srcset" not in body
+
+
+def test_results_page_is_compressed(client):
+    resources.get_result_store().put("token", [{"id": "listing-0", "image": "house_images/0.png", "description": "A" * 1000}])
+
+    with patch("server.resources.get_settings", return_value=make_settings(False)):
+        response = client.get("/results/token", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "A" * 1000 in gzip.decompress(response.data).decode()
+
+
+def test_results_are_rejected_when_the_queue_is_full(client):
+    queue = AdmissionQueue(max_active=1, max_queue=0)
+    resources.registry.get("admission_queue", lambda: queue)
+    assert queue.acquire()
+
+    with patch("server.get_results") as get_results:
+        response = client.post("/results", data=FORM)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    get_results.assert_not_called()
+
+
+def test_slot_is_released_after_the_request(client):
+    queue = AdmissionQueue(max_active=1, max_queue=0)
+    resources.registry.get("admission_queue", lambda: queue)
+
+    with patch("server.resources.get_settings", return_value=make_settings(False)), \
+            patch("server.get_results", side_effect=RuntimeError("LLM failed")), pytest.raises(RuntimeError):
+        client.post("/results", data=FORM)
+    assert queue.stats()["active"] == 0
+
+    with patch("server.resources.get_settings", return_value=make_settings(True)), \
+            patch("server.stream_results", return_value=iter([("listing-0", "house_images/0.png", "A")])):
+        response = client.post("/results", data=FORM)
+        assert queue.stats()["active"] == 1
+        response.get_data()
+        response.close()
+    assert queue.stats()["active"] == 0
+
+
+def test_metrics_endpoint(client):
+    queue = AdmissionQueue(max_active=1, max_queue=0)
+    resources.registry.get("admission_queue", lambda: queue)
+    assert queue.acquire()
+    client.post("/results", data=FORM)
+
+    response = client.get("/metrics")
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "admission_active 1" in text
+    assert "# TYPE admission_rejected_total counter" in text
+    assert 'http_requests_total{endpoint="results",status="503"}' in text
+
+    settings = make_settings(False)
+    settings.read_dict({"metrics": {"endpoint": "false"}})
+    with patch("server.resources.get_settings", return_value=settings):
+        assert client.get("/metrics").status_code == 404
+
+
+def test_form_is_served_without_importing_the_pipeline():
+    from benchmarks.bench_startup import loaded_modules
+
+    # a new process, the tests of this module have imported llm already
+    assert loaded_modules("server") == []
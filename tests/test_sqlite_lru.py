@@ -0,0 +1,62 @@
+import sqlite3
+from unittest.mock import patch
+
+from sqlite_lru import SQLiteLRU
+
+
+def test_get_and_put(tmp_path):
+    lru = SQLiteLRU(str(tmp_path / "cache" / "lru.sqlite3"), "entries", ("model", "key"), ("value",))
+    lru.put(("m", "a"), ("1",))
+    lru.put_many([(("m", "b"), ("2",)), (("n", "a"), ("3",))])
+
+    assert lru.get(("m", "a")) == ("1",)
+    assert lru.get_many([("n", "a"), ("n", "b")]) == [("3",), None]
+    assert lru.count() == 3
+    lru.clear()
+    assert lru.get(("m", "a")) is None
+
+
+def test_evicts_least_recently_used_in_batches(tmp_path):
+    path = str(tmp_path / "lru.sqlite3")
+    lru = SQLiteLRU(path, "entries", ("key",), ("value",), max_entries=20)
+    for index in range(20):
+        lru.put((str(index),), ("value",))
+    lru.get(("0",))
+    assert lru.count() == 20
+
+    lru.put(("20",), ("value",))
+
+    # the table is reduced by a tenth of the maximum, the recently read row is kept
+    assert lru.count() == 18
+    assert lru.get(("0",)) is not None
+    assert lru.get(("1",)) is None and lru.get(("3",)) is None
+    for index in range(21, 23):
+        lru.put((str(index),), ("value",))
+    assert lru.count() == 20
+    # another process sees the limit as well
+    assert SQLiteLRU(path, "entries", ("key",), ("value",), max_entries=20).count() == 20
+
+
+def test_table_without_access_time_is_migrated(tmp_path):
+    path = str(tmp_path / "lru.sqlite3")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute("INSERT INTO entries VALUES ('old', 'value')")
+
+    lru = SQLiteLRU(path, "entries", ("key",), ("value",), max_entries=10)
+
+    assert lru.get(("old",)) == ("value",)
+    lru.put(("new",), ("value",))
+    assert lru.count() == 2
+
+
+def test_rows_expire_after_the_last_access(tmp_path):
+    lru = SQLiteLRU(str(tmp_path / "lru.sqlite3"), "entries", ("key",), ("value",), ttl=10)
+    with patch("sqlite_lru.time.time", return_value=100.0):
+        lru.put(("a",), ("1",))
+    with patch("sqlite_lru.time.time", return_value=108.0):
+        assert lru.get(("a",)) == ("1",)
+    with patch("sqlite_lru.time.time", return_value=117.0):
+        assert lru.get(("a",)) == ("1",)
+    with patch("sqlite_lru.time.time", return_value=128.0):
+        assert lru.get(("a",)) is None
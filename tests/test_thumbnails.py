@@ -0,0 +1,51 @@
+import os
+
+from PIL import Image
+
+from thumbnails import file_digest, make_thumbnails, thumbnail_name
+
+
+def write_image(path, size=(800, 600)):
+    Image.new("RGB", size, (120, 80, 40)).save(path)
+    return str(path)
+
+
+def test_make_thumbnails(tmp_path):
+    image = write_image(tmp_path / "house.png")
+    output_dir = tmp_path / "thumbnails"
+    output_dir.mkdir()
+
+    assert make_thumbnails(image, str(output_dir), widths=(300, 600)) == 4
+
+    digest = file_digest(image)
+    with Image.open(output_dir / thumbnail_name(digest, 300, "webp")) as thumbnail:
+        assert thumbnail.format == "WEBP"
+        assert thumbnail.size == (300, 225)
+    with Image.open(output_dir / thumbnail_name(digest, 600, "jpg")) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert thumbnail.size == (600, 450)
+    assert not any(name.endswith(".tmp") for name in os.listdir(output_dir))
+
+
+def test_make_thumbnails_skips_existing(tmp_path):
+    image = write_image(tmp_path / "house.png")
+    make_thumbnails(image, str(tmp_path), widths=(300,))
+
+    assert make_thumbnails(image, str(tmp_path), widths=(300,)) == 0
+    assert make_thumbnails(image, str(tmp_path), widths=(300, 600)) == 2
+
+
+def test_make_thumbnails_does_not_upscale(tmp_path):
+    image = write_image(tmp_path / "house.png", size=(200, 100))
+    make_thumbnails(image, str(tmp_path), widths=(300,))
+
+    with Image.open(tmp_path / thumbnail_name(file_digest(image), 300, "jpg")) as thumbnail:
+        assert thumbnail.size == (200, 100)
+
+
+def test_name_changes_with_image(tmp_path):
+    image = write_image(tmp_path / "house.png")
+    digest = file_digest(image)
+    Image.new("RGB", (800, 600), (0, 0, 0)).save(image)
+
+    assert file_digest(image) != digest
@@ -0,0 +1,133 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import llm_history
+import metrics
+import resources
+import user_data
+from llm import LLM
+from llm_history import SessionStore
+from token_budget import TokenBudget, Tokenizer, questionnaire
+
+
+class RecordingChatModel(FakeListChatModel):
+    """Fake chat model that records the messages of every prompt."""
+    prompts: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages)
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@pytest.fixture
+def registry():
+    resources.registry.clear()
+    resources.registry.get("history_store", lambda: SessionStore(max_sessions=10, ttl=3600))
+    yield resources.registry
+    resources.registry.clear()
+
+
+def make_llm(registry, budget):
+    registry.get("token_budget", lambda: budget)
+    model = RecordingChatModel(responses=["answer"], prompts=[])
+    with patch("llm.ChatOpenAI", return_value=model):
+        return LLM(open_ai=True), model
+
+
+def test_questionnaire_is_one_message_without_repetitions():
+    text = questionnaire(["Size?", "Garden?", "Size?", "Pool?"], ["3  bedrooms", "yes", "3 bedrooms", " "])
+
+    assert text.splitlines() == ["Questions to the customer and the answers:",
+                                 "Q: Size?", "A: 3 bedrooms", "Q: Garden?", "A: yes"]
+
+
+def test_estimating_tokenizer():
+    tokenizer = Tokenizer()
+
+    assert tokenizer.count("") == 0
+    assert tokenizer.count("abcdefghi") == 3
+    assert tokenizer.truncate("abcdefghi", 2) == "abcdefgh"
+    assert tokenizer.count_messages([HumanMessage("abcd"), AIMessage("abcd")]) == 2 * (1 + 4) + 3
+
+
+def test_fit_drops_oldest_history_first():
+    budget = TokenBudget(limits={"profile": 40}, compact=False)
+    messages = [SystemMessage("s" * 40), HumanMessage("old " * 10), AIMessage("new " * 10), HumanMessage("query")]
+
+    fitted = budget.fit("profile", messages)
+
+    assert fitted == [messages[0], messages[2], messages[3]]
+    assert budget.tokenizer.count_messages(fitted) <= 40
+
+
+def test_fit_shortens_the_last_history_message():
+    budget = TokenBudget(limits={"profile": 40}, compact=False)
+    messages = [SystemMessage("s" * 40), HumanMessage("a" * 80), HumanMessage("query")]
+
+    fitted = budget.fit("profile", messages)
+
+    assert [message.type for message in fitted] == ["system", "human", "human"]
+    assert fitted[1].content == "a" * (4 * 13)
+    assert budget.tokenizer.count_messages(fitted) == 40
+
+
+def test_fit_without_limit_keeps_the_prompt():
+    budget = TokenBudget()
+    messages = [SystemMessage("abcd"), HumanMessage("abcd" * 100)]
+    before = metrics.llm_prompt_tokens.count(call="test_call")
+
+    assert budget.fit("test_call", messages) == messages
+    assert metrics.llm_prompt_tokens.count(call="test_call") == before + 1
+
+
+def test_compact_prompt_removes_indentation():
+    budget = TokenBudget()
+    messages = [SystemMessage("\n        You are AI.\n\n        - price range\n        "), HumanMessage("query")]
+
+    assert budget.fit("test_call", messages)[0].content == "You are AI.\n- price range"
+
+
+def test_compact_history_sends_fewer_tokens(registry):
+    questions, answers = user_data.get_info()
+    counted = {}
+    for compact in (False, True):
+        registry.clear()
+        registry.get("history_store", lambda: SessionStore(max_sessions=10, ttl=3600))
+        real_estate_llm, model = make_llm(registry, TokenBudget(compact=compact))
+        session_id = llm_history.new_session_id()
+        real_estate_llm.conversation({"questions": questions, "answers": answers}, session_id=session_id)
+        llm_history.delete_session(session_id)
+        counted[compact] = (len(model.prompts[0]), real_estate_llm.budget.tokenizer.count_messages(model.prompts[0]))
+
+    assert counted[False][0] == 2 * len(questions) + 2
+    assert counted[True][0] == 3
+    assert counted[True][1] < counted[False][1]
+
+
+def test_profile_prompt_is_kept_within_budget(registry):
+    questions, answers = user_data.get_info()
+    real_estate_llm, model = make_llm(registry, TokenBudget(limits={"profile": 300}, compact=False))
+
+    real_estate_llm.conversation({"questions": questions, "answers": answers}, session_id="budget-test")
+    llm_history.delete_session("budget-test")
+
+    prompt = model.prompts[0]
+    assert real_estate_llm.budget.tokenizer.count_messages(prompt) <= 300
+    assert prompt[0].type == "system"
+    assert "price range" in prompt[-1].content
+    # the latest answer is kept
+    assert prompt[-2].content == answers[-1]
+
+
+def test_results_prompt_contains_the_profile_but_no_history(registry):
+    real_estate_llm, model = make_llm(registry, TokenBudget())
+
+    real_estate_llm.results("Neighborhood: Green Oaks", "Profile: wants a garden")
+
+    prompt = model.prompts[0]
+    assert [message.type for message in prompt] == ["system", "human"]
+    assert "Profile: wants a garden" in prompt[0].content
+    assert "Neighborhood: Green Oaks" in prompt[0].content
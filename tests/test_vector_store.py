@@ -0,0 +1,169 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import fake_backends
+from database import Database
+from vector_store import NumpyClient, normalize
+import vector_store
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def collection(tmp_path):
+    return NumpyClient(str(tmp_path / "vectors")).get_or_create_collection("listings", metadata={"created": "now"})
+
+
+def random_vectors(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def add(collection, vectors, offset=0):
+    ids = [f"id{offset + index}" for index in range(len(vectors))]
+    collection.upsert(ids=ids, embeddings=vectors, documents=[f"document {id}" for id in ids],
+                      metadatas=[{"bedrooms": (offset + index) % 5, "city": "a" if index % 2 else "b"}
+                                 for index in range(len(vectors))],
+                      uris=[f"house_images/{id}.png" for id in ids])
+    return ids
+
+
+def test_query_returns_exact_nearest_neighbors(collection):
+    vectors = random_vectors(300)
+    ids = add(collection, vectors)
+    queries = random_vectors(4, seed=1)
+
+    results = collection.query(query_embeddings=queries, n_results=5, include=["documents", "uris", "distances"])
+
+    similarities = normalize(queries) @ normalize(vectors).T
+    for query, expected in enumerate(np.argsort(-similarities, axis=1)[:, :5]):
+        assert results["ids"][query] == [ids[row] for row in expected]
+        assert results["documents"][query] == [f"document {ids[row]}" for row in expected]
+        assert results["uris"][query][0] == f"house_images/{ids[expected[0]]}.png"
+        assert results["distances"][query] == pytest.approx(list(2 - 2 * similarities[query, expected]), abs=1e-5)
+    assert results["metadatas"] is None
+
+
+def test_query_with_where_filter(collection):
+    add(collection, random_vectors(50))
+
+    results = collection.query(query_embeddings=random_vectors(1, seed=1), n_results=100,
+                               where={"$and": [{"bedrooms": {"$gte": 3}}, {"city": "a"}]})
+
+    assert len(results["ids"][0]) == len([index for index in range(50) if index % 5 >= 3 and index % 2])
+    assert all(metadata["bedrooms"] >= 3 and metadata["city"] == "a" for metadata in results["metadatas"][0])
+    assert collection.query(query_embeddings=random_vectors(1), n_results=3, where={"bedrooms": {"$gt": 10}})["ids"] == [[]]
+
+
+def test_upsert_replaces_and_grows_beyond_the_capacity(collection, monkeypatch):
+    monkeypatch.setattr("vector_store.initial_capacity", 8)
+    add(collection, random_vectors(20))
+    vector = random_vectors(1, seed=5)
+    collection.upsert(ids=["id3"], embeddings=vector, metadatas=[{"bedrooms": 9}])
+    collection.update(ids=["id4", "unknown"], metadatas=[{"bedrooms": 7}, {"bedrooms": 1}])
+
+    assert collection.count() == 20
+    assert collection.query(query_embeddings=vector, n_results=1)["ids"] == [["id3"]]
+    assert collection.get(ids=["id4", "unknown"], include=["metadatas"]) == \
+        {"ids": ["id4"], "metadatas": [{"bedrooms": 7}], "documents": None, "uris": None, "embeddings": None}
+    assert collection.get(where={"bedrooms": {"$gte": 7}}, include=[])["ids"] == ["id3", "id4"]
+
+
+def test_delete_moves_the_last_rows(collection, tmp_path):
+    vectors = random_vectors(10)
+    add(collection, vectors)
+
+    collection.delete(ids=["id2", "id9", "unknown"])
+
+    other = NumpyClient(str(tmp_path / "vectors")).get_collection("listings")
+    for client in (collection, other):
+        assert client.count() == 8
+        assert client.get(ids=["id2", "id9"], include=[])["ids"] == []
+        for index in (0, 5, 8):
+            assert client.query(query_embeddings=vectors[index:index + 1], n_results=1)["ids"] == [[f"id{index}"]]
+        assert client.get(ids=["id8"], include=["metadatas"])["metadatas"] == [{"bedrooms": 3, "city": "b"}]
+
+
+def test_delete_during_a_query_does_not_mix_the_rows(collection, monkeypatch):
+    vectors = random_vectors(10)
+    add(collection, vectors)
+    searching, deleted = threading.Event(), threading.Event()
+    top_k = vector_store.top_k
+
+    def slow_top_k(*args, **kwargs):
+        searching.set()
+        # the delete is started while the search runs and must wait for the query
+        assert not deleted.wait(0.2)
+        return top_k(*args, **kwargs)
+
+    monkeypatch.setattr("vector_store.top_k", slow_top_k)
+    deleter = threading.Thread(target=lambda: (searching.wait(), collection.delete(ids=["id0"]), deleted.set()))
+    deleter.start()
+    results = collection.query(query_embeddings=vectors[:1], n_results=10, include=["documents", "metadatas"])
+    deleter.join()
+
+    # the last row was moved into the deleted row after the query, its ids and records still match
+    assert results["ids"][0][0] == "id0"
+    assert sorted(results["ids"][0]) == sorted(f"id{index}" for index in range(10))
+    assert results["documents"][0] == [f"document {id}" for id in results["ids"][0]]
+    assert [metadata["bedrooms"] for metadata in results["metadatas"][0]] == \
+        [int(id[2:]) % 5 for id in results["ids"][0]]
+    assert collection.count() == 9
+
+
+def test_changes_of_another_client_are_seen(collection, tmp_path):
+    add(collection, random_vectors(10))
+    other = NumpyClient(str(tmp_path / "vectors")).get_collection("listings")
+    assert other.count() == 10
+
+    add(other, random_vectors(5, seed=2), offset=10)
+    other.modify(metadata={"version": "2"})
+
+    assert collection.count() == 15
+    assert collection.metadata == {"version": "2"}
+    assert collection.query(query_embeddings=random_vectors(5, seed=2)[:1], n_results=1)["ids"] == [["id10"]]
+
+
+def test_dimension_mismatch_is_rejected(collection):
+    add(collection, random_vectors(3))
+
+    with pytest.raises(ValueError):
+        collection.upsert(ids=["other"], embeddings=random_vectors(1, dimension=8))
+    assert collection.count() == 3
+    assert collection.get(ids=["other"], include=[])["ids"] == []
+
+
+def test_database_with_numpy_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(repo_dir)
+    with fake_backends():
+        db = Database(open_ai=False, persist_directory=str(tmp_path / "vectors"), backend="numpy")
+    db.add_data_to_collections("data/data.json")
+    version = db.collection_version()
+
+    results = db.similarity_search_text(["A family home with a large backyard", "A loft downtown"], k=3)
+    results_image = db.similarity_search_image("A red house with big windows", k=3, where={"bedrooms": {"$gte": 3}})
+
+    assert db.count() == 17
+    assert [len(ids) for ids in results["ids"]] == [3, 3]
+    assert all(document.startswith("Neighborhood:") for document in results["documents"][0])
+    assert all(uri.startswith("house_images/") for uri in results_image["uris"][0])
+    assert db.count(where={"bedrooms": {"$gte": 3}}) >= len(results_image["ids"][0])
+    assert db.image_uri(results["ids"][0][0]).startswith("house_images/")
+    assert db.add_data_to_collections("data/data.json")["skipped"] == 17
+    assert db.collection_version() == version
+
+
+def test_copy_from_chroma(tmp_path, monkeypatch):
+    monkeypatch.chdir(repo_dir)
+    with fake_backends():
+        chroma = Database(open_ai=False, persist_directory=str(tmp_path / "chroma"))
+        chroma.add_data_to_collections("data/data.json")
+        db = Database(open_ai=False, persist_directory=str(tmp_path / "vectors"), backend="numpy")
+        copied = db.copy_from_chroma(str(tmp_path / "chroma"), batch_size=5)
+
+        query = "A family home with a large backyard"
+        assert copied == 17
+        assert db.similarity_search_text(query, k=5)["ids"] == chroma.similarity_search_text(query, k=5)["ids"]
+        assert db.col_image.count() == 17
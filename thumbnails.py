@@ -0,0 +1,140 @@
+"""
+thumbnails.py
+
+This module precomputes resized versions of the house images for the results page.
+
+Every image is stored as WebP and JPEG at a few widths, named by the hash of the image file and
+the width, e.g. "3f2a...-300.webp". The names change whenever an image changes, so the thumbnails
+can be cached by browsers indefinitely. The results page offers them with `srcset`, so browsers
+download the smallest file that fits the card instead of the full-size PNG.
+
+Usage:
+    python thumbnails.py --image-dir house_images
+"""
+
+import argparse
+import configparser
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+
+from logger_config import Logger
+logger = Logger(name="Thumbnails").get_logger()
+
+# file extension, Pillow format and encoder options of the thumbnail formats, preferred format first
+formats = {
+    "webp": ("WEBP", {"quality": 80, "method": 6}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+default_widths = (300, 600)
+
+
+def file_digest(path):
+    """
+    Hash of the content of an image file, used in the thumbnail names and as ETag.
+
+    Args:
+        path (str): Path of the image file.
+
+    Returns:
+        str: Hex digest of the file.
+    """
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:32]
+
+
+def thumbnail_name(digest, width, extension):
+    """
+    File name of a thumbnail.
+
+    Args:
+        digest (str): Hash of the original image file.
+        width (int): Width of the thumbnail in pixels.
+        extension (str): File extension of the format, a key of formats.
+
+    Returns:
+        str: The file name.
+    """
+    return f"{digest}-{width}.{extension}"
+
+
+def make_thumbnails(path, output_dir, widths=default_widths):
+    """
+    Write the thumbnails of an image in all formats and widths which don't exist yet.
+
+    Images are never scaled up, a thumbnail wider than the image has the size of the image.
+
+    Args:
+        path (str): Path of the image file.
+        output_dir (str): Directory of the thumbnails.
+        widths (tuple[int]): Widths of the thumbnails in pixels.
+
+    Returns:
+        int: Number of written thumbnails.
+    """
+    # Pillow is only needed for writing the thumbnails, not by the server looking them up
+    from PIL import Image
+
+    digest = file_digest(path)
+    missing = [(width, extension) for width in widths for extension in formats
+               if not os.path.exists(os.path.join(output_dir, thumbnail_name(digest, width, extension)))]
+    if not missing:
+        return 0
+
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        for width, extension in missing:
+            height = round(image.height * min(width, image.width) / image.width)
+            resized = image.resize((min(width, image.width), height), Image.LANCZOS)
+            pillow_format, options = formats[extension]
+            target = os.path.join(output_dir, thumbnail_name(digest, width, extension))
+            # write to a temporary file first, so the server never sees a partial thumbnail
+            resized.save(f"{target}.tmp", format=pillow_format, **options)
+            os.replace(f"{target}.tmp", target)
+    return len(missing)
+
+
+def thumbnail_settings(settings):
+    """
+    Read the thumbnail directory and widths from the [images] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        tuple: (output_dir, widths)
+    """
+    output_dir = settings.get("images", "thumbnail_dir", fallback=".cache/thumbnails")
+    widths = settings.get("images", "thumbnail_widths", fallback=",".join(map(str, default_widths)))
+    return output_dir, tuple(int(width) for width in widths.split(","))
+
+
+def main():
+    """
+    Write the thumbnails of all images in a directory.
+    """
+    parser = configparser.ConfigParser()
+    parser.read("settings.ini")
+    output_dir, widths = thumbnail_settings(parser)
+
+    arg_parser = argparse.ArgumentParser(description="Precompute thumbnails of the house images")
+    arg_parser.add_argument("--image-dir", default="house_images", help="Directory of the images (default: house_images)")
+    arg_parser.add_argument("--output-dir", default=output_dir, help=f"Directory of the thumbnails (default: {output_dir})")
+    arg_parser.add_argument("--widths", type=int, nargs="+", default=widths, help="Widths of the thumbnails in pixels")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes (default: number of CPUs)")
+    args = arg_parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = sorted(os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+                   if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+
+    logger.info(f"Writing thumbnails of {len(paths)} images to {args.output_dir}")
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        written = sum(executor.map(make_thumbnails, paths, [args.output_dir] * len(paths),
+                                   [tuple(args.widths)] * len(paths)))
+    logger.info(f"Wrote {written} thumbnails")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+token_budget.py
+
+This module counts the tokens of the prompts sent to the LLM and keeps them within a budget per call.
+
+- Tokenizer: counts tokens with a tiktoken encoding, or estimates them from the number of characters
+  if tiktoken or the encoding isn't available.
+- questionnaire(): the questions and answers of the customer as one compact message instead of one
+  message per question and per answer, without repeated questions and empty answers.
+- TokenBudget: step of the prompt pipelines between the prompt template and the model. It removes the
+  indentation of the prompt templates, counts the tokens of every prompt and drops the oldest history
+  messages, or shortens the last one, if the prompt exceeds the budget of the call. The counted and
+  the trimmed tokens are recorded as metrics.
+
+The budgets are set in the [tokens] section of settings.ini.
+"""
+
+import math
+import threading
+
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.runnables import RunnableLambda
+
+import metrics
+from logger_config import Logger
+logger = Logger(name="TokenBudget").get_logger()
+
+# tokens added by the chat format for every message and for the reply
+message_overhead = 4
+reply_overhead = 3
+# characters per token of the estimate
+characters_per_token = 4
+
+
+class Tokenizer:
+    """
+    Counts the tokens of texts, with tiktoken or estimated.
+    """
+
+    def __init__(self, encoding=None):
+        """
+        Initialize the tokenizer, the encoding is loaded on first use.
+
+        Args:
+            encoding (str): Name of the tiktoken encoding, e.g. 'o200k_base', None to estimate the tokens.
+        """
+        self.encoding = encoding
+        self._encoder = None
+        self._loaded = encoding is None
+        self._lock = threading.Lock()
+
+    def _get_encoder(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoder = tiktoken.get_encoding(self.encoding)
+                    except Exception as error:
+                        # e.g. tiktoken isn't installed or the encoding can't be downloaded
+                        logger.warning(f"Estimating tokens, tiktoken encoding {self.encoding} not available: {error}")
+                    self._loaded = True
+        return self._encoder
+
+    def count(self, text):
+        """
+        Count the tokens of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: Number of tokens.
+        """
+        encoder = self._get_encoder()
+        if encoder is not None:
+            return len(encoder.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / characters_per_token)
+
+    def truncate(self, text, tokens):
+        """
+        Shorten a text to at most the given number of tokens.
+
+        Args:
+            text (str): The text.
+            tokens (int): Maximum number of tokens.
+
+        Returns:
+            str: The beginning of the text.
+        """
+        tokens = max(0, tokens)
+        encoder = self._get_encoder()
+        if encoder is not None:
+            return encoder.decode(encoder.encode(text, disallowed_special=())[:tokens])
+        return text[:tokens * characters_per_token]
+
+    def count_messages(self, messages):
+        """
+        Count the tokens of a chat prompt.
+
+        Args:
+            messages (list[BaseMessage]): Messages of the prompt.
+
+        Returns:
+            int: Number of tokens including the overhead of the chat format.
+        """
+        return sum(self.count(str(message.content)) + message_overhead for message in messages) + reply_overhead
+
+
+def compact_text(text):
+    """
+    Remove the indentation, trailing whitespace and empty lines of a text.
+
+    Args:
+        text (str): The text, e.g. an indented prompt template.
+
+    Returns:
+        str: The text with the same lines.
+    """
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def questionnaire(questions, answers):
+    """
+    Write the questions and answers of the customer as one message.
+
+    Args:
+        questions (list[str]): Questions of the questionnaire.
+        answers (list[str]): Answers of the customer.
+
+    Returns:
+        str: One line per question and answer, repeated questions with the same answer and empty answers left out.
+    """
+    lines = ["Questions to the customer and the answers:"]
+    seen = set()
+    for question, answer in zip(questions, answers):
+        question, answer = " ".join(question.split()), " ".join(str(answer).split())
+        if not answer or (question, answer) in seen:
+            continue
+        seen.add((question, answer))
+        lines.append(f"Q: {question}\nA: {answer}")
+    return "\n".join(lines)
+
+
+class TokenBudget:
+    """
+    Counts the tokens of the prompts and trims the history of prompts exceeding the budget of their call.
+    """
+
+    def __init__(self, limits=None, tokenizer=None, compact=True):
+        """
+        Initialize the budget.
+
+        Args:
+            limits (dict): Maximum number of prompt tokens per call name, calls without or with 0 have no limit.
+            tokenizer (Tokenizer): Tokenizer of the model, an estimating one if None.
+            compact (bool): Send the questionnaire as one message instead of one message per question and answer,
+                and remove the indentation of the prompts.
+        """
+        self.limits = limits or {}
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer()
+        self.compact = compact
+
+    def fit(self, call, messages):
+        """
+        Keep the prompt of a call within its budget.
+
+        With compact prompts the indentation and the empty lines of the messages are removed. The first
+        message (system prompt) and the last message (instruction) are always kept. The messages between
+        them are the chat history, the oldest ones are dropped first and the last one is shortened.
+
+        Args:
+            call (str): Name of the call, e.g. 'profile'.
+            messages (list[BaseMessage]): Messages of the prompt.
+
+        Returns:
+            list[BaseMessage]: The messages within the budget.
+        """
+        messages = list(messages)
+        if self.compact:
+            messages = [message.model_copy(update={"content": compact_text(message.content)})
+                        if isinstance(message.content, str) else message for message in messages]
+        tokens = self.tokenizer.count_messages(messages)
+        counted = tokens
+        limit = self.limits.get(call, 0)
+
+        if limit and tokens > limit:
+            head, history, tail = messages[:1], messages[1:-1], messages[-1:]
+            while history and tokens > limit:
+                message = history[0]
+                message_tokens = self.tokenizer.count(str(message.content)) + message_overhead
+                if len(history) > 1 or tokens - message_tokens + message_overhead >= limit:
+                    history.pop(0)
+                    tokens -= message_tokens
+                else:
+                    allowed = message_tokens - (tokens - limit) - message_overhead
+                    content = self.tokenizer.truncate(str(message.content), allowed)
+                    history[0] = message.model_copy(update={"content": content})
+                    tokens = tokens - message_tokens + self.tokenizer.count(content) + message_overhead
+            messages = head + history + tail
+            if tokens > limit:
+                logger.warning(f"Prompt of {call} has {tokens} tokens without history, more than the budget of {limit}")
+            else:
+                logger.info(f"Trimmed the prompt of {call} from {counted} to {tokens} tokens")
+
+        metrics.prompt_tokens(call, tokens, counted - tokens)
+        return messages
+
+    def runnable(self, call):
+        """
+        Step of a prompt pipeline which keeps the prompts of a call within the budget.
+
+        Args:
+            call (str): Name of the call.
+
+        Returns:
+            Runnable: Maps the prompt value of the template to a prompt value within the budget.
+        """
+        return RunnableLambda(lambda prompt: ChatPromptValue(messages=self.fit(call, prompt.to_messages())),
+                              name=f"token_budget_{call}")
+
+
+def create_budget(settings):
+    """
+    Create the token budget configured in the [tokens] section of the settings.
+
+    Args:
+        settings (configparser.ConfigParser): The parsed settings.
+
+    Returns:
+        TokenBudget: The budget.
+    """
+    encoding = settings.get("tokens", "encoding", fallback="").strip()
+    limits = {call: settings.getint("tokens", call, fallback=0)
+              for call in ("profile", "profile_image", "results", "describe_listing")}
+    return TokenBudget(
+        limits=limits,
+        tokenizer=Tokenizer(encoding or None),
+        compact=settings.get("tokens", "history", fallback="compact").strip().lower() == "compact",
+    )
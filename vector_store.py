@@ -0,0 +1,646 @@
+"""
+vector_store.py
+
+This module provides an in-process vector store as an alternative to ChromaDB for small and medium
+catalogs (up to a few hundred thousand listings).
+
+The normalized embeddings of a collection are kept in a memory-mapped float32 matrix (a .npy file),
+the ids, documents, metadata and image uris in a SQLite file. A query is one matrix product of the
+query vectors with the matrix and an argpartition for the top k, without the HNSW index, the
+serialization and the SQLite round-trips of ChromaDB. The search is exact.
+
+- NumpyClient: replaces chromadb.PersistentClient, with get_or_create_collection() and get_collection().
+- NumpyCollection: implements the part of the ChromaDB collection API used by database.Database:
+  upsert(), update(), get(), query() with `where` filters, count(), metadata and modify().
+
+Distances are squared L2 distances of the normalized vectors (2 - 2 * cosine similarity), the
+distances of ChromaDB's default space for normalized embeddings. Changes written by another
+process are seen by the next query. The backend is selected in the [database] section of settings.ini.
+
+A collection can have a CompressedIndex (quantization.py): truncated and int8 or product quantized
+codes of the embeddings in a second memory-mapped matrix. Queries are scored on the codes and the best
+candidates are rescored with the full embeddings, which are only read for these rows. The codes are
+trained and written by reindex(), new listings are encoded when they are added. Collections too small
+to train a quantizer are searched with the full embeddings.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from quantization import CompressedIndex
+from logger_config import Logger
+logger = Logger(name="VectorStore").get_logger()
+
+# rows allocated for the vectors of a new collection, the capacity is doubled when it is full
+initial_capacity = 1024
+# rows encoded at once by reindex()
+encode_batch_size = 10000
+
+comparisons = {
+    "$eq": np.equal, "$ne": np.not_equal, "$gt": np.greater,
+    "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal,
+}
+
+
+def normalize(vectors):
+    """
+    Scale vectors to unit length.
+
+    Args:
+        vectors (array-like): One vector per row.
+
+    Returns:
+        np.ndarray: The float32 vectors with length 1, zero vectors are kept.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(similarities, k, mask=None):
+    """
+    Columns of the k largest similarities of every row, sorted.
+
+    Args:
+        similarities (np.ndarray): One row of similarities per query.
+        k (int): Number of columns per row, at most the number of columns.
+        mask (np.ndarray): Columns which can be selected, all if None.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Columns and similarities, one row per query.
+    """
+    if mask is not None:
+        similarities[:, ~mask] = -np.inf
+    count = similarities.shape[1]
+    if k < count:
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(count), (len(similarities), count))
+    top_similarities = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_similarities, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_similarities, order, axis=1)
+
+
+class NumpyClient:
+    """
+    Client of the collections stored in a directory, used like chromadb.PersistentClient.
+    """
+
+    def __init__(self, path=".vectors"):
+        """
+        Initialize the client.
+
+        Args:
+            path (str): Directory of the vector files and the SQLite file.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name, embedding_function=None, metadata=None, data_loader=None, index=None):
+        """
+        Return a collection, creating it with the given metadata if it doesn't exist.
+
+        Args:
+            name (str): Name of the collection.
+            embedding_function (callable): Embeds the documents of upsert() without embeddings.
+            metadata (dict): Metadata of a new collection.
+            data_loader: Ignored, the images are embedded before they are added.
+            index (CompressedIndex): Compression of the embeddings for the search, None to search the full embeddings.
+
+        Returns:
+            NumpyCollection: The collection.
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(self.path, name, embedding_function, metadata, index)
+                self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name, embedding_function=None):
+        """
+        Return an existing collection.
+
+        Args:
+            name (str): Name of the collection.
+            embedding_function (callable): Embeds the documents of upsert() without embeddings.
+
+        Returns:
+            NumpyCollection: The collection.
+
+        Raises:
+            ValueError: If the collection doesn't exist.
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+        if collection is None:
+            if not os.path.exists(os.path.join(self.path, f"{name}.sqlite3")):
+                raise ValueError(f"Collection {name} does not exist")
+            collection = self.get_or_create_collection(name, embedding_function)
+        return collection
+
+
+class NumpyCollection:
+    """
+    Collection of listings with their embeddings in a memory-mapped matrix.
+    """
+
+    def __init__(self, path, name, embedding_function=None, metadata=None, index=None):
+        """
+        Open or create a collection.
+
+        Args:
+            path (str): Directory of the collection files.
+            name (str): Name of the collection.
+            embedding_function (callable): Embeds the documents of upsert() without embeddings.
+            metadata (dict): Metadata of a new collection.
+            index (CompressedIndex): Compression of the embeddings for the search, None to search the full embeddings.
+        """
+        self.name = name
+        self.embedding_function = embedding_function
+        self.index_settings = index
+        self.vector_path = os.path.join(path, f"{name}.npy")
+        self.codes_path = os.path.join(path, f"{name}.codes.npy")
+        self.index_path = os.path.join(path, f"{name}.index.npz")
+        self.db_path = os.path.join(path, f"{name}.sqlite3")
+        self._lock = threading.RLock()
+        # one connection for all threads, its data_version only changes with commits of other processes
+        self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS collection (key TEXT PRIMARY KEY, value TEXT)")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS records (
+                   row INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT, uri TEXT)"""
+            )
+            self._connection.execute("INSERT OR IGNORE INTO collection VALUES ('metadata', ?)",
+                                     (json.dumps(metadata or {}),))
+        self._version = None
+        self._reload()
+
+    def _reload(self):
+        """
+        Load the ids, the metadata and the vector matrix if another process changed the collection.
+        """
+        with self._lock:
+            version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return
+            rows = self._connection.execute("SELECT row, id, metadata FROM records ORDER BY row").fetchall()
+            self._ids = [row[1] for row in rows]
+            self._rows = {row[1]: row[0] for row in rows}
+            self._metadatas = [json.loads(row[2]) if row[2] else {} for row in rows]
+            self._columns = {}
+            self._vectors = np.load(self.vector_path, mmap_mode="r+") if os.path.exists(self.vector_path) else None
+            self._load_index()
+            self._version = version
+
+    def _load_index(self):
+        """
+        Load the trained index and its codes if they match the index settings.
+        """
+        self._index, self._codes, self._trained = None, None, 0
+        if self.index_settings is None or not os.path.exists(self.index_path):
+            return
+        index = CompressedIndex.load(self.index_path, rescore=self.index_settings.rescore)
+        if index.params() != self.index_settings.params():
+            logger.warning(f"The index of {self.name} was built with {index.params()}, searching the full embeddings "
+                           f"until it is rebuilt with {self.index_settings.params()} (python database.py --reindex)")
+            return
+        self._index = index
+        self._codes = np.load(self.codes_path, mmap_mode="r+")
+        row = self._connection.execute("SELECT value FROM collection WHERE key = 'index'").fetchone()
+        self._trained = json.loads(row[0]).get("trained", 0) if row else 0
+
+    def index_stale(self):
+        """
+        Check whether the index has to be built, rebuilt or removed.
+
+        The quantizer is trained again when the collection has grown to twice the vectors it was
+        trained on, until it is trained on the full training sample. Collections too small to
+        train a quantizer are searched with the full embeddings.
+
+        Returns:
+            bool: True if reindex() has to be called.
+        """
+        self._reload()
+        if self.index_settings is None:
+            return False
+        count = len(self._ids)
+        if not self.index_settings.trainable(count):
+            return self._index is not None
+        if self._index is None:
+            return True
+        trained = self._trained
+        return trained < self._index.training_rows(count) and count >= 2 * trained
+
+    @property
+    def metadata(self):
+        """
+        Metadata of the collection.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM collection WHERE key = 'metadata'").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def modify(self, metadata=None):
+        """
+        Replace the metadata of the collection.
+
+        Args:
+            metadata (dict): The new metadata.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE collection SET value = ? WHERE key = 'metadata'",
+                                     (json.dumps(metadata or {}),))
+
+    def count(self):
+        """
+        Number of listings in the collection.
+
+        Returns:
+            int: The number of stored ids.
+        """
+        self._reload()
+        return len(self._ids)
+
+    def _grow(self, path, array, width, dtype):
+        """
+        Memory-mapped matrix with room for the current rows, created or enlarged by copying if needed.
+        """
+        rows = len(self._ids)
+        if array is not None and array.shape[0] >= rows:
+            return array
+        capacity = max(initial_capacity, rows)
+        if array is not None:
+            capacity = max(capacity, 2 * array.shape[0])
+        temporary = f"{path}.tmp"
+        grown = np.lib.format.open_memmap(temporary, mode="w+", dtype=dtype, shape=(capacity, width))
+        if array is not None:
+            grown[:array.shape[0]] = array
+        grown.flush()
+        del grown
+        os.replace(temporary, path)
+        logger.info(f"Matrix {os.path.basename(path)} has room for {capacity} listings")
+        return np.load(path, mmap_mode="r+")
+
+    def _matrix(self, dimension):
+        """
+        Vector matrix with room for the current rows, created or enlarged if needed.
+        """
+        if self._vectors is not None and self._vectors.shape[1] != dimension:
+            raise ValueError(f"Embedding dimension {dimension} does not match the collection dimensionality "
+                             f"{self._vectors.shape[1]}")
+        self._vectors = self._grow(self.vector_path, self._vectors, dimension, np.float32)
+        return self._vectors
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None, uris=None):
+        """
+        Add listings or replace the stored ones with the same ids.
+
+        Args:
+            ids (list[str]): Ids of the listings.
+            embeddings (list): Embedding vectors, the documents are embedded if None.
+            documents (list[str]): Texts of the listings.
+            metadatas (list[dict]): Metadata of the listings.
+            uris (list[str]): Image paths of the listings.
+
+        Raises:
+            ValueError: If there are neither embeddings nor documents and an embedding function.
+        """
+        if embeddings is None:
+            if documents is None or self.embedding_function is None:
+                raise ValueError("upsert needs embeddings, or documents and an embedding function")
+            embeddings = self.embedding_function(documents)
+        vectors = normalize(embeddings)
+        count = len(ids)
+        documents = documents if documents is not None else [None] * count
+        metadatas = metadatas if metadatas is not None else [None] * count
+        uris = uris if uris is not None else [None] * count
+
+        self._reload()
+        with self._lock:
+            try:
+                with self._connection:
+                    rows = []
+                    for id, document, metadata, uri in zip(ids, documents, metadatas, uris):
+                        row = self._rows.get(id)
+                        if row is None:
+                            row = len(self._ids)
+                            self._ids.append(id)
+                            self._metadatas.append({})
+                            self._rows[id] = row
+                        self._metadatas[row] = metadata or {}
+                        rows.append(row)
+                        self._connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                                                 (row, id, document, json.dumps(metadata) if metadata else None, uri))
+                    # the vectors are written before the rows are committed, so readers never see rows without vectors
+                    matrix = self._matrix(vectors.shape[1])
+                    matrix[rows] = vectors
+                    matrix.flush()
+                    if self._index is not None:
+                        self._codes = self._grow(self.codes_path, self._codes, self._index.width(vectors.shape[1]),
+                                                 self._index.dtype())
+                        self._codes[rows] = self._index.encode(vectors)
+                        self._codes.flush()
+                    elif os.path.exists(self.index_path):
+                        # the codes of an index which isn't used would miss the new rows
+                        os.remove(self.index_path)
+            except Exception:
+                # the rows are rolled back, the state is loaded again from the file
+                self._version = None
+                raise
+            finally:
+                self._columns = {}
+
+    def delete(self, ids):
+        """
+        Remove listings, unknown ids are ignored.
+
+        The last rows are moved into the freed rows, so the matrix stays without gaps.
+
+        Args:
+            ids (list[str]): Ids of the listings.
+        """
+        self._reload()
+        with self._lock:
+            try:
+                with self._connection:
+                    for id in ids:
+                        row = self._rows.pop(id, None)
+                        if row is None:
+                            continue
+                        last = len(self._ids) - 1
+                        self._connection.execute("DELETE FROM records WHERE row = ?", (row,))
+                        if row != last:
+                            moved = self._ids[last]
+                            self._connection.execute("UPDATE records SET row = ? WHERE row = ?", (row, last))
+                            self._ids[row], self._metadatas[row] = moved, self._metadatas[last]
+                            self._rows[moved] = row
+                            self._vectors[row] = self._vectors[last]
+                            if self._codes is not None:
+                                self._codes[row] = self._codes[last]
+                        self._ids.pop()
+                        self._metadatas.pop()
+                    if self._vectors is not None:
+                        self._vectors.flush()
+                    if self._codes is not None:
+                        self._codes.flush()
+            except Exception:
+                self._version = None
+                raise
+            finally:
+                self._columns = {}
+
+    def reindex(self):
+        """
+        Train the index on the stored embeddings and encode all of them.
+
+        Without index settings, or with too few embeddings to train the quantizer, a built index is
+        removed and the full embeddings are searched.
+
+        Returns:
+            dict: Number of listings, bytes per listing of the codes and the full embeddings and the parameters.
+        """
+        self._reload()
+        with self._lock:
+            count = len(self._ids)
+            if self.index_settings is None or count == 0 or not self.index_settings.trainable(count):
+                if self.index_settings is not None and count:
+                    logger.info(f"{count} listings of {self.name} are too few to train the index, "
+                                f"the full embeddings are searched")
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                self._index, self._codes, self._trained = None, None, 0
+                # the commit makes other processes drop the index
+                with self._connection:
+                    self._connection.execute("DELETE FROM collection WHERE key = 'index'")
+                dimension = self._vectors.shape[1] if self._vectors is not None else 0
+                return {"listings": count, "code_bytes": dimension * 4, "full_bytes": dimension * 4, "params": None}
+
+            settings = self.index_settings
+            index = CompressedIndex(settings.dimensions, settings.quantization, settings.subvectors, settings.rescore)
+            vectors = self._vectors[:count]
+            index.fit(vectors)
+            dimension = vectors.shape[1]
+            temporary = f"{self.codes_path}.tmp"
+            codes = np.lib.format.open_memmap(temporary, mode="w+", dtype=index.dtype(),
+                                              shape=(self._vectors.shape[0], index.width(dimension)))
+            for start in range(0, count, encode_batch_size):
+                end = min(start + encode_batch_size, count)
+                codes[start:end] = index.encode(vectors[start:end])
+            codes.flush()
+            del codes
+            index.save(f"{self.index_path}.tmp")
+            os.replace(temporary, self.codes_path)
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+            self._index = index
+            self._codes = np.load(self.codes_path, mmap_mode="r+")
+            self._trained = index.training_rows(count)
+            # the commit makes other processes load the new index
+            with self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO collection VALUES ('index', ?)",
+                                         (json.dumps({**index.params(), "listings": count,
+                                                      "trained": self._trained}),))
+
+        stats = {"listings": count, "code_bytes": self._codes.shape[1] * self._codes.itemsize,
+                 "full_bytes": dimension * 4, "params": index.params()}
+        logger.info(f"Indexed {count} listings of {self.name} with {stats['params']}, "
+                    f"{stats['code_bytes']} instead of {stats['full_bytes']} bytes per listing")
+        return stats
+
+    def update(self, ids, metadatas):
+        """
+        Replace the metadata of stored listings, unknown ids are ignored.
+
+        Args:
+            ids (list[str]): Ids of the listings.
+            metadatas (list[dict]): The new metadata.
+        """
+        self._reload()
+        with self._lock, self._connection:
+            for id, metadata in zip(ids, metadatas):
+                row = self._rows.get(id)
+                if row is not None:
+                    self._metadatas[row] = metadata or {}
+                    self._connection.execute("UPDATE records SET metadata = ? WHERE row = ?",
+                                             (json.dumps(metadata), row))
+            self._columns = {}
+
+    def _column(self, key):
+        """
+        Values of a metadata field of all rows as float array, NaN where missing or not numeric.
+        """
+        column = self._columns.get(key)
+        if column is None:
+            values = [metadata.get(key) for metadata in self._metadatas]
+            column = np.array([value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                               for value in values], dtype=np.float64)
+            self._columns[key] = column
+        return column
+
+    def _mask(self, where):
+        """
+        Rows matching a ChromaDB `where` filter.
+
+        Args:
+            where (dict): Filter with $and, $or and the comparisons $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin.
+
+        Returns:
+            np.ndarray: Boolean mask of the rows.
+        """
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                masks = [self._mask(clause) for clause in condition]
+                combined = np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+                mask &= combined
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and operator in comparisons:
+                    with np.errstate(invalid="ignore"):
+                        matches = comparisons[operator](self._column(key), value)
+                    if operator == "$ne":
+                        matches |= np.isnan(self._column(key))
+                elif operator in ("$in", "$nin", "$eq", "$ne"):
+                    values = value if operator in ("$in", "$nin") else [value]
+                    matches = np.array([metadata.get(key) in values for metadata in self._metadatas], dtype=bool)
+                    if operator in ("$nin", "$ne"):
+                        matches = ~matches
+                else:
+                    raise ValueError(f"Unsupported filter {operator} on {key}: {value!r}")
+                mask &= matches
+        return mask
+
+    def _records(self, rows, include):
+        """
+        Documents, metadata and uris of rows in the fields of a ChromaDB result.
+        """
+        records = {}
+        if rows and any(field in include for field in ("documents", "uris")):
+            unique = sorted(set(rows))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for row, document, uri in self._connection.execute(
+                        f"SELECT row, document, uri FROM records WHERE row IN ({placeholders})", chunk):
+                    records[row] = (document, uri)
+        result = {}
+        if "documents" in include:
+            result["documents"] = [records.get(row, (None, None))[0] for row in rows]
+        if "uris" in include:
+            result["uris"] = [records.get(row, (None, None))[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[row] or None for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.array(self._vectors[row]) for row in rows]
+        return result
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents")):
+        """
+        Stored listings by id or filter.
+
+        Args:
+            ids (list[str]): Ids of the listings, unknown ids are left out. All listings if None.
+            where (dict): Filter on the metadata.
+            limit (int): Maximum number of listings.
+            offset (int): Number of listings skipped.
+            include (list[str]): Fields of the result: documents, metadatas, uris, embeddings.
+
+        Returns:
+            dict: ids and the included fields, one entry per listing.
+        """
+        self._reload()
+        with self._lock:
+            if ids is None:
+                rows = list(range(len(self._ids)))
+            else:
+                rows = [self._rows[id] for id in dict.fromkeys(ids) if id in self._rows]
+            if where:
+                mask = self._mask(where)
+                rows = [row for row in rows if mask[row]]
+            rows = rows[offset or 0:][:limit] if limit is not None else rows[offset or 0:]
+            result = {"ids": [self._ids[row] for row in rows]}
+            result.update(self._records(rows, include))
+        for field in ("documents", "metadatas", "uris", "embeddings"):
+            result.setdefault(field, None)
+        return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("metadatas", "documents", "distances")):
+        """
+        Nearest listings of one or several queries by cosine similarity.
+
+        All queries are answered with one matrix product, the top n_results of every query are
+        selected with argpartition and sorted. With a built index the codes are scored instead and
+        rescore * n_results candidates are ranked again with the full embeddings.
+
+        Args:
+            query_embeddings (list): Query vectors.
+            query_texts (list[str]): Query texts, embedded if query_embeddings is None.
+            n_results (int): Number of results per query.
+            where (dict): Filter on the metadata, only matching listings are searched.
+            include (list[str]): Fields of the result: documents, metadatas, uris, distances, embeddings.
+
+        Returns:
+            dict: ids and the included fields, one list per query.
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = normalize(query_embeddings)
+
+        self._reload()
+        # delete() and upsert() write into the matrices in place, so the search and the lookup of the ids
+        # and records of the found rows hold the lock until the result is complete
+        with self._lock:
+            count = len(self._ids)
+            vectors, index, codes = self._vectors, self._index, self._codes
+            mask = self._mask(where) if where else None
+            candidates = count if mask is None else int(mask.sum())
+            k = min(n_results, candidates)
+
+            result = {"ids": [], "distances": [] if "distances" in include else None}
+            rows_per_query = []
+            if k > 0:
+                if vectors.shape[1] != queries.shape[1]:
+                    raise ValueError(f"Query dimension {queries.shape[1]} does not match the collection dimensionality "
+                                     f"{vectors.shape[1]}")
+                if index is None:
+                    top, top_similarities = top_k(queries @ vectors[:count].T, k, mask)
+                elif not index.rescore:
+                    top, top_similarities = top_k(index.scores(queries, codes[:count]), k, mask)
+                else:
+                    # the best candidates of the compressed scores are rescored with the full embeddings
+                    top, _ = top_k(index.scores(queries, codes[:count]), min(k * index.rescore, candidates), mask)
+                    exact = np.einsum("qcd,qd->qc", vectors[top], queries)
+                    order, top_similarities = top_k(exact, k)
+                    top = np.take_along_axis(top, order, axis=1)
+                for rows, row_similarities in zip(top, top_similarities):
+                    rows = [int(row) for row in rows]
+                    rows_per_query.append(rows)
+                    result["ids"].append([self._ids[row] for row in rows])
+                    if result["distances"] is not None:
+                        result["distances"].append([float(2.0 - 2.0 * similarity) for similarity in row_similarities])
+            else:
+                rows_per_query = [[] for _ in range(len(queries))]
+                result["ids"] = [[] for _ in range(len(queries))]
+                if result["distances"] is not None:
+                    result["distances"] = [[] for _ in range(len(queries))]
+
+            records = self._records([row for rows in rows_per_query for row in rows], include)
+        for field in ("documents", "metadatas", "uris", "embeddings"):
+            result[field] = [] if field in include else None
+        start = 0
+        for rows in rows_per_query:
+            for field, values in records.items():
+                result[field].append(values[start:start + len(rows)])
+            start += len(rows)
+        return result
@@ -0,0 +1,17 @@
+"""
+wsgi.py
+
+Production entry point of the web server, e.g. for gunicorn:
+
+    gunicorn wsgi:app
+
+The settings of gunicorn are in gunicorn.conf.py. Every worker process builds the LLM clients,
+the database client and the embedding functions when it starts if `preload = true` in the
+[server] section of settings.ini, so the first requests don't pay for it.
+"""
+
+import resources
+from server import app
+
+if resources.get_settings().getboolean("server", "preload", fallback=False):
+    resources.preload(open_ai=True)